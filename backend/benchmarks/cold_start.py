@@ -0,0 +1,53 @@
+"""
+Benchmark cold-start time of a worker with lazy vs eager heavy imports.
+
+Run from the backend directory:
+    python benchmarks/cold_start.py --repeat 10
+
+Each sample is a fresh interpreter that loads config.wsgi and serves one
+request. The "eager" variant imports openai and pypdf up front, which is
+how the backend behaved before those imports were made lazy.
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from summarizer.management.commands.profile_startup import measure_startup  # noqa: E402
+
+EAGER_MODULES = ['openai', 'pypdf']
+
+
+def run(label, repeat, path, eager):
+    """Time `repeat` cold starts and print median and p90 figures."""
+    samples = [measure_startup(path, eager) for _ in range(repeat)]
+    ready = sorted(sample['ready_ms'] for sample in samples)
+    first = sorted(sample['first_request_ms'] for sample in samples)
+    p90 = max(0, math.ceil(len(first) * 0.9) - 1)
+    print(f"{label:<6} ready median {statistics.median(ready):7.1f} ms | "
+          f"first request median {statistics.median(first):7.1f} ms, p90 {first[p90]:7.1f} ms")
+    return statistics.median(first)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--path', default='/api/summarize/')
+    args = parser.parse_args()
+
+    lazy = run('lazy', args.repeat, args.path, [])
+    eager = run('eager', args.repeat, args.path, EAGER_MODULES)
+    print(f"Time-to-first-request saved by lazy imports: {eager - lazy:.1f} ms "
+          f"({(eager - lazy) / eager * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
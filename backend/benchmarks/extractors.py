@@ -0,0 +1,134 @@
+"""
+Benchmark extraction throughput per document format.
+
+Run from the backend directory:
+    python benchmarks/extractors.py --size-mb 5 --repeat 3
+
+Synthetic documents of roughly the requested size are generated for each
+format and run through the same pipeline as uploads (format detection,
+streaming extractor, chunk normalisation). Throughput is reported in MB/s
+of input and in extracted characters per second.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+
+from summarizer.utils.text_extractor import extract_pages_from_file  # noqa: E402
+
+PARAGRAPH = ("The committee reviewed the quarterly figures and agreed to extend the pilot "
+             "programme to three further regions, subject to a budget review in spring. ")
+
+
+def paragraphs(size):
+    count = max(1, size // len(PARAGRAPH))
+    return [f"{index}. {PARAGRAPH}" for index in range(count)]
+
+
+def make_txt(size):
+    return "\n".join(paragraphs(size)).encode()
+
+
+def make_markdown(size):
+    lines = []
+    for index, text in enumerate(paragraphs(size)):
+        if index % 20 == 0:
+            lines.append(f"## Section {index // 20}\n")
+        lines.append(f"- **Item** {text} See [notes](https://example.com/{index}).")
+    return "\n".join(lines).encode()
+
+
+def make_html(size):
+    body = "".join(f"<p>{text}</p><script>track({index})</script>"
+                   for index, text in enumerate(paragraphs(size)))
+    return f"<!DOCTYPE html><html><head><title>Report</title></head><body>{body}</body></html>".encode()
+
+
+def make_docx(size):
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs(size))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('word/document.xml',
+                         '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                         f'<w:body>{body}</w:body></w:document>')
+    return buffer.getvalue()
+
+
+def make_pdf(size):
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+    texts = paragraphs(size)
+    for start in range(0, len(texts), 40):
+        page = writer.add_blank_page(612, 792)
+        lines = " ".join(f"({text[:90]}) Tj T*" for text in texts[start:start + 40])
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 8 Tf 10 TL 20 770 Td {lines} ET".encode())
+        page[NameObject('/Contents')] = writer._add_object(stream)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font}),
+        })
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+FORMATS = {
+    'txt': ('doc.txt', make_txt),
+    'markdown': ('doc.md', make_markdown),
+    'html': ('doc.html', make_html),
+    'docx': ('doc.docx', make_docx),
+    'pdf': ('doc.pdf', make_pdf),
+}
+
+
+def run(label, filename, content, repeat):
+    """Extract `repeat` times and print the median throughput."""
+    seconds = []
+    chars = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text, _, error = extract_pages_from_file(SimpleUploadedFile(filename, content))
+        seconds.append(time.perf_counter() - started)
+        if error:
+            print(f"{label:<9} failed: {error}")
+            return
+        chars = len(text)
+    median = statistics.median(seconds)
+    print(f"{label:<9} {len(content) / 1e6:6.1f} MB in {median * 1000:8.1f} ms | "
+          f"{len(content) / 1e6 / median:7.1f} MB/s | {chars / median / 1e6:6.2f} M chars/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=5, help="Approximate text size of each document")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--formats', default=",".join(FORMATS), help="Comma-separated formats to run")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    for label in args.formats.split(','):
+        filename, make = FORMATS[label]
+        run(label, filename, make(size), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
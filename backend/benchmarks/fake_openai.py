@@ -0,0 +1,254 @@
+"""
+Fake OpenAI-compatible chat completions server for load tests.
+
+Run from the backend directory:
+    python benchmarks/fake_openai.py --port 8100 --latency lognormal:0.6,0.5 --tokens-per-second 60
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake python manage.py runserver
+
+Answers POST /v1/chat/completions like the real API, without tokens or
+cost:
+- the time to the first token is drawn from --latency, then completion
+  tokens arrive at --tokens-per-second (up to the request's max_tokens)
+- stream=true is answered with server-sent chunks, and a final usage chunk
+  when stream_options.include_usage is set
+- response_format json_schema requests get a valid structured summary
+- --rate-limit-rate and --timeout-rate inject 429s (with Retry-After) and
+  calls that hang for --timeout-seconds
+
+Latency distributions:
+    fixed:SECONDS
+    uniform:LOW,HIGH
+    exponential:MEAN
+    lognormal:MEDIAN,SIGMA
+
+GET /stats returns the count of each outcome. benchmarks/loadgen.py and
+benchmarks/load_test.py start this server in-process with FakeOpenAI.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+
+WORDS = ("the committee reviewed quarterly figures and agreed to extend pilot programme "
+         "regions subject budget review spring policy staff approval").split()
+
+STRUCTURED_SUMMARY = {
+    "title": "Quarterly review",
+    "key_points": ["The pilot programme is extended", "A budget review follows in spring"],
+    "entities": [{"name": "Committee", "type": "organization"}],
+    "action_items": [{"task": "Prepare the budget review", "owner": None, "due": "spring"}],
+}
+
+
+def parse_distribution(spec):
+    """Turn a latency spec such as "lognormal:0.6,0.5" into a sampler returning seconds."""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    samplers = {
+        'fixed': lambda seconds: lambda: seconds,
+        'uniform': lambda low, high: lambda: random.uniform(low, high),
+        'exponential': lambda mean: lambda: random.expovariate(1 / mean),
+        'lognormal': lambda median, sigma: lambda: random.lognormvariate(math.log(median), sigma),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    try:
+        return samplers[kind](*values)
+    except TypeError:
+        raise ValueError(f"Wrong number of parameters for {kind}: {spec}") from None
+
+
+class FakeOpenAI:
+    """
+    A fake chat completions server on a background thread.
+
+    Args:
+        latency: Latency spec for the time to the first token
+        tokens_per_second: Completion token rate; 0 sends all tokens at once
+        completion_tokens: Tokens per answer, capped by the request's max_tokens
+        rate_limit_rate: Fraction of calls answered 429
+        timeout_rate: Fraction of calls that hang for timeout_seconds
+        timeout_seconds: How long a hanging call hangs
+        retry_after: Retry-After of injected 429s, in seconds
+    """
+
+    def __init__(self, latency='fixed:0.5', tokens_per_second=0.0, completion_tokens=120,
+                 rate_limit_rate=0.0, timeout_rate=0.0, timeout_seconds=120.0, retry_after=1,
+                 host='127.0.0.1', port=0):
+        self.sample_latency = parse_distribution(latency)
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.retry_after = retry_after
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='fake-openai', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path.rstrip('/') != '/stats':
+                    return self._json(404, {'error': {'message': 'Not found'}})
+                with fake._lock:
+                    self._json(200, dict(fake.stats))
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    return self._json(404, {'error': {'message': 'Not found'}})
+
+                draw = random.random()
+                if draw < fake.rate_limit_rate:
+                    fake.count('rate_limited')
+                    return self._json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                                      'code': 'rate_limit_exceeded'}},
+                                      {'Retry-After': str(fake.retry_after)})
+                if draw < fake.rate_limit_rate + fake.timeout_rate:
+                    fake.count('timed_out')
+                    time.sleep(fake.timeout_seconds)
+                    self.close_connection = True
+                    return
+
+                prompt = "".join(str(message.get('content', '')) for message in body.get('messages', []))
+                usage = {
+                    'prompt_tokens': max(1, len(prompt) // CHARS_PER_TOKEN),
+                    'completion_tokens': min(fake.completion_tokens, body.get('max_tokens') or fake.completion_tokens),
+                }
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+                content = self._content(body, usage['completion_tokens'])
+
+                time.sleep(fake.sample_latency())
+                if body.get('stream'):
+                    fake.count('streamed')
+                    self._stream(body, content, usage)
+                else:
+                    fake.count('completed')
+                    if fake.tokens_per_second:
+                        time.sleep(usage['completion_tokens'] / fake.tokens_per_second)
+                    self._json(200, {
+                        'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                        'model': body.get('model', 'fake'),
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': content}}],
+                        'usage': usage,
+                    })
+
+            @staticmethod
+            def _content(body, tokens):
+                if (body.get('response_format') or {}).get('type') == 'json_schema':
+                    return json.dumps(STRUCTURED_SUMMARY)
+                return " ".join(WORDS[index % len(WORDS)] for index in range(tokens)) + "."
+
+            def _stream(self, body, content, usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                pieces = [content[start:start + CHARS_PER_TOKEN] for start in range(0, len(content), CHARS_PER_TOKEN)]
+                delay = 1 / fake.tokens_per_second if fake.tokens_per_second else 0
+                chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk',
+                         'created': int(time.time()), 'model': body.get('model', 'fake')}
+                try:
+                    for piece in pieces:
+                        self._event(dict(chunk, choices=[{'index': 0, 'delta': {'content': piece},
+                                                          'finish_reason': None}]))
+                        if delay:
+                            time.sleep(delay)
+                    self._event(dict(chunk, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+                    if (body.get('stream_options') or {}).get('include_usage'):
+                        self._event(dict(chunk, choices=[], usage=usage))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _event(self, data):
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+
+            def _json(self, status, data, headers=None):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def add_arguments(parser):
+    """Fake server options, shared with the load test scripts."""
+    parser.add_argument('--latency', default='fixed:0.5', help="Time to first token, e.g. lognormal:0.6,0.5")
+    parser.add_argument('--tokens-per-second', type=float, default=0.0,
+                        help="Completion token rate; 0 sends the whole answer at once")
+    parser.add_argument('--completion-tokens', type=int, default=120)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of calls answered 429")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="Fraction of calls that hang")
+    parser.add_argument('--timeout-seconds', type=float, default=120.0)
+
+
+def from_arguments(args, port=0):
+    return FakeOpenAI(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        port=port,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = from_arguments(args, port=args.port).start()
+    print(f"Fake OpenAI API at {server.url} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare throughput of the bundled gunicorn profile against the bare default.
+
+Run from the backend directory:
+    python benchmarks/load_test.py --requests 200 --concurrency 32 --latency fixed:0.5
+    python benchmarks/load_test.py --mix chat=1 --latency lognormal:0.5,0.4 --rate-limit-rate 0.01
+
+Both servers talk to the same fake AI endpoint (benchmarks/fake_openai.py),
+so the test measures how well each server profile overlaps I/O-bound
+requests, without calling OpenAI. The load is generated by
+benchmarks/loadgen.py and reported per endpoint and stage.
+
+Profiles:
+    default - gunicorn config.wsgi:application (one sync worker)
+    tuned   - gunicorn -c python:config.gunicorn config.wsgi:application
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai  # noqa: E402
+import loadgen  # noqa: E402
+
+
+def run_profile(profile, args, upstream_url):
+    port = loadgen.free_port()
+    server = loadgen.start_server(profile, port, upstream_url)
+    base_url = f"http://127.0.0.1:{port}"
+    documents = loadgen.DocumentMix(args.pdf_ratio, args.repeat_ratio)
+    try:
+        loadgen.send(base_url, 'chat', documents)  # warm the first worker
+        results, elapsed = loadgen.run_load(
+            base_url, loadgen.parse_mix(args.mix), documents,
+            args.requests if args.requests or args.duration else 200, args.duration, args.concurrency,
+        )
+    finally:
+        loadgen.stop_server(*server)
+
+    report = loadgen.build_report(results, elapsed)
+    loadgen.print_report(report, profile)
+    return sum(figures['throughput_rps'] for figures in report['endpoints'].values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    loadgen.add_load_arguments(parser)
+    fake_openai.add_arguments(parser)
+    parser.add_argument('--profiles', nargs='+', default=list(loadgen.PROFILES), choices=list(loadgen.PROFILES))
+    args = parser.parse_args()
+
+    upstream = fake_openai.from_arguments(args).start()
+    try:
+        results = {profile: run_profile(profile, args, upstream.url) for profile in args.profiles}
+    finally:
+        upstream.stop()
+    if 'default' in results and 'tuned' in results and results['default']:
+        print(f"tuned / default throughput: {results['tuned'] / results['default']:.1f}x")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,398 @@
+"""
+Load generator for capacity planning, against a fake AI upstream.
+
+Run from the backend directory:
+    python benchmarks/loadgen.py --requests 500 --concurrency 32 --mix summarize=2,extract=1,chat=3
+    python benchmarks/loadgen.py --duration 120 --latency lognormal:0.8,0.6 --rate-limit-rate 0.02
+    python benchmarks/loadgen.py --url http://staging:8000 --api-key sk-sum-... --requests 200
+
+Without --url a fake OpenAI server (benchmarks/fake_openai.py) and the
+backend under gunicorn (--profile) are started locally, with a throwaway
+SQLite database and SERVER_TIMING_ENABLED. --concurrency clients then
+send requests back to back to /api/summarize/, /api/extract-text/ and
+/api/chat-document/ in the --mix proportions. Uploads are PDF or TXT
+(--pdf-ratio) in a spread of sizes. Each one is unique unless
+--repeat-ratio says otherwise, so stored summaries do not hide the AI
+cost.
+
+The report gives throughput and latency percentiles per endpoint, then a
+per-stage breakdown (extract, queue, upstream, db) read from the
+Server-Timing header. --json writes the same figures to a file.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    'default': ['gunicorn', 'config.wsgi:application'],
+    'tuned': ['gunicorn', '-c', 'python:config.gunicorn', 'config.wsgi:application'],
+}
+
+ENDPOINTS = {
+    'summarize': '/api/summarize/',
+    'extract': '/api/extract-text/',
+    'chat': '/api/chat-document/',
+}
+
+# Upload sizes in KB and how often each occurs
+DOCUMENT_SIZES = ((4, 0.5), (40, 0.35), (400, 0.15))
+
+SENTENCES = (
+    "The committee reviewed the quarterly figures and agreed to extend the pilot programme.",
+    "Travel expenses above the monthly limit need the approval of a line manager.",
+    "The budget review in spring will decide on funding for three further regions.",
+    "Staff may carry over up to five days of annual leave into the next year.",
+    "Receipts must be submitted within thirty days of the expense being incurred.",
+)
+
+QUESTIONS = ("What is this document about?", "Who has to approve expenses?", "What happens in spring?")
+
+
+def document_text(size, rng):
+    sentences = []
+    length = 0
+    while length < size:
+        sentence = rng.choice(SENTENCES)
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def make_txt(text):
+    return text.encode()
+
+
+def make_pdf(text):
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+    lines = [text[start:start + 90] for start in range(0, len(text), 90)]
+    for start in range(0, len(lines), 60):
+        page = writer.add_blank_page(612, 792)
+        body = " ".join(f"({line}) Tj T*" for line in lines[start:start + 60])
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 8 Tf 10 TL 20 770 Td {body} ET".encode())
+        page[NameObject('/Contents')] = writer._add_object(stream)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font}),
+        })
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class DocumentMix:
+    """Generates upload bodies: PDF or TXT, in a spread of sizes, mostly unique."""
+
+    def __init__(self, pdf_ratio=0.5, repeat_ratio=0.0, seed=1):
+        self.pdf_ratio = pdf_ratio
+        self.repeat_ratio = repeat_ratio
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.seen = []
+
+    def next(self):
+        """Return (filename, content_type, body)."""
+        with self.lock:
+            if self.seen and self.rng.random() < self.repeat_ratio:
+                return self.rng.choice(self.seen)
+            sizes, weights = zip(*DOCUMENT_SIZES)
+            size = self.rng.choices(sizes, weights)[0] * 1024
+            text = f"Document {uuid.uuid4()}. " + document_text(size, self.rng)
+            pdf = self.rng.random() < self.pdf_ratio
+
+        if pdf:
+            document = ('load.pdf', 'application/pdf', make_pdf(text))
+        else:
+            document = ('load.txt', 'text/plain', make_txt(text))
+        with self.lock:
+            self.seen = (self.seen + [document])[-50:]
+        return document
+
+
+def multipart(fields, file):
+    """Encode form fields and one (filename, content_type, body) file as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    filename, content_type, body = file
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + body + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b"".join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def parse_server_timing(header):
+    """Map each metric of a Server-Timing header to its duration in seconds."""
+    stages = {}
+    for metric in (header or '').split(','):
+        name, _, params = metric.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'dur' and name:
+                try:
+                    stages[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return stages
+
+
+def send(base_url, endpoint, documents, api_key=None, timeout=300):
+    """Send one request; returns (endpoint, status, seconds, stages)."""
+    headers = {'X-API-Key': api_key} if api_key else {}
+    if endpoint == 'chat':
+        text = document_text(2000, random.Random())
+        data = json.dumps({'question': random.choice(QUESTIONS), 'context': text}).encode()
+        headers['Content-Type'] = 'application/json'
+    else:
+        data, headers['Content-Type'] = multipart({}, documents.next())
+
+    request = urllib.request.Request(base_url + ENDPOINTS[endpoint], data=data, headers=headers)
+    started = time.perf_counter()
+    stages = {}
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+            stages = parse_server_timing(response.headers.get('Server-Timing'))
+    except urllib.error.HTTPError as e:
+        status = e.code
+        stages = parse_server_timing(e.headers.get('Server-Timing'))
+    except OSError:
+        status = 0
+    return endpoint, status, time.perf_counter() - started, stages
+
+
+def parse_mix(spec):
+    """Turn "summarize=2,chat=3" into endpoint weights."""
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_load(base_url, mix, documents, requests=None, duration=None, concurrency=16, api_key=None):
+    """
+    Drive the backend with `concurrency` closed-loop clients.
+
+    Stops after `requests` requests or `duration` seconds, whichever is set.
+
+    Returns:
+        Tuple of (results, elapsed_seconds)
+    """
+    names, weights = zip(*mix.items())
+    lock = threading.Lock()
+    remaining = [requests if requests is not None else math.inf]
+    deadline = time.monotonic() + duration if duration else math.inf
+    results = []
+
+    def client(_):
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            result = send(base_url, rng.choices(names, weights)[0], documents, api_key)
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)] if values else 0.0
+
+
+def build_report(results, elapsed):
+    """Throughput and latency percentiles per endpoint and per stage."""
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[result[0]].append(result)
+
+    report = {'elapsed_s': round(elapsed, 2), 'requests': len(results), 'endpoints': {}}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        ok = [seconds for _, status, seconds, _ in rows if status == 200]
+        stage_values = defaultdict(list)
+        for _, status, _, stages in rows:
+            if status == 200:
+                for name, seconds in stages.items():
+                    stage_values[name].append(seconds)
+        report['endpoints'][endpoint] = {
+            'requests': len(rows),
+            'ok': len(ok),
+            'statuses': dict(Counter(status for _, status, _, _ in rows)),
+            'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                label: round(percentile(ok, fraction) * 1000, 1)
+                for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+            },
+            'stages_ms': {
+                name: {
+                    'p50': round(percentile(values, 0.5) * 1000, 1),
+                    'p95': round(percentile(values, 0.95) * 1000, 1),
+                    'mean': round(sum(values) / len(values) * 1000, 1),
+                }
+                for name, values in sorted(stage_values.items())
+            },
+        }
+    return report
+
+
+def print_report(report, label=''):
+    title = f"{label}: " if label else ""
+    print(f"{title}{report['requests']} requests in {report['elapsed_s']}s")
+    print(f"  {'endpoint':<10} {'ok':>6} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}  errors")
+    for endpoint, figures in report['endpoints'].items():
+        errors = {status: count for status, count in figures['statuses'].items() if status != 200}
+        latency = figures['latency_ms']
+        print(f"  {endpoint:<10} {figures['ok']:>6} {figures['throughput_rps']:>8.1f} {latency['p50']:>9.0f} "
+              f"{latency['p90']:>9.0f} {latency['p99']:>9.0f}  {errors or '-'}")
+    for endpoint, figures in report['endpoints'].items():
+        if figures['stages_ms']:
+            stages = ", ".join(f"{name} p50 {values['p50']:.0f} / p95 {values['p95']:.0f}"
+                               for name, values in figures['stages_ms'].items())
+            print(f"  {endpoint:<10} stages (ms): {stages}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile, port, upstream_url, extra_env=None):
+    """
+    Start the backend under gunicorn with the given profile on a fresh
+    SQLite database, and wait until it accepts connections.
+
+    Returns:
+        Tuple of (process, database_directory)
+    """
+    database_dir = tempfile.TemporaryDirectory()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY='fake-key',
+        OPENAI_BASE_URL=upstream_url,
+        DATABASE_URL=f"sqlite:///{os.path.join(database_dir.name, 'load.sqlite3')}",
+        DEBUG='False',
+        SECURE_SSL_REDIRECT='False',
+        API_KEY_REQUIRED='False',
+        SERVER_TIMING_ENABLED='True',
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_ACCESS_LOG='',
+        **(extra_env or {}),
+    )
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput'], cwd=BACKEND_DIR, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    command = PROFILES[profile] + ['--bind', f'127.0.0.1:{port}']
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, database_dir
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    database_dir.cleanup()
+    raise RuntimeError(f"{profile} server did not start")
+
+
+def stop_server(process, database_dir):
+    process.terminate()
+    process.wait(timeout=30)
+    database_dir.cleanup()
+
+
+def add_load_arguments(parser):
+    """Load options, shared with benchmarks/load_test.py."""
+    parser.add_argument('--requests', type=int, default=None, help="Total requests (default 200 without --duration)")
+    parser.add_argument('--duration', type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--mix', default='summarize=2,extract=1,chat=3',
+                        help="Endpoint weights, from " + ", ".join(ENDPOINTS))
+    parser.add_argument('--pdf-ratio', type=float, default=0.5, help="Share of uploads that are PDFs")
+    parser.add_argument('--repeat-ratio', type=float, default=0.0, help="Share of uploads repeating an earlier one")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_load_arguments(parser)
+    parser.add_argument('--url', default=None, help="Load an already running backend instead")
+    parser.add_argument('--api-key', default=None)
+    parser.add_argument('--profile', choices=list(PROFILES), default='tuned')
+    parser.add_argument('--json', default=None, help="Also write the report to this file")
+    fake_openai.add_arguments(parser)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    documents = DocumentMix(args.pdf_ratio, args.repeat_ratio)
+    requests = args.requests if args.requests or args.duration else 200
+
+    upstream = server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        upstream = fake_openai.from_arguments(args).start()
+        port = free_port()
+        server = start_server(args.profile, port, upstream.url)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        results, elapsed = run_load(base_url, mix, documents, requests, args.duration,
+                                    args.concurrency, args.api_key)
+    finally:
+        if server is not None:
+            stop_server(*server)
+        if upstream is not None:
+            upstream.stop()
+
+    report = build_report(results, elapsed)
+    if upstream is not None:
+        report['upstream'] = dict(upstream.stats)
+    print_report(report, args.profile if args.url is None else base_url)
+    if upstream is not None:
+        print(f"  upstream calls: {dict(upstream.stats)}")
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Gunicorn server profile for the AI Summarizer backend.
+
+Usage:
+    gunicorn -c python:config.gunicorn config.wsgi:application
+
+Requests spend most of their time waiting on the AI API, so workers use
+threads (gthread) rather than one request per process. The app is
+preloaded in the master: heavy modules and prompt templates are imported
+once and shared copy-on-write with every forked worker. Workers are
+recycled after a number of requests to contain memory growth from PDF
+parsing.
+
+Every setting can be overridden with a GUNICORN_* environment variable.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+# Threads serve I/O-bound AI calls; a few processes use the available cores.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', str(min(4, multiprocessing.cpu_count() + 1))))
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# Preload so warm state is built once in the master and shared with workers.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+# Recycle workers to bound memory held by pypdf parsing; jitter avoids all restarting at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '500'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '50'))
+
+# AI calls can legitimately take a while; keep-alive helps the frontend's follow-up requests.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    """Warm shared state in the master once the preloaded app is loaded."""
+    if not preload_app:
+        return
+    from summarizer.warmup import warm_up
+
+    timings = warm_up()
+    server.log.info(
+        "Warmed %s in %.0f ms", ", ".join(timings), sum(timings.values())
+    )
+    # Move everything loaded so far out of the collector's reach, so that
+    # garbage collection in the workers does not touch (and copy) shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Make sure no database connection is shared between processes."""
+    from django.db import connections
+
+    connections.close_all()
@@ -4,10 +4,12 @@ Django settings for AI Summarizer project.
 Production-ready configuration with environment variables support.
 """
 
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Load environment variables from .env file
 load_dotenv()
@@ -48,6 +50,8 @@ INSTALLED_APPS = [
 ]
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  # MUST BE FIRST
+    "summarizer.middleware.ResponseCompressionMiddleware",  # Before anything that reads the body
+    "summarizer.timing.ServerTimingMiddleware",  # Inert unless SERVER_TIMING_ENABLED
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -56,6 +60,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "summarizer.profiling.ProfilingMiddleware",  # Last, so only the view is profiled; inert unless PROFILING_ENABLED
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -141,30 +146,113 @@ CORS_ALLOWED_ORIGINS = [
     "https://ai-summarizer-pro-frontend.onrender.com",
 ]
 
+# Browsers must be allowed to send the API key header (see summarizer/authentication.py)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-api-key')
 
 CORS_ALLOW_CREDENTIALS = True
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'summarizer.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'summarizer.authentication.ApiKeyAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
-        'rest_framework.permissions.AllowAny',
+        'summarizer.authentication.HasApiKey',
     ],
+    'EXCEPTION_HANDLER': 'summarizer.exceptions.api_exception_handler',
 }
 
+# API clients (see summarizer/authentication.py). Keys identify server-side
+# clients for quotas and usage attribution. The browser frontend cannot keep
+# a key secret, so its traffic is anonymous; require keys only for
+# deployments that no browser calls directly.
+API_KEY_REQUIRED = os.environ.get('API_KEY_REQUIRED', 'False') == 'True'
+
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 
-# Allowed file types for upload
-ALLOWED_FILE_TYPES = ['pdf', 'txt']
+# Scanned PDFs (see summarizer/utils/pdf_scan.py and summarizer/utils/ocr.py)
+PDF_PRESCAN_PAGES = int(os.environ.get('PDF_PRESCAN_PAGES', '8'))
+OCR_ENABLED = os.environ.get('OCR_ENABLED', 'False') == 'True'
+OCR_LANGUAGES = os.environ.get('OCR_LANGUAGES', 'eng')
+OCR_TESSERACT_CMD = os.environ.get('OCR_TESSERACT_CMD', 'tesseract')
+OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))
+OCR_CACHE_ALIAS = 'ocr'
+
+# Sandboxed extraction with time and memory limits (see summarizer/utils/sandbox.py)
+SANDBOX_ENABLED = os.environ.get('SANDBOX_ENABLED', str(not DEBUG)) == 'True'
+SANDBOX_FORMATS = [name for name in os.environ.get('SANDBOX_FORMATS', 'pdf').split(',') if name]
+SANDBOX_WORKERS = int(os.environ.get('SANDBOX_WORKERS', '2'))
+SANDBOX_WALL_CLOCK = float(os.environ.get('SANDBOX_WALL_CLOCK', '60'))
+SANDBOX_MAX_RSS_MB = int(os.environ.get('SANDBOX_MAX_RSS_MB', '1024'))
+SANDBOX_PAGE_TIMEOUT = float(os.environ.get('SANDBOX_PAGE_TIMEOUT', '10'))
+SANDBOX_MAX_JOBS = int(os.environ.get('SANDBOX_MAX_JOBS', '200'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-page OCR results, shared by all workers and kept across restarts
+    OCR_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('OCR_CACHE_DIR', str(BASE_DIR / 'media' / 'ocr-cache')),
+        'TIMEOUT': int(os.environ.get('OCR_CACHE_TIMEOUT', str(30 * 24 * 3600))),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Chunked resumable uploads (see summarizer/uploads.py)
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', str(BASE_DIR / 'media' / 'uploads'))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(200 * 1024 * 1024)))  # 200 MB
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))  # 8 MB
+UPLOAD_EXPIRY_HOURS = int(os.environ.get('UPLOAD_EXPIRY_HOURS', '24'))
+
+# Cache-Control of stored summaries at /api/summaries/<id>/ (see summarizer/views.py).
+# The URL of a summary never changes meaning, so shared caches may keep it,
+# unless API keys are required: then only the client's own cache may. The
+# responses also carry Vary: X-API-Key (see summarizer/views.py).
+SUMMARY_CACHE_CONTROL = os.environ.get(
+    'SUMMARY_CACHE_CONTROL', f"{'private' if API_KEY_REQUIRED else 'public'}, max-age=86400"
+)
+
+# Opt-in request profiling (see summarizer/profiling.py)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SAMPLE_MODE = os.environ.get('PROFILING_SAMPLE_MODE', 'sample')
+PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL', '0.005'))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', str(BASE_DIR / 'media' / 'profiles'))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', '200'))
+
+# Server-Timing header with per-stage durations (see summarizer/timing.py)
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'False') == 'True'
+
+# Response compression (see summarizer/middleware.py)
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+RESPONSE_COMPRESSION_TYPES = ['application/json', 'text/plain', 'text/html', 'text/event-stream']
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+# Page size for plain text served page by page, and browser cache lifetime of pages
+TEXT_PAGE_CHARS = int(os.environ.get('TEXT_PAGE_CHARS', '4000'))
+DOCUMENT_PAGE_MAX_AGE = int(os.environ.get('DOCUMENT_PAGE_MAX_AGE', '86400'))
+
+# Modules imported in the gunicorn master before forking (see summarizer/warmup.py)
+WARM_UP_MODULES = [
+    module for module in os.environ.get('WARM_UP_MODULES', 'openai,pypdf').split(',') if module
+]
+
+# Allowed file types for upload. The extension must be listed here, but the
+# format is detected from the content (see summarizer/utils/extractors.py)
+ALLOWED_FILE_TYPES = ['pdf', 'txt', 'docx', 'html', 'htm', 'md', 'markdown']
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 
 # OpenAI Configuration
@@ -173,9 +261,101 @@ OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 OPENAI_MAX_TOKENS = int(os.environ.get('OPENAI_MAX_TOKENS', '150'))
 OPENAI_TEMPERATURE = float(os.environ.get('OPENAI_TEMPERATURE', '0.7'))
 
+# Prompt templates (see summarizer/utils/prompts.py)
+SUMMARY_DEFAULT_STYLE = os.environ.get('SUMMARY_DEFAULT_STYLE', 'brief')
+
+# Extractive pre-filter for over-long input (see summarizer/utils/prefilter.py)
+PREFILTER_ENABLED = os.environ.get('PREFILTER_ENABLED', 'True') == 'True'
+
+# Summary pyramid (see summarizer/utils/pyramid.py)
+PYRAMID_MAX_SECTIONS = int(os.environ.get('PYRAMID_MAX_SECTIONS', '12'))
+PYRAMID_MAX_WORKERS = int(os.environ.get('PYRAMID_MAX_WORKERS', '4'))
+
+# Incremental summaries of long documents (see summarizer/utils/incremental.py);
+# chunks are summarized with up to PYRAMID_MAX_WORKERS concurrent calls
+INCREMENTAL_ENABLED = os.environ.get('INCREMENTAL_ENABLED', 'True') == 'True'
+INCREMENTAL_MIN_CHARS = int(os.environ.get('INCREMENTAL_MIN_CHARS', '16000'))
+INCREMENTAL_CHUNK_CHARS = int(os.environ.get('INCREMENTAL_CHUNK_CHARS', '4000'))
+# Chunks of longer documents grow so a document makes at most this many chunk calls
+INCREMENTAL_MAX_CHUNKS = int(os.environ.get('INCREMENTAL_MAX_CHUNKS', '64'))
+
+# Summarizing long documents while they are extracted (see summarizer/utils/pipeline.py);
+# chunks are dispatched once PIPELINE_MIN_CHARS have arrived and the route is map-reduce
+PIPELINE_ENABLED = os.environ.get('PIPELINE_ENABLED', 'True') == 'True'
+PIPELINE_MIN_CHARS = int(os.environ.get('PIPELINE_MIN_CHARS', '16000'))
+
+# Summary routing by document size, structure and script (see summarizer/utils/routing.py).
+# The first matching rule picks the strategy, and the model and output budget
+# of templates without their own; no match falls back to the settings above.
+# The default rules switch to map-reduce at INCREMENTAL_MIN_CHARS; custom rules replace that threshold
+ROUTING_ENABLED = os.environ.get('ROUTING_ENABLED', 'True') == 'True'
+ROUTING_RULES = json.loads(os.environ.get('ROUTING_RULES', '') or json.dumps([
+    {'name': 'short', 'max_input_tokens': 1000, 'max_input_chars': INCREMENTAL_MIN_CHARS - 1,
+     'strategy': 'direct', 'max_tokens': 120},
+    {'name': 'medium', 'max_input_chars': INCREMENTAL_MIN_CHARS - 1, 'strategy': 'direct', 'max_tokens': 200},
+] + ([
+    {'name': 'long', 'strategy': 'map_reduce', 'max_tokens': 350, 'max_chunks': INCREMENTAL_MAX_CHUNKS},
+] if INCREMENTAL_ENABLED else [])))
+
+# Chat answer cache (see summarizer/utils/answer_cache.py); questions about the same
+# document with the same content words, whose trigram MinHash signatures agree on
+# CHAT_CACHE_SIMILARITY, share an answer
+CHAT_CACHE_ENABLED = os.environ.get('CHAT_CACHE_ENABLED', 'True') == 'True'
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '1000'))
+CHAT_CACHE_TTL = float(os.environ.get('CHAT_CACHE_TTL', '3600'))
+CHAT_CACHE_SIMILARITY = float(os.environ.get('CHAT_CACHE_SIMILARITY', '0.8'))
+
+# Speculative summaries after /api/extract-text/ with speculate=true (see summarizer/speculation.py);
+# jobs run at batch priority while the scheduler load is below SPECULATIVE_MAX_LOAD
+SPECULATIVE_ENABLED = os.environ.get('SPECULATIVE_ENABLED', 'True') == 'True'
+SPECULATIVE_WORKERS = int(os.environ.get('SPECULATIVE_WORKERS', '1'))
+SPECULATIVE_MAX_PENDING = int(os.environ.get('SPECULATIVE_MAX_PENDING', '8'))
+SPECULATIVE_MAX_CHARS = int(os.environ.get('SPECULATIVE_MAX_CHARS', '200000'))
+SPECULATIVE_TOKEN_BUDGET = int(os.environ.get('SPECULATIVE_TOKEN_BUDGET', '500000'))
+SPECULATIVE_MAX_LOAD = float(os.environ.get('SPECULATIVE_MAX_LOAD', '0.5'))
+SPECULATIVE_ATTACH_TIMEOUT = float(os.environ.get('SPECULATIVE_ATTACH_TIMEOUT', '60'))
+
+# AI call scheduling (see summarizer/utils/scheduler.py)
+LLM_SCHEDULER_MAX_CONCURRENCY = int(os.environ.get('LLM_SCHEDULER_MAX_CONCURRENCY', '8'))
+LLM_SCHEDULER_QUEUE_TIMEOUT = float(os.environ.get('LLM_SCHEDULER_QUEUE_TIMEOUT', '30'))
+LLM_SCHEDULER_QUEUE_LIMITS = {
+    'chat': int(os.environ.get('LLM_SCHEDULER_CHAT_QUEUE', '32')),
+    'summarize': int(os.environ.get('LLM_SCHEDULER_SUMMARIZE_QUEUE', '32')),
+    'batch': int(os.environ.get('LLM_SCHEDULER_BATCH_QUEUE', '64')),
+}
+LLM_SCHEDULER_WEIGHTS = {
+    'chat': 6,
+    'summarize': 3,
+    'batch': 1,
+}
+
+# Hedged AI requests (see summarizer/utils/hedging.py)
+LLM_HEDGING_ENABLED = os.environ.get('LLM_HEDGING_ENABLED', 'False') == 'True'
+LLM_HEDGING_PERCENTILE = float(os.environ.get('LLM_HEDGING_PERCENTILE', '0.95'))
+LLM_HEDGING_MIN_DELAY = float(os.environ.get('LLM_HEDGING_MIN_DELAY', '1.0'))
+LLM_HEDGING_DEFAULT_DELAY = float(os.environ.get('LLM_HEDGING_DEFAULT_DELAY', '8.0'))
+LLM_HEDGING_MIN_SAMPLES = int(os.environ.get('LLM_HEDGING_MIN_SAMPLES', '20'))
+LLM_HEDGING_FALLBACK_MODEL = os.environ.get('LLM_HEDGING_FALLBACK_MODEL', '')
+LLM_HEDGING_BUDGET_RATIO = float(os.environ.get('LLM_HEDGING_BUDGET_RATIO', '0.1'))
+LLM_HEDGING_BUDGET_BURST = float(os.environ.get('LLM_HEDGING_BUDGET_BURST', '5'))
+LLM_HEDGING_ATTEMPT_TIMEOUT = float(os.environ.get('LLM_HEDGING_ATTEMPT_TIMEOUT', '60'))
+LLM_HEDGING_MAX_WORKERS = int(os.environ.get('LLM_HEDGING_MAX_WORKERS', '32'))
+
+# Token usage accounting and quotas (see summarizer/usage.py)
+USAGE_BATCH_SIZE = int(os.environ.get('USAGE_BATCH_SIZE', '100'))
+USAGE_FLUSH_INTERVAL = float(os.environ.get('USAGE_FLUSH_INTERVAL', '5'))
+USAGE_QUOTA_REFRESH = float(os.environ.get('USAGE_QUOTA_REFRESH', '30'))
+# USD per million [prompt, completion] tokens, matched by model name prefix
+OPENAI_PRICES = json.loads(os.environ.get('OPENAI_PRICES', '') or json.dumps({
+    'gpt-4o-mini': [0.15, 0.60],
+    'gpt-4o': [2.50, 10.00],
+    'gpt-4-turbo': [10.00, 30.00],
+    'gpt-3.5-turbo': [0.50, 1.50],
+}))
+
 # Security Settings (Uncomment for production)
 if not DEBUG:
-    SECURE_SSL_REDIRECT = True
+    SECURE_SSL_REDIRECT = os.environ.get('SECURE_SSL_REDIRECT', 'True') == 'True'
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
     SECURE_BROWSER_XSS_FILTER = True
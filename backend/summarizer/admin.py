@@ -1,3 +1,50 @@
 from django.contrib import admin
 
-# Register your models here if needed in the future
+from .models import ApiClient, Document, IngestionItem, Summary, Upload, UsageRecord
+
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'content_hash', 'char_count', 'created_at')
+    search_fields = ('filename', 'content_hash')
+
+
+@admin.register(Summary)
+class SummaryAdmin(admin.ModelAdmin):
+    list_display = ('document', 'level', 'position', 'prompt_key', 'word_count', 'created_at')
+    list_filter = ('level', 'prompt_key')
+
+
+@admin.register(ApiClient)
+class ApiClientAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key_prefix', 'monthly_token_quota', 'is_admin', 'is_active', 'created_at')
+    list_filter = ('is_active', 'is_admin')
+    search_fields = ('name', 'key_prefix')
+    # Keys are issued with `manage.py create_api_client`; only their hash is stored
+    readonly_fields = ('key_prefix', 'key_hash')
+
+
+@admin.register(UsageRecord)
+class UsageRecordAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'client', 'endpoint', 'model', 'prompt_tokens', 'completion_tokens', 'cost_usd')
+    list_filter = ('model', 'endpoint')
+
+    # Usage is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'size', 'status', 'client', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(IngestionItem)
+class IngestionItemAdmin(admin.ModelAdmin):
+    list_display = ('path', 'status', 'document', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('path',)
@@ -0,0 +1,125 @@
+"""
+API key authentication for API clients.
+
+Clients send their key in the X-API-Key header. Keys are looked up by
+their SHA-256 hash; lookups are cached briefly in each process so that
+authentication does not cost a query on every request.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+
+from .models import ApiClient
+
+API_KEY_HEADER = 'X-API-Key'
+
+# Seconds a key lookup is reused before the client is read again
+CLIENT_CACHE_SECONDS = 60
+
+
+def hash_key(key: str) -> str:
+    """Hash an API key for storage and lookup."""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def generate_key() -> str:
+    """Create a new random API key."""
+    return f"sk-sum-{secrets.token_urlsafe(32)}"
+
+
+def create_client(name: str, monthly_token_quota: int = 0, is_admin: bool = False) -> Tuple[ApiClient, str]:
+    """
+    Create an API client with a new key.
+
+    Returns:
+        Tuple of (client, key). The key is not stored and cannot be shown again.
+    """
+    key = generate_key()
+    client = ApiClient.objects.create(
+        name=name,
+        key_prefix=key[:12],
+        key_hash=hash_key(key),
+        monthly_token_quota=monthly_token_quota,
+        is_admin=is_admin,
+    )
+    return client, key
+
+
+class ApiKeyAuthentication(BaseAuthentication):
+    """
+    Authenticates requests carrying a valid X-API-Key header.
+
+    The client is both request.user and request.auth. Requests without
+    the header are left anonymous; HasApiKey decides whether that is allowed.
+    """
+    _cache: Dict[str, Tuple[ApiClient, float]] = {}
+    _cache_lock = threading.Lock()
+
+    def authenticate(self, request):
+        key = request.headers.get(API_KEY_HEADER, '').strip()
+        if not key:
+            return None
+        client = self.get_client(hash_key(key))
+        if client is None:
+            raise exceptions.AuthenticationFailed("Invalid or inactive API key.")
+        return client, client
+
+    def authenticate_header(self, request):
+        return 'Api-Key'
+
+    @classmethod
+    def get_client(cls, key_hash: str) -> Optional[ApiClient]:
+        """Look up an active client by key hash, using the process cache."""
+        now = time.monotonic()
+        with cls._cache_lock:
+            cached = cls._cache.get(key_hash)
+        if cached and cached[1] > now:
+            return cached[0]
+        client = ApiClient.objects.filter(key_hash=key_hash, is_active=True).first()
+        if client is not None:
+            # Unknown keys are not cached, so guessing cannot grow the cache
+            with cls._cache_lock:
+                cls._cache[key_hash] = (client, now + CLIENT_CACHE_SECONDS)
+        return client
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        with cls._cache_lock:
+            cls._cache.clear()
+
+
+class HasApiKey(BasePermission):
+    """
+    Requires an authenticated API client when API_KEY_REQUIRED is on.
+    """
+    message = "A valid API key is required in the X-API-Key header."
+
+    def has_permission(self, request, view):
+        return not settings.API_KEY_REQUIRED or isinstance(request.auth, ApiClient)
+
+
+class IsApiClient(BasePermission):
+    """
+    Requires an authenticated API client, even when API_KEY_REQUIRED is off.
+    """
+    message = "This endpoint requires an API key in the X-API-Key header."
+
+    def has_permission(self, request, view):
+        return isinstance(request.auth, ApiClient)
+
+
+class IsAdminClient(BasePermission):
+    """
+    Allows only API clients flagged as admin.
+    """
+    message = "This endpoint requires an admin API key."
+
+    def has_permission(self, request, view):
+        return isinstance(request.auth, ApiClient) and request.auth.is_admin
@@ -2,32 +2,55 @@
 Additional views for chat with document functionality.
 """
 import logging
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 
-from .serializers import FileUploadSerializer
-from .utils.text_extractor import extract_text_from_file
+from .authentication import API_KEY_HEADER, IsApiClient
+from .models import Document
+from .serializers import ExtractTextRequestSerializer
+from .speculation import speculator
+from .storage import content_hash, get_or_create_document
+from .usage import TokenQuotaThrottle, UsageAttributionMixin
+from .utils.text_extractor import extract_pages_from_file, extract_text_from_file
 from .utils.ai_summarizer import ai_summarizer
+from .utils.answer_cache import answer_cache
+from .utils.language import LANGUAGE_CODES, detect_language, get_language, localize
+from .utils.prompts import get_prompt
+from .utils.scheduler import PRIORITY_CHAT, QueueFull
+from .views import overloaded_response
 
 logger = logging.getLogger(__name__)
 
 
-class ExtractTextView(APIView):
+class ExtractTextView(UsageAttributionMixin, APIView):
     """
     API endpoint to extract text from a document without summarizing.
     
     POST /api/extract-text/
     
     Returns the extracted text for chat functionality.
+    
+    Request:
+        - file: The document file (PDF, DOCX, HTML, Markdown or TXT)
+        - mode: Optional payload mode
+            full  - the whole text in one string (default)
+            pages - page offsets and lengths; fetch each page from
+                    /api/documents/<document_id>/pages/<page>/
+            id    - only the document ID and size
+        - speculate: Optional, true to start summarizing the document in the
+                     background for a later /api/summarize/ request; the
+                     response's "speculative" field says whether it started
     """
     parser_classes = [MultiPartParser, FormParser]
     
     def post(self, request):
         """Extract text from uploaded file."""
         # Validate file upload
-        serializer = FileUploadSerializer(data=request.data)
+        serializer = ExtractTextRequestSerializer(data=request.data)
         
         if not serializer.is_valid():
             return Response(
@@ -39,10 +62,15 @@ class ExtractTextView(APIView):
             )
         
         uploaded_file = serializer.validated_data['file']
+        mode = serializer.validated_data['mode']
+        speculate = serializer.validated_data['speculate'] and settings.SPECULATIVE_ENABLED
         
         # Extract text from file
         try:
-            extracted_text, extraction_error = extract_text_from_file(uploaded_file)
+            if mode == ExtractTextRequestSerializer.MODE_FULL:
+                extracted_text, extraction_error = extract_text_from_file(uploaded_file)
+            else:
+                extracted_text, page_spans, extraction_error = extract_pages_from_file(uploaded_file)
             
             if extraction_error:
                 return Response(
@@ -53,14 +81,36 @@ class ExtractTextView(APIView):
                     status=status.HTTP_422_UNPROCESSABLE_ENTITY
                 )
             
-            return Response(
-                {
-                    "text": extracted_text,
-                    "filename": uploaded_file.name,
-                    "status": "success"
-                },
-                status=status.HTTP_200_OK
-            )
+            if mode == ExtractTextRequestSerializer.MODE_FULL:
+                data = {"text": extracted_text, "filename": uploaded_file.name}
+                if speculate:
+                    data["document_id"] = content_hash(extracted_text)
+                    data["speculative"] = speculator.submit(extracted_text, uploaded_file.name)
+                return Response(
+                    {
+                        **data,
+                        "status": "success"
+                    },
+                    status=status.HTTP_200_OK
+                )
+            
+            # Compact modes: store the text and let the client fetch pages lazily
+            document = get_or_create_document(extracted_text, uploaded_file.name, page_spans)
+            data = {
+                "document_id": document.content_hash,
+                "filename": uploaded_file.name,
+                "char_count": document.char_count,
+                "page_count": len(document.page_spans),
+                "status": "success"
+            }
+            if mode == ExtractTextRequestSerializer.MODE_PAGES:
+                data["pages"] = [
+                    {"page": index + 1, "offset": offset, "length": length}
+                    for index, (offset, length) in enumerate(document.page_spans)
+                ]
+            if speculate:
+                data["speculative"] = speculator.submit(extracted_text, uploaded_file.name)
+            return Response(data, status=status.HTTP_200_OK)
             
         except Exception as e:
             logger.error(f"Text extraction error: {str(e)}")
@@ -75,23 +125,121 @@ class ExtractTextView(APIView):
     @staticmethod
     def _format_validation_errors(errors):
         """Format validation errors into user-friendly message."""
-        if 'file' in errors:
-            file_errors = errors['file']
-            if isinstance(file_errors, list) and len(file_errors) > 0:
-                return str(file_errors[0])
-            return str(file_errors)
-        return "Invalid request. Please upload a valid PDF or TXT file."
+        for field in ('file', 'mode'):
+            if field in errors:
+                field_errors = errors[field]
+                if isinstance(field_errors, list) and len(field_errors) > 0:
+                    return str(field_errors[0])
+                return str(field_errors)
+        return "Invalid request. Please upload a valid PDF, DOCX, HTML, Markdown or TXT file."
+
+
+class DocumentPageView(APIView):
+    """
+    API endpoint returning one page of a stored document.
+    
+    GET /api/documents/<document_id>/pages/<page>/
+    
+    Pages are 1-based. Documents are addressed by content hash, so a page
+    never changes and responses may be cached; only privately when API keys
+    are required.
+    """
+    
+    def get(self, request, document_id, page):
+        """Return the text of a single page."""
+        document = Document.objects.filter(content_hash=document_id).only(
+            'content_hash', 'page_spans', 'text'
+        ).first()
+        if document is None:
+            return Response(
+                {
+                    "error": "Document not found",
+                    "status": "failed"
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            text = document.page_text(page)
+        except IndexError:
+            return Response(
+                {
+                    "error": f"Page {page} does not exist",
+                    "status": "failed"
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        response = Response(
+            {
+                "document_id": document.content_hash,
+                "page": page,
+                "page_count": len(document.page_spans),
+                "offset": document.page_spans[page - 1][0],
+                "text": text,
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+        # Shared caches may only keep pages when no API key is needed to read them
+        visibility = 'private' if settings.API_KEY_REQUIRED else 'public'
+        patch_cache_control(response, max_age=settings.DOCUMENT_PAGE_MAX_AGE, **{visibility: True})
+        patch_vary_headers(response, [API_KEY_HEADER])
+        return response
 
 
-class ChatWithDocumentView(APIView):
+class SpeculationView(APIView):
+    """
+    API endpoint cancelling the speculative summary of a document.
+    
+    DELETE /api/documents/<document_id>/speculation/
+    
+    For clients that requested speculate=true from /api/extract-text/ and
+    no longer need the summary, e.g. because the user left the document.
+    Requires an API key, and only cancels the jobs submitted with it
+    (admin keys cancel any), so a client cannot cancel others' work by
+    knowing a document's content hash.
+    """
+    permission_classes = [IsApiClient]
+    
+    def delete(self, request, document_id):
+        """Cancel the document's speculative jobs submitted by this client."""
+        return Response(
+            {
+                "cancelled": speculator.cancel(document_id, request.auth),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ChatWithDocumentView(UsageAttributionMixin, APIView):
     """
     API endpoint for chatting with a document.
     
     POST /api/chat-document/
     
     Accepts a question and document context, returns AI-generated answer.
+    
+    Answers are cached per document, so a repeated or closely rephrased
+    question is answered without an AI call (see utils/answer_cache.py).
+    
+    The prompt is localized for the document's detected language (see
+    utils/language.py). Answers are in output_language if given, else in
+    the language of the question.
+    
+    Request:
+        - question: The question to answer
+        - context: The document text
+        - cache: Optional, false to skip the cached answers and ask the
+                 model again; the new answer replaces the cached one
+        - output_language: Optional language code of the answer
+    
+    The response's "cached" field is "exact" or "similar" for a cached
+    answer, false otherwise.
     """
     parser_classes = [JSONParser]
+    throttle_classes = [TokenQuotaThrottle]
     
     def post(self, request):
         """Answer questions about document context."""
@@ -119,15 +267,35 @@ class ChatWithDocumentView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Create prompt for AI
-            prompt = f"""Based on the following document content, answer the user's question.
-
-Document Content:
-{context[:8000]}
-
-User Question: {question}
-
-Answer the question based only on the information provided in the document. If the answer is not in the document, say so."""
+            output_language = request.data.get('output_language') or None
+            if output_language is not None and output_language not in LANGUAGE_CODES:
+                return Response(
+                    {
+                        "error": f"Unknown output language '{output_language}'",
+                        "status": "failed"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            output_language = get_language(output_language) if output_language else detect_language(question)
+            template = localize(get_prompt('chat'), detect_language(context), output_language)
+            context = context[:template.max_input_chars]
+            
+            # Serve a cached answer to the same or a near-identical question
+            use_cache = settings.CHAT_CACHE_ENABLED
+            document_key = template.cache_key(context)
+            if use_cache and str(request.data.get('cache', True)).lower() in ('false', '0', 'no'):
+                answer_cache.bypass()
+            elif use_cache:
+                answer, match = answer_cache.get(document_key, question)
+                if answer is not None:
+                    return Response(
+                        {
+                            "answer": answer,
+                            "cached": match,
+                            "status": "success"
+                        },
+                        status=status.HTTP_200_OK
+                    )
             
             # Get AI response
             if not ai_summarizer.client:
@@ -140,32 +308,28 @@ Answer the question based only on the information provided in the document. If t
                 )
             
             try:
-                response = ai_summarizer.client.chat.completions.create(
-                    model=ai_summarizer.model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a helpful assistant that answers questions about documents accurately and concisely."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    max_tokens=300,
-                    temperature=0.7,
+                response = ai_summarizer.create_completion(
+                    template,
+                    priority=PRIORITY_CHAT,
+                    context=context,
+                    question=question,
                 )
                 
                 answer = response.choices[0].message.content.strip()
+                if use_cache and answer:
+                    answer_cache.put(document_key, question, answer)
                 
                 return Response(
                     {
                         "answer": answer,
+                        "cached": False,
                         "status": "success"
                     },
                     status=status.HTTP_200_OK
                 )
                 
+            except QueueFull as e:
+                return overloaded_response(e)
             except Exception as ai_error:
                 logger.error(f"AI chat error: {str(ai_error)}")
                 return Response(
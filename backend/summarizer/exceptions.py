@@ -0,0 +1,24 @@
+"""
+REST framework exception handling.
+
+Errors raised by DRF itself (authentication, permissions, throttling,
+malformed requests) are returned in the same {"error", "status"} shape
+as errors produced by the views.
+"""
+from rest_framework.views import exception_handler
+
+
+def api_exception_handler(exc, context):
+    """
+    Reshape DRF's {"detail": ...} error bodies into {"error": ..., "status": "failed"}.
+    """
+    response = exception_handler(exc, context)
+    if response is not None and isinstance(response.data, dict) and 'detail' in response.data:
+        response.data = {
+            "error": str(response.data['detail']),
+            "status": "failed",
+        }
+        wait = getattr(exc, 'wait', None)
+        if wait is not None:
+            response.data["retry_after"] = int(wait)
+    return response
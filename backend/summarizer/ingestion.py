@@ -0,0 +1,380 @@
+"""
+Offline bulk ingestion of document archives.
+
+IngestionPipeline runs three stages connected by bounded queues, so a
+slow stage holds back the ones before it instead of buffering the
+archive in memory:
+
+- extract: a process pool extracts text with the same extractors as the
+  API; at most queue_size files are in flight
+- normalize: the text is keyed by its content hash and stored as a
+  Document, exactly as an upload would be, so a document that is already
+  summarized skips the AI stage
+- summarize: `concurrency` threads generate and store the summary through
+  the same storage helpers as /api/summarize/, at batch priority so live
+  traffic is served first
+
+Every file has an IngestionItem checkpoint. A rerun skips finished files
+and resumes extracted ones at the summarize stage.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import django
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection
+
+from .models import Document, IngestionItem, Summary
+from .storage import (
+    document_language,
+    get_or_create_document,
+    load_chunk_summaries,
+    load_summary,
+    save_chunk_summaries,
+    save_summary,
+)
+from .utils.ai_summarizer import ai_summarizer, summarize_text
+from .utils.incremental import summarize_incremental
+from .utils.routing import STRATEGY_EXTRACTIVE, STRATEGY_MAP_REDUCE, extractive_key, extractive_summary, router
+from .utils.scheduler import PRIORITY_BATCH, QueueFull
+from .utils.text_extractor import extract_pages_from_file
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('extract', 'normalize', 'summarize')
+
+# Shed batch calls are retried this many times, after the scheduler's Retry-After
+MAX_SHED_RETRIES = 20
+
+_DONE = object()
+
+
+def discover(source: Path) -> List[Path]:
+    """
+    Files to ingest from a directory (walked recursively) or a manifest.
+
+    A manifest lists one path per line, relative to the manifest's
+    directory; blank lines and lines starting with # are ignored. Only
+    files with an extension in ALLOWED_FILE_TYPES are returned.
+    """
+    if source.is_dir():
+        paths = (path for path in sorted(source.rglob('*')) if path.is_file())
+    else:
+        lines = (line.strip() for line in source.read_text().splitlines())
+        paths = (source.parent / line for line in lines if line and not line.startswith('#'))
+    allowed = set(settings.ALLOWED_FILE_TYPES)
+    return [path.resolve() for path in paths if path.suffix.lstrip('.').lower() in allowed]
+
+
+def extract_file(path: str) -> Tuple[str, str, List[Tuple[int, int]], str]:
+    """
+    Extract one file; runs in the extraction process pool.
+
+    Returns:
+        Tuple of (path, text, page_spans, error_message)
+    """
+    try:
+        with open(path, 'rb') as source:
+            text, spans, error = extract_pages_from_file(File(source, name=os.path.basename(path)))
+    except OSError as e:
+        return path, "", [], f"Could not read file: {str(e)}"
+    except Exception as e:
+        return path, "", [], f"Failed to process file: {str(e)}"
+    if not error and not text.strip():
+        error = "No text could be extracted from the file."
+    return path, text, spans, error
+
+
+def summarize_document(document: Document, style: Optional[str] = None,
+                       version: Optional[str] = None) -> Tuple[Optional[Summary], str]:
+    """
+    Serve or generate and store a document's summary, as /api/summarize/ does.
+
+    Returns:
+        Tuple of (stored_summary, error_message)
+
+    Raises:
+        QueueFull: If the scheduler sheds the call
+    """
+    language = document_language(document)
+    template = ai_summarizer.get_template(style, version, language)
+    stored = load_summary(document, template.key)
+    if stored is not None:
+        return stored, None
+
+    decision = router.decide(document.text)
+    route = decision.route
+    # Extractive summaries ignore the template, so they are stored under their own key
+    key = extractive_key(route.max_tokens) if route.strategy == STRATEGY_EXTRACTIVE else template.key
+    if key != template.key:
+        stored = load_summary(document, key)
+        if stored is not None:
+            return stored, None
+    with router.track(decision):
+        if route.strategy == STRATEGY_EXTRACTIVE:
+            summary, error = extractive_summary(document.text, route.max_tokens), None
+        elif route.strategy == STRATEGY_MAP_REDUCE:
+            summary, chunks, error = summarize_incremental(
+                document.text, load_chunk_summaries, style=style, version=version, priority=PRIORITY_BATCH,
+                model=route.model, max_tokens=route.max_tokens, language=language, max_chunks=route.max_chunks
+            )
+            if chunks:
+                save_chunk_summaries(document, chunks)
+        else:
+            summary, error = summarize_text(
+                document.text, style=style, version=version, priority=PRIORITY_BATCH,
+                model=route.model, max_tokens=route.max_tokens, language=language
+            )
+        decision.error = error
+    if error:
+        return None, error
+    return save_summary(document, key, summary), None
+
+
+class StageStats:
+    """Documents through one stage, for throughput reporting."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.done = 0
+        self.failed = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+
+    def finish(self) -> None:
+        self.finished = time.monotonic()
+
+    def count(self, failed: bool = False) -> None:
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.done += 1
+
+    @property
+    def rate(self) -> float:
+        """Documents per second since the stage started."""
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"{self.name} {self.done} ({self.rate:.2f} docs/s{failed})"
+
+
+class IngestionPipeline:
+    """
+    Staged, resumable ingestion of many files (see the module docstring).
+
+    Args:
+        workers: Extraction processes
+        concurrency: Summaries generated at the same time
+        queue_size: Capacity of each queue between stages
+        style: Summary style, defaults to SUMMARY_DEFAULT_STYLE
+        version: Prompt template version, defaults to the latest
+        summarize: False to stop after storing the documents
+        retry_failed: Ingest files that failed in an earlier run again
+        report: Called with the stage stats every report_interval seconds
+    """
+
+    def __init__(self, workers: int = 4, concurrency: int = 4, queue_size: int = 32,
+                 style: Optional[str] = None, version: Optional[str] = None,
+                 summarize: bool = True, retry_failed: bool = False,
+                 report: Optional[Callable[[Dict[str, StageStats]], None]] = None,
+                 report_interval: float = 10.0):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.style = style
+        self.version = version
+        self.summarize = summarize
+        self.retry_failed = retry_failed
+        self.report = report
+        self.report_interval = report_interval
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.skipped = 0
+        self._extracted: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._normalized: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._finished = threading.Event()
+
+    def run(self, paths: Iterable[Path]) -> Dict[str, StageStats]:
+        """Ingest the files and return the stats of every stage."""
+        to_extract, to_summarize = self.plan(paths)
+        logger.info(
+            f"Ingesting {len(to_extract)} files, resuming {len(to_summarize)} at summarize, "
+            f"skipping {self.skipped}"
+        )
+
+        threads = [
+            threading.Thread(target=self._extract_stage, args=(to_extract, to_summarize), name='ingest-extract'),
+            threading.Thread(target=self._normalize_stage, name='ingest-normalize'),
+        ]
+        threads += [
+            threading.Thread(target=self._summarize_stage, name=f'ingest-summarize-{index}')
+            for index in range(self.concurrency)
+        ]
+        reporter = threading.Thread(target=self._report_loop, name='ingest-report', daemon=True)
+        for stats in self.stats.values():
+            stats.start()
+        for thread in threads:
+            thread.start()
+        reporter.start()
+        for thread in threads:
+            thread.join()
+        self.stats['summarize'].finish()
+        self._finished.set()
+        return self.stats
+
+    def plan(self, paths: Iterable[Path]) -> Tuple[List[IngestionItem], List[IngestionItem]]:
+        """
+        Checkpoint every file and split them into files to extract and
+        files whose document is already stored.
+        """
+        paths = [str(path) for path in paths]
+        existing = IngestionItem.objects.in_bulk(paths, field_name='path')
+        to_extract, to_summarize = [], []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+                self.skipped += 1
+                continue
+
+            item = existing.get(path)
+            unchanged = item is not None and item.size == stat.st_size and item.mtime == stat.st_mtime
+            if unchanged and item.status == IngestionItem.STATUS_DONE:
+                self.skipped += 1
+                continue
+            if unchanged and item.status == IngestionItem.STATUS_FAILED and not self.retry_failed:
+                self.skipped += 1
+                continue
+            if unchanged and item.status == IngestionItem.STATUS_EXTRACTED and item.document_id:
+                to_summarize.append(item)
+                continue
+
+            if item is None:
+                item = IngestionItem(path=path)
+            item.size, item.mtime = stat.st_size, stat.st_mtime
+            item.status, item.error, item.document, item.summary = IngestionItem.STATUS_PENDING, '', None, None
+            item.save()
+            to_extract.append(item)
+        return to_extract, to_summarize
+
+    def _extract_stage(self, items: List[IngestionItem], resumed: List[IngestionItem]) -> None:
+        stats = self.stats['extract']
+        try:
+            for item in resumed:
+                self._put_normalized(item)
+
+            by_path = {item.path: item for item in items}
+            # Forking while the other stages' threads hold locks (logging, DB) can
+            # deadlock the children, so workers are spawned and set Django up themselves
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=django.setup) as pool:
+                pending = set()
+                for item in items:
+                    if len(pending) >= self.queue_size:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._forward(done, by_path, stats)
+                    pending.add(pool.submit(extract_file, item.path))
+                self._forward(pending, by_path, stats)
+        finally:
+            stats.finish()
+            self._extracted.put(_DONE)
+            connection.close()
+
+    def _forward(self, futures, by_path: Dict[str, IngestionItem], stats: StageStats) -> None:
+        """Hand finished extractions on; blocks while the normalize queue is full."""
+        for future in futures:
+            path, text, spans, error = future.result()
+            item = by_path[path]
+            if error:
+                stats.count(failed=True)
+                self._fail(item, error)
+                continue
+            stats.count()
+            self._extracted.put((item, text, spans))
+
+    def _normalize_stage(self) -> None:
+        stats = self.stats['normalize']
+        try:
+            while True:
+                entry = self._extracted.get()
+                if entry is _DONE:
+                    break
+                item, text, spans = entry
+                try:
+                    item.document = get_or_create_document(text, os.path.basename(item.path), spans)
+                    item.status = IngestionItem.STATUS_EXTRACTED
+                    item.save(update_fields=['document', 'status', 'updated_at'])
+                except Exception as e:
+                    stats.count(failed=True)
+                    self._fail(item, f"Could not store document: {str(e)}")
+                    continue
+                stats.count()
+                self._put_normalized(item)
+        finally:
+            stats.finish()
+            for _ in range(self.concurrency):
+                self._normalized.put(_DONE)
+            connection.close()
+
+    def _put_normalized(self, item: IngestionItem) -> None:
+        if self.summarize:
+            self._normalized.put(item)
+
+    def _summarize_stage(self) -> None:
+        stats = self.stats['summarize']
+        try:
+            while True:
+                item = self._normalized.get()
+                if item is _DONE:
+                    break
+                close_old_connections()
+                try:
+                    stored, error = self._summarize_with_retry(item.document)
+                except Exception as e:
+                    stored, error = None, f"AI summarization failed: {str(e)}"
+                if error:
+                    stats.count(failed=True)
+                    self._fail(item, error)
+                    continue
+                item.summary, item.status, item.error = stored, IngestionItem.STATUS_DONE, ''
+                item.save(update_fields=['summary', 'status', 'error', 'updated_at'])
+                stats.count()
+        finally:
+            connection.close()
+
+    def _summarize_with_retry(self, document: Document) -> Tuple[Optional[Summary], str]:
+        for attempt in range(MAX_SHED_RETRIES):
+            try:
+                return summarize_document(document, self.style, self.version)
+            except QueueFull as e:
+                if attempt == MAX_SHED_RETRIES - 1:
+                    raise
+                time.sleep(e.retry_after)
+
+    @staticmethod
+    def _fail(item: IngestionItem, error: str) -> None:
+        logger.warning(f"Ingestion of {item.path} failed: {error}")
+        item.status, item.error = IngestionItem.STATUS_FAILED, error
+        item.save(update_fields=['status', 'error', 'updated_at'])
+
+    def _report_loop(self) -> None:
+        while self.report is not None and not self._finished.wait(self.report_interval):
+            self.report(self.stats)
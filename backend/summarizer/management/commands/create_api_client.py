@@ -0,0 +1,35 @@
+"""
+Management command issuing an API key for a new client.
+
+Usage:
+    python manage.py create_api_client frontend
+    python manage.py create_api_client partner --quota 2000000
+    python manage.py create_api_client ops --admin
+
+The key is printed once; only its hash is stored.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from summarizer.authentication import create_client
+from summarizer.models import ApiClient
+
+
+class Command(BaseCommand):
+    help = "Create an API client and print its API key."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Unique client name")
+        parser.add_argument('--quota', type=int, default=0,
+                            help="Prompt plus completion tokens allowed per month (default: 0, unlimited)")
+        parser.add_argument('--admin', action='store_true',
+                            help="Allow the client to read usage of all clients")
+
+    def handle(self, *args, **options):
+        if ApiClient.objects.filter(name=options['name']).exists():
+            raise CommandError(f"An API client named '{options['name']}' already exists.")
+        if options['quota'] < 0:
+            raise CommandError("Quota must not be negative.")
+
+        client, key = create_client(options['name'], options['quota'], options['admin'])
+        self.stdout.write(f"Created API client {client.name}")
+        self.stdout.write(f"API key (shown only once): {key}")
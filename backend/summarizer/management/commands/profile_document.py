@@ -0,0 +1,91 @@
+"""
+Management command profiling extraction and summarization of a local file.
+
+Usage:
+    python manage.py profile_document slow.pdf
+    python manage.py profile_document slow.pdf --summarize --style bullet
+    python manage.py profile_document slow.pdf --mode sample --output slow.folded
+    python manage.py profile_document slow.pdf --sort tottime --limit 40
+
+Runs the same code path as an upload (format detection, extraction,
+optionally the AI summary) in this process, so a document that is slow in
+production can be examined offline. Prints the top functions of each
+stage and, with --output, saves the profile (pstats for cprofile,
+collapsed stacks for sample).
+"""
+import io
+import pstats
+import time
+from pathlib import Path
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from summarizer.profiling import MODE_CPROFILE, MODES, profile_call
+from summarizer.utils.ai_summarizer import summarize_text
+from summarizer.utils.text_extractor import extract_text_from_file
+
+
+class Command(BaseCommand):
+    help = "Profile text extraction (and optionally summarization) of a local file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Document to profile")
+        parser.add_argument('--mode', choices=MODES, default=MODE_CPROFILE)
+        parser.add_argument('--summarize', action='store_true', help="Also profile the AI summary")
+        parser.add_argument('--style', default=None, help="Summary style for --summarize")
+        parser.add_argument('--sort', default='cumulative', help="pstats sort key for cprofile output")
+        parser.add_argument('--limit', type=int, default=25, help="Functions or stacks to print per stage")
+        parser.add_argument('--output', default=None,
+                            help="Save the profile here; the stage name is added with --summarize")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"No such file: {path}")
+
+        with open(path, 'rb') as source:
+            (text, error), seconds, profiler = self._run(
+                options, extract_text_from_file, File(source, name=path.name)
+            )
+        if error:
+            self.stdout.write(self.style.WARNING(f"Extraction failed: {error}"))
+        self._report('extract', options, profiler, seconds,
+                     f"{len(text)} characters from {path.stat().st_size} bytes")
+
+        if options['summarize'] and not error:
+            (summary, error), seconds, profiler = self._run(
+                options, summarize_text, text, style=options['style']
+            )
+            if error:
+                self.stdout.write(self.style.WARNING(f"Summarization failed: {error}"))
+            self._report('summarize', options, profiler, seconds, f"{len(summary.split())} words")
+
+    @staticmethod
+    def _run(options, function, *args, **kwargs):
+        started = time.perf_counter()
+        result, profiler = profile_call(options['mode'], function, *args, **kwargs)
+        return result, time.perf_counter() - started, profiler
+
+    def _report(self, stage, options, profiler, seconds, outcome):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{stage}: {seconds:.3f}s, {outcome}"))
+        if options['mode'] == MODE_CPROFILE:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write(stream.getvalue())
+        else:
+            total = profiler.samples or 1
+            self.stdout.write(f"{profiler.samples} samples")
+            for stack, count in profiler.stacks.most_common(options['limit']):
+                frames = stack.split(';')
+                self.stdout.write(f"{count / total:6.1%}  {' <- '.join(reversed(frames[-4:]))}")
+
+        if options['output']:
+            output = Path(options['output'])
+            if options['summarize']:
+                output = output.with_name(f"{output.stem}-{stage}{output.suffix}")
+            if options['mode'] == MODE_CPROFILE:
+                profiler.dump_stats(str(output))
+            else:
+                output.write_text(profiler.collapsed())
+            self.stdout.write(self.style.SUCCESS(f"Saved {stage} profile to {output}"))
@@ -0,0 +1,127 @@
+"""
+Management command reporting per-module import time at startup.
+
+Usage:
+    python manage.py profile_startup
+    python manage.py profile_startup --limit 30 --repeat 5
+    python manage.py profile_startup --eager openai pypdf
+
+Each run starts a fresh interpreter with `-X importtime`, loads the WSGI
+application the way a gunicorn worker does, and serves one request, so
+the numbers reflect a cold worker rather than this already-warm process.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in the child interpreter: load the app, then time one request.
+BOOTSTRAP = """
+import io, json, os, sys, time
+started = time.perf_counter()
+for module in {eager!r}:
+    __import__(module)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+from config.wsgi import application
+ready = time.perf_counter()
+environ = {{
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': {path!r}, 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '443', 'HTTP_HOST': 'localhost',
+    'wsgi.url_scheme': 'https', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+}}
+statuses = []
+body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(body)
+done = time.perf_counter()
+print(json.dumps({{'ready_ms': (ready - started) * 1000, 'first_request_ms': (done - started) * 1000,
+                  'status': statuses[0] if statuses else None}}))
+"""
+
+
+def measure_startup(path: str = '/api/summarize/', eager: Optional[List[str]] = None) -> Dict[str, object]:
+    """
+    Start a fresh interpreter, load the WSGI app and serve one request.
+
+    Args:
+        path: URL path of the first request
+        eager: Modules to import before Django, to compare against eager loading
+
+    Returns:
+        Dict with ready_ms, first_request_ms, the response status and the
+        parsed import-time table (module, self_us, cumulative_us, depth)
+    """
+    code = BOOTSTRAP.format(eager=list(eager or []), path=path)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=str(settings.BASE_DIR),
+        env=dict(os.environ),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_importtime(result.stderr)
+    return timings
+
+
+def parse_importtime(output: str) -> List[Dict[str, object]]:
+    """
+    Parse the stderr of `python -X importtime` into rows.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip())) // 2,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Report per-module import time and time-to-first-request for a cold worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20,
+                            help="Number of slowest modules to list (default: 20)")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Cold starts to time; the median is reported (default: 3)")
+        parser.add_argument('--path', default='/api/summarize/',
+                            help="URL path of the first request (default: /api/summarize/)")
+        parser.add_argument('--eager', nargs='*', default=[],
+                            help="Modules to import up front, e.g. to compare with eager loading")
+        parser.add_argument('--top-level', action='store_true',
+                            help="Only list modules imported directly by the app, not their children")
+
+    def handle(self, *args, **options):
+        runs = [measure_startup(options['path'], options['eager']) for _ in range(max(1, options['repeat']))]
+
+        imports = runs[0]['imports']
+        if options['top_level']:
+            imports = [row for row in imports if row['depth'] == 0]
+        slowest = sorted(imports, key=lambda row: row['cumulative_us'], reverse=True)[:options['limit']]
+
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for row in slowest:
+            self.stdout.write(
+                f"{row['cumulative_us'] / 1000:>14.1f} {row['self_us'] / 1000:>9.1f}  {row['module']}"
+            )
+
+        total_ms = sum(row['self_us'] for row in runs[0]['imports']) / 1000
+        ready = statistics.median(run['ready_ms'] for run in runs)
+        first = statistics.median(run['first_request_ms'] for run in runs)
+        self.stdout.write("")
+        self.stdout.write(f"Total import time:          {total_ms:.1f} ms")
+        self.stdout.write(f"App ready (median of {len(runs)}):   {ready:.1f} ms")
+        self.stdout.write(f"First request done:         {first:.1f} ms ({runs[0]['status']})")
@@ -0,0 +1,20 @@
+"""
+Management command deleting abandoned chunked uploads.
+
+Usage:
+    python manage.py purge_uploads
+
+Removes unfinished uploads not touched for UPLOAD_EXPIRY_HOURS, together
+with their parts on disk. Run it periodically, e.g. from cron.
+"""
+from django.core.management.base import BaseCommand
+
+from summarizer.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete unfinished chunked uploads older than UPLOAD_EXPIRY_HOURS."
+
+    def handle(self, *args, **options):
+        count = purge_expired_uploads()
+        self.stdout.write(f"Purged {count} expired upload(s)")
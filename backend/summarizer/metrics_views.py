@@ -0,0 +1,292 @@
+"""
+Views exposing operational metrics of the summarizer backend.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.http import FileResponse
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+
+from .authentication import IsAdminClient
+from .models import ApiClient, UsageRecord
+from .profiling import list_profiles, profile_path
+from .serializers import UsageQuerySerializer
+from .speculation import speculator
+from .usage import month_start, usage_recorder
+from .utils.answer_cache import answer_cache
+from .utils.hedging import hedger
+from .utils.routing import router
+from .utils.sandbox import sandbox_pool
+from .utils.scheduler import llm_scheduler
+
+
+class SchedulerMetricsView(APIView):
+    """
+    API endpoint for AI call scheduler metrics.
+    
+    GET /api/metrics/scheduler/
+    
+    Returns in-flight calls, per-class queue depths, admission and shed
+    counters, and recent queue wait-time percentiles for this process.
+    """
+    
+    def get(self, request):
+        """Return a snapshot of the scheduler state."""
+        return Response(
+            {
+                "scheduler": llm_scheduler.metrics(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class HedgingMetricsView(APIView):
+    """
+    API endpoint for hedged request metrics.
+    
+    GET /api/metrics/hedging/
+    
+    Returns hedge counters and the observed latency percentiles per model
+    that hedge deadlines are derived from.
+    """
+    
+    def get(self, request):
+        """Return a snapshot of the hedging state."""
+        return Response(
+            {
+                "hedging": hedger.metrics(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class RoutingMetricsView(APIView):
+    """
+    API endpoint for summary routing metrics.
+    
+    GET /api/metrics/routing/
+    
+    Returns the routing rules and, per route, the decisions taken with the
+    AI calls, tokens and cost they produced and their latency percentiles.
+    """
+    
+    def get(self, request):
+        """Return a snapshot of the routing state."""
+        return Response(
+            {
+                "routing": router.metrics(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class SandboxMetricsView(APIView):
+    """
+    API endpoint for sandboxed extraction metrics.
+    
+    GET /api/metrics/sandbox/
+    
+    Returns the sandbox processes of this worker and counters of extracted
+    documents, replaced processes and each limit that tripped.
+    """
+    
+    def get(self, request):
+        """Return a snapshot of the sandbox pool."""
+        return Response(
+            {
+                "sandbox": sandbox_pool.metrics(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ChatCacheMetricsView(APIView):
+    """
+    API endpoint for chat answer cache metrics.
+    
+    GET /api/metrics/chat-cache/
+    
+    Returns the cached answers of this worker and counters of exact and
+    similar hits, misses, bypassed lookups and evictions.
+    """
+    
+    def get(self, request):
+        """Return a snapshot of the answer cache."""
+        return Response(
+            {
+                "chat_cache": answer_cache.metrics(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class SpeculationMetricsView(APIView):
+    """
+    API endpoint for speculative summary metrics.
+    
+    GET /api/metrics/speculation/
+    
+    Returns the jobs in flight, the tokens spent against the hourly budget
+    and counters of completed, attached, cancelled and skipped jobs.
+    """
+    
+    def get(self, request):
+        """Return a snapshot of the speculator."""
+        return Response(
+            {
+                "speculation": speculator.metrics(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class UsageView(APIView):
+    """
+    API endpoint aggregating token usage and spend.
+    
+    GET /api/usage/?since=2024-05-01&until=2024-05-31&group_by=model
+    
+    Groups usage records by client, model, endpoint or day. Admin clients
+    see every client's usage; other clients only their own, together with
+    their monthly quota. Without API keys (development), all usage is shown.
+    """
+    GROUP_FIELDS = {
+        'client': F('client__name'),
+        'model': F('model'),
+        'endpoint': F('endpoint'),
+        'day': TruncDate('created_at', tzinfo=dt_timezone.utc),
+    }
+    
+    def get(self, request):
+        """Return usage totals per group for the requested period."""
+        serializer = UsageQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    "error": " ".join(
+                        f"{field}: {' '.join(str(message) for message in messages)}"
+                        for field, messages in serializer.errors.items()
+                    ),
+                    "status": "failed"
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Include calls still buffered in this process
+        usage_recorder.flush()
+        
+        since = serializer.validated_data.get('since')
+        until = serializer.validated_data.get('until')
+        group_by = serializer.validated_data['group_by']
+        start = datetime.combine(since, time.min, dt_timezone.utc) if since else month_start()
+        records = UsageRecord.objects.filter(created_at__gte=start)
+        if until:
+            records = records.filter(created_at__lt=datetime.combine(until, time.min, dt_timezone.utc) + timedelta(days=1))
+        
+        client = request.auth if isinstance(request.auth, ApiClient) else None
+        if client is not None and not client.is_admin:
+            records = records.filter(client=client)
+        
+        totals = {
+            'calls': Count('id'),
+            'prompt_tokens': Sum('prompt_tokens'),
+            'completion_tokens': Sum('completion_tokens'),
+            'cost_usd': Sum('cost_usd'),
+        }
+        rows = (
+            records.order_by()
+            .annotate(group=self.GROUP_FIELDS[group_by])
+            .values('group')
+            .annotate(**totals)
+            .order_by('group')
+        )
+        data = {
+            "since": start.date().isoformat(),
+            "until": until.isoformat() if until else None,
+            "group_by": group_by,
+            "usage": [{"group": self._format_group(row['group']), **self._format_row(row)} for row in rows],
+            "total": self._format_row(records.order_by().aggregate(**totals)),
+            "status": "success"
+        }
+        if client is not None:
+            data["quota"] = {
+                "monthly_token_quota": client.monthly_token_quota or None,
+                "tokens_used_this_month": usage_recorder.tokens_used(client),
+            }
+        return Response(data, status=status.HTTP_200_OK)
+    
+    @staticmethod
+    def _format_group(group):
+        """Dates as ISO strings; calls without a client are grouped as anonymous."""
+        if hasattr(group, 'isoformat'):
+            return group.isoformat()
+        return group or "anonymous"
+    
+    @staticmethod
+    def _format_row(row):
+        """Turn aggregated values into JSON-friendly numbers."""
+        prompt_tokens = row['prompt_tokens'] or 0
+        completion_tokens = row['completion_tokens'] or 0
+        return {
+            "calls": row['calls'],
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost_usd": float(row['cost_usd'] or 0),
+        }
+
+
+class ProfileListView(APIView):
+    """
+    API endpoint listing stored request profiles.
+    
+    GET /api/profiles/
+    
+    Admin clients only. Profiles are captured by ProfilingMiddleware (see
+    profiling.py) and listed newest first with the request they belong to.
+    """
+    permission_classes = [IsAdminClient]
+    
+    def get(self, request):
+        """Return the metadata of every stored profile."""
+        return Response(
+            {
+                "profiles": list_profiles(),
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class ProfileDownloadView(APIView):
+    """
+    API endpoint downloading one request profile.
+    
+    GET /api/profiles/<profile_id>/
+    
+    Admin clients only. cProfile profiles are in pstats format (.prof),
+    sampled ones are collapsed stacks (.folded).
+    """
+    permission_classes = [IsAdminClient]
+    
+    def get(self, request, profile_id):
+        """Stream the profile file as an attachment."""
+        path = profile_path(profile_id)
+        if path is None:
+            return Response(
+                {
+                    "error": "Profile not found",
+                    "status": "failed"
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
@@ -0,0 +1,119 @@
+"""
+Middleware for the summarizer API.
+"""
+import gzip
+import re
+import zlib
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Optional dependency; gzip is used without it
+    brotli = None
+
+re_accept_encoding = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """
+    Parse an Accept-Encoding header into a mapping of coding to q-value.
+    """
+    codings = {}
+    for item in header.split(','):
+        match = re_accept_encoding.fullmatch(item)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        codings[match.group(1).lower()] = quality
+    return codings
+
+
+def flushed_gzip_sequence(sequence: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip a streamed body, flushing after every chunk.
+
+    Unlike django.utils.text.compress_sequence, which lets zlib buffer,
+    each chunk can be decompressed as soon as it is received, so
+    server-sent events are not held back until the stream ends.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in sequence:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class ResponseCompressionMiddleware:
+    """
+    Compress API responses with brotli or gzip, as negotiated by Accept-Encoding.
+
+    Brotli is used when the optional `brotli` package is installed and the
+    client prefers it; streaming responses are always gzip-compressed and
+    flushed chunk by chunk.
+    Small responses and content types outside RESPONSE_COMPRESSION_TYPES
+    are left alone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def choose_encoding(self, header: str, streaming: bool):
+        """Pick the best coding the client accepts, or None."""
+        codings = parse_accept_encoding(header)
+        wildcard = codings.get('*', 0.0)
+        candidates = []
+        if brotli is not None and not streaming:
+            candidates.append(('br', codings.get('br', wildcard)))
+        candidates.append(('gzip', codings.get('gzip', wildcard)))
+        encoding, quality = max(candidates, key=lambda candidate: candidate[1])
+        return encoding if quality > 0 else None
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in settings.RESPONSE_COMPRESSION_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), response.streaming)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = flushed_gzip_sequence(
+                response.streaming_content, settings.RESPONSE_GZIP_LEVEL
+            )
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=settings.RESPONSE_BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(
+                    response.content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0
+                )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A compressed representation is no longer byte-identical; see RFC 9110 8.8.1
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-19 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('text', models.TextField()),
+                ('char_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Summary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('section', 'Section'), ('detailed', 'Detailed'), ('paragraph', 'Paragraph'), ('tldr', 'TL;DR')], max_length=32)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('prompt_key', models.CharField(max_length=64)),
+                ('text', models.TextField()),
+                ('word_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='summarizer.document')),
+            ],
+            options={
+                'ordering': ['document', 'level', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='summary',
+            constraint=models.UniqueConstraint(fields=('document', 'level', 'position', 'prompt_key'), name='unique_summary_level'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='page_spans',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
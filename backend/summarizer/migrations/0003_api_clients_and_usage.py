@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0002_document_page_spans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('key_prefix', models.CharField(max_length=12)),
+                ('key_hash', models.CharField(max_length=64, unique=True)),
+                ('monthly_token_quota', models.PositiveBigIntegerField(default=0)),
+                ('is_admin', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(blank=True, max_length=64)),
+                ('model', models.CharField(max_length=64)),
+                ('prompt_key', models.CharField(blank=True, max_length=64)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField()),
+                ('client', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='usage_records', to='summarizer.apiclient')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['client', 'created_at'], name='usage_client_created')],
+            },
+        ),
+    ]
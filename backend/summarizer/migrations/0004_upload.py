@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:19
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0003_api_clients_and_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('part_size', models.PositiveIntegerField()),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete'), ('failed', 'Failed')], default='uploading', max_length=16)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='summarizer.apiclient')),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='summarizer.document')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.1 on 2026-10-19 18:20
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_digests(apps, schema_editor):
+    Summary = apps.get_model('summarizer', 'Summary')
+    for summary in Summary.objects.select_related('document').iterator():
+        source = (f"{summary.document.content_hash}\x00{summary.prompt_key}\x00"
+                  f"{summary.level}\x00{summary.position}")
+        summary.digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        summary.save(update_fields=['digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0004_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='digest',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='summary',
+            name='digest',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='summary',
+            name='level',
+            field=models.CharField(choices=[('summary', 'Summary'), ('section', 'Section'), ('detailed', 'Detailed'), ('paragraph', 'Paragraph'), ('tldr', 'TL;DR')], max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0005_summary_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='chunk_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='summary',
+            name='level',
+            field=models.CharField(choices=[('summary', 'Summary'), ('section', 'Section'), ('chunk', 'Chunk'), ('detailed', 'Detailed'), ('paragraph', 'Paragraph'), ('tldr', 'TL;DR')], max_length=32),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0006_summary_chunk_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('mtime', models.FloatField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('extracted', 'Extracted'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_items', to='summarizer.document')),
+                ('summary', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_items', to='summarizer.summary')),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('summarizer', '0007_ingestionitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='language',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+    ]
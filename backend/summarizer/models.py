@@ -1,4 +1,263 @@
+"""
+Database models for the summarizer app.
+
+Documents are keyed by the hash of their extracted text so that repeat
+uploads of the same content reuse stored work instead of calling the AI
+again.
+"""
+import hashlib
+import uuid
+
 from django.db import models
 
-# Models can be added here if you need to store summaries or track uploads
-# For now, we're keeping it stateless
+
+class Document(models.Model):
+    """
+    Extracted text of an uploaded document.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    filename = models.CharField(max_length=255, blank=True)
+    text = models.TextField()
+    char_count = models.PositiveIntegerField(default=0)
+    # [offset, length] of each page within text, for lazy page-by-page delivery
+    page_spans = models.JSONField(default=list, blank=True)
+    # Code of the detected language (see utils/language.py), blank until detected
+    language = models.CharField(max_length=8, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename or 'document'} ({self.content_hash[:12]})"
+
+    def page_text(self, page: int) -> str:
+        """
+        Text of a 1-based page.
+
+        Raises:
+            IndexError: If the page does not exist
+        """
+        if page < 1:
+            raise IndexError(page)
+        offset, length = self.page_spans[page - 1]
+        return self.text[offset:offset + length]
+
+
+class Summary(models.Model):
+    """
+    A stored summary of a document.
+
+    Pyramid summaries are stored one row per level ("section" rows carry
+    their position in the document), tagged with the key of the prompt
+    template that produced them so that a new template version is never
+    served from stale rows. Direct summaries in a given style are stored
+    at the "summary" level. Long documents also store one "chunk" row per
+    content-defined chunk (see utils/incremental.py), with the hash of the
+    chunk's text, so later versions of the document reuse them.
+
+    Every row is addressable at /api/summaries/<digest>/. The digest is
+    derived from the document's content hash, the prompt key (template
+    name and version), the level and the position. Rows can be regenerated
+    under the same digest, so the ETag also covers the summary text.
+    """
+    LEVEL_SUMMARY = 'summary'
+    LEVEL_SECTION = 'section'
+    LEVEL_CHUNK = 'chunk'
+    LEVEL_DETAILED = 'detailed'
+    LEVEL_PARAGRAPH = 'paragraph'
+    LEVEL_TLDR = 'tldr'
+    LEVEL_CHOICES = [
+        (LEVEL_SUMMARY, 'Summary'),
+        (LEVEL_SECTION, 'Section'),
+        (LEVEL_CHUNK, 'Chunk'),
+        (LEVEL_DETAILED, 'Detailed'),
+        (LEVEL_PARAGRAPH, 'Paragraph'),
+        (LEVEL_TLDR, 'TL;DR'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='summaries')
+    level = models.CharField(max_length=32, choices=LEVEL_CHOICES)
+    position = models.PositiveIntegerField(default=0)
+    prompt_key = models.CharField(max_length=64)
+    text = models.TextField()
+    word_count = models.PositiveIntegerField(default=0)
+    digest = models.CharField(max_length=64, unique=True)
+    # SHA-256 of the chunk's text, for "chunk" rows only
+    chunk_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['document', 'level', 'position']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'level', 'position', 'prompt_key'],
+                name='unique_summary_level',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.level} summary of {self.document}"
+
+    @staticmethod
+    def make_digest(content_hash: str, prompt_key: str, level: str, position: int = 0) -> str:
+        """Identify a summary by what it was generated from."""
+        source = f"{content_hash}\x00{prompt_key}\x00{level}\x00{position}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag of the stored summary, which changes whenever its text does."""
+        source = f"{self.digest}\x00{self.text}"
+        version = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        return f'"{version}"'
+
+
+class ApiClient(models.Model):
+    """
+    A consumer of the API, identified by an API key.
+
+    Only a SHA-256 hash of the key is stored; the prefix is kept in clear
+    text so that keys can be told apart in the admin and in logs.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    key_prefix = models.CharField(max_length=12)
+    key_hash = models.CharField(max_length=64, unique=True)
+    # Prompt plus completion tokens allowed per calendar month; 0 means unlimited
+    monthly_token_quota = models.PositiveBigIntegerField(default=0)
+    # Admin clients may read usage of every client
+    is_admin = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.key_prefix}...)"
+
+    @property
+    def is_authenticated(self) -> bool:
+        """Lets DRF treat the client as the request's user."""
+        return True
+
+
+class UsageRecord(models.Model):
+    """
+    Token usage of a single AI call.
+
+    The table is append-only and written in batches (see usage.py). It
+    has no foreign key constraint and a single index, so inserts stay
+    cheap; rows survive deletion of their client.
+    """
+    client = models.ForeignKey(
+        ApiClient, null=True, blank=True, on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name='usage_records',
+    )
+    endpoint = models.CharField(max_length=64, blank=True)
+    model = models.CharField(max_length=64)
+    prompt_key = models.CharField(max_length=64, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['client', 'created_at'], name='usage_client_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.prompt_tokens}+{self.completion_tokens} tokens on {self.model}"
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class Upload(models.Model):
+    """
+    A chunked, resumable upload of a large document.
+
+    Parts are written to disk as they arrive (see uploads.py); the files
+    on disk are the record of which parts have been received, so parts can
+    be sent concurrently and resent after a failure.
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    client = models.ForeignKey(ApiClient, null=True, blank=True, on_delete=models.SET_NULL, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    part_size = models.PositiveIntegerField()
+    # Optional SHA-256 of the whole file, checked when the parts are assembled
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    error = models.TextField(blank=True)
+    document = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL, related_name='uploads')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def part_count(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    def expected_part_size(self, part: int) -> int:
+        """Size in bytes of a 1-based part; only the last part may be shorter."""
+        if part < self.part_count:
+            return self.part_size
+        return self.size - self.part_size * (self.part_count - 1)
+
+
+class IngestionItem(models.Model):
+    """
+    Checkpoint of one file in a bulk ingestion (see ingestion.py).
+
+    The status moves from pending through extracted (the document is
+    stored) to done (its summary is stored), so an interrupted run resumes
+    each file at the stage it had reached. A file whose size or mtime has
+    changed since is ingested again.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_EXTRACTED = 'extracted'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_EXTRACTED, 'Extracted'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    path = models.CharField(max_length=1024, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    mtime = models.FloatField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True)
+    document = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL,
+                                 related_name='ingestion_items')
+    summary = models.ForeignKey(Summary, null=True, blank=True, on_delete=models.SET_NULL,
+                                related_name='ingestion_items')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['path']
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
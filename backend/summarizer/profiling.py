@@ -0,0 +1,242 @@
+"""
+Opt-in profiling of API requests.
+
+With PROFILING_ENABLED, ProfilingMiddleware profiles a request's view
+when either
+- an admin API client sends the X-Profile header ("cprofile" or "sample"), or
+- the request is picked by PROFILING_SAMPLE_RATE, in PROFILING_SAMPLE_MODE.
+
+Two profilers are available:
+- cprofile: deterministic cProfile of the request thread, including pypdf
+  and openai internals; saved in pstats format for snakeviz or pstats
+- sample: a background thread records the request thread's stack every
+  PROFILING_SAMPLE_INTERVAL seconds; far cheaper on long requests, saved
+  as collapsed stacks for flamegraph.pl or speedscope
+
+Profiles are written to PROFILING_DIR with a JSON sidecar describing the
+request, and downloaded from /api/profiles/ by admin clients. The newest
+PROFILING_MAX_FILES are kept.
+
+Both profilers only see the request thread. Work handed to thread pools
+(pyramid sections, OCR workers) shows up as time spent waiting on them.
+
+When PROFILING_ENABLED is off the middleware removes itself from the
+chain at startup (MiddlewareNotUsed), so requests pay nothing.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import ApiKeyAuthentication
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLE = 'sample'
+MODES = (MODE_CPROFILE, MODE_SAMPLE)
+EXTENSIONS = {MODE_CPROFILE: '.prof', MODE_SAMPLE: '.folded'}
+
+re_profile_id = re.compile(r'^[0-9a-f]{32}$')
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval.
+
+    Samples are aggregated as collapsed stacks ("outer;inner;leaf"), one
+    line per distinct stack with its count, the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """The samples as collapsed stacks, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_call(mode: str, function: Callable, *args, **kwargs) -> Tuple[object, object]:
+    """
+    Run a function under a profiler.
+
+    Args:
+        mode: "cprofile" or "sample"
+        function: Callable to profile
+
+    Returns:
+        Tuple of (result, profiler). The profiler is a cProfile.Profile or
+        a StackSampler.
+    """
+    if mode == MODE_CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return function(*args, **kwargs), profiler
+        finally:
+            profiler.disable()
+
+    profiler = StackSampler(settings.PROFILING_SAMPLE_INTERVAL)
+    profiler.start()
+    try:
+        return function(*args, **kwargs), profiler
+    finally:
+        profiler.stop()
+
+
+def profile_dir() -> Path:
+    return Path(settings.PROFILING_DIR)
+
+
+def save_profile(profiler, mode: str, meta: Dict[str, object]) -> str:
+    """
+    Write a profile and its metadata to PROFILING_DIR.
+
+    Returns:
+        The new profile's ID
+    """
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    path = directory / f"{profile_id}{EXTENSIONS[mode]}"
+    if mode == MODE_CPROFILE:
+        profiler.dump_stats(str(path))
+    else:
+        path.write_text(profiler.collapsed())
+        meta['samples'] = profiler.samples
+    meta.update(id=profile_id, mode=mode, file=path.name, created_at=timezone.now().isoformat())
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta))
+    prune_profiles(settings.PROFILING_MAX_FILES)
+    return profile_id
+
+
+def list_profiles() -> List[Dict[str, object]]:
+    """Metadata of the stored profiles, newest first."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in directory.glob('*.json'):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda meta: meta.get('created_at', ''), reverse=True)
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Path of a stored profile, or None if there is no such profile."""
+    if not re_profile_id.match(profile_id):
+        return None
+    for extension in EXTENSIONS.values():
+        path = profile_dir() / f"{profile_id}{extension}"
+        if path.is_file():
+            return path
+    return None
+
+
+def prune_profiles(keep: int) -> None:
+    """Delete all but the newest `keep` profiles."""
+    for meta in list_profiles()[keep:]:
+        for name in (meta.get('file'), f"{meta.get('id')}.json"):
+            if name:
+                (profile_dir() / name).unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """
+    Profile the views of selected requests (see the module docstring).
+
+    Place it last in MIDDLEWARE so that only the view is measured.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        response, profiler = profile_call(mode, self.get_response, request)
+        duration = time.perf_counter() - started
+        try:
+            profile_id = save_profile(profiler, mode, {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 1),
+            })
+        except OSError as e:
+            logger.warning(f"Could not save profile of {request.path}: {str(e)}")
+            return response
+        logger.info(f"Profiled {request.method} {request.path} ({mode}, {duration:.2f}s): {profile_id}")
+        response[PROFILE_ID_HEADER] = profile_id
+        return response
+
+    def requested_mode(self, request) -> Optional[str]:
+        """The profiler to run for this request, or None."""
+        header = request.headers.get(PROFILE_HEADER, '').strip().lower()
+        if header and self.is_admin(request):
+            return header if header in MODES else MODE_CPROFILE
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate > 0 and random.random() < rate:
+            return settings.PROFILING_SAMPLE_MODE
+        return None
+
+    @staticmethod
+    def is_admin(request) -> bool:
+        """Whether the request carries an admin API key."""
+        try:
+            result = ApiKeyAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return result is not None and result[0].is_admin
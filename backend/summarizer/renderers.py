@@ -0,0 +1,29 @@
+"""
+Renderers for API responses.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Optional dependency; the stdlib encoder is used without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that uses orjson when it is installed.
+
+    Extracted documents make responses dominated by one large string, which
+    orjson encodes several times faster than the stdlib encoder. Output is
+    compact UTF-8, matching DRF's defaults. Indented (browsable) output and
+    installs without orjson fall back to DRF's JSONRenderer.
+    """
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self._encoder.default)
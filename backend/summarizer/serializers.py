@@ -4,18 +4,23 @@ Serializers for file upload validation.
 from rest_framework import serializers
 from django.conf import settings
 
+from .utils.language import LANGUAGE_CODES
+from .utils.prompts import STRUCTURED_PROMPT, SUMMARY_STYLES, registry
+from .utils.pyramid import parse_length
+
 
 class FileUploadSerializer(serializers.Serializer):
     """
     Serializer for validating uploaded files.
-    Only accepts PDF and TXT files within size limits.
+    Only accepts supported document types (ALLOWED_FILE_TYPES) within size limits.
     """
     file = serializers.FileField(required=True)
 
     def validate_file(self, file):
         """
         Validate uploaded file:
-        - Check file type (PDF or TXT only)
+        - Check file type (extension in ALLOWED_FILE_TYPES; the content is
+          checked when the text is extracted)
         - Check file size
         - Ensure file is not empty
         """
@@ -43,6 +48,134 @@ class FileUploadSerializer(serializers.Serializer):
         return file
 
 
+class ExtractTextRequestSerializer(FileUploadSerializer):
+    """
+    Serializer for text extraction requests.
+    
+    mode selects the response payload:
+    - full: the whole extracted text (default)
+    - pages: page offsets and lengths only; pages are fetched separately
+    - id: the stored document ID only
+    
+    speculate=true also starts summarizing the document in the background,
+    so that a later summary request is served at once (see speculation.py).
+    """
+    MODE_FULL = 'full'
+    MODE_PAGES = 'pages'
+    MODE_ID = 'id'
+    mode = serializers.ChoiceField(choices=[MODE_FULL, MODE_PAGES, MODE_ID], default=MODE_FULL)
+    speculate = serializers.BooleanField(default=False)
+
+
+class SummarizeRequestSerializer(FileUploadSerializer):
+    """
+    Serializer for summarization requests.
+    Adds the optional summary style, prompt version and length to the file upload.
+    
+    output=structured returns a JSON summary (see utils/structured.py)
+    instead of text; with stream=true its fields are sent as server-sent
+    events while the model generates them.
+    
+    output_language (a code such as "en" or "de") asks for the summary, in
+    any output or length, in that language instead of the document's (see
+    utils/language.py).
+    """
+    OUTPUT_TEXT = 'text'
+    OUTPUT_STRUCTURED = 'structured'
+    style = serializers.ChoiceField(choices=SUMMARY_STYLES, required=False)
+    prompt_version = serializers.CharField(required=False, max_length=32)
+    length = serializers.CharField(required=False, max_length=16)
+    output = serializers.ChoiceField(choices=[OUTPUT_TEXT, OUTPUT_STRUCTURED], default=OUTPUT_TEXT)
+    stream = serializers.BooleanField(default=False)
+    output_language = serializers.ChoiceField(choices=LANGUAGE_CODES, required=False)
+
+    def validate_length(self, length):
+        """
+        Accept a pyramid level name (tldr, paragraph, detailed) or a word count.
+        """
+        if parse_length(length) is None:
+            raise serializers.ValidationError(
+                "Length must be tldr, paragraph, detailed or a positive number of words."
+            )
+        return length
+
+    def validate(self, attrs):
+        """
+        Ensure the requested prompt version exists for the chosen style, and
+        that structured output is not combined with a length.
+        """
+        structured = attrs.get('output') == self.OUTPUT_STRUCTURED
+        if structured and attrs.get('length'):
+            raise serializers.ValidationError(
+                {'output': "Structured output cannot be combined with a length."}
+            )
+        if attrs.get('stream') and not structured:
+            raise serializers.ValidationError(
+                {'stream': "Streaming is only available with output=structured."}
+            )
+        
+        version = attrs.get('prompt_version')
+        if version:
+            style = STRUCTURED_PROMPT if structured else attrs.get('style') or settings.SUMMARY_DEFAULT_STYLE
+            if not registry.has(style, version):
+                raise serializers.ValidationError(
+                    {'prompt_version': f"Unknown prompt version '{version}' for style '{style}'."}
+                )
+        return attrs
+
+
+class UploadInitSerializer(serializers.Serializer):
+    """
+    Serializer for starting a chunked upload.
+    
+    sha256 is optional; when given, the assembled file is checked against it.
+    """
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
+
+    def validate_filename(self, filename):
+        """
+        Check the file type the same way single-request uploads do.
+        """
+        file_extension = filename.split('.')[-1].lower()
+        if file_extension not in settings.ALLOWED_FILE_TYPES:
+            raise serializers.ValidationError(
+                f"Invalid file type. Only {', '.join(settings.ALLOWED_FILE_TYPES)} files are allowed."
+            )
+        return filename
+
+    def validate_size(self, size):
+        """
+        Check the size against the chunked upload limit.
+        """
+        if size > settings.UPLOAD_MAX_SIZE:
+            max_size_mb = settings.UPLOAD_MAX_SIZE / (1024 * 1024)
+            raise serializers.ValidationError(f"File size exceeds maximum limit of {max_size_mb:g}MB.")
+        return size
+
+
+class UsageQuerySerializer(serializers.Serializer):
+    """
+    Serializer for usage aggregation queries.
+    
+    since and until are inclusive dates; since defaults to the start of
+    the current month.
+    """
+    GROUP_BY_CHOICES = ['client', 'model', 'endpoint', 'day']
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, default='client')
+
+    def validate(self, attrs):
+        """
+        Ensure the date range is not reversed.
+        """
+        if attrs.get('since') and attrs.get('until') and attrs['since'] > attrs['until']:
+            raise serializers.ValidationError({'since': "since must not be after until."})
+        return attrs
+
+
 class SummaryResponseSerializer(serializers.Serializer):
     """
     Serializer for summary response.
@@ -0,0 +1,300 @@
+"""
+Speculative summaries of documents extracted for later summarizing.
+
+Clients that call /api/extract-text/ first and ask for the summary later
+would pay the full AI latency on the second request, although the text has
+been on the server all along. With speculate=true the extract-text view
+hands the text to the Speculator, which summarizes it in the background
+and stores the summary exactly as /api/summarize/ would, so the later
+request finds it stored. A request arriving while the job runs waits for
+it instead of paying twice, and the job's calls are promoted to the
+request's priority (see LLMScheduler.promote) so the request is not
+starved behind batch work; a job that has not started yet is dropped and
+the request summarizes at its own, higher priority.
+
+Speculation only spends spare capacity:
+
+- calls run at batch priority, behind chat and summary requests
+- a job is only queued, and only started, while the scheduler's load
+  (calls in flight and waiting per slot) is below SPECULATIVE_MAX_LOAD
+- documents over SPECULATIVE_MAX_CHARS are skipped, and the estimated
+  input tokens of the last hour may not exceed SPECULATIVE_TOKEN_BUDGET
+- clients over their monthly quota are not speculated for
+
+Jobs are summarized in the default style and prompt version, and can be
+cancelled per document with DELETE /api/documents/<document_id>/speculation/
+by the API client that submitted them (or an admin client).
+Cancelling a running job cancels its call group in the scheduler, so it
+stops at its next AI call; calls already upstream finish.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import copy_context
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .ingestion import summarize_document
+from .models import ApiClient, Summary
+from .storage import content_hash, get_or_create_document
+from .usage import usage_context, usage_recorder
+from .utils.ai_summarizer import ai_summarizer
+from .utils.language import detect_language
+from .utils.routing import DocumentFeatures
+from .utils.scheduler import PRIORITY_SUMMARIZE, CallCancelled, QueueFull, call_group, llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Window of the token budget, in seconds
+BUDGET_WINDOW = 3600
+
+
+class SpeculativeJob:
+    """A background summary of one document in one prompt template."""
+
+    def __init__(self, digest: str, template_key: str, text: str, filename: str, tokens: int,
+                 client_id: Optional[int] = None):
+        self.digest = digest
+        self.template_key = template_key
+        self.text = text
+        self.filename = filename
+        self.tokens = tokens
+        # API client that submitted the job, the only one allowed to cancel it
+        self.client_id = client_id
+        self.cancelled = False
+        self.future: Optional[Future] = None
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.digest, self.template_key
+
+
+class Speculator:
+    """
+    Runs speculative summaries in the background within a budget.
+
+    Args:
+        workers: Documents summarized at once
+        max_pending: Jobs allowed to wait for a worker
+        max_chars: Longest document speculated on
+        token_budget: Estimated input tokens speculated on per hour
+        max_load: Scheduler load at or above which nothing is speculated
+        attach_timeout: Seconds a summary request waits for a running job
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = 8, max_chars: int = 200000,
+                 token_budget: int = 500000, max_load: float = 0.5, attach_timeout: float = 60.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_chars = max_chars
+        self.token_budget = token_budget
+        self.max_load = max_load
+        self.attach_timeout = attach_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speculation')
+        self._jobs: Dict[Tuple[str, str], SpeculativeJob] = {}
+        # (time, estimated tokens) of jobs in the budget window
+        self._spent: deque = deque()
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    @classmethod
+    def from_settings(cls) -> 'Speculator':
+        return cls(
+            workers=settings.SPECULATIVE_WORKERS,
+            max_pending=settings.SPECULATIVE_MAX_PENDING,
+            max_chars=settings.SPECULATIVE_MAX_CHARS,
+            token_budget=settings.SPECULATIVE_TOKEN_BUDGET,
+            max_load=settings.SPECULATIVE_MAX_LOAD,
+            attach_timeout=settings.SPECULATIVE_ATTACH_TIMEOUT,
+        )
+
+    def submit(self, text: str, filename: str = '') -> bool:
+        """
+        Start summarizing a document in the background if the budget and load allow.
+
+        AI calls are attributed to the client of the current request.
+
+        Returns:
+            Whether a job for the document is running or queued
+        """
+        skipped = self._skip_reason(text)
+        if skipped:
+            self._count(f'skipped_{skipped}')
+            logger.info(f"Not speculating on {filename or 'document'}: {skipped.replace('_', ' ')}")
+            return False
+
+        template = ai_summarizer.get_template(language=detect_language(text))
+        tokens = DocumentFeatures.from_text(text).tokens
+        client = usage_context.get().client
+        job = SpeculativeJob(
+            content_hash(text), template.key, text, filename, tokens, client.pk if client is not None else None
+        )
+        with self._lock:
+            if job.key in self._jobs:
+                return True
+            now = time.monotonic()
+            while self._spent and self._spent[0][0] <= now - BUDGET_WINDOW:
+                self._spent.popleft()
+            if sum(spent for _, spent in self._spent) + tokens > self.token_budget:
+                self._counters['skipped_over_budget'] += 1
+                return False
+            if len(self._jobs) >= self.workers + self.max_pending:
+                self._counters['skipped_queue_full'] += 1
+                return False
+            self._spent.append((now, tokens))
+            self._jobs[job.key] = job
+            self._counters['submitted'] += 1
+            job.future = self._executor.submit(copy_context().run, self._run, job)
+        job.future.add_done_callback(lambda future: self._finished(job, future))
+        logger.info(f"Speculating on {filename or 'document'} {job.digest[:12]} ({tokens} tokens)")
+        return True
+
+    def _skip_reason(self, text: str) -> Optional[str]:
+        if not ai_summarizer.client:
+            return 'not_configured'
+        if len(text) > self.max_chars:
+            return 'too_long'
+        if llm_scheduler.load() >= self.max_load:
+            return 'busy'
+        client = usage_context.get().client
+        if client is not None and client.monthly_token_quota and \
+                usage_recorder.tokens_used(client) >= client.monthly_token_quota:
+            return 'over_quota'
+        return None
+
+    def _run(self, job: SpeculativeJob) -> Tuple[Optional[Summary], Optional[str]]:
+        """Summarize and store one document; runs on a speculation thread."""
+        close_old_connections()
+        # Tag the job's AI calls, so a request that attaches can promote them
+        token = call_group.set(job)
+        try:
+            if job.cancelled:
+                return None, "Cancelled"
+            if llm_scheduler.load() >= self.max_load:
+                # Live traffic arrived while the job was waiting
+                return None, "The AI service became busy"
+            document = get_or_create_document(job.text, job.filename)
+            try:
+                return summarize_document(document)
+            except QueueFull as e:
+                return None, str(e)
+            except CallCancelled:
+                return None, "Cancelled"
+        finally:
+            call_group.reset(token)
+            llm_scheduler.forget(job)
+            job.text = ''
+            connection.close()
+
+    def _finished(self, job: SpeculativeJob, future: Future) -> None:
+        # Drops a cancellation that arrived after _run returned
+        llm_scheduler.forget(job)
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+        if future.cancelled() or job.cancelled:
+            self._count('cancelled')
+            return
+        error = future.exception()
+        if error is None:
+            stored, error = future.result()
+        if error:
+            self._count('failed')
+            logger.info(f"Speculative summary of {job.digest[:12]} not made: {error}")
+        else:
+            self._count('completed')
+            logger.info(f"Stored speculative summary {stored.digest[:12]} of {job.digest[:12]}")
+
+    def attach(self, digest: str, template_key: str, priority: str = PRIORITY_SUMMARIZE) -> Optional[Summary]:
+        """
+        Wait for the running speculative summary of a document, if there is one.
+
+        A job still waiting for a worker is cancelled instead, so the caller
+        summarizes at its own priority rather than queueing behind it. A
+        running job's AI calls are promoted to the caller's priority.
+
+        Returns:
+            The stored summary, or None if there was no job or it failed
+        """
+        with self._lock:
+            job = self._jobs.get((digest, template_key))
+        if job is None:
+            return None
+        if job.future.cancel():
+            self._count('preempted')
+            return None
+        llm_scheduler.promote(job, priority)
+        self._count('promoted')
+        if job.future.done():
+            # Finished while being promoted; nothing is left to serve faster
+            llm_scheduler.forget(job)
+        try:
+            stored, error = job.future.result(timeout=self.attach_timeout)
+        except (CancelledError, FutureTimeout):
+            return None
+        except Exception as e:
+            logger.warning(f"Speculative summary of {digest[:12]} failed: {str(e)}")
+            return None
+        if error:
+            return None
+        self._count('attached')
+        return stored
+
+    def cancel(self, digest: str, client: Optional[ApiClient] = None) -> int:
+        """
+        Cancel the speculative jobs of a document that the client submitted.
+
+        Admin clients may cancel any job; without a client nothing is cancelled.
+
+        A job that is already running stops at its next AI call, and its
+        calls waiting for a slot are withdrawn; calls already upstream finish.
+
+        Returns:
+            Number of jobs cancelled
+        """
+        if client is None:
+            return 0
+        with self._lock:
+            jobs = [
+                job for key, job in self._jobs.items()
+                if key[0] == digest and (client.is_admin or job.client_id == client.pk)
+            ]
+        for job in jobs:
+            job.cancelled = True
+            if not job.future.cancel():
+                llm_scheduler.cancel(job)
+                if job.future.done():
+                    # Finished meanwhile; _finished has already run
+                    llm_scheduler.forget(job)
+        return len(jobs)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def metrics(self) -> Dict[str, object]:
+        """Jobs in flight, tokens spent in the budget window and outcome counters."""
+        now = time.monotonic()
+        with self._lock:
+            spent = sum(tokens for started, tokens in self._spent if started > now - BUDGET_WINDOW)
+            return {
+                "enabled": settings.SPECULATIVE_ENABLED,
+                "jobs": len(self._jobs),
+                "budget_tokens": self.token_budget,
+                "spent_tokens": spent,
+                **self._counters,
+            }
+
+    def shutdown(self) -> None:
+        """Cancel every job that has not started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Create a singleton instance shared by every request in the process
+speculator = Speculator.from_settings()
+atexit.register(speculator.shutdown)
@@ -0,0 +1,201 @@
+"""
+Storage helpers for documents and their summaries.
+
+Views go through these functions rather than the ORM directly so that
+all code paths store and look up documents the same way.
+"""
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+
+from .models import Document, Summary
+from .utils.incremental import chunk_key
+from .utils.language import Language, detect_language, get_language
+from .utils.pyramid import LEVELS, pyramid_key, word_count
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash extracted text to identify a document by its content.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_or_create_document(text: str, filename: str = '',
+                           page_spans: Optional[List[Tuple[int, int]]] = None) -> Document:
+    """
+    Return the stored document for this text, creating it if needed.
+
+    Args:
+        text: Extracted document text
+        filename: Original file name, recorded on first upload
+        page_spans: Optional (offset, length) of each page within text
+
+    Returns:
+        Document instance
+    """
+    digest = content_hash(text)
+    spans = [list(span) for span in page_spans or []]
+    try:
+        document, created = Document.objects.get_or_create(
+            content_hash=digest,
+            defaults={
+                'filename': filename[:255],
+                'text': text,
+                'char_count': len(text),
+                'page_spans': spans,
+                'language': detect_language(text).code,
+            },
+        )
+    except IntegrityError:
+        # Another request stored the same content concurrently
+        document, created = Document.objects.get(content_hash=digest), False
+    if created:
+        logger.info(f"Stored document {digest[:12]} ({len(text)} characters)")
+    elif spans and not document.page_spans:
+        document.page_spans = spans
+        document.save(update_fields=['page_spans', 'updated_at'])
+    return document
+
+
+def document_language(document: Document) -> Language:
+    """
+    Language of a stored document, detected once and kept on the row.
+    """
+    if not document.language:
+        document.language = detect_language(document.text).code
+        document.save(update_fields=['language', 'updated_at'])
+    return get_language(document.language)
+
+
+def load_pyramid(document: Document, prompt_key: Optional[str] = None) -> Optional[Dict[str, object]]:
+    """
+    Load the stored summary pyramid for a document.
+
+    Args:
+        document: The document
+        prompt_key: Key of the pyramid's templates (see pyramid_key), by
+            default the unlocalized one
+
+    Returns:
+        Levels in the format produced by build_pyramid, or None if the
+        document has no complete pyramid for the current prompt templates
+    """
+    rows = Summary.objects.filter(document=document, prompt_key=prompt_key or pyramid_key())
+    levels: Dict[str, object] = {'sections': []}
+    sections = []
+    for row in rows:
+        if row.level == Summary.LEVEL_SECTION:
+            sections.append((row.position, row.text))
+        else:
+            levels[row.level] = row.text
+
+    if not sections or any(level not in levels for level, _ in LEVELS):
+        return None
+    levels['sections'] = [text for _, text in sorted(sections)]
+    return levels
+
+
+def save_pyramid(document: Document, levels: Dict[str, object],
+                 prompt_key: Optional[str] = None) -> Dict[str, object]:
+    """
+    Store every level of a summary pyramid, replacing older rows for the same templates.
+
+    Returns:
+        The stored levels: the given ones, or those of another request that
+        stored the same document's pyramid first
+    """
+    key = prompt_key or pyramid_key()
+    rows = [
+        _summary_row(document, key, Summary.LEVEL_SECTION, text, position=index)
+        for index, text in enumerate(levels['sections'])
+    ]
+    rows += [_summary_row(document, key, level, levels[level]) for level, _ in LEVELS]
+    try:
+        with transaction.atomic():
+            Summary.objects.filter(document=document, prompt_key=key).delete()
+            Summary.objects.bulk_create(rows)
+    except IntegrityError:
+        # Another request stored the same document's pyramid concurrently
+        logger.info(f"Summary pyramid of {document.content_hash[:12]} already stored")
+        return load_pyramid(document, key) or levels
+    return levels
+
+
+def pyramid_summary(document: Document, level: str, prompt_key: Optional[str] = None) -> Optional[Summary]:
+    """
+    Stored row of one pyramid level for the current prompt templates.
+    """
+    digest = Summary.make_digest(document.content_hash, prompt_key or pyramid_key(), level)
+    return Summary.objects.filter(digest=digest).first()
+
+
+def load_summary(document: Document, prompt_key: str) -> Optional[Summary]:
+    """
+    Stored direct summary of a document made with the given prompt template.
+    """
+    digest = Summary.make_digest(document.content_hash, prompt_key, Summary.LEVEL_SUMMARY)
+    return Summary.objects.filter(digest=digest).first()
+
+
+def save_summary(document: Document, prompt_key: str, text: str) -> Summary:
+    """
+    Store a direct summary, keeping the existing row if another request stored it first.
+    """
+    row = _summary_row(document, prompt_key, Summary.LEVEL_SUMMARY, text)
+    try:
+        with transaction.atomic():
+            row.save()
+    except IntegrityError:
+        row = Summary.objects.get(digest=row.digest)
+    return row
+
+
+def load_chunk_summaries(hashes: Iterable[str]) -> Dict[str, str]:
+    """
+    Stored summaries of chunks with the given hashes, from any document.
+
+    A new version of a document finds the chunks it shares with the
+    previous version here, whichever document row that version is.
+    """
+    hashes = list(set(hashes))
+    found: Dict[str, str] = {}
+    # Batched to stay below SQLite's limit on query parameters
+    for start in range(0, len(hashes), 500):
+        rows = Summary.objects.filter(
+            level=Summary.LEVEL_CHUNK, prompt_key=chunk_key(), chunk_hash__in=hashes[start:start + 500]
+        ).values_list('chunk_hash', 'text')
+        found.update(rows)
+    return found
+
+
+def save_chunk_summaries(document: Document, chunks: List[Tuple[str, str]]) -> None:
+    """
+    Store a document's (hash, summary) chunks, replacing older rows for the same template.
+    """
+    key = chunk_key()
+    rows = []
+    for index, (digest, text) in enumerate(chunks):
+        row = _summary_row(document, key, Summary.LEVEL_CHUNK, text, position=index)
+        row.chunk_hash = digest
+        rows.append(row)
+    try:
+        with transaction.atomic():
+            Summary.objects.filter(document=document, prompt_key=key).delete()
+            Summary.objects.bulk_create(rows)
+    except IntegrityError:
+        # Another request stored the same document's chunks concurrently
+        logger.info(f"Chunk summaries of {document.content_hash[:12]} already stored")
+
+
+def _summary_row(document: Document, prompt_key: str, level: str, text: str,
+                 position: int = 0) -> Summary:
+    return Summary(
+        document=document, level=level, position=position, prompt_key=prompt_key,
+        text=text, word_count=word_count(text),
+        digest=Summary.make_digest(document.content_hash, prompt_key, level, position),
+    )
@@ -3,15 +3,26 @@ Unit tests for the summarizer app.
 
 Run tests with: python manage.py test
 """
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
 from unittest.mock import patch, MagicMock
 from io import BytesIO
+import gzip
+import json
+import threading
+import time
 
-from .utils.text_extractor import extract_text_from_txt, extract_text_from_pdf
+from .middleware import parse_accept_encoding
+from .utils.text_extractor import extract_text_from_txt, extract_text_from_pdf, split_text_pages
 from .utils.ai_summarizer import AISummarizer
+from .utils.pyramid import build_pyramid, split_sections, summary_for_length
+from .utils.hedging import Hedger, LatencyTracker
+from .utils.lazy import lazy_import
+from .utils.prefilter import prefilter_text, split_sentences
+from .utils.scheduler import LLMScheduler, QueueFull
+from .utils.prompts import PromptRegistry, PromptTemplate, SUMMARY_STYLES, get_prompt
 
 
 class TextExtractorTests(TestCase):
@@ -37,45 +48,1654 @@ class TextExtractorTests(TestCase):
         self.assertIsNotNone(error)
         self.assertEqual(text, "")
         self.assertIn("empty", error.lower())
+    
+    def test_empty_upload_reported_before_format_detection(self):
+        """Test a file with no bytes gets the empty-file error, not an unsupported type."""
+        from django.core.files import File
+        from .utils.text_extractor import EMPTY_FILE_ERROR, extract_pages_from_file
+        
+        with patch('summarizer.utils.text_extractor.detect_format') as detect_format:
+            text, spans, error = extract_pages_from_file(File(BytesIO(b""), name="upload.bin"))
+        
+        self.assertEqual(error, EMPTY_FILE_ERROR)
+        self.assertEqual((text, spans), ("", []))
+        detect_format.assert_not_called()
+    
+    def test_blank_upload_gets_format_error(self):
+        """Test a file holding only whitespace is detected and gets its format's empty error."""
+        from .utils.text_extractor import extract_text_from_file
+        
+        text, error = extract_text_from_file(SimpleUploadedFile("blank.txt", b"  \n\n "))
+        
+        self.assertEqual(text, "")
+        self.assertEqual(error, "Text file is empty")
+
+
+def make_docx(paragraphs):
+    """Build a minimal DOCX whose body holds the given paragraphs."""
+    import zipfile
+    from xml.sax.saxutils import escape
+    
+    body = "".join(f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>" for text in paragraphs)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        )
+    return buffer.getvalue()
+
+
+class ExtractorRegistryTests(TestCase):
+    """Test content-based format detection and the streaming extractors."""
+    
+    def _extract(self, name, content):
+        from .utils.text_extractor import extract_pages_from_file
+        return extract_pages_from_file(SimpleUploadedFile(name, content))
+    
+    def test_format_detected_from_content(self):
+        """Test magic bytes win over the file name, and text formats use it as a hint."""
+        from .utils.extractors import registry
+        
+        def detect(name, content):
+            return registry.detect(SimpleUploadedFile(name, content), name).name
+        
+        self.assertEqual(detect("report.txt", make_pdf(['text'])), 'pdf')
+        self.assertEqual(detect("report.pdf", make_docx(["Hello"])), 'docx')
+        self.assertEqual(detect("page.txt", b"<!DOCTYPE html><html><body>Hi</body></html>"), 'html')
+        markdown = b"# Title\n\n- first\n- second\n"
+        self.assertEqual(detect("notes.md", markdown), 'markdown')
+        self.assertEqual(detect("notes.txt", markdown), 'txt')
+        self.assertEqual(detect("notes", markdown), 'markdown')
+        self.assertIsNone(registry.detect(SimpleUploadedFile("x.txt", b"\x89PNG\r\n\x1a\n\x00\x00"), "x.txt"))
+    
+    def test_docx_paragraphs_streamed(self):
+        """Test DOCX text is read paragraph by paragraph from the zip."""
+        text, spans, error = self._extract("memo.docx", make_docx(["First & foremost", "Second"]))
+        
+        self.assertIsNone(error)
+        self.assertEqual(text, "First & foremost\nSecond\n")
+        self.assertEqual(spans, [(0, len(text))])
+    
+    def test_html_skips_scripts_and_breaks_blocks(self):
+        """Test HTML is reduced to visible text with line breaks at block elements."""
+        html = (b"<html><head><title>T</title><style>p {}</style></head><body>"
+                b"<h1>Heading</h1><script>var x = 1;</script><p>Caf&eacute; text</p></body></html>")
+        text, _, error = self._extract("page.html", html)
+        
+        self.assertIsNone(error)
+        self.assertIn("Heading", text)
+        self.assertIn("Café text", text)
+        self.assertNotIn("var x", text)
+        self.assertNotIn("p {}", text)
+    
+    def test_markdown_markup_stripped(self):
+        """Test Markdown headings, emphasis and links are reduced to their text."""
+        text, _, error = self._extract(
+            "readme.md", b"# Guide\n\nRead **this** and [the docs](https://example.com).\n- item\n"
+        )
+        
+        self.assertIsNone(error)
+        self.assertIn("Guide\n", text)
+        self.assertIn("Read this and the docs.", text)
+        self.assertNotIn("https://", text)
+    
+    def test_text_chunks_normalised(self):
+        """Test large text files are streamed in chunks with CRLF and NULs normalised."""
+        from .utils.extractors import CHUNK_CHARS
+        
+        content = ("line\r\n" * (CHUNK_CHARS // 3)).encode() + b"end\x00"
+        text, _, error = self._extract("big.txt", content)
+        
+        self.assertIsNone(error)
+        self.assertNotIn("\r", text)
+        self.assertTrue(text.endswith("line\nend"))
+        self.assertEqual(text.count("line\n"), CHUNK_CHARS // 3)
+    
+    def test_empty_document_reported(self):
+        """Test a document without text gets a format-specific error."""
+        _, _, error = self._extract("blank.docx", make_docx([]))
+        
+        self.assertEqual(error, "Word document contains no text")
+
+
+def make_pdf(kinds):
+    """
+    Build a PDF whose pages are 'text' (a Tj operator), 'heavy' (tens of
+    thousands of them, slow to extract) or 'image' (a painted image).
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+    
+    writer = PdfWriter()
+    for kind in kinds:
+        page = writer.add_blank_page(200, 200)
+        content = DecodedStreamObject()
+        if kind in ('text', 'heavy'):
+            font = DictionaryObject({
+                NameObject('/Type'): NameObject('/Font'),
+                NameObject('/Subtype'): NameObject('/Type1'),
+                NameObject('/BaseFont'): NameObject('/Helvetica'),
+            })
+            resources = {NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(font)})}
+            if kind == 'text':
+                content.set_data(b"BT /F1 12 Tf 20 100 Td (Quarterly report text) Tj ET")
+            else:
+                content.set_data(b"BT /F1 12 Tf " + b"(x) Tj 1 0 Td " * 30000 + b"ET")
+        else:
+            image = DecodedStreamObject()
+            image.set_data(b"\xff\xff\xff")
+            image.update({
+                NameObject('/Type'): NameObject('/XObject'),
+                NameObject('/Subtype'): NameObject('/Image'),
+                NameObject('/Width'): NumberObject(1),
+                NameObject('/Height'): NumberObject(1),
+                NameObject('/ColorSpace'): NameObject('/DeviceRGB'),
+                NameObject('/BitsPerComponent'): NumberObject(8),
+            })
+            resources = {NameObject('/XObject'): DictionaryObject({NameObject('/Im0'): writer._add_object(image)})}
+            content.set_data(b"q 200 0 0 200 0 0 cm /Im0 Do Q")
+        page[NameObject('/Resources')] = DictionaryObject(resources)
+        page[NameObject('/Contents')] = writer._add_object(content)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'ocr': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ocr-tests'},
+})
+class ScannedPdfTests(TestCase):
+    """Test the image-only PDF pre-scan and the OCR stage."""
+    
+    def _pdf(self, kinds):
+        return SimpleUploadedFile("scan.pdf", make_pdf(kinds), content_type="application/pdf")
+    
+    def test_prescan_finds_text_and_images(self):
+        """Test sampled pages are classified by their resources and operators."""
+        from pypdf import PdfReader
+        from .utils.pdf_scan import prescan_pdf, sample_pages
+        
+        self.assertEqual(sample_pages(100, 4), [0, 33, 66, 99])
+        self.assertTrue(prescan_pdf(PdfReader(BytesIO(make_pdf(['image'] * 5))), 8).image_only)
+        self.assertFalse(prescan_pdf(PdfReader(BytesIO(make_pdf(['image', 'text']))), 8).image_only)
+    
+    def test_text_pdf_still_extracts(self):
+        """Test a PDF with a text layer goes through normal extraction."""
+        text, error = extract_text_from_pdf(self._pdf(['text', 'image']))
+        
+        self.assertIsNone(error)
+        self.assertIn("Quarterly report text", text)
+    
+    def test_scanned_pdf_fails_fast(self):
+        """Test an image-only PDF is rejected without extracting every page."""
+        from pypdf import PageObject
+        
+        with patch.object(PageObject, 'extract_text') as extract_text:
+            text, error = extract_text_from_pdf(self._pdf(['image'] * 20))
+        
+        self.assertEqual(text, "")
+        self.assertIn("scanned", error)
+        extract_text.assert_not_called()
+    
+    @override_settings(OCR_ENABLED=True, OCR_MAX_WORKERS=0)
+    @patch('summarizer.utils.ocr.ocr_unavailable_reason', return_value=None)
+    @patch('summarizer.utils.ocr.page_images', return_value=[b"same scanned image"])
+    def test_scanned_pdf_routed_to_ocr_with_page_cache(self, *_):
+        """Test OCR runs when enabled and repeated pages come from the cache."""
+        with patch('summarizer.utils.ocr.ocr_images', return_value="Recognised words") as ocr_images:
+            first, error = extract_text_from_pdf(self._pdf(['image'] * 3))
+            second, _ = extract_text_from_pdf(self._pdf(['image'] * 3))
+        
+        self.assertIsNone(error)
+        self.assertEqual(first.count("Recognised words"), 3)
+        self.assertEqual(second, first)
+        # All pages carry the same image, so it is recognised once
+        self.assertEqual(ocr_images.call_count, 1)
+    
+    @override_settings(OCR_ENABLED=True)
+    @patch('summarizer.utils.ocr.ocr_unavailable_reason', return_value="the pytesseract package is not installed")
+    def test_ocr_reports_missing_engine(self, _):
+        """Test enabling OCR without a local engine gives a clear error."""
+        text, error = extract_text_from_pdf(self._pdf(['image']))
+        
+        self.assertEqual(text, "")
+        self.assertIn("pytesseract", error)
+
+
+class SandboxedExtractionTests(TestCase):
+    """Test extraction in reused sandbox processes with time and memory limits."""
+    
+    def setUp(self):
+        from .utils.sandbox import SandboxPool
+        
+        self.pool = SandboxPool(size=1, wall_clock=30, max_rss_mb=0, page_timeout=0)
+        self.addCleanup(self.pool.shutdown)
+    
+    def _extract(self, kinds):
+        return self.pool.extract(SimpleUploadedFile("doc.pdf", make_pdf(kinds), content_type="application/pdf"))
+    
+    def test_process_reused_across_documents(self):
+        """Test documents are extracted in the sandbox without a spawn each."""
+        first = self._extract(['text', 'text'])
+        pid = self.pool._idle.queue[0].pid
+        second = self._extract(['text'])
+        
+        self.assertEqual(first.chunks, ["Quarterly report text"] * 2)
+        self.assertIsNone(first.limit)
+        self.assertEqual(second.extractor, 'pdf')
+        self.assertEqual(self.pool._idle.queue[0].pid, pid)
+        self.assertEqual(self.pool.metrics()['started'], 1)
+    
+    def test_slow_page_skipped(self):
+        """Test a page over the page timeout is left empty and the rest kept."""
+        self.pool.page_timeout = 0.05
+        
+        result = self._extract(['text', 'heavy', 'text'])
+        
+        self.assertEqual(result.chunks, ["Quarterly report text", "", "Quarterly report text"])
+        self.assertEqual((result.limit, result.page_timeouts), ('page_timeout', 1))
+        self.assertEqual(self.pool.metrics()['idle'], 1)
+    
+    def test_first_page_bounded_by_page_timeout(self):
+        """Test opening the document and its first page get the page timeout too."""
+        self.pool.page_timeout = 0.05
+        
+        result = self._extract(['heavy', 'text'])
+        
+        self.assertEqual(result.limit, 'page_timeout')
+        self.assertTrue(result.partial)
+        self.assertLess(result.seconds, 5)
+    
+    def test_limits_return_partial_results(self):
+        """Test the wall clock and memory limits kill the process and keep finished pages."""
+        self._extract(['text'])
+        self.pool.wall_clock = 0.3
+        
+        slow = self._extract(['text'] + ['heavy'] * 6)
+        self.pool.max_rss = 1
+        hungry = self._extract(['text'])
+        
+        self.assertEqual(slow.limit, 'wall_clock')
+        self.assertEqual(slow.chunks[:1], ["Quarterly report text"])
+        self.assertLess(len(slow.chunks), 7)
+        self.assertEqual(hungry.limit, 'rss')
+        metrics = self.pool.metrics()
+        self.assertEqual((metrics['wall_clock'], metrics['rss'], metrics['replaced']), (1, 1, 2))
+    
+    @override_settings(SANDBOX_ENABLED=True)
+    def test_extract_text_uses_sandbox(self):
+        """Test PDF uploads are extracted through the sandbox pool."""
+        from .utils.text_extractor import extract_pages_from_file
+        
+        fake_file = SimpleUploadedFile("doc.pdf", make_pdf(['text', 'image', 'text']))
+        with patch('summarizer.utils.text_extractor.sandbox_pool', self.pool):
+            text, spans, error = extract_pages_from_file(fake_file)
+        
+        self.assertIsNone(error)
+        self.assertEqual(text, "Quarterly report text\n\nQuarterly report text")
+        self.assertEqual([length for _, length in spans], [21, 0, 21])
+        self.assertEqual(self.pool.metrics()['documents'], 1)
+    
+    @override_settings(SANDBOX_ENABLED=True)
+    def test_partial_extraction_fails(self):
+        """Test a document a limit cut short is not passed on as if it were complete."""
+        from .utils.sandbox import LIMIT_ERRORS
+        from .utils.text_extractor import extract_pages_from_file
+        
+        self.pool.page_timeout = 0.05
+        fake_file = SimpleUploadedFile("doc.pdf", make_pdf(['text', 'heavy', 'text']))
+        with patch('summarizer.utils.text_extractor.sandbox_pool', self.pool):
+            text, spans, error = extract_pages_from_file(fake_file)
+        
+        self.assertEqual((text, spans), ("", []))
+        self.assertEqual(error, LIMIT_ERRORS['page_timeout'])
+
+
+class ExtractTextPayloadTests(APITestCase):
+    """Test compact payload modes and compression for /api/extract-text/."""
+    
+    def setUp(self):
+        self.url = '/api/extract-text/'
+        self.content = ("Line of document text.\n" * 400).encode()
+    
+    def _upload(self, data=None, **extra):
+        fake_file = SimpleUploadedFile("doc.txt", self.content, content_type="text/plain")
+        return self.client.post(self.url, {'file': fake_file, **(data or {})}, format='multipart', **extra)
+    
+    def test_split_text_pages_covers_text(self):
+        """Test page spans are contiguous and break at line ends."""
+        text = self.content.decode()
+        spans = split_text_pages(text, 1000)
+        
+        self.assertEqual(sum(length for _, length in spans), len(text))
+        for offset, length in spans[:-1]:
+            self.assertEqual(text[offset + length - 1], "\n")
+    
+    @override_settings(TEXT_PAGE_CHARS=1000)
+    def test_pages_mode_and_lazy_page_fetch(self):
+        """Test pages mode returns offsets only and pages can be fetched one by one."""
+        response = self._upload({'mode': 'pages'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('text', response.data)
+        pages = response.data['pages']
+        self.assertGreater(len(pages), 1)
+        
+        page_url = f"/api/documents/{response.data['document_id']}/pages/2/"
+        page = self.client.get(page_url)
+        self.assertEqual(page.status_code, status.HTTP_200_OK)
+        self.assertEqual(page.data['offset'], pages[1]['offset'])
+        self.assertEqual(len(page.data['text']), pages[1]['length'])
+        self.assertIn('max-age', page['Cache-Control'])
+        
+        missing = self.client.get(f"/api/documents/{response.data['document_id']}/pages/99/")
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_keyed_pages_not_shared_cacheable(self):
+        """Test pages that need an API key are only cacheable privately, per key."""
+        from .authentication import ApiKeyAuthentication, create_client
+        
+        ApiKeyAuthentication.clear_cache()
+        _, key = create_client("partner")
+        response = self._upload({'mode': 'pages'})
+        page_url = f"/api/documents/{response.data['document_id']}/pages/1/"
+        
+        with override_settings(API_KEY_REQUIRED=True):
+            page = self.client.get(page_url, HTTP_X_API_KEY=key)
+        
+        self.assertIn('private', page['Cache-Control'])
+        self.assertNotIn('public', page['Cache-Control'])
+        self.assertIn('X-API-Key', page['Vary'])
+    
+    def test_id_mode(self):
+        """Test id mode returns only the document reference."""
+        response = self._upload({'mode': 'id'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['document_id']), 64)
+        self.assertNotIn('pages', response.data)
+        self.assertNotIn('text', response.data)
+    
+    def test_gzip_negotiation(self):
+        """Test large responses are gzip-compressed when the client accepts it."""
+        response = self._upload(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['text'], self.content.decode())
+    
+    def test_no_compression_without_accept_encoding(self):
+        """Test responses stay uncompressed for clients that do not accept gzip."""
+        response = self._upload(HTTP_ACCEPT_ENCODING='gzip;q=0')
+        
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json()['status'], 'success')
+    
+    def test_parse_accept_encoding(self):
+        """Test q-values in Accept-Encoding are parsed."""
+        self.assertEqual(
+            parse_accept_encoding("br;q=0.9, gzip, *;q=0"),
+            {'br': 0.9, 'gzip': 1.0, '*': 0.0},
+        )
+    
+    def test_streamed_events_readable_as_produced(self):
+        """Test each gzip-compressed event can be decompressed before the next is produced."""
+        import zlib
+        from django.http import HttpResponse, StreamingHttpResponse
+        from django.test import RequestFactory
+        from .middleware import ResponseCompressionMiddleware
+        
+        produced = []
+        
+        def events():
+            for index in range(5):
+                produced.append(index)
+                yield f"event: key_point\ndata: {index}\n\n".encode()
+        
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        middleware = ResponseCompressionMiddleware(lambda request: HttpResponse())
+        response = middleware.process_response(
+            request, StreamingHttpResponse(events(), content_type='text/event-stream')
+        )
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = iter(response.streaming_content)
+        
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        for index in range(5):
+            self.assertEqual(decompressor.decompress(next(body)), f"event: key_point\ndata: {index}\n\n".encode())
+            self.assertEqual(len(produced), index + 1)
+    
+    def test_pdf_pages_keep_their_numbers(self):
+        """Test a PDF page without text keeps its number, so later pages match the PDF."""
+        fake_file = SimpleUploadedFile("report.pdf", make_pdf(['text', 'image', 'text']),
+                                       content_type="application/pdf")
+        response = self.client.post(self.url, {'file': fake_file, 'mode': 'pages'}, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['page_count'], 3)
+        self.assertEqual([page['length'] for page in response.data['pages']][1], 0)
+        third = self.client.get(f"/api/documents/{response.data['document_id']}/pages/3/")
+        self.assertIn("Quarterly report text", third.data['text'])
+        empty = self.client.get(f"/api/documents/{response.data['document_id']}/pages/2/")
+        self.assertEqual(empty.data['text'], "")
+
+
+class SpeculativeSummaryTests(APITransactionTestCase):
+    """Test background summaries started by /api/extract-text/."""
+    
+    def setUp(self):
+        from .authentication import ApiKeyAuthentication, create_client
+        from .speculation import speculator
+        
+        ApiKeyAuthentication.clear_cache()
+        _, self.key = create_client("partner")
+        self.client.credentials(HTTP_X_API_KEY=self.key)
+        self.speculator = speculator
+        self.speculator._counters.clear()
+        self.release = threading.Event()
+        self.release.set()
+        self.upstream = MagicMock()
+        
+        def create(**kwargs):
+            self.release.wait(5)
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = "A speculative summary."
+            response.usage = None
+            return response
+        
+        self.upstream.chat.completions.create.side_effect = create
+    
+    def _post(self, url, name="notes.txt", **data):
+        from .utils.ai_summarizer import ai_summarizer
+        
+        upload = SimpleUploadedFile(name, f"Meeting notes of {name}. The budget was approved.".encode(),
+                                    content_type="text/plain")
+        with patch.object(ai_summarizer, '_client', self.upstream):
+            return self.client.post(url, {'file': upload, **data}, format='multipart')
+    
+    def _wait_for_jobs(self):
+        deadline = time.monotonic() + 5
+        while self.speculator.metrics()['jobs'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+    
+    def test_summary_request_is_served_from_speculative_summary(self):
+        """Test the summary made after extraction is served without another upstream call."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        with patch.object(ai_summarizer, '_client', self.upstream):
+            extracted = self._post('/api/extract-text/', speculate='true')
+            self._wait_for_jobs()
+            summarized = self._post('/api/summarize/')
+        
+        self.assertTrue(extracted.data['speculative'])
+        self.assertEqual(len(extracted.data['document_id']), 64)
+        self.assertEqual(summarized.data['summary'], "A speculative summary.")
+        self.assertEqual(self.upstream.chat.completions.create.call_count, 1)
+        self.assertEqual(self.speculator.metrics()['completed'], 1)
+    
+    def test_summary_request_attaches_to_running_job(self):
+        """Test a request arriving while the job runs waits for it instead of calling upstream again."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        self.release.clear()
+        with patch.object(ai_summarizer, '_client', self.upstream):
+            self._post('/api/extract-text/', speculate='true')
+            while not self.upstream.chat.completions.create.called:
+                time.sleep(0.01)
+            threading.Timer(0.1, self.release.set).start()
+            summarized = self._post('/api/summarize/')
+        
+        self.assertEqual(summarized.data['summary'], "A speculative summary.")
+        self.assertEqual(self.upstream.chat.completions.create.call_count, 1)
+        self.assertEqual(self.speculator.metrics()['attached'], 1)
+        self.assertEqual(self.speculator.metrics()['promoted'], 1)
+    
+    def test_speculation_yields_to_load_and_can_be_cancelled(self):
+        """Test nothing is speculated under load, and queued jobs are cancelled per document."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        with patch('summarizer.speculation.llm_scheduler.load', return_value=1.0):
+            busy = self._post('/api/extract-text/', speculate='true')
+        without = self._post('/api/extract-text/', name="other.txt")
+        
+        self.release.clear()
+        with patch.object(ai_summarizer, '_client', self.upstream):
+            self._post('/api/extract-text/', name="first.txt", speculate='true')
+            queued = self._post('/api/extract-text/', name="second.txt", speculate='true')
+            cancelled = self.client.delete(f"/api/documents/{queued.data['document_id']}/speculation/")
+            self.release.set()
+            self._wait_for_jobs()
+        
+        self.assertFalse(busy.data['speculative'])
+        self.assertNotIn('speculative', without.data)
+        self.assertEqual(cancelled.data['cancelled'], 1)
+        metrics = self.client.get('/api/metrics/speculation/').data['speculation']
+        self.assertEqual((metrics['skipped_busy'], metrics['completed'], metrics['cancelled']), (1, 1, 1))
+        self.assertEqual(self.upstream.chat.completions.create.call_count, 1)
+    
+    def test_cancelled_running_job_stops_between_calls(self):
+        """Test cancelling a running job stops it before its next AI call."""
+        from .utils.ai_summarizer import ai_summarizer
+        from .utils.scheduler import llm_scheduler
+        
+        calls = []
+        
+        def summarize_document(document):
+            # Stands in for a map-reduce summary making one call per chunk
+            for chunk in range(5):
+                llm_scheduler.run('batch', lambda: (calls.append(chunk), self.release.wait(5)))
+            return None, "not reached"
+        
+        self.release.clear()
+        with patch.object(ai_summarizer, '_client', self.upstream), \
+                patch('summarizer.speculation.summarize_document', side_effect=summarize_document):
+            running = self._post('/api/extract-text/', speculate='true')
+            while not calls:
+                time.sleep(0.01)
+            cancelled = self.client.delete(f"/api/documents/{running.data['document_id']}/speculation/")
+            self.release.set()
+            self._wait_for_jobs()
+        
+        self.assertEqual(cancelled.data['cancelled'], 1)
+        self.assertEqual(calls, [0])
+        self.assertEqual(self.speculator.metrics()['cancelled'], 1)
+        self.assertEqual(llm_scheduler._cancelled, set())
+    
+    def test_only_submitting_client_cancels_job(self):
+        """Test other clients and anonymous requests cannot cancel a job they did not submit."""
+        from .authentication import create_client
+        from .utils.ai_summarizer import ai_summarizer
+        
+        _, other_key = create_client("other")
+        self.release.clear()
+        with patch.object(ai_summarizer, '_client', self.upstream):
+            submitted = self._post('/api/extract-text/', speculate='true')
+            url = f"/api/documents/{submitted.data['document_id']}/speculation/"
+            self.client.credentials()
+            anonymous = self.client.delete(url)
+            other = self.client.delete(url, HTTP_X_API_KEY=other_key)
+            own = self.client.delete(url, HTTP_X_API_KEY=self.key)
+            self.release.set()
+            self._wait_for_jobs()
+        
+        self.assertEqual(anonymous.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(other.data['cancelled'], 0)
+        self.assertEqual(own.data['cancelled'], 1)
+
+
+class AISummarizerTests(TestCase):
+    """Test AI summarization utilities."""
+    
+    @override_settings(OPENAI_API_KEY='test-key')
+    @patch('summarizer.utils.ai_summarizer.OpenAI')
+    def test_summarize_success(self, mock_openai):
+        """Test successful summarization."""
+        # Mock OpenAI response
+        mock_client = MagicMock()
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Test summary"
+        mock_client.chat.completions.create.return_value = mock_response
+        mock_openai.return_value = mock_client
+        
+        summarizer = AISummarizer()
+        summary, error = summarizer.summarize("Long text to summarize")
+        
+        self.assertIsNone(error)
+        self.assertEqual(summary, "Test summary")
+    
+    @override_settings(OPENAI_API_KEY='')
+    def test_summarize_no_api_key(self):
+        """Test summarization without API key."""
+        summarizer = AISummarizer()
+        summary, error = summarizer.summarize("Test text")
+        
+        self.assertIsNotNone(error)
+        self.assertIn("not configured", error)
+    
+    @override_settings(OPENAI_API_KEY='test-key')
+    @patch('summarizer.utils.ai_summarizer.OpenAI')
+    def test_client_built_lazily_once(self, mock_openai):
+        """Test the OpenAI client is only created on first use, and only once."""
+        summarizer = AISummarizer()
+        mock_openai.assert_not_called()
+        
+        threads = [threading.Thread(target=lambda: summarizer.client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        mock_openai.assert_called_once_with(api_key='test-key')
+    
+    def test_lazy_import(self):
+        """Test lazily imported modules load on first attribute access."""
+        module = lazy_import('colorsys')
+        self.assertFalse(module.is_loaded)
+        
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertTrue(module.is_loaded)
+    
+    @override_settings(WARM_UP_MODULES=['colorsys', 'module_that_does_not_exist'])
+    def test_warm_up_skips_missing_modules(self):
+        """Test pre-fork warm-up imports available modules and skips missing ones."""
+        from .warmup import warm_up
+        
+        timings = warm_up()
+        
+        self.assertIn('colorsys', timings)
+        self.assertIn('prompts', timings)
+        self.assertNotIn('module_that_does_not_exist', timings)
+    
+    def test_summarize_empty_text(self):
+        """Test summarization with empty text."""
+        summarizer = AISummarizer()
+        summary, error = summarizer.summarize("")
+        
+        self.assertIsNotNone(error)
+        self.assertIn("No text", error)
+
+
+class PrefilterTests(TestCase):
+    """Test the extractive pre-filter."""
+    
+    def _document(self, sentences=2000):
+        """Every tenth sentence is on topic; the rest share no words with anything."""
+        return " ".join(
+            f"The contract payment deadline {i} is extended for the supplier." if i % 10 == 0
+            else f"Noise{i} filler{i} words{i} here{i}."
+            for i in range(sentences)
+        )
+    
+    def test_short_text_unchanged(self):
+        """Test text within the budget is returned as is."""
+        result = prefilter_text("One sentence. Two sentences.", max_tokens=100)
+        
+        self.assertEqual(result.text, "One sentence. Two sentences.")
+        self.assertEqual(result.compression_ratio, 1.0)
+    
+    def test_keeps_central_sentences_in_order_within_budget(self):
+        """Test the best sentences are kept, in original order, up to the budget."""
+        text = self._document()
+        
+        result = prefilter_text(text, max_tokens=50)
+        
+        self.assertLessEqual(len(result.text), 50 * 4)
+        self.assertGreater(result.compression_ratio, 100)
+        sentences = split_sentences(result.text)
+        self.assertTrue(sentences)
+        self.assertTrue(all(sentence.startswith("The contract payment") for sentence in sentences))
+        positions = [text.index(sentence) for sentence in sentences]
+        self.assertEqual(positions, sorted(positions))
+    
+    def test_large_document_is_fast(self):
+        """Test a multi-megabyte document is condensed in well under a second."""
+        text = self._document(50000)
+        prefilter_text(text[:10000], max_tokens=100)  # load numpy outside the timing
+        
+        result = prefilter_text(text, max_tokens=3000)
+        
+        self.assertGreater(len(text), 2_000_000)
+        self.assertLess(result.seconds, 1.0)
+    
+    @override_settings(PREFILTER_ENABLED=False)
+    def test_prepare_text_truncates_when_disabled(self):
+        """Test prepare_text falls back to truncation when the pre-filter is off."""
+        text = self._document()
+        
+        prepared = AISummarizer().prepare_text(text, max_chars=1000)
+        
+        self.assertTrue(prepared.startswith(text[:1000]))
+        self.assertIn("[Text truncated", prepared)
+
+
+class PromptRegistryTests(TestCase):
+    """Test the prompt template registry."""
+    
+    def test_summary_styles_share_prefix(self):
+        """Test every summary style renders the same system message and document prefix."""
+        rendered = [get_prompt(style).render(text="DOC") for style in SUMMARY_STYLES]
+        
+        self.assertEqual(len({messages[0]['content'] for messages in rendered}), 1)
+        for messages in rendered:
+            self.assertTrue(messages[1]['content'].startswith("Document:\nDOC\n\n"))
+    
+    def test_registry_versions(self):
+        """Test lookup defaults to the latest version and keeps older ones."""
+        registry = PromptRegistry()
+        registry.register(PromptTemplate("brief", "1", "{text}"))
+        registry.register(PromptTemplate("brief", "2", "Summary: {text}"))
+        
+        self.assertEqual(registry.get("brief").version, "2")
+        self.assertEqual(registry.get("brief", "1").version, "1")
+        self.assertFalse(registry.has("brief", "3"))
+        with self.assertRaises(KeyError):
+            registry.get("missing")
+    
+    def test_cache_key_includes_version(self):
+        """Test cache keys change with the template version."""
+        v1 = PromptTemplate("brief", "1", "{text}")
+        v2 = PromptTemplate("brief", "2", "{text}")
+        
+        self.assertEqual(v1.cache_key("hash"), v1.cache_key("hash"))
+        self.assertNotEqual(v1.cache_key("hash"), v2.cache_key("hash"))
+    
+    def test_render_missing_field(self):
+        """Test rendering fails loudly when a field is missing."""
+        with self.assertRaises(KeyError):
+            get_prompt('chat').render(context="doc")
+    
+    @override_settings(OPENAI_API_KEY='test-key')
+    @patch('summarizer.utils.ai_summarizer.OpenAI')
+    def test_summarize_uses_style_parameters(self, mock_openai):
+        """Test the chosen style's token budget is sent upstream."""
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.return_value.choices = [MagicMock()]
+        mock_client.chat.completions.create.return_value.choices[0].message.content = "Summary"
+        mock_openai.return_value = mock_client
+        
+        summary, error = AISummarizer().summarize("Some text", style="detailed")
+        
+        self.assertIsNone(error)
+        kwargs = mock_client.chat.completions.create.call_args.kwargs
+        self.assertEqual(kwargs['max_tokens'], get_prompt('detailed').max_tokens)
+
+
+class SummaryPyramidTests(TestCase):
+    """Test the multi-level summary pyramid."""
+    
+    def _fake_summarizer(self, words_per_call=10):
+        """Summarizer whose output length follows the requested word budget."""
+        summarizer = MagicMock()
+        summarizer._truncate_text.side_effect = lambda text, max_chars: text[:max_chars]
+        
+        def generate(template, **values):
+            words = values.get('words', words_per_call)
+            return " ".join(["word"] * words), None
+        
+        summarizer.generate.side_effect = generate
+        return summarizer
+    
+    @override_settings(PYRAMID_MAX_SECTIONS=4)
+    def test_split_sections_bounded(self):
+        """Test sections keep document order and respect the section cap."""
+        text = "\n\n".join(f"Paragraph {i} " + "x" * 50 for i in range(40))
+        
+        sections = split_sections(text, 200, 4)
+        
+        self.assertLessEqual(len(sections), 4)
+        self.assertTrue(sections[0].startswith("Paragraph 0"))
+        self.assertIn("Paragraph 39", sections[-1])
+    
+    @override_settings(PYRAMID_MAX_SECTIONS=3)
+    def test_build_pyramid_levels(self):
+        """Test every level is built and shorter than the one above it."""
+        summarizer = self._fake_summarizer(words_per_call=200)
+        text = "\n\n".join("Paragraph " + "y" * 5000 for _ in range(6))
+        
+        levels, error = build_pyramid(text, summarizer)
+        
+        self.assertIsNone(error)
+        self.assertEqual(len(levels['sections']), 3)
+        self.assertEqual(len(levels['tldr'].split()), 30)
+        self.assertLess(len(levels['paragraph'].split()), len(levels['detailed'].split()))
+    
+    def test_summary_for_length_uses_nearest_level(self):
+        """Test a stored level is served without an AI call when it fits."""
+        summarizer = self._fake_summarizer()
+        levels = {'detailed': "a " * 400, 'paragraph': "b " * 120, 'tldr': "c " * 30}
+        
+        summary, level, error = summary_for_length(levels, 'tldr', summarizer)
+        self.assertIsNone(error)
+        self.assertEqual(level, 'tldr')
+        
+        summary, level, error = summary_for_length(levels, 100, summarizer)
+        self.assertEqual(level, 'paragraph')
+        summarizer.generate.assert_not_called()
+        
+        summary, level, error = summary_for_length(levels, 60, summarizer)
+        self.assertEqual(level, 'paragraph')
+        self.assertEqual(len(summary.split()), 60)
+        summarizer.generate.assert_called_once()
+    
+    @patch('summarizer.views.build_pyramid')
+    def test_pyramid_built_once_per_document(self, mock_build):
+        """Test repeat requests at other lengths reuse the stored pyramid."""
+        mock_build.return_value = (
+            {'sections': ["s"], 'detailed': "d " * 400, 'paragraph': "p " * 120, 'tldr': "t " * 30},
+            None,
+        )
+        
+        for length in ('tldr', 'paragraph', 'detailed'):
+            fake_file = SimpleUploadedFile("doc.txt", b"Same document text.", content_type="text/plain")
+            response = self.client.post('/api/summarize/', {'file': fake_file, 'length': length})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(mock_build.call_count, 1)
+        self.assertTrue(response.data['summary'].startswith("d "))
+    
+    def test_concurrent_pyramid_save_keeps_stored_rows(self):
+        """Test a pyramid save that loses a race returns the rows already stored."""
+        from django.db import IntegrityError
+        from .models import Summary
+        from .storage import get_or_create_document, load_pyramid, save_pyramid
+        
+        document = get_or_create_document("Same document text.", "doc.txt")
+        stored = {'sections': ["s"], 'detailed': "d " * 400, 'paragraph': "p " * 120, 'tldr': "t " * 30}
+        save_pyramid(document, stored)
+        
+        other = {'sections': ["o"], 'detailed': "x " * 400, 'paragraph': "y " * 120, 'tldr': "z " * 30}
+        with patch.object(Summary.objects, 'bulk_create', side_effect=IntegrityError):
+            levels = save_pyramid(document, other)
+        
+        self.assertEqual(levels['tldr'], stored['tldr'])
+        self.assertEqual(load_pyramid(document)['detailed'], stored['detailed'])
+
+
+class IncrementalSummaryTests(APITestCase):
+    """Test content-defined chunking and incremental re-summarization."""
+    
+    @staticmethod
+    def _policy_text(paragraphs=120):
+        import random
+        
+        rng = random.Random(7)
+        words = ["policy", "employee", "leave", "approval", "manager", "request", "days", "annual",
+                 "travel", "expense", "report", "within", "must", "submit", "receipt", "limit"]
+        return "\n\n".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(30, 90))) + "."
+            for _ in range(paragraphs)
+        )
+    
+    def test_insertion_only_changes_nearby_chunks(self):
+        """Test an edit leaves every chunk away from it byte-identical."""
+        from .utils.incremental import chunk_hash, chunk_text
+        
+        text = self._policy_text()
+        chunks = chunk_text(text, 2000)
+        middle = len(text) // 2
+        edited = chunk_text(text[:middle] + " A new clause on remote work. " + text[middle:], 2000)
+        
+        self.assertEqual("".join(chunks), text)
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) <= 6000 + 64 for chunk in chunks))
+        before = {chunk_hash(chunk) for chunk in chunks}
+        changed = [chunk for chunk in edited if chunk_hash(chunk) not in before]
+        self.assertLessEqual(len(changed), 2)
+    
+    @override_settings(INCREMENTAL_MIN_CHARS=1000, INCREMENTAL_CHUNK_CHARS=2000)
+    def test_new_version_only_summarizes_changed_chunks(self):
+        """Test re-uploading an edited document reuses stored chunk summaries."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        text = self._policy_text()
+        edited = text.replace("policy", "Policy", 1)
+        
+        def upload(content):
+            fake_file = SimpleUploadedFile("policy.txt", content.encode(), content_type="text/plain")
+            return self.client.post('/api/summarize/', {'file': fake_file}, format='multipart')
+        
+        with patch.object(ai_summarizer, 'generate', return_value=("Chunk summary.", None)) as generate, \
+                patch.object(ai_summarizer, 'summarize', return_value=("Final summary.", None)) as reduce:
+            first = upload(text)
+            first_calls = generate.call_count
+            second = upload(edited)
+        
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data['summary'], "Final summary.")
+        self.assertNotEqual(first.data['summary_id'], second.data['summary_id'])
+        self.assertGreater(first_calls, 10)
+        self.assertEqual(generate.call_count - first_calls, 1)
+        self.assertEqual(reduce.call_count, 2)
+        self.assertIn("Chunk summary.", reduce.call_args.args[0])
+    
+    @override_settings(INCREMENTAL_MIN_CHARS=1000, INCREMENTAL_CHUNK_CHARS=2000)
+    def test_failed_chunk_keeps_other_chunk_summaries(self):
+        """Test a retry after one chunk call failed only repeats that chunk."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        text = self._policy_text()
+        middle = len(text) // 2
+        text = text[:middle] + " Remote work needs approval. " + text[middle:]
+        failing = [True]
+        
+        def generate(template, priority=None, text=""):
+            if failing[0] and "Remote work" in text:
+                return "", "Upstream error"
+            return "Chunk summary.", None
+        
+        def upload():
+            fake_file = SimpleUploadedFile("policy.txt", text.encode(), content_type="text/plain")
+            return self.client.post('/api/summarize/', {'file': fake_file}, format='multipart')
+        
+        with patch.object(ai_summarizer, 'generate', side_effect=generate) as mock_generate, \
+                patch.object(ai_summarizer, 'summarize', return_value=("Final summary.", None)):
+            first = upload()
+            first_calls = mock_generate.call_count
+            failing[0] = False
+            second = upload()
+        
+        self.assertEqual(first.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertGreater(first_calls, 10)
+        self.assertEqual(mock_generate.call_count - first_calls, 1)
+    
+    @override_settings(INCREMENTAL_MAX_CHUNKS=32)
+    def test_chunk_calls_bounded_for_very_long_documents(self):
+        """Test a multi-megabyte document grows its chunks instead of making thousands of calls."""
+        from .utils.ai_summarizer import ai_summarizer
+        from .utils.incremental import document_chunk_chars, summarize_incremental
+        
+        text = "\n\n".join([self._policy_text()] * 60)
+        with patch.object(ai_summarizer, 'generate', return_value=("Chunk summary.", None)) as generate, \
+                patch.object(ai_summarizer, 'prepare_text', side_effect=lambda text, limit: text[:limit]), \
+                patch.object(ai_summarizer, 'summarize', return_value=("Final summary.", None)):
+            summary, chunks, error = summarize_incremental(text, lambda hashes: {})
+        
+        self.assertGreater(len(text), 2_000_000)
+        self.assertEqual((summary, error), ("Final summary.", None))
+        self.assertLessEqual(generate.call_count, 32)
+        self.assertEqual(generate.call_count, len(chunks))
+        self.assertEqual(document_chunk_chars(10_000), 4000)
+        self.assertGreater(document_chunk_chars(len(text)), 4000 * 2 ** 5)
+
+
+class PipelinedSummaryTests(APITestCase):
+    """Test dispatching chunk summaries while a document is still being extracted."""
+    
+    def test_chunk_stream_matches_chunk_text(self):
+        """Test chunking text piece by piece gives the same chunks as chunking it whole."""
+        from .utils.incremental import ChunkStream, chunk_text
+        
+        text = IncrementalSummaryTests._policy_text()
+        stream = ChunkStream(2000)
+        chunks = []
+        for start in range(0, len(text), 1500):
+            chunks += stream.feed(text[start:start + 1500])
+        chunks += stream.finish()
+        
+        self.assertEqual(chunks, chunk_text(text, 2000))
+    
+    @override_settings(INCREMENTAL_CHUNK_CHARS=2000)
+    def test_chunks_dispatched_during_extraction(self):
+        """Test chunk summaries start before the text is complete and are reduced in order."""
+        from .utils.ai_summarizer import ai_summarizer
+        from .utils.incremental import chunk_hash, chunk_template, chunk_text
+        from .utils.pipeline import PipelinedSummary
+        
+        text = IncrementalSummaryTests._policy_text()
+        pipeline = PipelinedSummary(lambda hashes: {}, min_chars=16000)
+        with patch.object(ai_summarizer, 'generate', return_value=("Chunk summary.", None)) as generate, \
+                patch.object(ai_summarizer, 'summarize', return_value=("Final summary.", None)) as reduce:
+            half = len(text) // 2
+            pipeline.feed(text[:half])
+            dispatched = len(pipeline._chunks)
+            pipeline.feed(text[half:])
+            summary, chunks, error = pipeline.result()
+        
+        self.assertTrue(pipeline.started)
+        self.assertGreater(dispatched, 3)
+        self.assertEqual((summary, error), ("Final summary.", None))
+        expected = chunk_text(text, 2000, max_chars=chunk_template().max_input_chars)
+        self.assertEqual([digest for digest, _ in chunks], [chunk_hash(chunk) for chunk in expected])
+        self.assertEqual(generate.call_count, len(chunks))
+        reduce.assert_called_once()
+    
+    @override_settings(INCREMENTAL_CHUNK_CHARS=2000)
+    def test_long_document_drops_pipeline(self):
+        """Test a document outgrowing the chunk call bound stops being pipelined."""
+        from .utils.ai_summarizer import ai_summarizer
+        from .utils.pipeline import PipelinedSummary
+        
+        text = IncrementalSummaryTests._policy_text()
+        pipeline = PipelinedSummary(lambda hashes: {}, min_chars=16000, max_chunks=20)
+        with patch.object(ai_summarizer, 'generate', return_value=("Chunk summary.", None)) as generate:
+            pipeline.feed(text[:16000])
+            started = pipeline.started
+            for start in range(16000, len(text), 2000):
+                pipeline.feed(text[start:start + 2000])
+        
+        self.assertTrue(started)
+        self.assertFalse(pipeline.started)
+        self.assertLessEqual(generate.call_count, 10)
+    
+    @patch('summarizer.views.summarize_text', return_value=("Direct summary.", None))
+    def test_short_document_not_pipelined(self, mock_summarize):
+        """Test documents below the threshold take the regular path."""
+        fake_file = SimpleUploadedFile("memo.txt", b"Lunch moved to noon.", content_type="text/plain")
+        response = self.client.post('/api/summarize/', {'file': fake_file}, format='multipart')
+        
+        self.assertEqual(response.data['summary'], "Direct summary.")
+        mock_summarize.assert_called_once()
+
+
+class SummaryRoutingTests(APITestCase):
+    """Test routing summaries by document features and recording what routes cost."""
+    
+    def setUp(self):
+        from .usage import usage_recorder
+        from .utils.routing import Router, RoutingRule
+        
+        # Calls are tallied per route; keep their usage records out of the database
+        usage_recorder.reset()
+        self.addCleanup(usage_recorder.reset)
+        self.router = Router([
+            RoutingRule.from_dict({'name': 'memo', 'max_input_tokens': 50, 'strategy': 'extractive'}),
+            RoutingRule.from_dict({'name': 'cjk', 'scripts': ['cjk'], 'model': 'gpt-4o'}),
+            RoutingRule.from_dict({'name': 'report', 'min_sections': 3, 'strategy': 'map_reduce'}),
+            RoutingRule.from_dict({'name': 'short', 'max_input_tokens': 1000, 'model': 'gpt-4o',
+                                   'max_tokens': 90}),
+        ])
+    
+    def _summarize(self, text, style='brief'):
+        fake_file = SimpleUploadedFile("doc.txt", text.encode(), content_type="text/plain")
+        with patch('summarizer.views.router', self.router):
+            return self.client.post('/api/summarize/', {'file': fake_file, 'style': style}, format='multipart')
+    
+    def test_rules_match_features(self):
+        """Test the first rule matching size, headings and script wins."""
+        from .utils.routing import DocumentFeatures, RoutingRule
+        
+        body = "The committee reviewed the quarterly figures and agreed to extend the pilot. " * 4
+        report = "\n\n".join(f"## Part {index}\n\n{body}" for index in range(4))
+        chinese = "委员会审查了季度数据并同意延长试点计划。" * 20
+        
+        self.assertEqual(self.router.decide("Lunch moved to noon.").route.name, 'memo')
+        self.assertEqual(self.router.decide(chinese).route.name, 'cjk')
+        self.assertEqual(DocumentFeatures.from_text(chinese).tokens, len(chinese))
+        self.assertEqual(DocumentFeatures.from_text(report).sections, 4)
+        self.assertEqual(self.router.decide(report).route.strategy, 'map_reduce')
+        self.assertEqual(self.router.decide(body).route.name, 'short')
+        self.assertEqual(self.router.decide(body * 20).route.name, 'default')
+        self.assertEqual(RoutingRule.from_dict({'name': 'long', 'strategy': 'map_reduce', 'max_chunks': 8})
+                         .route.max_chunks, 8)
+        with self.assertRaises(ValueError):
+            RoutingRule.from_dict({'name': 'bad', 'strategy': 'telepathy'})
+    
+    def test_default_rules_follow_incremental_threshold(self):
+        """Test the default rules switch to map-reduce where INCREMENTAL_MIN_CHARS does."""
+        from django.conf import settings
+        from .utils.routing import Router
+        
+        router = Router.from_settings()
+        below = "x" * (settings.INCREMENTAL_MIN_CHARS - 1)
+        
+        self.assertEqual(router.decide(below).route.strategy, 'direct')
+        self.assertEqual(router.decide(below + "x").route.strategy, 'map_reduce')
+        self.assertEqual(router.decide(below[:2000]).route.name, 'short')
+    
+    def test_route_sets_model_and_budget(self):
+        """Test the route's model and budget apply to templates without their own, and cost is recorded."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        upstream = MagicMock()
+        response = upstream.chat.completions.create.return_value
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = "A summary."
+        response.model = "gpt-4o-2024-08-06"
+        response.usage.prompt_tokens = 400
+        response.usage.completion_tokens = 80
+        body = "The committee reviewed the quarterly figures and agreed to extend the pilot. " * 4
+        with patch.object(ai_summarizer, '_client', upstream):
+            brief = self._summarize(body)
+            detailed = self._summarize(body, style='detailed')
+        
+        self.assertEqual(brief.status_code, status.HTTP_200_OK)
+        self.assertEqual(detailed.status_code, status.HTTP_200_OK)
+        brief_call, detailed_call = (call.kwargs for call in upstream.chat.completions.create.call_args_list)
+        self.assertEqual((brief_call['model'], brief_call['max_tokens']), ('gpt-4o', 90))
+        self.assertEqual((detailed_call['model'], detailed_call['max_tokens']), ('gpt-4o', 700))
+        route = self.router.metrics()['routes']['short']
+        self.assertEqual((route['decisions'], route['calls'], route['completion_tokens']), (2, 2, 160))
+        self.assertAlmostEqual(route['cost_usd'], 2 * (400 * 2.5 + 80 * 10) / 1_000_000)
+        self.assertEqual(route['latency']['samples'], 2)
+    
+    @patch('summarizer.views.summarize_text')
+    def test_extractive_route_skips_ai(self, mock_summarize):
+        """Test an extractive route answers without an AI call."""
+        response = self._summarize("Lunch moved to noon. Bring the slides.")
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary'], "Lunch moved to noon. Bring the slides.")
+        mock_summarize.assert_not_called()
+        self.assertEqual(self.router.metrics()['routes']['memo']['calls'], 0)
+    
+    @patch('summarizer.views.summarize_text', return_value=("An AI summary.", None))
+    def test_extractive_summary_stored_under_own_key(self, mock_summarize):
+        """Test an extractive summary is not served to a later request routed to the AI."""
+        from .models import Summary
+        from .utils.routing import Router
+        
+        extractive = self._summarize("Lunch moved to noon. Bring the slides.")
+        with patch('summarizer.views.router', Router([], enabled=False)):
+            fake_file = SimpleUploadedFile("doc.txt", b"Lunch moved to noon. Bring the slides.",
+                                           content_type="text/plain")
+            direct = self.client.post('/api/summarize/', {'file': fake_file, 'style': 'brief'}, format='multipart')
+        
+        self.assertEqual(direct.data['summary'], "An AI summary.")
+        self.assertNotEqual(direct.data['summary_id'], extractive.data['summary_id'])
+        self.assertTrue(Summary.objects.get(digest=extractive.data['summary_id']).prompt_key.startswith('extractive@1+'))
+        mock_summarize.assert_called_once()
+
+
+class LanguageDetectionTests(APITestCase):
+    """Test local language detection and language-aware prompts."""
+    
+    GERMAN = ("Der Ausschuss hat den Haushalt für das nächste Jahr geprüft und die Mittel für das neue "
+              "Gebäude genehmigt. Die Arbeiten werden im Frühjahr beginnen und sind nicht vor dem Herbst "
+              "abgeschlossen. ")
+    
+    def test_detects_language_from_script_and_stopwords(self):
+        """Test scripts decide most languages and stopwords split the Latin ones."""
+        from .utils.language import detect_language
+        
+        samples = {
+            'en': "The committee reviewed the budget and approved the plan for the new building. ",
+            'de': self.GERMAN,
+            'fr': "Le comité a examiné le budget et a approuvé le projet pour le nouveau bâtiment. ",
+            'es': "El comité revisó el presupuesto y aprobó el plan para el nuevo edificio de la ciudad. ",
+            'ru': "Комитет рассмотрел годовой бюджет и одобрил предложение о новом здании. ",
+            'uk': "Комітет розглянув річний бюджет і схвалив пропозицію щодо нової будівлі. ",
+            'ar': "راجعت اللجنة الميزانية السنوية ووافقت على اقتراح المبنى الجديد. ",
+            'fa': "کمیته بودجه سالانه را بررسی کرد و پیشنهاد ساختمان جدید را تصویب کرد. ",
+            'ja': "委員会は年間予算を検討し、新しい建物の提案を承認しました。",
+            'zh': "委员会审查了年度预算，并批准了新大楼的提案。",
+            'ko': "위원회는 연간 예산을 검토하고 새 건물에 대한 제안을 승인했습니다. ",
+        }
+        for code, text in samples.items():
+            self.assertEqual(detect_language(text * 3).code, code, text)
+        self.assertEqual(detect_language("12345 67890").code, 'en')
+    
+    def test_localized_templates(self):
+        """Test instructions and keys per language, and budgets calibrated to the script."""
+        from .utils.language import LANGUAGES, chunk_chars, localize
+        
+        template = get_prompt('brief')
+        english = localize(template, LANGUAGES['en'])
+        german = localize(template, LANGUAGES['de'])
+        translated = localize(template, LANGUAGES['de'], LANGUAGES['en'])
+        japanese = localize(template, LANGUAGES['ja'])
+        
+        self.assertIs(english, template)
+        self.assertEqual(german.key, f"{template.key}+de")
+        self.assertEqual(translated.key, f"{template.key}+de>en")
+        self.assertIn("The document is in German. Write your response in English.",
+                      translated.render(text="Text")[-1]['content'])
+        self.assertEqual(german.max_input_chars, template.max_input_chars)
+        self.assertLess(japanese.max_input_chars, template.max_input_chars)
+        self.assertLess(chunk_chars(LANGUAGES['ja']), chunk_chars(LANGUAGES['de']))
+    
+    def test_summary_is_localized_and_language_stored(self):
+        """Test the stored document language and the output_language parameter."""
+        from .models import Document, Summary
+        from .utils.ai_summarizer import ai_summarizer
+        
+        upstream = MagicMock()
+        response = upstream.chat.completions.create.return_value
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = "Eine Zusammenfassung."
+        response.usage = None
+        
+        def summarize(**extra):
+            fake_file = SimpleUploadedFile("bericht.txt", (self.GERMAN * 3).encode(), content_type="text/plain")
+            with patch.object(ai_summarizer, '_client', upstream):
+                return self.client.post('/api/summarize/', {'file': fake_file, 'style': 'brief', **extra},
+                                        format='multipart')
+        
+        german = summarize()
+        english = summarize(output_language='en')
+        shortened = summarize(output_language='en', length='tldr')
+        
+        self.assertEqual(german.status_code, status.HTTP_200_OK)
+        self.assertEqual(english.status_code, status.HTTP_200_OK)
+        self.assertEqual(shortened.status_code, status.HTTP_200_OK)
+        self.assertEqual(Document.objects.get().language, 'de')
+        keys = sorted(Summary.objects.filter(level=Summary.LEVEL_SUMMARY).values_list('prompt_key', flat=True))
+        self.assertTrue(keys[0].endswith('+de') and keys[1].endswith('+de>en'), keys)
+        pyramid_key = Summary.objects.get(level=Summary.LEVEL_TLDR).prompt_key
+        self.assertTrue(pyramid_key.startswith('section@') and pyramid_key.endswith('+de>en'), pyramid_key)
+        prompts = [call.kwargs['messages'][-1]['content'] for call in upstream.chat.completions.create.call_args_list]
+        self.assertIn("Write your response in German.", prompts[0])
+        self.assertIn("Write your response in English.", prompts[1])
+        # Sections are summarized in German, the levels condensed from them in English
+        self.assertIn("Write your response in German.", prompts[2])
+        self.assertIn("Write your response in English.", prompts[-1])
+    
+    def test_structured_and_chat_prompts_are_localized(self):
+        """Test structured summaries and chat answers use localized templates."""
+        from .utils.ai_summarizer import ai_summarizer
+        from .utils.language import LANGUAGES
+        
+        with patch.object(ai_summarizer, '_client', MagicMock()):
+            template, _, error = ai_summarizer._structured_request(self.GERMAN, None, LANGUAGES['de'], LANGUAGES['en'])
+        self.assertIsNone(error)
+        self.assertTrue(template.key.endswith('+de>en'), template.key)
+        
+        upstream = MagicMock()
+        upstream.chat.completions.create.return_value.choices = [MagicMock()]
+        upstream.chat.completions.create.return_value.choices[0].message.content = "The budget was approved."
+        upstream.chat.completions.create.return_value.usage = None
+        with patch.object(ai_summarizer, '_client', upstream):
+            answered = self.client.post('/api/chat-document/', {
+                'question': "What was decided about the budget?", 'context': self.GERMAN, 'cache': False,
+            }, format='json')
+            unknown = self.client.post('/api/chat-document/', {
+                'question': "Why?", 'context': self.GERMAN, 'output_language': 'xx',
+            }, format='json')
+        
+        self.assertEqual(answered.status_code, status.HTTP_200_OK)
+        self.assertEqual(unknown.status_code, status.HTTP_400_BAD_REQUEST)
+        prompt = upstream.chat.completions.create.call_args.kwargs['messages'][-1]['content']
+        self.assertIn("The document is in German. Write your response in English.", prompt)
+
+
+class BulkIngestionTests(TransactionTestCase):
+    """Test the staged, resumable bulk ingestion pipeline."""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from pathlib import Path
+        
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        for index in range(5):
+            (self.directory / f"policy-{index}.txt").write_text(f"Policy number {index} on travel expenses.")
+        (self.directory / "empty.txt").write_text("   ")
+        (self.directory / "notes.csv").write_text("not,ingested")
+    
+    def _run(self, **options):
+        from .ingestion import IngestionPipeline, discover
+        
+        pipeline = IngestionPipeline(workers=2, concurrency=2, queue_size=2, **options)
+        return pipeline, pipeline.run(discover(self.directory))
+    
+    @patch('summarizer.ingestion.summarize_text', return_value=("Ingested summary", None))
+    def test_pipeline_stores_documents_and_summaries(self, mock_summarize):
+        """Test every stage processes each supported file once and reports throughput."""
+        from .models import Document, IngestionItem, Summary
+        
+        pipeline, stats = self._run()
+        
+        self.assertEqual(stats['extract'].done, 5)
+        self.assertEqual(stats['extract'].failed, 1)
+        self.assertEqual(stats['summarize'].done, 5)
+        self.assertGreater(stats['summarize'].rate, 0)
+        self.assertEqual(Document.objects.count(), 5)
+        self.assertEqual(Summary.objects.filter(text="Ingested summary").count(), 5)
+        self.assertEqual(IngestionItem.objects.filter(status=IngestionItem.STATUS_DONE).count(), 5)
+        self.assertEqual(IngestionItem.objects.get(path__endswith="empty.txt").status, IngestionItem.STATUS_FAILED)
+        self.assertIn("docs/s", str(stats['extract']))
+    
+    @patch('summarizer.ingestion.summarize_text', return_value=("Ingested summary", None))
+    def test_rerun_resumes_from_checkpoints(self, mock_summarize):
+        """Test a rerun skips finished files and resumes extracted ones at summarize."""
+        from .models import IngestionItem, Summary
+        
+        self._run()
+        # Simulate a crash after one document was stored but before its summary was
+        item = IngestionItem.objects.get(path__endswith="policy-0.txt")
+        Summary.objects.filter(document=item.document).delete()
+        item.status, item.summary = IngestionItem.STATUS_EXTRACTED, None
+        item.save()
+        mock_summarize.reset_mock()
+        
+        pipeline, stats = self._run()
+        
+        self.assertEqual(pipeline.skipped, 5)
+        self.assertEqual(stats['extract'].done, 0)
+        self.assertEqual(stats['summarize'].done, 1)
+        self.assertEqual(mock_summarize.call_count, 1)
+        item.refresh_from_db()
+        self.assertEqual(item.status, IngestionItem.STATUS_DONE)
 
 
-class AISummarizerTests(TestCase):
-    """Test AI summarization utilities."""
+class FakeUpstream:
+    """Local stand-in for the AI API with a configurable latency."""
     
-    @override_settings(OPENAI_API_KEY='test-key')
-    @patch('summarizer.utils.ai_summarizer.OpenAI')
-    def test_summarize_success(self, mock_openai):
-        """Test successful summarization."""
-        # Mock OpenAI response
-        mock_client = MagicMock()
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message.content = "Test summary"
-        mock_client.chat.completions.create.return_value = mock_response
-        mock_openai.return_value = mock_client
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.calls = []
+        self.lock = threading.Lock()
+    
+    def create(self, label, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls.append(label)
+        return label
+
+
+class LLMSchedulerTests(TestCase):
+    """Test priority scheduling and admission control."""
+    
+    def _scheduler(self, limits=None, timeout=5.0):
+        return LLMScheduler(
+            max_concurrency=1,
+            queue_limits=limits or {'chat': 10, 'summarize': 10, 'batch': 10},
+            weights={'chat': 6, 'summarize': 3, 'batch': 1},
+            queue_timeout=timeout,
+        )
+    
+    def _start(self, scheduler, upstream, priority, label):
+        thread = threading.Thread(target=scheduler.run, args=(priority, upstream.create, label))
+        thread.start()
+        return thread
+    
+    def _wait_for_depth(self, scheduler, priority, depth):
+        for _ in range(200):
+            if scheduler.metrics()['classes'][priority]['depth'] >= depth:
+                return
+            time.sleep(0.005)
+        self.fail(f"{priority} queue never reached depth {depth}")
+    
+    def _wait_for_in_flight(self, scheduler):
+        for _ in range(200):
+            if scheduler.metrics()['in_flight']:
+                return
+            time.sleep(0.005)
+        self.fail("no call was admitted")
+    
+    def test_chat_served_before_batch(self):
+        """Test queued chat calls are admitted ahead of earlier batch calls."""
+        scheduler = self._scheduler()
+        upstream = FakeUpstream(latency=0.01)
+        blocker = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=('batch', blocker.wait))
+        holder.start()
+        self._wait_for_in_flight(scheduler)
         
-        summarizer = AISummarizer()
-        summary, error = summarizer.summarize("Long text to summarize")
+        threads = [self._start(scheduler, upstream, 'batch', f"batch-{i}") for i in range(3)]
+        self._wait_for_depth(scheduler, 'batch', 3)
+        threads += [self._start(scheduler, upstream, 'chat', f"chat-{i}") for i in range(3)]
+        self._wait_for_depth(scheduler, 'chat', 3)
         
-        self.assertIsNone(error)
-        self.assertEqual(summary, "Test summary")
+        blocker.set()
+        for thread in threads + [holder]:
+            thread.join()
+        
+        first_four = upstream.calls[:4]
+        self.assertEqual(sum(label.startswith('chat') for label in first_four), 3)
+        self.assertEqual(len(upstream.calls), 6)
     
-    @override_settings(OPENAI_API_KEY='')
-    def test_summarize_no_api_key(self):
-        """Test summarization without API key."""
-        summarizer = AISummarizer()
-        summary, error = summarizer.summarize("Test text")
+    def test_sheds_when_queue_full(self):
+        """Test a full queue sheds the call with a Retry-After hint."""
+        scheduler = self._scheduler(limits={'chat': 1, 'summarize': 1, 'batch': 1})
+        upstream = FakeUpstream()
+        blocker = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=('summarize', blocker.wait))
+        holder.start()
+        self._wait_for_in_flight(scheduler)
+        waiter = self._start(scheduler, upstream, 'batch', 'queued')
+        self._wait_for_depth(scheduler, 'batch', 1)
         
-        self.assertIsNotNone(error)
-        self.assertIn("not configured", error)
+        with self.assertRaises(QueueFull) as ctx:
+            scheduler.run('batch', upstream.create, 'shed')
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        
+        blocker.set()
+        holder.join()
+        waiter.join()
+        metrics = scheduler.metrics()['classes']['batch']
+        self.assertEqual(metrics['shed'], 1)
+        self.assertEqual(metrics['admitted'], 1)
+        self.assertEqual(upstream.calls, ['queued'])
     
-    def test_summarize_empty_text(self):
-        """Test summarization with empty text."""
-        summarizer = AISummarizer()
-        summary, error = summarizer.summarize("")
+    def test_sheds_after_wait_timeout(self):
+        """Test callers waiting past the queue timeout are shed."""
+        scheduler = self._scheduler(timeout=0.05)
+        blocker = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=('chat', blocker.wait))
+        holder.start()
+        self._wait_for_in_flight(scheduler)
         
-        self.assertIsNotNone(error)
-        self.assertIn("No text", error)
+        with self.assertRaises(QueueFull) as ctx:
+            scheduler.run('chat', FakeUpstream().create, 'late')
+        self.assertEqual(ctx.exception.reason, "wait timeout")
+        
+        blocker.set()
+        holder.join()
+    
+    def test_promoted_group_served_at_higher_priority(self):
+        """Test promoting a call group moves its waiting and later calls to the higher class."""
+        from .utils.scheduler import call_group
+        
+        scheduler = self._scheduler()
+        upstream = FakeUpstream()
+        blocker = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=('chat', blocker.wait))
+        holder.start()
+        self._wait_for_in_flight(scheduler)
+        job = object()
+        
+        def grouped(label):
+            call_group.set(job)
+            scheduler.run('batch', upstream.create, label)
+        
+        def start_grouped(label):
+            thread = threading.Thread(target=grouped, args=(label,))
+            thread.start()
+            return thread
+        
+        threads = [self._start(scheduler, upstream, 'batch', 'other')]
+        self._wait_for_depth(scheduler, 'batch', 1)
+        threads.append(start_grouped('job-1'))
+        self._wait_for_depth(scheduler, 'batch', 2)
+        
+        self.assertEqual(scheduler.promote(job, 'summarize'), 1)
+        threads.append(start_grouped('job-2'))
+        self._wait_for_depth(scheduler, 'summarize', 2)
+        self.assertEqual(scheduler.metrics()['classes']['batch']['depth'], 1)
+        
+        blocker.set()
+        for thread in threads + [holder]:
+            thread.join()
+        scheduler.forget(job)
+        
+        self.assertEqual(upstream.calls, ['job-1', 'job-2', 'other'])
+        self.assertEqual(scheduler.metrics()['classes']['summarize']['admitted'], 2)
+        self.assertEqual(scheduler._promoted, {})
+    
+    def test_cancelled_group_calls_are_withdrawn(self):
+        """Test cancelling a call group withdraws its waiting calls and refuses later ones."""
+        from .utils.scheduler import CallCancelled, call_group
+        
+        scheduler = self._scheduler()
+        upstream = FakeUpstream()
+        blocker = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=('chat', blocker.wait))
+        holder.start()
+        self._wait_for_in_flight(scheduler)
+        job = object()
+        errors = []
+        
+        def grouped():
+            call_group.set(job)
+            try:
+                scheduler.run('batch', upstream.create, 'job')
+            except CallCancelled as e:
+                errors.append(e)
+        
+        thread = threading.Thread(target=grouped)
+        thread.start()
+        self._wait_for_depth(scheduler, 'batch', 1)
+        
+        self.assertEqual(scheduler.cancel(job), 1)
+        thread.join(timeout=2)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(scheduler.metrics()['classes']['batch']['depth'], 0)
+        
+        token = call_group.set(job)
+        try:
+            with self.assertRaises(CallCancelled):
+                scheduler.run('batch', upstream.create, 'later')
+            scheduler.forget(job)
+            blocker.set()
+            holder.join()
+            self.assertEqual(scheduler.run('batch', upstream.create, 'after'), 'after')
+        finally:
+            call_group.reset(token)
+        self.assertEqual(upstream.calls, ['after'])
+    
+    @patch('summarizer.views.summarize_text')
+    def test_summarize_returns_429_when_shed(self, mock_summarize):
+        """Test the API answers 429 with Retry-After when the scheduler sheds."""
+        mock_summarize.side_effect = QueueFull('summarize', 7)
+        fake_file = SimpleUploadedFile("test.txt", b"Some content.", content_type="text/plain")
+        
+        response = self.client.post('/api/summarize/', {'file': fake_file})
+        
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(response.json()['status'], 'failed')
+    
+    def test_metrics_endpoint(self):
+        """Test scheduler metrics are exposed per priority class."""
+        response = self.client.get('/api/metrics/scheduler/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        classes = response.json()['scheduler']['classes']
+        self.assertEqual(set(classes), {'chat', 'summarize', 'batch'})
+        self.assertIn('p95', classes['chat']['wait_ms'])
+
+
+class HedgingTests(TestCase):
+    """Test hedged AI requests."""
+    
+    def _hedger(self, **overrides):
+        options = dict(
+            enabled=True, percentile=0.95, min_delay=0.01, default_delay=0.05, min_samples=5,
+            fallback_model='', budget_ratio=1.0, budget_burst=1.0, attempt_timeout=5.0, max_workers=4,
+        )
+        options.update(overrides)
+        return Hedger(**options)
+    
+    def _attempt(self, latencies):
+        """Fake upstream whose latency depends on the model."""
+        def attempt(model):
+            time.sleep(latencies[model])
+            return model
+        return attempt
+    
+    def test_slow_call_is_hedged_to_fallback(self):
+        """Test a stalled call loses to a hedge sent to the fallback model."""
+        hedger = self._hedger(fallback_model='small')
+        
+        result = hedger.call(self._attempt({'large': 0.5, 'small': 0.01}), 'large')
+        
+        self.assertEqual(result, 'small')
+        metrics = hedger.metrics()
+        self.assertEqual(metrics['hedged'], 1)
+        self.assertEqual(metrics['hedge_wins'], 1)
+    
+    def test_fast_call_is_not_hedged(self):
+        """Test calls finishing before the deadline issue no hedge."""
+        hedger = self._hedger()
+        
+        result = hedger.call(self._attempt({'large': 0.0}), 'large')
+        
+        self.assertEqual(result, 'large')
+        self.assertEqual(hedger.metrics()['hedged'], 0)
+    
+    def test_losing_stream_is_closed(self):
+        """Test the response of the losing attempt is closed once it returns."""
+        hedger = self._hedger(fallback_model='small')
+        responses = {}
+        
+        def attempt(model):
+            time.sleep({'large': 0.3, 'small': 0.01}[model])
+            responses[model] = MagicMock()
+            return responses[model]
+        
+        result = hedger.call(attempt, 'large')
+        
+        self.assertIs(result, responses['small'])
+        deadline = time.monotonic() + 2
+        while hedger.metrics()['losers_closed'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        responses['large'].close.assert_called_once_with()
+        result.close.assert_not_called()
+    
+    def test_losing_attempt_frees_its_slot(self):
+        """Test a running loser returns its scheduler slot when the race is decided, and its usage is reported."""
+        scheduler = LLMScheduler(
+            max_concurrency=2, queue_limits={'chat': 10, 'summarize': 10, 'batch': 10},
+            weights={'chat': 6, 'summarize': 3, 'batch': 1}, queue_timeout=5.0,
+        )
+        hedger = self._hedger(fallback_model='small', scheduler=scheduler)
+        release = threading.Event()
+        discarded = []
+        returned = threading.Event()
+        
+        def respond(model):
+            if model == 'large':
+                release.wait(2)
+            return model
+        
+        def on_discard(result):
+            discarded.append(result)
+            returned.set()
+        
+        result = hedger.call(lambda model: scheduler.run('summarize', respond, model), 'large', on_discard)
+        
+        self.assertEqual(result, 'small')
+        self.assertEqual(scheduler.metrics()['in_flight'], 0)
+        release.set()
+        self.assertTrue(returned.wait(2))
+        self.assertEqual(discarded, ['large'])
+        self.assertEqual(scheduler.metrics()['in_flight'], 0)
+    
+    def test_failed_attempts_count_toward_latency(self):
+        """Test failed attempts are recorded, timeouts as taking at least the attempt timeout."""
+        hedger = self._hedger(enabled=False, attempt_timeout=5.0)
+        
+        def timed_out(model):
+            raise TimeoutError("Request timed out")
+        
+        def failed(model):
+            raise ValueError("Bad request")
+        
+        for attempt in (timed_out, failed):
+            with self.assertRaises((TimeoutError, ValueError)):
+                hedger.call(attempt, 'large')
+        
+        self.assertEqual(hedger.tracker.count('large'), 2)
+        self.assertEqual(hedger.tracker.percentile('large', 1.0), 5.0)
+        self.assertLess(hedger.tracker.percentile('large', 0.5), 1.0)
+    
+    def test_budget_caps_hedges(self):
+        """Test no hedge is issued once the budget is exhausted."""
+        hedger = self._hedger(budget_ratio=0.0, budget_burst=0.0, fallback_model='small')
+        
+        result = hedger.call(self._attempt({'large': 0.1, 'small': 0.0}), 'large')
+        
+        self.assertEqual(result, 'large')
+        self.assertEqual(hedger.metrics()['budget_denied'], 1)
+    
+    def test_deadline_follows_observed_latency(self):
+        """Test the hedge deadline adapts to the model's latency percentile."""
+        hedger = self._hedger(min_samples=3)
+        self.assertEqual(hedger.deadline('large'), 0.05)
+        
+        for seconds in (0.2, 0.3, 0.4):
+            hedger.tracker.record('large', seconds)
+        
+        self.assertEqual(hedger.deadline('large'), 0.4)
+    
+    def test_latency_tracker_percentiles(self):
+        """Test nearest-rank percentiles of recorded latencies."""
+        tracker = LatencyTracker()
+        for ms in range(1, 101):
+            tracker.record('model', ms / 1000)
+        
+        self.assertAlmostEqual(tracker.percentile('model', 0.5), 0.05)
+        self.assertAlmostEqual(tracker.percentile('model', 0.99), 0.099)
+        self.assertIsNone(tracker.percentile('other', 0.5))
 
 
 class SummarizeAPITests(APITestCase):
@@ -142,6 +1762,15 @@ class SummarizeAPITests(APITestCase):
         self.assertEqual(response.data['status'], 'success')
         self.assertIn('summary', response.data)
     
+    def test_post_with_unknown_style(self):
+        """Test POST request with an unknown summary style."""
+        fake_file = SimpleUploadedFile("test.txt", b"content", content_type="text/plain")
+        
+        response = self.client.post(self.url, {'file': fake_file, 'style': 'haiku'}, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['status'], 'failed')
+    
     @override_settings(MAX_FILE_SIZE=100)  # Set very small limit
     def test_post_with_oversized_file(self):
         """Test POST request with file exceeding size limit."""
@@ -156,6 +1785,588 @@ class SummarizeAPITests(APITestCase):
         self.assertIn('size', response.data['error'].lower())
 
 
+class SummaryResourceTests(APITestCase):
+    """Test stored summaries at /api/summaries/<id>/ with conditional GET."""
+    
+    def _summarize(self, content=b"Document worth summarizing.", **data):
+        fake_file = SimpleUploadedFile("doc.txt", content, content_type="text/plain")
+        return self.client.post('/api/summarize/', {'file': fake_file, **data}, format='multipart')
+    
+    @patch('summarizer.views.summarize_text', return_value=("Stored summary", None))
+    def test_repeat_summaries_served_from_storage(self, mock_summarize):
+        """Test a second request for the same document and prompt costs no AI call."""
+        first = self._summarize()
+        second = self._summarize()
+        other_style = self._summarize(style='bullet')
+        
+        self.assertEqual(first.data['summary_id'], second.data['summary_id'])
+        self.assertNotEqual(first.data['summary_id'], other_style.data['summary_id'])
+        self.assertEqual(second.data['summary'], "Stored summary")
+        self.assertEqual(mock_summarize.call_count, 2)
+    
+    @patch('summarizer.views.summarize_text', return_value=("Stored summary", None))
+    def test_conditional_get_returns_304(self, _):
+        """Test the summary resource sends a strong ETag and honours If-None-Match."""
+        from .models import Summary
+        
+        summary_id = self._summarize().data['summary_id']
+        url = f'/api/summaries/{summary_id}/'
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary'], "Stored summary")
+        self.assertEqual(response['ETag'], Summary.objects.get(digest=summary_id).etag)
+        self.assertIn('max-age', response['Cache-Control'])
+        
+        self.assertIn('X-API-Key', response['Vary'])
+        
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached.content, b"")
+        self.assertEqual(cached['ETag'], response['ETag'])
+        
+        stale = self.client.get(url, HTTP_IF_NONE_MATCH='"something-else"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+    
+    @patch('summarizer.views.summarize_text', return_value=("Stored summary", None))
+    def test_regenerated_summary_changes_etag(self, _):
+        """Test a summary regenerated under the same ID gets a new ETag."""
+        from .models import Summary
+        
+        summary_id = self._summarize().data['summary_id']
+        url = f'/api/summaries/{summary_id}/'
+        old_etag = self.client.get(url)['ETag']
+        
+        Summary.objects.filter(digest=summary_id).update(text="Regenerated summary")
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=old_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary'], "Regenerated summary")
+        self.assertNotEqual(response['ETag'], old_etag)
+    
+    def test_unknown_summary_not_found(self):
+        """Test an unknown summary ID gives a 404."""
+        response = self.client.get('/api/summaries/missing/')
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['status'], 'failed')
+
+
+class StructuredSummaryTests(APITestCase):
+    """Test JSON schema summaries, incremental parsing and SSE streaming."""
+    
+    SUMMARY = {
+        "title": "Launch plan",
+        "key_points": ["Launch moves to May", "Budget is approved"],
+        "entities": [{"name": "Acme", "type": "organization"}],
+        "action_items": [{"task": "Book the venue", "owner": "Dana", "due": None}],
+    }
+    
+    def _summarize(self, **data):
+        fake_file = SimpleUploadedFile("plan.txt", b"The launch plan document.", content_type="text/plain")
+        return self.client.post('/api/summarize/', {'file': fake_file, 'output': 'structured', **data},
+                                format='multipart')
+    
+    def test_fields_reported_as_they_complete(self):
+        """Test the streaming parser emits each field before the object is closed."""
+        from .utils.structured import stream_summary_events
+        
+        text = "```json\n" + json.dumps(self.SUMMARY, indent=2) + "\n```"
+        seen_at = []
+        
+        def deltas():
+            for index, char in enumerate(text):
+                seen_at.append(index)
+                yield char
+        
+        events = [(event, value, seen_at[-1]) for event, value in stream_summary_events(deltas())]
+        
+        self.assertEqual([event for event, _, _ in events],
+                         ["title", "key_point", "key_point", "entity", "action_item", "summary"])
+        self.assertEqual(events[1][1], "Launch moves to May")
+        self.assertLess(events[1][2], text.index("Budget"))
+        self.assertEqual(events[-1][1], self.SUMMARY)
+    
+    def test_validation(self):
+        """Test summaries missing fields are rejected and values are normalized."""
+        from .utils.structured import parse_summary, validate_summary
+        
+        _, error = validate_summary({"title": "Only a title"})
+        self.assertIn("key_points", error)
+        _, error = parse_summary("Sorry, I cannot do that.")
+        self.assertIsNotNone(error)
+        
+        summary, error = validate_summary({
+            "title": " Plan ", "key_points": ["A", " "],
+            "entities": [{"name": "Mars", "type": "planet"}],
+            "action_items": [{"task": "Go", "owner": "", "due": None}],
+        })
+        self.assertIsNone(error)
+        self.assertEqual(summary["title"], "Plan")
+        self.assertEqual(summary["key_points"], ["A"])
+        self.assertEqual(summary["entities"][0]["type"], "other")
+        self.assertIsNone(summary["action_items"][0]["owner"])
+    
+    def test_structured_summary_stored_and_served(self):
+        """Test a structured summary is returned as an object and stored as one."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        with patch.object(ai_summarizer, 'summarize_structured', return_value=(self.SUMMARY, None)) as mock:
+            first = self._summarize()
+            second = self._summarize()
+        
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['summary'], self.SUMMARY)
+        self.assertEqual(second.data['summary_id'], first.data['summary_id'])
+        self.assertEqual(mock.call_count, 1)
+        
+        stored = self.client.get(f"/api/summaries/{first.data['summary_id']}/")
+        self.assertEqual(stored.data['summary'], self.SUMMARY)
+    
+    def test_invalid_combinations_rejected(self):
+        """Test streaming needs structured output, which cannot take a length."""
+        fake_file = SimpleUploadedFile("plan.txt", b"Text.", content_type="text/plain")
+        text_stream = self.client.post('/api/summarize/', {'file': fake_file, 'stream': 'true'},
+                                       format='multipart')
+        with_length = self._summarize(length='tldr')
+        
+        self.assertEqual(text_stream.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(with_length.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_stream_sends_events(self):
+        """Test stream=true sends server-sent events, then the stored summary's ID."""
+        from .usage import usage_recorder
+        from .utils.ai_summarizer import ai_summarizer
+        
+        text = json.dumps(self.SUMMARY)
+        chunks = []
+        for start in range(0, len(text), 7):
+            chunk = MagicMock(usage=None)
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = text[start:start + 7]
+            chunks.append(chunk)
+        final = MagicMock(choices=[])
+        final.usage.prompt_tokens = 100
+        final.usage.completion_tokens = 40
+        chunks.append(final)
+        upstream = MagicMock()
+        upstream.chat.completions.create.return_value = iter(chunks)
+        usage_recorder.reset()
+        
+        with patch.object(ai_summarizer, '_client', upstream):
+            response = self._summarize(stream='true')
+            body = b"".join(response.streaming_content).decode()
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(upstream.chat.completions.create.call_args.kwargs['stream'])
+        events = [block.split("\n") for block in body.strip().split("\n\n")]
+        names = [lines[0].removeprefix("event: ") for lines in events]
+        self.assertEqual(names, ["title", "key_point", "key_point", "entity", "action_item", "summary"])
+        final_event = json.loads(events[-1][1].removeprefix("data: "))
+        self.assertEqual(final_event['summary'], self.SUMMARY)
+        self.assertEqual(usage_recorder.pending(), 1)
+        
+        replay = self._summarize(stream='true')
+        replayed = b"".join(replay.streaming_content).decode()
+        self.assertIn(final_event['summary_id'], replayed)
+        self.assertEqual(upstream.chat.completions.create.call_count, 1)
+
+
+class ProfilingTests(APITestCase):
+    """Test the opt-in profiling middleware and profile downloads."""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from .authentication import ApiKeyAuthentication, create_client
+        
+        ApiKeyAuthentication.clear_cache()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        _, self.admin_key = create_client("ops", is_admin=True)
+        _, self.key = create_client("partner")
+    
+    def _get(self, key, mode='cprofile'):
+        return self.client.get('/api/summarize/', HTTP_X_API_KEY=key, HTTP_X_PROFILE=mode)
+    
+    def test_disabled_middleware_removes_itself(self):
+        """Test the middleware is dropped from the chain when profiling is off."""
+        from django.core.exceptions import MiddlewareNotUsed
+        from .profiling import ProfilingMiddleware
+        
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+    
+    def test_admin_header_profiles_request(self):
+        """Test an admin's X-Profile header stores a downloadable profile."""
+        import pstats
+        
+        with self.settings(PROFILING_ENABLED=True, PROFILING_DIR=self.directory):
+            response = self._get(self.admin_key)
+            profile_id = response['X-Profile-Id']
+            listing = self.client.get('/api/profiles/', HTTP_X_API_KEY=self.admin_key)
+            download = self.client.get(f'/api/profiles/{profile_id}/', HTTP_X_API_KEY=self.admin_key)
+            forbidden = self.client.get('/api/profiles/', HTTP_X_API_KEY=self.key)
+        
+        self.assertEqual(listing.data['profiles'][0]['path'], '/api/summarize/')
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        path = f"{self.directory}/{profile_id}.prof"
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_header_ignored_for_other_clients(self):
+        """Test non-admin clients cannot trigger profiling."""
+        with self.settings(PROFILING_ENABLED=True, PROFILING_DIR=self.directory):
+            response = self._get(self.key)
+        
+        self.assertNotIn('X-Profile-Id', response)
+    
+    def test_sampling_rate_uses_stack_sampler(self):
+        """Test sampled requests are profiled with the stack sampler and pruned to the limit."""
+        from .profiling import list_profiles
+        
+        with self.settings(PROFILING_ENABLED=True, PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=1.0,
+                           PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                response = self.client.get('/api/summarize/')
+            profiles = list_profiles()
+        
+        self.assertTrue(response['X-Profile-Id'])
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(profiles[0]['mode'], 'sample')
+    
+    def test_stack_sampler_records_busy_function(self):
+        """Test the sampler attributes samples to the running function."""
+        from .profiling import StackSampler
+        
+        def busy_loop():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+        
+        sampler = StackSampler(0.002)
+        sampler.start()
+        busy_loop()
+        sampler.stop()
+        
+        self.assertGreater(sampler.samples, 5)
+        self.assertIn("tests.py:busy_loop", sampler.collapsed())
+
+
+class ServerTimingTests(APITestCase):
+    """Test the per-stage Server-Timing header."""
+    
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_stages_reported(self):
+        """Test extraction, AI and database time are reported with the total."""
+        from .utils.ai_summarizer import ai_summarizer
+        
+        upstream = MagicMock()
+        upstream.chat.completions.create.return_value.choices = [MagicMock()]
+        upstream.chat.completions.create.return_value.choices[0].message.content = "A summary."
+        fake_file = SimpleUploadedFile("doc.txt", b"Text to summarize.", content_type="text/plain")
+        with patch.object(ai_summarizer, '_client', upstream):
+            response = self.client.post('/api/summarize/', {'file': fake_file}, format='multipart')
+        
+        stages = dict(metric.strip().split(';dur=') for metric in response['Server-Timing'].split(','))
+        self.assertEqual(set(stages), {'extract', 'queue', 'upstream', 'db', 'total'})
+        self.assertGreaterEqual(float(stages['total']), float(stages['extract']))
+    
+    def test_disabled_by_default(self):
+        """Test no header is sent unless SERVER_TIMING_ENABLED is on."""
+        response = self.client.get('/api/summarize/')
+        
+        self.assertNotIn('Server-Timing', response)
+
+
+class UsageAccountingTests(APITestCase):
+    """Test API key clients, usage recording, quotas and the usage endpoint."""
+    
+    def setUp(self):
+        from .authentication import ApiKeyAuthentication, create_client
+        from .usage import usage_recorder
+        
+        ApiKeyAuthentication.clear_cache()
+        self.recorder = usage_recorder
+        self.recorder.reset()
+        self.api_client, self.key = create_client("partner", monthly_token_quota=1000)
+        self.admin_client, self.admin_key = create_client("ops", is_admin=True)
+        
+        # Upstream reports 100 prompt and 20 completion tokens per call
+        self.upstream = MagicMock()
+        response = self.upstream.chat.completions.create.return_value
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = "An answer."
+        response.model = "gpt-4o-mini-2024-07-18"
+        response.usage.prompt_tokens = 100
+        response.usage.completion_tokens = 20
+    
+    def _chat(self, key=None):
+        from .utils.ai_summarizer import ai_summarizer
+        
+        headers = {'HTTP_X_API_KEY': key} if key else {}
+        with patch.object(ai_summarizer, '_client', self.upstream), \
+                patch.object(self.recorder, 'flush_interval', 3600):
+            return self.client.post('/api/chat-document/', {'question': 'Why?', 'context': 'Because.', 'cache': False},
+                                    format='json', **headers)
+    
+    @override_settings(API_KEY_REQUIRED=True)
+    def test_api_key_required(self):
+        """Test requests need a valid key when keys are required."""
+        missing = self.client.get('/api/summarize/')
+        invalid = self.client.get('/api/summarize/', HTTP_X_API_KEY='sk-sum-wrong')
+        valid = self.client.get('/api/summarize/', HTTP_X_API_KEY=self.key)
+        
+        self.assertEqual(missing.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(missing.data['status'], 'failed')
+        self.assertEqual(invalid.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(valid.status_code, status.HTTP_200_OK)
+    
+    def test_usage_is_buffered_then_written_in_one_batch(self):
+        """Test calls are recorded per client without a write per request."""
+        from .models import UsageRecord
+        
+        for _ in range(3):
+            self.assertEqual(self._chat(self.key).status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(UsageRecord.objects.count(), 0)
+        self.assertEqual(self.recorder.pending(), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.recorder.flush(), 3)
+        
+        record = UsageRecord.objects.first()
+        self.assertEqual(record.client, self.api_client)
+        self.assertEqual(record.endpoint, 'chat_document')
+        self.assertEqual((record.prompt_tokens, record.completion_tokens), (100, 20))
+        # gpt-4o-mini pricing: (100 * 0.15 + 20 * 0.60) / 1M
+        self.assertAlmostEqual(float(record.cost_usd), 0.000027)
+    
+    def test_quota_enforced_before_upstream_call(self):
+        """Test an over-quota client gets 429 without reaching the AI API."""
+        from .usage import UsageContext
+        
+        self.recorder.record("gpt-4o-mini", 900, 100, context=UsageContext(self.api_client))
+        
+        response = self._chat(self.key)
+        
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('quota', response.data['error'].lower())
+        self.assertIn('Retry-After', response)
+        self.upstream.chat.completions.create.assert_not_called()
+    
+    def test_quota_counts_stored_and_buffered_usage(self):
+        """Test usage already in the database and usage still buffered both count."""
+        from .usage import UsageContext
+        
+        self.recorder.record("gpt-4o-mini", 300, 0, context=UsageContext(self.api_client))
+        self.recorder.flush()
+        self.recorder.record("gpt-4o-mini", 200, 0, context=UsageContext(self.api_client))
+        
+        self.assertEqual(self.recorder.tokens_used(self.api_client), 500)
+        self.recorder.record("gpt-4o-mini", 50, 0, context=UsageContext(self.api_client))
+        self.recorder.flush()
+        self.assertEqual(self.recorder.tokens_used(self.api_client), 550)
+    
+    def test_usage_endpoint_aggregates_spend(self):
+        """Test usage totals per group, scoped to the requesting client."""
+        from .usage import UsageContext
+        
+        self._chat(self.key)
+        self.recorder.record("gpt-4o", 1000, 0, context=UsageContext(self.admin_client, 'summarize'))
+        
+        admin_view = self.client.get('/api/usage/', {'group_by': 'model'}, HTTP_X_API_KEY=self.admin_key)
+        own_view = self.client.get('/api/usage/', HTTP_X_API_KEY=self.key)
+        
+        self.assertEqual(admin_view.status_code, status.HTTP_200_OK)
+        groups = {row['group']: row for row in admin_view.data['usage']}
+        self.assertEqual(set(groups), {'gpt-4o-mini-2024-07-18', 'gpt-4o'})
+        self.assertEqual(admin_view.data['total']['total_tokens'], 1120)
+        self.assertAlmostEqual(groups['gpt-4o']['cost_usd'], 0.0025)
+        
+        self.assertEqual([row['group'] for row in own_view.data['usage']], ['partner'])
+        self.assertEqual(own_view.data['quota'], {'monthly_token_quota': 1000, 'tokens_used_this_month': 120})
+
+
+class ChatAnswerCacheTests(APITestCase):
+    """Test cached chat answers for repeated and rephrased questions."""
+    
+    def setUp(self):
+        from .utils.answer_cache import answer_cache
+        
+        self.cache = answer_cache
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        self.upstream = MagicMock()
+        response = self.upstream.chat.completions.create.return_value
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = "Revenue grew 12%."
+        response.usage = None
+    
+    def _chat(self, question, context="The annual report of Example Corp.", **extra):
+        from .utils.ai_summarizer import ai_summarizer
+        
+        with patch.object(ai_summarizer, '_client', self.upstream):
+            return self.client.post('/api/chat-document/', {'question': question, 'context': context, **extra},
+                                    format='json')
+    
+    def test_repeated_questions_are_answered_from_cache(self):
+        """Test repeats and rephrasings of a question skip the upstream call."""
+        first = self._chat("How did revenue develop over the year?")
+        repeat = self._chat("  how did REVENUE develop over the year ")
+        similar = self._chat("How did the revenue develop over the year?")
+        other_document = self._chat("How did revenue develop over the year?", context="A different report.")
+        
+        self.assertEqual(first.data['cached'], False)
+        self.assertEqual(repeat.data['cached'], 'exact')
+        self.assertEqual(similar.data['cached'], 'similar')
+        self.assertEqual(similar.data['answer'], "Revenue grew 12%.")
+        self.assertEqual(other_document.data['cached'], False)
+        self.assertEqual(self.upstream.chat.completions.create.call_count, 2)
+        
+        metrics = self.client.get('/api/metrics/chat-cache/').data['chat_cache']
+        self.assertEqual((metrics['hits'], metrics['similar_hits'], metrics['misses']), (1, 1, 2))
+    
+    def test_different_questions_and_bypass_call_upstream(self):
+        """Test other questions, other numbers and cache=false are not served from cache."""
+        self._chat("What was the revenue in 2022?")
+        other_year = self._chat("What was the revenue in 2023?")
+        other_question = self._chat("Who is the chief executive?")
+        bypassed = self._chat("What was the revenue in 2022?", cache=False)
+        
+        self.assertEqual(other_year.data['cached'], False)
+        self.assertEqual(other_question.data['cached'], False)
+        self.assertEqual(bypassed.data['cached'], False)
+        self.assertEqual(self.upstream.chat.completions.create.call_count, 4)
+        self.assertEqual(self.cache.metrics()['bypassed'], 1)
+    
+    def test_entries_expire_and_least_recently_used_are_evicted(self):
+        """Test the TTL and the LRU bound."""
+        from .utils.answer_cache import AnswerCache
+        
+        cache = AnswerCache(max_entries=2, ttl=60, similarity=0.8)
+        cache.put('doc', "First question?", "one")
+        cache.put('doc', "Second question?", "two")
+        self.assertEqual(cache.get('doc', "first question"), ("one", 'exact'))
+        cache.put('doc', "Third question?", "three")
+        
+        self.assertEqual(cache.get('doc', "Second question?"), (None, None))
+        self.assertEqual(cache.get('doc', "First question?")[0], "one")
+        self.assertEqual(cache.metrics()['evicted'], 1)
+        
+        with patch('summarizer.utils.answer_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(cache.get('doc', "Third question?"), (None, None))
+        self.assertEqual(cache.metrics()['entries'], 1)
+    
+    def test_negations_and_names_are_not_near_duplicates(self):
+        """Test questions differing in a negation or a party name miss, and contractions hit."""
+        from .utils.answer_cache import AnswerCache
+        
+        cache = AnswerCache(similarity=0.8)
+        cache.put('doc', "Can the contract be terminated?", "Yes, with notice.")
+        cache.put('doc', "What must party A pay?", "Party A pays 100.")
+        cache.put('doc', "What is the deadline?", "March 1.")
+        
+        self.assertEqual(cache.get('doc', "Can the contract not be terminated?"), (None, None))
+        self.assertEqual(cache.get('doc', "Can't the contract be terminated?"), (None, None))
+        self.assertEqual(cache.get('doc', "What must party B pay?"), (None, None))
+        self.assertEqual(cache.get('doc', "whats the deadline"), ("March 1.", 'similar'))
+
+
+class ChunkedUploadTests(APITestCase):
+    """Test chunked, resumable uploads."""
+    
+    def setUp(self):
+        import tempfile
+        
+        self.upload_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_DIR=self.upload_dir, UPLOAD_PART_SIZE=1000)
+        self.settings_override.enable()
+        self.content = ("A line of a large report.\n" * 100).encode()  # 2700 bytes, 3 parts
+    
+    def tearDown(self):
+        import shutil
+        
+        self.settings_override.disable()
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+    
+    def _init(self, **extra):
+        response = self.client.post('/api/uploads/', {'filename': 'report.txt', 'size': len(self.content), **extra},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['upload_id']
+    
+    def _put(self, upload_id, part, data=None, checksum=None):
+        import hashlib
+        
+        data = self.content[(part - 1) * 1000:part * 1000] if data is None else data
+        return self.client.put(
+            f'/api/uploads/{upload_id}/parts/{part}/', data, content_type='application/octet-stream',
+            HTTP_X_CHECKSUM_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+    
+    def test_resumable_upload_and_extraction(self):
+        """Test parts arrive out of order, the upload resumes, and completion extracts the text."""
+        import os
+        
+        upload_id = self._init()
+        self.assertEqual(self._put(upload_id, 3).status_code, status.HTTP_200_OK)
+        self.assertEqual(self._put(upload_id, 2).status_code, status.HTTP_200_OK)
+        
+        progress = self.client.get(f'/api/uploads/{upload_id}/')
+        self.assertEqual(progress.data['part_count'], 3)
+        self.assertEqual(progress.data['missing_parts'], [1])
+        
+        incomplete = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(incomplete.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(incomplete.data['missing_parts'], [1])
+        
+        self._put(upload_id, 1)
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['char_count'], len(self.content))
+        page = self.client.get(f"/api/documents/{response.data['document_id']}/pages/1/")
+        self.assertTrue(page.data['text'].startswith("A line of a large report."))
+        self.assertFalse(os.path.exists(os.path.join(self.upload_dir, upload_id)))
+    
+    def test_part_with_bad_checksum_is_not_kept(self):
+        """Test a corrupted part is rejected and has to be sent again."""
+        upload_id = self._init()
+        
+        response = self._put(upload_id, 1, checksum="0" * 64)
+        
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertIn('Checksum', response.data['error'])
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').data['received_parts'], [])
+    
+    def test_part_of_wrong_size_is_rejected(self):
+        """Test only the last part may be shorter than the part size."""
+        upload_id = self._init()
+        
+        response = self._put(upload_id, 1, data=b"short")
+        
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    
+    def test_whole_file_checksum_mismatch_fails_upload(self):
+        """Test the assembled file is checked against the checksum sent at init."""
+        upload_id = self._init(sha256="f" * 64)
+        for part in (1, 2, 3):
+            self._put(upload_id, part)
+        
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').data['upload_status'], 'failed')
+    
+    @override_settings(UPLOAD_MAX_SIZE=1000)
+    def test_init_rejects_oversized_file(self):
+        """Test the chunked upload size limit."""
+        response = self.client.post('/api/uploads/', {'filename': 'report.txt', 'size': 5000}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('size', response.data['error'].lower())
+
+
 class SerializerTests(TestCase):
     """Test serializers."""
     
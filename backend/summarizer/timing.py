@@ -0,0 +1,101 @@
+"""
+Per-request stage timings, reported in a Server-Timing header.
+
+With SERVER_TIMING_ENABLED, ServerTimingMiddleware times every request and
+adds, for example,
+
+    Server-Timing: extract;dur=41.2, queue;dur=0.3, upstream;dur=812.5, db;dur=3.1, total;dur=861.0
+
+Stages are recorded with `stage(name)` wherever the work happens:
+- extract: text extraction (utils/text_extractor.py)
+- queue: waiting for a slot in the AI call scheduler
+- upstream: AI API calls, summed over calls (a pyramid's parallel
+  sections or a hedged pair count once each)
+- db: queries on the request thread
+
+Load tests (benchmarks/loadgen.py) break latency down by stage from this
+header. Outside a timed request `stage()` only checks a context variable.
+When SERVER_TIMING_ENABLED is off the middleware removes itself at
+startup (MiddlewareNotUsed).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+STAGE_EXTRACT = 'extract'
+STAGE_QUEUE = 'queue'
+STAGE_UPSTREAM = 'upstream'
+STAGE_DB = 'db'
+
+
+class StageTimer:
+    """Seconds spent per stage during one request; shared with worker threads."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        with self._lock:
+            items = list(self.durations.items())
+        items.append(('total', total))
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in items)
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook timing every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(STAGE_DB, time.perf_counter() - started)
+
+
+request_timer: ContextVar[Optional[StageTimer]] = ContextVar('request_timer', default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Add the duration of the block to the current request's timings, if any."""
+    timer = request_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    """
+    Time each request's stages and report them in a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = StageTimer()
+        token = request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer.db_wrapper):
+                response = self.get_response(request)
+        finally:
+            request_timer.reset(token)
+        response['Server-Timing'] = timer.header(time.perf_counter() - started)
+        return response
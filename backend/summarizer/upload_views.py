@@ -0,0 +1,297 @@
+"""
+Views for chunked, resumable uploads of large documents.
+
+Flow:
+    POST /api/uploads/                          -> upload_id, part_size, part_count
+    PUT  /api/uploads/<upload_id>/parts/<n>/    -> raw part bytes, X-Checksum-SHA256 header
+    GET  /api/uploads/<upload_id>/              -> received and missing parts, to resume
+    POST /api/uploads/<upload_id>/complete/     -> assemble, extract and store the document
+
+Parts are streamed to disk (see uploads.py), so no request body is held
+in memory and part requests stay well below the single-upload size limit.
+"""
+import logging
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.parsers import JSONParser
+
+from .models import ApiClient, Upload
+from .serializers import UploadInitSerializer
+from .storage import get_or_create_document
+from .uploads import assemble, discard, missing_parts, received_parts, write_part
+from .utils.text_extractor import extract_pages_from_file
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_HEADER = 'X-Checksum-SHA256'
+
+
+def _request_client(request):
+    return request.auth if isinstance(request.auth, ApiClient) else None
+
+
+def get_upload(request, upload_id):
+    """
+    Look up an upload owned by the requesting client.
+
+    Returns:
+        The Upload, or None if it does not exist or belongs to another client
+    """
+    upload = Upload.objects.filter(pk=upload_id).first()
+    if upload is None or upload.client_id != getattr(_request_client(request), 'pk', None):
+        return None
+    return upload
+
+
+def not_found_response() -> Response:
+    return Response(
+        {
+            "error": "Upload not found",
+            "status": "failed"
+        },
+        status=status.HTTP_404_NOT_FOUND
+    )
+
+
+def upload_data(upload: Upload) -> dict:
+    """Progress of an upload, enough for a client to resume it."""
+    received = received_parts(upload)
+    return {
+        "upload_id": str(upload.id),
+        "filename": upload.filename,
+        "size": upload.size,
+        "part_size": upload.part_size,
+        "part_count": upload.part_count,
+        "received_parts": sorted(received),
+        "received_bytes": sum(received.values()),
+        "upload_status": upload.status,
+    }
+
+
+class UploadInitView(APIView):
+    """
+    API endpoint starting a chunked upload.
+
+    POST /api/uploads/
+
+    Request (JSON):
+        - filename: Original file name (PDF, DOCX, HTML, Markdown or TXT)
+        - size: Total size in bytes, up to UPLOAD_MAX_SIZE
+        - sha256: Optional hex SHA-256 of the whole file
+    """
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        """Create the upload and tell the client how to split the file."""
+        serializer = UploadInitSerializer(data=request.data)
+        if not serializer.is_valid():
+            errors = next(iter(serializer.errors.values()))
+            return Response(
+                {
+                    "error": str(errors[0]) if isinstance(errors, list) else str(errors),
+                    "status": "failed"
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        upload = Upload.objects.create(
+            client=_request_client(request),
+            filename=serializer.validated_data['filename'],
+            size=serializer.validated_data['size'],
+            sha256=serializer.validated_data.get('sha256', '').lower(),
+            part_size=settings.UPLOAD_PART_SIZE,
+        )
+        logger.info(f"Started upload {upload.id} of {upload.filename} ({upload.size} bytes, "
+                    f"{upload.part_count} parts)")
+        return Response(
+            {
+                **upload_data(upload),
+                "status": "success"
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+class UploadDetailView(APIView):
+    """
+    API endpoint reporting the progress of a chunked upload.
+
+    GET /api/uploads/<upload_id>/
+
+    A client resuming after a failure sends only the parts missing here.
+    """
+
+    def get(self, request, upload_id):
+        """Return received and missing parts."""
+        upload = get_upload(request, upload_id)
+        if upload is None:
+            return not_found_response()
+        data = upload_data(upload)
+        data["missing_parts"] = missing_parts(upload) if upload.status == Upload.STATUS_UPLOADING else []
+        if upload.document_id:
+            data["document_id"] = upload.document.content_hash
+        if upload.error:
+            data["error"] = upload.error
+        return Response({**data, "status": "success"}, status=status.HTTP_200_OK)
+
+
+class UploadPartView(APIView):
+    """
+    API endpoint receiving one part of a chunked upload.
+
+    PUT /api/uploads/<upload_id>/parts/<part>/
+
+    The body is the raw bytes of the 1-based part, with its hex SHA-256 in
+    the X-Checksum-SHA256 header. Sending a part again replaces it.
+    """
+
+    def put(self, request, upload_id, part):
+        """Stream the part to disk and verify its checksum."""
+        upload = get_upload(request, upload_id)
+        if upload is None:
+            return not_found_response()
+
+        if upload.status != Upload.STATUS_UPLOADING:
+            return self._error(f"Upload is already {upload.status}", status.HTTP_409_CONFLICT)
+        if not 1 <= part <= upload.part_count:
+            return self._error(f"Part must be between 1 and {upload.part_count}", status.HTTP_400_BAD_REQUEST)
+
+        checksum = request.headers.get(CHECKSUM_HEADER, '').strip()
+        if len(checksum) != 64:
+            return self._error(f"The {CHECKSUM_HEADER} header with the part's hex SHA-256 is required",
+                               status.HTTP_400_BAD_REQUEST)
+
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+
+        # Read the raw body stream; request.data would buffer the whole part
+        sha256, error = write_part(upload, part, request.stream, length, checksum)
+        if error:
+            logger.warning(f"Rejected part {part} of upload {upload.id}: {error}")
+            return self._error(error, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Keep the upload from expiring while parts are still arriving
+        Upload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+        return Response(
+            {
+                "upload_id": str(upload.id),
+                "part": part,
+                "size": length,
+                "sha256": sha256,
+                "status": "success"
+            },
+            status=status.HTTP_200_OK
+        )
+
+    @staticmethod
+    def _error(message, code):
+        return Response({"error": message, "status": "failed"}, status=code)
+
+
+class UploadCompleteView(APIView):
+    """
+    API endpoint finishing a chunked upload.
+
+    POST /api/uploads/<upload_id>/complete/
+
+    Assembles the parts, extracts the text and stores the document. The
+    response matches /api/extract-text/ in id mode; pages can then be
+    fetched from /api/documents/<document_id>/pages/<page>/.
+    """
+
+    def post(self, request, upload_id):
+        """Assemble the file and extract its text."""
+        upload = get_upload(request, upload_id)
+        if upload is None:
+            return not_found_response()
+
+        if upload.status == Upload.STATUS_FAILED:
+            return Response(
+                {
+                    "error": upload.error,
+                    "status": "failed"
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if upload.status == Upload.STATUS_COMPLETE:
+            return Response(self._document_data(upload, upload.document), status=status.HTTP_200_OK)
+
+        # Missing parts can still be sent, so they do not fail the upload
+        missing = missing_parts(upload)
+        if missing:
+            return Response(
+                {
+                    "error": f"{len(missing)} part(s) have not been uploaded yet",
+                    "missing_parts": missing,
+                    "status": "failed"
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+
+        path, error = assemble(upload)
+        if error:
+            self._fail(upload, error)
+            return Response(
+                {
+                    "error": error,
+                    "status": "failed"
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
+        try:
+            with open(path, 'rb') as assembled:
+                text, page_spans, error = extract_pages_from_file(File(assembled, name=upload.filename))
+            if error:
+                self._fail(upload, error)
+                return Response(
+                    {
+                        "error": error,
+                        "status": "failed"
+                    },
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+
+            document = get_or_create_document(text, upload.filename, page_spans)
+        except Exception as e:
+            logger.error(f"Failed to process upload {upload.id}: {str(e)}")
+            self._fail(upload, f"Failed to process file: {str(e)}")
+            return Response(
+                {
+                    "error": f"Failed to process file: {str(e)}",
+                    "status": "failed"
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        finally:
+            discard(upload)
+
+        upload.status = Upload.STATUS_COMPLETE
+        upload.document = document
+        upload.save(update_fields=['status', 'document', 'updated_at'])
+        logger.info(f"Completed upload {upload.id}: {document.char_count} characters extracted")
+        return Response(self._document_data(upload, document), status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _fail(upload, error):
+        upload.status = Upload.STATUS_FAILED
+        upload.error = error
+        upload.save(update_fields=['status', 'error', 'updated_at'])
+        discard(upload)
+
+    @staticmethod
+    def _document_data(upload, document):
+        return {
+            "upload_id": str(upload.id),
+            "document_id": document.content_hash,
+            "filename": upload.filename,
+            "char_count": document.char_count,
+            "page_count": len(document.page_spans),
+            "status": "success"
+        }
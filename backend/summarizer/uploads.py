@@ -0,0 +1,167 @@
+"""
+Disk storage for chunked, resumable uploads.
+
+Each upload gets a directory under UPLOAD_DIR. A part is streamed from
+the request to a temporary file in fixed-size blocks while its SHA-256 is
+computed, and only renamed to its final name once size and checksum
+match. A part file on disk therefore always holds verified data, and a
+part can simply be sent again after a failure. On completion the parts
+are concatenated into one file, again block by block, so memory use does
+not depend on the size of the upload.
+"""
+import hashlib
+import logging
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Upload
+
+logger = logging.getLogger(__name__)
+
+# Bytes copied per read when streaming parts to and from disk
+BLOCK_SIZE = 64 * 1024
+
+
+def upload_dir(upload: Upload) -> Path:
+    return Path(settings.UPLOAD_DIR) / str(upload.id)
+
+
+def part_path(upload: Upload, part: int) -> Path:
+    return upload_dir(upload) / f"part-{part:05d}"
+
+
+def assembled_path(upload: Upload) -> Path:
+    return upload_dir(upload) / "assembled"
+
+
+def write_part(upload: Upload, part: int, stream: BinaryIO, length: int,
+               checksum: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Stream one part to disk and verify it.
+
+    Args:
+        upload: The upload the part belongs to
+        part: 1-based part number
+        stream: Readable request body
+        length: Declared body length (Content-Length)
+        checksum: Expected hex SHA-256 of the part
+
+    Returns:
+        Tuple of (sha256, error_message). On error nothing is kept.
+    """
+    expected = upload.expected_part_size(part)
+    if length != expected:
+        return None, f"Part {part} must be {expected} bytes, got {length}."
+
+    directory = upload_dir(upload)
+    directory.mkdir(parents=True, exist_ok=True)
+    temporary = directory / f".part-{part:05d}.{os.getpid()}.{id(stream)}"
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        with open(temporary, 'wb') as out:
+            while received < length:
+                block = stream.read(min(BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+                received += len(block)
+
+        if received != length:
+            return None, f"Part {part} was cut short after {received} of {length} bytes."
+        if digest.hexdigest() != checksum.lower():
+            return None, f"Checksum mismatch for part {part}."
+
+        # Atomic: a part file is either absent or complete and verified
+        os.replace(temporary, part_path(upload, part))
+        return digest.hexdigest(), None
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+def received_parts(upload: Upload) -> Dict[int, int]:
+    """
+    Parts stored so far.
+
+    Returns:
+        Mapping of 1-based part number to its size in bytes
+    """
+    directory = upload_dir(upload)
+    if not directory.is_dir():
+        return {}
+    parts = {}
+    for entry in os.scandir(directory):
+        if entry.name.startswith('part-'):
+            parts[int(entry.name[len('part-'):])] = entry.stat().st_size
+    return parts
+
+
+def missing_parts(upload: Upload):
+    """1-based numbers of the parts not received yet."""
+    received = received_parts(upload)
+    return [part for part in range(1, upload.part_count + 1) if part not in received]
+
+
+def assemble(upload: Upload) -> Tuple[Optional[Path], Optional[str]]:
+    """
+    Concatenate all parts into a single file and remove the parts.
+
+    Returns:
+        Tuple of (path, error_message)
+    """
+    missing = missing_parts(upload)
+    if missing:
+        shown = ", ".join(str(part) for part in missing[:10])
+        return None, f"Missing {len(missing)} part(s): {shown}{'...' if len(missing) > 10 else ''}"
+
+    target = assembled_path(upload)
+    digest = hashlib.sha256()
+    with open(target, 'wb') as out:
+        for part in range(1, upload.part_count + 1):
+            with open(part_path(upload, part), 'rb') as source:
+                while True:
+                    block = source.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    out.write(block)
+
+    if upload.sha256 and digest.hexdigest() != upload.sha256.lower():
+        target.unlink()
+        return None, "Checksum of the assembled file does not match."
+
+    for part in range(1, upload.part_count + 1):
+        part_path(upload, part).unlink()
+    return target, None
+
+
+def discard(upload: Upload) -> None:
+    """Delete everything stored on disk for an upload."""
+    shutil.rmtree(upload_dir(upload), ignore_errors=True)
+
+
+def purge_expired_uploads() -> int:
+    """
+    Delete unfinished uploads older than UPLOAD_EXPIRY_HOURS, with their files.
+
+    Returns:
+        Number of uploads removed
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    expired = Upload.objects.filter(updated_at__lt=cutoff).exclude(status=Upload.STATUS_COMPLETE)
+    count = 0
+    for upload in expired:
+        discard(upload)
+        upload.delete()
+        count += 1
+    if count:
+        logger.info(f"Purged {count} expired uploads")
+    return count
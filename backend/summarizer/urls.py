@@ -2,13 +2,41 @@
 URL patterns for the summarizer app.
 """
 from django.urls import path
-from .views import SummarizeDocumentView
-from .chat_views import ExtractTextView, ChatWithDocumentView
+from .views import SummarizeDocumentView, SummaryDetailView
+from .chat_views import ExtractTextView, DocumentPageView, ChatWithDocumentView, SpeculationView
+from .upload_views import UploadCompleteView, UploadDetailView, UploadInitView, UploadPartView
+from .metrics_views import (
+    ChatCacheMetricsView,
+    HedgingMetricsView,
+    ProfileDownloadView,
+    ProfileListView,
+    RoutingMetricsView,
+    SandboxMetricsView,
+    SchedulerMetricsView,
+    SpeculationMetricsView,
+    UsageView,
+)
 
 app_name = 'summarizer'
 
 urlpatterns = [
     path('summarize/', SummarizeDocumentView.as_view(), name='summarize'),
+    path('summaries/<str:summary_id>/', SummaryDetailView.as_view(), name='summary_detail'),
     path('extract-text/', ExtractTextView.as_view(), name='extract_text'),
+    path('documents/<str:document_id>/pages/<int:page>/', DocumentPageView.as_view(), name='document_page'),
+    path('documents/<str:document_id>/speculation/', SpeculationView.as_view(), name='document_speculation'),
+    path('uploads/', UploadInitView.as_view(), name='upload_init'),
+    path('uploads/<uuid:upload_id>/', UploadDetailView.as_view(), name='upload_detail'),
+    path('uploads/<uuid:upload_id>/parts/<int:part>/', UploadPartView.as_view(), name='upload_part'),
+    path('uploads/<uuid:upload_id>/complete/', UploadCompleteView.as_view(), name='upload_complete'),
     path('chat-document/', ChatWithDocumentView.as_view(), name='chat_document'),
+    path('metrics/scheduler/', SchedulerMetricsView.as_view(), name='scheduler_metrics'),
+    path('metrics/hedging/', HedgingMetricsView.as_view(), name='hedging_metrics'),
+    path('metrics/routing/', RoutingMetricsView.as_view(), name='routing_metrics'),
+    path('metrics/sandbox/', SandboxMetricsView.as_view(), name='sandbox_metrics'),
+    path('metrics/chat-cache/', ChatCacheMetricsView.as_view(), name='chat_cache_metrics'),
+    path('metrics/speculation/', SpeculationMetricsView.as_view(), name='speculation_metrics'),
+    path('usage/', UsageView.as_view(), name='usage'),
+    path('profiles/', ProfileListView.as_view(), name='profile_list'),
+    path('profiles/<str:profile_id>/', ProfileDownloadView.as_view(), name='profile_download'),
 ]
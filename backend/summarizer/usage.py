@@ -0,0 +1,316 @@
+"""
+Token usage accounting and per-client quotas.
+
+Every AI call records its prompt and completion tokens against the API
+client that made the request. Records are buffered in memory and written
+with one bulk insert per batch once the response has been sent, so
+accounting adds no database round trip to individual requests.
+
+Quotas are checked before the upstream call from a per-process running
+total: the client's monthly usage is read from the database at most every
+USAGE_QUOTA_REFRESH seconds, and this process's own calls are added on
+top. Usage of other processes that has not been flushed yet is not seen,
+so a client can overshoot by at most a batch or two.
+"""
+import atexit
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from .models import ApiClient, UsageRecord
+
+logger = logging.getLogger(__name__)
+
+
+class UsageContext:
+    """
+    Who AI calls in the current request are attributed to.
+    """
+
+    def __init__(self, client: Optional[ApiClient] = None, endpoint: str = ''):
+        self.client = client
+        self.endpoint = endpoint
+
+
+# Set per request by UsageAttributionMixin; copied into worker threads that make AI calls
+usage_context: ContextVar[UsageContext] = ContextVar('usage_context', default=UsageContext())
+
+
+class UsageTally:
+    """
+    Running totals of the AI calls recorded while it is the current tally.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = Decimal(0)
+        self._lock = threading.Lock()
+
+    def add(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += record.prompt_tokens
+            self.completion_tokens += record.completion_tokens
+            self.cost_usd += record.cost_usd
+
+
+# Set around a unit of work to measure what its AI calls used (see utils/routing.py)
+usage_tally: ContextVar[Optional[UsageTally]] = ContextVar('usage_tally', default=None)
+
+
+def month_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the calendar month (UTC) that quotas are counted over."""
+    now = now or timezone.now()
+    return now.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the following calendar month (UTC), when quotas reset."""
+    start = month_start(now)
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+
+def price_for(model: str) -> Tuple[Decimal, Decimal]:
+    """
+    USD price per million prompt and completion tokens for a model.
+
+    Dated model names such as gpt-4o-mini-2024-07-18 use the price of the
+    longest configured name they start with. Unknown models cost nothing.
+    """
+    prices = settings.OPENAI_PRICES
+    name = max((known for known in prices if model.startswith(known)), key=len, default=None)
+    if name is None:
+        return Decimal(0), Decimal(0)
+    prompt_price, completion_price = prices[name]
+    return Decimal(str(prompt_price)), Decimal(str(completion_price))
+
+
+def _token_count(value) -> int:
+    return value if isinstance(value, int) and value > 0 else 0
+
+
+class UsageRecorder:
+    """
+    Buffers usage records and writes them in batches.
+
+    A flush happens when batch_size records are pending or flush_interval
+    seconds have passed, checked after each response is finished, and at
+    process exit.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 5.0, quota_refresh: float = 30.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.quota_refresh = quota_refresh
+        self._buffer: List[UsageRecord] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        # client id -> tokens recorded by this process and not yet in the database
+        self._unsaved: Dict[int, int] = {}
+        # client id -> (month start, database total at fetch, fetched at, tokens recorded since)
+        self._totals: Dict[int, Tuple[datetime, int, float, int]] = {}
+
+    @classmethod
+    def from_settings(cls) -> 'UsageRecorder':
+        return cls(
+            batch_size=settings.USAGE_BATCH_SIZE,
+            flush_interval=settings.USAGE_FLUSH_INTERVAL,
+            quota_refresh=settings.USAGE_QUOTA_REFRESH,
+        )
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int,
+               prompt_key: str = '', context: Optional[UsageContext] = None) -> UsageRecord:
+        """
+        Buffer the usage of one AI call.
+
+        Args:
+            model: Model that served the call
+            prompt_tokens: Tokens in the prompt
+            completion_tokens: Tokens in the completion
+            prompt_key: Key of the prompt template used
+            context: Attribution, defaults to the current request's
+
+        Returns:
+            The unsaved UsageRecord
+        """
+        context = context or usage_context.get()
+        prompt_price, completion_price = price_for(model)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        record = UsageRecord(
+            client=context.client,
+            endpoint=context.endpoint[:64],
+            model=model[:64],
+            prompt_key=prompt_key[:64],
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=cost.quantize(Decimal('0.000001')),
+            created_at=timezone.now(),
+        )
+        tally = usage_tally.get()
+        if tally is not None:
+            tally.add(record)
+        tokens = prompt_tokens + completion_tokens
+        with self._lock:
+            self._buffer.append(record)
+            if record.client_id is not None:
+                self._unsaved[record.client_id] = self._unsaved.get(record.client_id, 0) + tokens
+                if record.client_id in self._totals:
+                    start, total, fetched_at, since = self._totals[record.client_id]
+                    self._totals[record.client_id] = (start, total, fetched_at, since + tokens)
+        return record
+
+    def record_response(self, response, model: str, prompt_key: str = '',
+                        context: Optional[UsageContext] = None) -> Optional[UsageRecord]:
+        """
+        Record the usage reported on a chat completion response (or the
+        final chunk of a stream), if any.
+        """
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        served_by = getattr(response, 'model', None)
+        return self.record(
+            served_by if isinstance(served_by, str) and served_by else model,
+            _token_count(getattr(usage, 'prompt_tokens', 0)),
+            _token_count(getattr(usage, 'completion_tokens', 0)),
+            prompt_key,
+            context,
+        )
+
+    def pending(self) -> int:
+        """Number of buffered records."""
+        with self._lock:
+            return len(self._buffer)
+
+    def maybe_flush(self) -> int:
+        """Flush if the batch is full or the flush interval has passed."""
+        with self._lock:
+            due = self._buffer and (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        return self.flush() if due else 0
+
+    def flush(self) -> int:
+        """
+        Write all buffered records with one bulk insert.
+
+        Returns:
+            Number of records written
+        """
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if not records:
+                return 0
+            try:
+                UsageRecord.objects.bulk_create(records, batch_size=500)
+            except Exception as e:
+                logger.error(f"Failed to write {len(records)} usage records: {str(e)}")
+                with self._lock:
+                    # Keep them for the next flush, but never grow without bound
+                    self._buffer = (records + self._buffer)[-self.batch_size * 10:]
+                return 0
+            with self._lock:
+                for record in records:
+                    if record.client_id is not None:
+                        self._unsaved[record.client_id] -= record.total_tokens
+            logger.debug(f"Wrote {len(records)} usage records")
+            return len(records)
+
+    def tokens_used(self, client: ApiClient) -> int:
+        """
+        Tokens the client has used this month, as far as this process knows.
+        """
+        start = month_start()
+        with self._lock:
+            cached = self._totals.get(client.pk)
+        if cached and cached[0] == start and time.monotonic() - cached[2] < self.quota_refresh:
+            return cached[1] + cached[3]
+
+        totals = UsageRecord.objects.filter(client=client, created_at__gte=start).aggregate(
+            prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens')
+        )
+        stored = (totals['prompt'] or 0) + (totals['completion'] or 0)
+        with self._lock:
+            # Calls recorded here but not yet written are not in the database total
+            since = self._unsaved.get(client.pk, 0)
+            self._totals[client.pk] = (start, stored, time.monotonic(), since)
+        return stored + since
+
+    def reset(self) -> None:
+        """Drop buffered records and cached totals."""
+        with self._lock:
+            self._buffer = []
+            self._unsaved = {}
+            self._totals = {}
+
+
+# Create a singleton instance shared by every AI call in the process
+usage_recorder = UsageRecorder.from_settings()
+
+
+def _flush_after_response(sender, **kwargs):
+    usage_recorder.maybe_flush()
+
+
+request_finished.connect(_flush_after_response, dispatch_uid='summarizer_usage_flush')
+atexit.register(usage_recorder.flush)
+
+
+class QuotaExceeded(Throttled):
+    default_detail = "Monthly token quota exceeded."
+    extra_detail_singular = "Quota resets in {wait} second."
+    extra_detail_plural = "Quota resets in {wait} seconds."
+
+
+class TokenQuotaThrottle(BaseThrottle):
+    """
+    Rejects requests from clients that have used up their monthly token quota.
+
+    Runs before the view, so no upstream call is made for such requests.
+    """
+
+    def allow_request(self, request, view):
+        client = request.auth if isinstance(request.auth, ApiClient) else None
+        if client is None or not client.monthly_token_quota:
+            return True
+        used = usage_recorder.tokens_used(client)
+        if used < client.monthly_token_quota:
+            return True
+        logger.warning(f"Client {client.name} is over quota ({used}/{client.monthly_token_quota} tokens)")
+        raise QuotaExceeded(wait=int((next_month_start() - timezone.now()).total_seconds()))
+
+
+class UsageAttributionMixin:
+    """
+    View mixin attributing AI calls made while handling a request to its client.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        client = request.auth if isinstance(request.auth, ApiClient) else None
+        endpoint = request.resolver_match.url_name if request.resolver_match else request.path
+        self._usage_token = usage_context.set(UsageContext(client, endpoint or ''))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_usage_token', None)
+        if token is not None:
+            usage_context.reset(token)
+            self._usage_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
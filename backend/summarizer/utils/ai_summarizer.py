@@ -2,14 +2,34 @@
 AI summarization utilities using OpenAI API.
 
 This module handles communication with the AI model for text summarization.
+The openai package is imported and the client is built on first use, which
+keeps both off the startup path of every worker.
 """
 import logging
-from typing import Tuple
-from openai import OpenAI
+import threading
+from typing import Dict, Iterator, Optional, Tuple
 from django.conf import settings
 
+from ..usage import usage_context, usage_recorder
+from .hedging import hedger
+from .language import Language, localize
+from .lazy import lazy_import
+from .prefilter import CHARS_PER_TOKEN, prefilter_text
+from .prompts import STRUCTURED_PROMPT, PromptTemplate, get_prompt
+from .scheduler import PRIORITY_SUMMARIZE, CallCancelled, QueueFull, llm_scheduler
+from .structured import parse_summary, stream_summary_events
+
 logger = logging.getLogger(__name__)
 
+openai = lazy_import('openai')
+
+
+def __getattr__(name):
+    """Resolve the OpenAI client class lazily on first access."""
+    if name == 'OpenAI':
+        return openai.OpenAI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class AISummarizer:
     """
@@ -17,14 +37,34 @@ class AISummarizer:
     """
     
     def __init__(self):
-        """Initialize OpenAI client with API key from settings."""
+        """Read configuration from settings; the OpenAI client is built on first use."""
         self.api_key = settings.OPENAI_API_KEY
         if not self.api_key:
             logger.warning("OpenAI API key not configured")
-        self.client = OpenAI(api_key=self.api_key) if self.api_key else None
+        self._client = None
+        self._client_lock = threading.Lock()
         self.model = settings.OPENAI_MODEL
         self.max_tokens = settings.OPENAI_MAX_TOKENS
         self.temperature = settings.OPENAI_TEMPERATURE
+        self.scheduler = llm_scheduler
+        self.hedger = hedger
+        self.usage = usage_recorder
+    
+    @property
+    def client(self):
+        """
+        OpenAI client, created on first access.
+        
+        Returns:
+            The client, or None if no API key is configured
+        """
+        if self._client is None and self.api_key:
+            with self._client_lock:
+                if self._client is None:
+                    # A patched module attribute (tests) takes precedence over the lazy import
+                    client_class = globals().get('OpenAI') or __getattr__('OpenAI')
+                    self._client = client_class(api_key=self.api_key)
+        return self._client
     
     def _truncate_text(self, text: str, max_chars: int = 12000) -> str:
         """
@@ -43,18 +83,126 @@ class AISummarizer:
         
         logger.warning(f"Text truncated from {len(text)} to {max_chars} characters")
         return text[:max_chars] + "\n\n[Text truncated due to length...]"
+
+    def prepare_text(self, text: str, max_chars: int = 12000) -> str:
+        """
+        Fit text into the prompt's input budget.
+
+        With PREFILTER_ENABLED the most informative sentences of the whole
+        text are kept (see utils/prefilter.py); otherwise the text is cut
+        at max_chars.
+
+        Args:
+            text: Input text
+            max_chars: Maximum characters to send
+
+        Returns:
+            Text of at most roughly max_chars characters
+        """
+        if len(text) <= max_chars or not settings.PREFILTER_ENABLED:
+            return self._truncate_text(text, max_chars)
+
+        result = prefilter_text(text, max_chars // CHARS_PER_TOKEN)
+        logger.info(
+            f"Pre-filter kept {result.sentences_kept}/{result.sentences_total} sentences "
+            f"({result.compression_ratio:.1f}x compression)"
+        )
+        return result.text
     
-    def summarize(self, text: str) -> Tuple[str, str]:
+    def get_template(self, style: Optional[str] = None, version: Optional[str] = None,
+                     language: Optional[Language] = None,
+                     output_language: Optional[Language] = None) -> PromptTemplate:
+        """
+        Resolve the prompt template for a summary style.
+
+        Args:
+            style: Summary style name, defaults to SUMMARY_DEFAULT_STYLE
+            version: Template version, defaults to the latest
+            language: Language of the document, if known (see utils/language.py)
+            output_language: Language to summarize in, defaults to the document's
+
+        Returns:
+            The matching PromptTemplate, localized for the languages
+        """
+        return localize(get_prompt(style or settings.SUMMARY_DEFAULT_STYLE, version), language, output_language)
+
+    def create_completion(self, template: PromptTemplate, priority: str = PRIORITY_SUMMARIZE,
+                          stream: bool = False, **values):
+        """
+        Render a template and send it to the chat completions API.
+
+        The call waits for a slot from the shared scheduler in the given
+        priority class. With hedging enabled, a slow call is raced against a
+        second request (see utils/hedging.py), each taking its own slot.
+        Token usage of the response, and of a losing hedged attempt once it
+        returns, is recorded against the requesting client (see usage.py).
+        A losing stream is closed before it reports usage.
+
+        Args:
+            template: Prompt template to render
+            priority: Scheduler priority class (chat, summarize or batch)
+            stream: Return a stream of chunks. The scheduler slot and hedging
+                then only cover the time to the response headers, and usage
+                is recorded by the consumer from the final chunk.
+            **values: Field values for the template
+
+        Returns:
+            The raw chat completion response, or the chunk stream
+
+        Raises:
+            QueueFull: If the scheduler sheds the call
+        """
+        params = template.request_params(self.model, self.max_tokens, self.temperature)
+        messages = template.render(**values)
+        extra = {"timeout": self.hedger.attempt_timeout} if self.hedger.enabled else {}
+        if stream:
+            extra.update(stream=True, stream_options={"include_usage": True})
+        
+        def attempt(model):
+            return self.scheduler.run(
+                priority,
+                self.client.chat.completions.create,
+                messages=messages,
+                **dict(params, model=model),
+                **extra,
+            )
+        
+        # A losing attempt returns in a worker thread, so it is attributed to this request's client
+        attribution = usage_context.get()
+        
+        def record_loser(loser):
+            self.usage.record_response(loser, params["model"], template.key, attribution)
+        
+        response = self.hedger.call(attempt, params["model"], None if stream else record_loser)
+        if not stream:
+            self.usage.record_response(response, params["model"], template.key)
+        return response
+
+    def summarize(self, text: str, style: Optional[str] = None, version: Optional[str] = None,
+                  priority: str = PRIORITY_SUMMARIZE, model: Optional[str] = None,
+                  max_tokens: Optional[int] = None, language: Optional[Language] = None,
+                  output_language: Optional[Language] = None) -> Tuple[str, str]:
         """
         Generate a summary of the provided text using AI.
         
         Args:
             text: The text content to summarize
+            style: Summary style (brief, detailed, bullet, executive)
+            version: Prompt template version, defaults to the latest
+            priority: Scheduler priority class for the AI call
+            model: Model for templates without their own, instead of OPENAI_MODEL
+            max_tokens: Output budget for templates without their own, instead
+                of OPENAI_MAX_TOKENS (see utils/routing.py)
+            language: Language of the document, if known (see utils/language.py)
+            output_language: Language to summarize in, defaults to the document's
             
         Returns:
             Tuple of (summary, error_message)
             If successful, error_message will be None
             If failed, summary will be empty string
+            
+        Raises:
+            QueueFull: If the scheduler sheds the call
         """
         # Check if API key is configured
         if not self.client:
@@ -65,30 +213,143 @@ class AISummarizer:
             return "", "No text provided for summarization"
         
         try:
-            # Truncate text if too long
-            truncated_text = self._truncate_text(text)
+            template = self.get_template(style, version, language, output_language).with_defaults(
+                model=model, max_tokens=max_tokens
+            )
+        except KeyError as e:
+            return "", e.args[0]
+        
+        # Condense text if too long
+        prepared_text = self.prepare_text(text, template.max_input_chars)
+        
+        return self.generate(template, priority=priority, text=prepared_text)
+    
+    def summarize_structured(self, text: str, version: Optional[str] = None,
+                             priority: str = PRIORITY_SUMMARIZE, language: Optional[Language] = None,
+                             output_language: Optional[Language] = None) -> Tuple[Dict[str, object], str]:
+        """
+        Generate a structured summary (title, key points, entities, action
+        items) in one schema-constrained call.
+        
+        Args:
+            text: The text content to summarize
+            version: Structured prompt version, defaults to the latest
+            priority: Scheduler priority class for the AI call
+            language: Language of the document, if known (see utils/language.py)
+            output_language: Language of the field values, defaults to the document's
+            
+        Returns:
+            Tuple of (summary, error_message). summary is the validated dict.
+            
+        Raises:
+            QueueFull: If the scheduler sheds the call
+        """
+        template, prepared_text, error = self._structured_request(text, version, language, output_language)
+        if error:
+            return {}, error
+        
+        output, error = self.generate(template, priority=priority, text=prepared_text)
+        if error:
+            return {}, error
+        summary, error = parse_summary(output)
+        if error:
+            logger.error(f"Structured summary failed validation: {error}")
+        return summary, error
+    
+    def stream_structured(self, text: str, version: Optional[str] = None, priority: str = PRIORITY_SUMMARIZE,
+                          language: Optional[Language] = None, output_language: Optional[Language] = None
+                          ) -> Tuple[Iterator[Tuple[str, object]], str]:
+        """
+        Start a streamed structured summary.
+        
+        The upstream call is made before returning, so shedding and
+        configuration errors surface here rather than mid-stream. Events
+        are produced as the completion arrives (see
+        structured.stream_summary_events): each field as soon as it is
+        complete, then ("summary", dict) with the validated whole. The
+        template is localized as in summarize_structured.
+        
+        Returns:
+            Tuple of (events, error_message)
+            
+        Raises:
+            QueueFull: If the scheduler sheds the call
+        """
+        template, prepared_text, error = self._structured_request(text, version, language, output_language)
+        if error:
+            return iter(()), error
+        
+        try:
+            stream = self.create_completion(template, priority=priority, stream=True, text=prepared_text)
+        except QueueFull:
+            raise
+        except Exception as e:
+            logger.error(f"AI summarization error: {str(e)}")
+            return iter(()), f"AI summarization failed: {str(e)}"
+        
+        # The stream is consumed after the view has returned, outside the request's context
+        attribution = usage_context.get()
+        model = template.request_params(self.model, self.max_tokens, self.temperature)["model"]
+        
+        def deltas():
+            try:
+                for chunk in stream:
+                    if getattr(chunk, 'usage', None) is not None:
+                        self.usage.record_response(chunk, model, template.key, context=attribution)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                close = getattr(stream, 'close', None)
+                if close is not None:
+                    close()
+        
+        def events():
+            try:
+                yield from stream_summary_events(deltas())
+            except Exception as e:
+                logger.error(f"Structured summary stream failed: {str(e)}")
+                yield "error", f"AI summarization failed: {str(e)}"
+        
+        return events(), None
+    
+    def _structured_request(self, text: str, version: Optional[str], language: Optional[Language] = None,
+                            output_language: Optional[Language] = None):
+        """Localized template and prepared text for a structured summary, or an error."""
+        if not self.client:
+            return None, "", "AI summarization is not configured. Please add OPENAI_API_KEY to environment."
+        if not text.strip():
+            return None, "", "No text provided for summarization"
+        try:
+            template = self.get_template(STRUCTURED_PROMPT, version, language, output_language)
+        except KeyError as e:
+            return None, "", e.args[0]
+        return template, self.prepare_text(text, template.max_input_chars), None
+    
+    def generate(self, template: PromptTemplate, priority: str = PRIORITY_SUMMARIZE,
+                 **values) -> Tuple[str, str]:
+        """
+        Run a prompt template and return the model's text output.
+        
+        Args:
+            template: Prompt template to render
+            priority: Scheduler priority class for the AI call
+            **values: Field values for the template
             
-            # Create prompt for summarization
-            prompt = f"""Summarize this document clearly and concisely. Focus on the main ideas and key points:
-
-{truncated_text}"""
+        Returns:
+            Tuple of (output_text, error_message)
+            If successful, error_message will be None
+            If failed, output_text will be empty string
             
+        Raises:
+            QueueFull: If the scheduler sheds the call
+            CallCancelled: If the call's group was cancelled (see LLMScheduler.cancel)
+        """
+        if not self.client:
+            return "", "AI summarization is not configured. Please add OPENAI_API_KEY to environment."
+        
+        try:
             # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that creates clear, concise summaries of documents. Focus on extracting the most important information."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-            )
+            response = self.create_completion(template, priority=priority, **values)
             
             # Extract summary from response
             summary = response.choices[0].message.content.strip()
@@ -98,6 +359,10 @@ class AISummarizer:
             
             return summary, None
             
+        except (QueueFull, CallCancelled):
+            # Load shedding is reported to the client as 429, not as an AI failure;
+            # a cancelled job stops instead of recording a failure per call
+            raise
         except Exception as e:
             error_message = str(e)
             logger.error(f"AI summarization error: {error_message}")
@@ -117,14 +382,27 @@ class AISummarizer:
 ai_summarizer = AISummarizer()
 
 
-def summarize_text(text: str) -> Tuple[str, str]:
+def summarize_text(text: str, style: Optional[str] = None, version: Optional[str] = None,
+                   priority: str = PRIORITY_SUMMARIZE, model: Optional[str] = None,
+                   max_tokens: Optional[int] = None, language: Optional[Language] = None,
+                   output_language: Optional[Language] = None) -> Tuple[str, str]:
     """
     Convenience function to summarize text using the default AI summarizer.
     
     Args:
         text: Text content to summarize
+        style: Optional summary style
+        version: Optional prompt template version
+        priority: Scheduler priority class for the AI call
+        model: Optional model override for templates without their own
+        max_tokens: Optional output budget for templates without their own
+        language: Optional language of the document
+        output_language: Optional language to summarize in
         
     Returns:
         Tuple of (summary, error_message)
     """
-    return ai_summarizer.summarize(text)
+    return ai_summarizer.summarize(
+        text, style=style, version=version, priority=priority, model=model, max_tokens=max_tokens,
+        language=language, output_language=output_language
+    )
@@ -0,0 +1,223 @@
+"""
+Cache of chat answers per document and question.
+
+Users of a shared document tend to ask the same few questions in
+slightly different words. Answers are cached per document (the hash of
+the context sent to the model, under the chat template's cache key) and
+found in two ways:
+
+- exact: the normalised question (case, punctuation and spacing folded)
+  matches a cached one
+- near duplicate: the two questions have the same content terms, and the
+  MinHash signatures over the character trigrams of those terms, in
+  order, agree on at least CHAT_CACHE_SIMILARITY of their positions (an
+  estimate of the trigrams' Jaccard similarity). Content terms are every
+  word but a few function words, with contractions expanded ("what's" is
+  "what", "can't" is "can not") and a plural s dropped, so "whats the
+  deadline" answers "What is the deadline?". Numbers, negations, question
+  words and one-letter names all count, so "revenue in 2022" never answers
+  "revenue in 2023", "Can the contract not be terminated?" never answers
+  "Can the contract be terminated?" and "party A" never answers "party B".
+  Trigrams of the whole question would match each of these pairs.
+
+Entries expire after CHAT_CACHE_TTL seconds and the least recently used
+are evicted beyond CHAT_CACHE_MAX_ENTRIES. Only a few questions are cached
+per document, so a near-duplicate lookup compares against them all in one
+vectorised step rather than through an LSH index. The cache lives in each
+worker process.
+"""
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+# Hash functions in each signature
+SIGNATURE_SIZE = 64
+
+# Characters per shingle
+SHINGLE_CHARS = 3
+
+# Fixed seeds, so signatures are comparable for the life of the process
+_rng = np.random.default_rng(20240517)
+_SEEDS = _rng.integers(0, 2 ** 63, SIGNATURE_SIZE, dtype=np.uint64)
+_MULTIPLIERS = _rng.integers(0, 2 ** 63, SIGNATURE_SIZE, dtype=np.uint64) | np.uint64(1)
+
+PUNCTUATION_TO_SPACE = str.maketrans(string.punctuation + '¿¡“”‘’', ' ' * (len(string.punctuation) + 6))
+
+# Words left out of content terms; negations, modals and question words are kept
+FUNCTION_WORDS = frozenset(
+    "an the is are was were be been being am do does did of to in on at by for with from into about "
+    "over under as this that these those it its there their they them he she his her we our you your i "
+    "me my please tell".split()
+)
+# Contractions, as they read once normalize_question drops the apostrophe
+CONTRACTIONS = {
+    'whats': 'what', 'whos': 'who', 'wheres': 'where', 'whens': 'when', 'hows': 'how', 'whys': 'why',
+    'cant': 'can not', 'cannot': 'can not', 'wont': 'will not', 'dont': 'do not', 'doesnt': 'does not',
+    'didnt': 'did not', 'isnt': 'is not', 'arent': 'are not', 'wasnt': 'was not', 'werent': 'were not',
+    'hasnt': 'has not', 'havent': 'have not', 'hadnt': 'had not', 'shouldnt': 'should not',
+    'couldnt': 'could not', 'wouldnt': 'would not', 'mustnt': 'must not', 'neednt': 'need not',
+}
+
+MATCH_EXACT = 'exact'
+MATCH_SIMILAR = 'similar'
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, width, punctuation and spacing, keeping the words in order."""
+    folded = unicodedata.normalize('NFKC', question).casefold()
+    return " ".join(folded.replace("'", "").translate(PUNCTUATION_TO_SPACE).split())
+
+
+def content_terms(normalized: str) -> str:
+    """The words of a normalised question that a near duplicate must share, in order."""
+    words = " ".join(CONTRACTIONS.get(word, word) for word in normalized.split()).split()
+    return " ".join(
+        word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+        for word in words if word not in FUNCTION_WORDS
+    )
+
+
+def signature(normalized: str) -> np.ndarray:
+    """
+    MinHash signature of the character trigrams of a normalised question or its content terms.
+
+    Each of the SIGNATURE_SIZE hash functions is an xor with a seed then a
+    multiplication by an odd constant, wrapping at 64 bits; the signature
+    keeps the minimum of each over all trigrams.
+    """
+    padded = f" {normalized} "
+    shingles = {padded[index:index + SHINGLE_CHARS] for index in range(max(1, len(padded) - SHINGLE_CHARS + 1))}
+    hashes = np.fromiter((hash(shingle) for shingle in shingles), dtype=np.int64, count=len(shingles))
+    mixed = (hashes.view(np.uint64)[:, None] ^ _SEEDS) * _MULTIPLIERS
+    return mixed.min(axis=0)
+
+
+class CachedAnswer:
+    """An answer and the question it was given for."""
+
+    def __init__(self, document_key: str, question: str, answer: str, expires_at: float):
+        self.document_key = document_key
+        self.question = question
+        terms = content_terms(question)
+        self.terms = frozenset(terms.split())
+        self.signature = signature(terms)
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    LRU cache of chat answers with a TTL and near-duplicate lookup.
+
+    Args:
+        max_entries: Answers kept; the least recently used go first
+        ttl: Seconds an answer is served for
+        similarity: Share of signature positions two questions must agree
+            on to be near duplicates; above 1 disables near-duplicate hits
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, similarity: float = 0.8):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        # (document key, normalised question) -> answer, least recently used first
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        # document key -> its normalised questions, for near-duplicate lookup
+        self._questions: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'similar_hits': 0, 'misses': 0, 'bypassed': 0, 'evicted': 0}
+
+    @classmethod
+    def from_settings(cls) -> 'AnswerCache':
+        return cls(
+            max_entries=settings.CHAT_CACHE_MAX_ENTRIES,
+            ttl=settings.CHAT_CACHE_TTL,
+            similarity=settings.CHAT_CACHE_SIMILARITY,
+        )
+
+    def get(self, document_key: str, question: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look up the answer to a question about a document.
+
+        Returns:
+            Tuple of (answer, match) where match is "exact" or "similar",
+            or (None, None) on a miss
+        """
+        normalized = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((document_key, normalized))
+            match = MATCH_EXACT
+            if entry is None and self.similarity <= 1:
+                entry = self._most_similar(document_key, normalized)
+                match = MATCH_SIMILAR
+            if entry is not None and entry.expires_at <= now:
+                self._remove((entry.document_key, entry.question))
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None, None
+            self._entries.move_to_end((document_key, entry.question))
+            self._counters['hits' if match == MATCH_EXACT else 'similar_hits'] += 1
+            return entry.answer, match
+
+    def _most_similar(self, document_key: str, normalized: str) -> Optional[CachedAnswer]:
+        questions = self._questions.get(document_key)
+        if not questions:
+            return None
+        terms = content_terms(normalized)
+        candidates = [self._entries[(document_key, question)] for question in questions]
+        candidates = [entry for entry in candidates if entry.terms == frozenset(terms.split())]
+        if not candidates:
+            return None
+        agreement = (np.stack([entry.signature for entry in candidates]) == signature(terms)).mean(axis=1)
+        best = int(agreement.argmax())
+        return candidates[best] if agreement[best] >= self.similarity else None
+
+    def put(self, document_key: str, question: str, answer: str) -> None:
+        """Cache an answer, evicting the least recently used beyond max_entries."""
+        normalized = normalize_question(question)
+        entry = CachedAnswer(document_key, normalized, answer, time.monotonic() + self.ttl)
+        key = (document_key, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._questions.setdefault(document_key, []).append(normalized)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters['evicted'] += 1
+
+    def bypass(self) -> None:
+        """Count a request that skipped the lookup."""
+        with self._lock:
+            self._counters['bypassed'] += 1
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        del self._entries[key]
+        questions = self._questions[key[0]]
+        questions.remove(key[1])
+        if not questions:
+            del self._questions[key[0]]
+
+    def metrics(self) -> Dict[str, object]:
+        """Entry count and hit, miss and eviction counters."""
+        with self._lock:
+            return {"entries": len(self._entries), "documents": len(self._questions), **self._counters}
+
+    def clear(self) -> None:
+        """Drop every answer and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._questions.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+# Create a singleton instance shared by every chat request in the process
+answer_cache = AnswerCache.from_settings()
@@ -0,0 +1,484 @@
+"""
+Registry of streaming text extractors, one per document format.
+
+Each extractor recognises its format from the first bytes of the file
+(magic bytes or markup), not from the file name, and yields the text in
+chunks as it reads, so no format needs the whole document in memory as a
+parsed tree:
+
+- pdf: one chunk per page, via pypdf (scans go to the pre-scan/OCR route)
+- docx: word/document.xml is decompressed as a stream from the zip and
+  parsed with iterparse, one paragraph element at a time
+- html: an incremental HTMLParser fed block by block
+- markdown: line by line, with markup stripped
+- txt: decoded block by block
+
+All extractors feed the same chunk pipeline (see text_extractor.py).
+New formats register with `registry.register(...)`.
+"""
+import codecs
+import logging
+import re
+import zipfile
+from html.parser import HTMLParser
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+
+from .lazy import lazy_import
+from .ocr import ocr_pdf_pages
+from .pdf_scan import prescan_pdf
+
+logger = logging.getLogger(__name__)
+
+pypdf = lazy_import('pypdf')
+
+# Bytes inspected to detect the format
+HEAD_BYTES = 8192
+
+# Bytes read per block, and characters gathered before a chunk is yielded
+BLOCK_SIZE = 64 * 1024
+CHUNK_CHARS = 64 * 1024
+
+NO_TEXT_PDF_ERROR = "Could not extract text from PDF. The file might be image-based or encrypted."
+SCANNED_PDF_ERROR = "This PDF appears to be scanned images without a text layer, so no text can be extracted."
+
+
+class ExtractionError(Exception):
+    """
+    Raised by an extractor when a document cannot be read.
+
+    The message is shown to the client.
+    """
+
+
+def file_is_seekable(file) -> bool:
+    """Whether a file object supports the random access pypdf and zipfile need."""
+    try:
+        return file.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def read_blocks(file, size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Read a file in blocks."""
+    while True:
+        block = file.read(size)
+        if not block:
+            return
+        yield block
+
+
+def decode_blocks(file, encoding: str) -> Iterator[str]:
+    """Decode a file block by block; characters split across blocks are handled."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for block in read_blocks(file):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def text_encoding(head: bytes) -> Optional[str]:
+    """
+    Encoding of text content judged from its first bytes, or None for binary data.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if b'\x00' in head:
+        return None
+    try:
+        # The head may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def batched(pieces: Iterator[str], size: int = CHUNK_CHARS) -> Iterator[str]:
+    """Join small pieces of text into chunks of about `size` characters."""
+    buffer: List[str] = []
+    length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class Extractor:
+    """
+    A document format and how to stream text out of it.
+
+    Attributes:
+        name: Format name, e.g. "pdf"
+        extensions: File name extensions of the format
+        paged: Whether chunks are the document's own pages, one per page
+            and empty for a page without text
+        magic: Whether detection relies on an unambiguous signature (magic
+            bytes or an HTML root element), which takes precedence over
+            the file name
+        empty_error: Error when the document holds no text
+    """
+    name = ''
+    extensions = ()
+    paged = False
+    magic = False
+    empty_error = "No text found in the file"
+
+    def detect(self, head: bytes, file) -> bool:
+        """Whether the file, starting with `head`, is in this format."""
+        raise NotImplementedError
+
+    def iter_chunks(self, file) -> Iterator[str]:
+        """
+        Yield the document's text in chunks.
+
+        Raises:
+            ExtractionError: If the document cannot be read
+        """
+        raise NotImplementedError
+
+
+class PdfExtractor(Extractor):
+    name = 'pdf'
+    extensions = ('pdf',)
+    paged = True
+    magic = True
+
+    def detect(self, head, file):
+        # The header may be preceded by junk; readers accept it within the first KB
+        return b'%PDF-' in head[:1024]
+
+    def iter_chunks(self, file):
+        try:
+            # pypdf seeks within the file, so a file on disk is read lazily
+            # rather than copied into memory; anything else is buffered first
+            reader = pypdf.PdfReader(file if file_is_seekable(file) else BytesIO(file.read()))
+            page_count = len(reader.pages)
+        except Exception as e:
+            logger.error(f"PDF extraction error: {str(e)}")
+            raise ExtractionError(f"Failed to process PDF file: {str(e)}")
+
+        if page_count == 0:
+            raise ExtractionError("PDF file contains no pages")
+
+        # Sample a few pages before walking all of them: scans have no text to extract
+        scan = prescan_pdf(reader, settings.PDF_PRESCAN_PAGES)
+        if scan.image_only:
+            logger.info(f"PDF looks image-only: {scan!r}")
+            yield from self._ocr(reader, SCANNED_PDF_ERROR)
+            return
+
+        found_text = False
+        # Empty pages are held back until text is found, so OCR can still take over
+        empty_pages = 0
+        for page_num, page in enumerate(reader.pages):
+            try:
+                page_text = page.extract_text()
+            except Exception as page_error:
+                logger.warning(f"Failed to extract text from page {page_num + 1}: {str(page_error)}")
+                page_text = ''
+            if not page_text.strip():
+                if found_text:
+                    yield ''
+                else:
+                    empty_pages += 1
+                continue
+            if not found_text:
+                yield from [''] * empty_pages
+                found_text = True
+            yield page_text
+
+        if not found_text:
+            yield from self._ocr(reader, NO_TEXT_PDF_ERROR)
+
+    @staticmethod
+    def _ocr(reader, error_without_ocr):
+        if not settings.OCR_ENABLED:
+            raise ExtractionError(error_without_ocr)
+        pages, error = ocr_pdf_pages(reader)
+        if error:
+            raise ExtractionError(error)
+        yield from pages
+
+
+class DocxExtractor(Extractor):
+    name = 'docx'
+    extensions = ('docx',)
+    magic = True
+    empty_error = "Word document contains no text"
+
+    DOCUMENT_PART = 'word/document.xml'
+    NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+    def detect(self, head, file):
+        if not head.startswith(b'PK\x03\x04') or not file_is_seekable(file):
+            return False
+        try:
+            # Only the zip's central directory is read here
+            with zipfile.ZipFile(file) as archive:
+                return self.DOCUMENT_PART in archive.namelist()
+        except zipfile.BadZipFile:
+            return False
+        finally:
+            file.seek(0)
+
+    def iter_chunks(self, file):
+        try:
+            archive = zipfile.ZipFile(file)
+            part = archive.open(self.DOCUMENT_PART)
+        except (zipfile.BadZipFile, KeyError) as e:
+            raise ExtractionError(f"Failed to process DOCX file: {str(e)}")
+        with archive, part:
+            yield from batched(self._paragraphs(part))
+
+    def _paragraphs(self, part) -> Iterator[str]:
+        text_tag = f'{self.NAMESPACE}t'
+        tab_tag = f'{self.NAMESPACE}tab'
+        break_tags = (f'{self.NAMESPACE}br', f'{self.NAMESPACE}cr')
+        paragraph_tag = f'{self.NAMESPACE}p'
+        pieces: List[str] = []
+        try:
+            for _, element in iterparse(part, events=('end',)):
+                tag = element.tag
+                if tag == text_tag:
+                    pieces.append(element.text or '')
+                elif tag == tab_tag:
+                    pieces.append('\t')
+                elif tag in break_tags:
+                    pieces.append('\n')
+                elif tag == paragraph_tag:
+                    yield "".join(pieces) + "\n"
+                    pieces = []
+                    # Drop the parsed paragraph so memory does not grow with the document
+                    element.clear()
+        except Exception as e:
+            raise ExtractionError(f"Failed to process DOCX file: {str(e)}")
+
+
+class _HtmlTextParser(HTMLParser):
+    """
+    Collects visible text, with line breaks at block elements.
+    """
+    SKIP = {'script', 'style', 'noscript', 'template', 'head'}
+    BLOCK = {
+        'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'table', 'section', 'article', 'header',
+        'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'hr', 'title',
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCK:
+            self.pieces.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCK:
+            self.pieces.append('\n')
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.pieces.append(data)
+
+    def take(self) -> str:
+        text = "".join(self.pieces)
+        self.pieces = []
+        return text
+
+
+class HtmlExtractor(Extractor):
+    name = 'html'
+    extensions = ('html', 'htm')
+    magic = True
+    empty_error = "HTML file contains no text"
+
+    re_markup = re.compile(rb'^\s*(<!--.*?-->\s*)*<(!doctype\s+html|html|head|body)[\s>]', re.IGNORECASE | re.DOTALL)
+    re_meta_charset = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+    re_blank_lines = re.compile(r'\n\s*\n\s*')
+    re_spaces = re.compile(r'[ \t\r\f\v]+')
+
+    def detect(self, head, file):
+        return bool(self.re_markup.match(head.lstrip(codecs.BOM_UTF8)))
+
+    def iter_chunks(self, file):
+        head = file.read(HEAD_BYTES)
+        file.seek(0)
+        encoding = self._encoding(head)
+        parser = _HtmlTextParser()
+        pending = ''
+        for text in decode_blocks(file, encoding):
+            parser.feed(text)
+            pending += self._clean(parser.take())
+            if len(pending) >= CHUNK_CHARS:
+                yield pending
+                pending = ''
+        parser.close()
+        pending += self._clean(parser.take())
+        if pending.strip():
+            yield pending
+
+    def _encoding(self, head: bytes) -> str:
+        match = self.re_meta_charset.search(head)
+        if match:
+            try:
+                return codecs.lookup(match.group(1).decode('ascii')).name
+            except (LookupError, UnicodeDecodeError):
+                pass
+        return text_encoding(head) or 'utf-8'
+
+    def _clean(self, text: str) -> str:
+        return self.re_blank_lines.sub('\n\n', self.re_spaces.sub(' ', text))
+
+
+class MarkdownExtractor(Extractor):
+    name = 'markdown'
+    extensions = ('md', 'markdown')
+    empty_error = "Markdown file is empty"
+
+    # Lines that only Markdown starts this way: ATX headings, fences, lists, quotes, tables, links
+    re_syntax = re.compile(
+        r'^(#{1,6} \S|```|~~~|[-*+] \S|\d+\. \S|> |\|.*\|\s*$|\[[^\]]+\]: \S)|\]\([^)]+\)|\*\*\S',
+        re.MULTILINE,
+    )
+    re_heading = re.compile(r'^\s{0,3}#{1,6}\s+|\s+#+\s*$', re.MULTILINE)
+    re_image = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+    re_link = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+    re_emphasis = re.compile(r'(\*\*|__|\*|_|~~|`)(?=\S)(.+?)(?<=\S)\1')
+    re_fence = re.compile(r'^\s*(```|~~~).*$', re.MULTILINE)
+    re_quote = re.compile(r'^\s{0,3}>\s?', re.MULTILINE)
+
+    # Markdown syntax lines needed in the head to tell it from plain text
+    MIN_SYNTAX_MATCHES = 2
+
+    def detect(self, head, file):
+        encoding = text_encoding(head)
+        if encoding is None:
+            return False
+        sample = head.decode(encoding, errors='ignore')
+        return len(self.re_syntax.findall(sample)) >= self.MIN_SYNTAX_MATCHES
+
+    def iter_chunks(self, file):
+        encoding = text_encoding(file.read(HEAD_BYTES)) or 'utf-8'
+        file.seek(0)
+        carry = ''
+        for text in batched(decode_blocks(file, encoding)):
+            # Only strip complete lines; the rest waits for the next chunk
+            text = carry + text
+            cut = text.rfind('\n') + 1
+            carry = text[cut:]
+            if cut:
+                yield self.strip(text[:cut])
+        if carry:
+            yield self.strip(carry)
+
+    def strip(self, text: str) -> str:
+        """Remove Markdown markup, keeping the readable text."""
+        text = self.re_fence.sub('', text)
+        text = self.re_heading.sub('', text)
+        text = self.re_quote.sub('', text)
+        text = self.re_image.sub(r'\1', text)
+        text = self.re_link.sub(r'\1', text)
+        return self.re_emphasis.sub(r'\2', text)
+
+
+class TextFileExtractor(Extractor):
+    name = 'txt'
+    extensions = ('txt',)
+    empty_error = "Text file is empty"
+
+    def detect(self, head, file):
+        return text_encoding(head) is not None
+
+    def iter_chunks(self, file):
+        encoding = text_encoding(file.read(HEAD_BYTES)) or 'utf-8'
+        file.seek(0)
+        yield from batched(decode_blocks(file, encoding))
+
+
+class ExtractorRegistry:
+    """
+    Extractors in detection order: specific signatures before plain text.
+    """
+
+    def __init__(self):
+        self._extractors: Dict[str, Extractor] = {}
+
+    def register(self, extractor: Extractor) -> Extractor:
+        """Add an extractor; later registrations are tried after earlier ones."""
+        self._extractors[extractor.name] = extractor
+        return extractor
+
+    def get(self, name: str) -> Extractor:
+        """
+        Raises:
+            KeyError: If no extractor has that name
+        """
+        if name not in self._extractors:
+            raise KeyError(f"Unknown document format '{name}'")
+        return self._extractors[name]
+
+    def names(self) -> List[str]:
+        return list(self._extractors)
+
+    def enabled(self) -> List[Extractor]:
+        """Extractors whose extensions appear in ALLOWED_FILE_TYPES."""
+        allowed = set(settings.ALLOWED_FILE_TYPES)
+        return [extractor for extractor in self._extractors.values() if allowed.intersection(extractor.extensions)]
+
+    def detect(self, file, filename: str = '') -> Optional[Extractor]:
+        """
+        Find the extractor for a file from its content.
+
+        Signatures (PDF, DOCX, HTML) always decide. Text formats cannot be
+        told apart with certainty, so among those the file name's extension
+        is preferred when the content fits it, e.g. a .txt file containing
+        a Markdown-like list stays plain text. The file is left at position 0.
+
+        Args:
+            file: Seekable file object
+            filename: Original file name, used only as a hint
+
+        Returns:
+            The matching enabled Extractor, or None if the format is not supported
+        """
+        file.seek(0)
+        head = file.read(HEAD_BYTES)
+        file.seek(0)
+        if not head:
+            return None
+
+        enabled = self.enabled()
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        hinted = [extractor for extractor in enabled if extension in extractor.extensions]
+        candidates = dict.fromkeys(
+            [extractor for extractor in enabled if extractor.magic]
+            + hinted
+            + [extractor for extractor in enabled if not extractor.magic]
+        )
+        for extractor in candidates:
+            if extractor.detect(head, file):
+                return extractor
+        return None
+
+
+registry = ExtractorRegistry()
+registry.register(PdfExtractor())
+registry.register(DocxExtractor())
+registry.register(HtmlExtractor())
+registry.register(MarkdownExtractor())
+registry.register(TextFileExtractor())
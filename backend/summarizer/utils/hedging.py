@@ -0,0 +1,315 @@
+"""
+Hedged AI requests to cut tail latency.
+
+When hedging is enabled, each AI call runs on a worker thread. If it has
+not returned by a deadline taken from the observed latency distribution
+of its model (for example the p95), a second request is issued, optionally
+to a cheaper fallback model. The first successful response wins. A hedge
+budget caps the extra calls at a fraction of primary calls.
+
+Once the race is decided the loser is cancelled in the scheduler (see
+scheduler.py): if it is still waiting for a slot it never calls upstream,
+and if it is running its slot is returned at once. Python threads cannot
+be interrupted, so a running request still goes on, bounded by the
+per-attempt request timeout. When it returns, its usage is recorded
+through the caller's on_discard and its result is closed if it can be (a
+streamed response closes its connection, which stops generation upstream).
+
+Latencies of failed attempts are recorded too, and a timed-out attempt
+counts as taking at least the attempt timeout, so the slow tail is not
+left out of the hedge deadline.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+from .scheduler import CallCancelled, LLMScheduler, QueueFull, call_attempt, llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Number of recent latencies kept per model
+LATENCY_SAMPLES = 500
+
+
+class LatencyTracker:
+    """
+    Recent call latencies per model, used to set hedge deadlines.
+    """
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self._samples = samples
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        """Record the duration of a successful call."""
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self._samples)).append(seconds)
+
+    def count(self, model: str) -> int:
+        """Number of recorded samples for a model."""
+        with self._lock:
+            return len(self._latencies.get(model, ()))
+
+    def percentile(self, model: str, fraction: float) -> Optional[float]:
+        """
+        Nearest-rank percentile of recent latencies, or None without samples.
+        """
+        with self._lock:
+            values = sorted(self._latencies.get(model, ()))
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+        return values[index]
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Sample count and latency percentiles in milliseconds for each model."""
+        with self._lock:
+            models = list(self._latencies)
+        return {
+            model: {
+                "samples": self.count(model),
+                "p50_ms": round(self.percentile(model, 0.50) * 1000, 2),
+                "p95_ms": round(self.percentile(model, 0.95) * 1000, 2),
+                "p99_ms": round(self.percentile(model, 0.99) * 1000, 2),
+            }
+            for model in models
+        }
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedges to a fraction of primary calls.
+
+    Every primary call deposits `ratio` tokens, up to `burst`; every hedge
+    spends one whole token.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        """Credit the budget for one primary call."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend one token for a hedge; False if the budget is exhausted."""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Hedger:
+    """
+    Runs AI calls with an optional hedge after a percentile-based deadline.
+    """
+
+    def __init__(self, enabled: bool, percentile: float, min_delay: float, default_delay: float,
+                 min_samples: int, fallback_model: str, budget_ratio: float, budget_burst: float,
+                 attempt_timeout: float, max_workers: int, scheduler: Optional[LLMScheduler] = None):
+        """
+        Args:
+            enabled: Whether calls are hedged at all
+            percentile: Latency percentile of the model used as the hedge deadline
+            min_delay: Lower bound on the hedge deadline in seconds
+            default_delay: Deadline used until the model has min_samples latencies
+            min_samples: Samples required before the percentile is trusted
+            fallback_model: Model for the hedge request, empty to reuse the primary model
+            budget_ratio: Hedges allowed per primary call on average
+            budget_burst: Hedges allowed back to back
+            attempt_timeout: Request timeout for each attempt, which bounds abandoned losers
+            max_workers: Worker threads running hedged attempts
+            scheduler: Scheduler the attempts take their slots from, for cancelling the loser
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.fallback_model = fallback_model
+        self.attempt_timeout = attempt_timeout
+        self.max_workers = max_workers
+        self.scheduler = scheduler or llm_scheduler
+        self.tracker = LatencyTracker()
+        self.budget = HedgeBudget(budget_ratio, budget_burst)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0, "losers_closed": 0}
+        self._counters_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> 'Hedger':
+        """Build a hedger from the LLM_HEDGING_* settings."""
+        return cls(
+            enabled=settings.LLM_HEDGING_ENABLED,
+            percentile=settings.LLM_HEDGING_PERCENTILE,
+            min_delay=settings.LLM_HEDGING_MIN_DELAY,
+            default_delay=settings.LLM_HEDGING_DEFAULT_DELAY,
+            min_samples=settings.LLM_HEDGING_MIN_SAMPLES,
+            fallback_model=settings.LLM_HEDGING_FALLBACK_MODEL,
+            budget_ratio=settings.LLM_HEDGING_BUDGET_RATIO,
+            budget_burst=settings.LLM_HEDGING_BUDGET_BURST,
+            attempt_timeout=settings.LLM_HEDGING_ATTEMPT_TIMEOUT,
+            max_workers=settings.LLM_HEDGING_MAX_WORKERS,
+        )
+
+    def deadline(self, model: str) -> float:
+        """Seconds to wait for the primary call before hedging."""
+        if self.tracker.count(model) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, self.tracker.percentile(model, self.percentile))
+
+    def call(self, attempt: Callable[[str], object], model: str,
+             on_discard: Optional[Callable[[object], None]] = None):
+        """
+        Run attempt(model), hedging it if it is slow.
+
+        Args:
+            attempt: Callable issuing one request to the given model
+            model: Model for the primary request
+            on_discard: Called with the result of a losing attempt that
+                still returned, e.g. to record its usage, before it is closed
+
+        Returns:
+            Result of the first attempt to succeed
+
+        Raises:
+            The primary attempt's exception if every attempt fails
+        """
+        self._count("calls")
+        if not self.enabled:
+            return self._timed(attempt, model)
+
+        self.budget.deposit()
+        keys = {}
+        primary = self._submit(attempt, model, keys)
+        done, _ = wait([primary], timeout=self.deadline(model))
+        if done:
+            return primary.result()
+        if not self.budget.withdraw():
+            self._count("budget_denied")
+            return primary.result()
+
+        hedge_model = self.fallback_model or model
+        logger.info(f"Hedging slow {model} call with {hedge_model}")
+        hedge = self._submit(attempt, hedge_model, keys)
+        self._count("hedged")
+
+        pending = {primary, hedge}
+        errors = {}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not isinstance(e, QueueFull):
+                        logger.warning(f"Hedged attempt failed: {str(e)}")
+                    errors[future] = e
+                    continue
+                for loser in pending:
+                    if not loser.cancel():
+                        self._discard(loser, keys[loser], on_discard)
+                if future is hedge:
+                    self._count("hedge_wins")
+                return result
+        raise errors.get(primary) or errors[hedge]
+
+    def _submit(self, attempt: Callable[[str], object], model: str, keys: Dict[object, object]):
+        """
+        Start one attempt on the pool, in a copy of the caller's context (so
+        the scheduler sees its call group) marked with its own call_attempt.
+        """
+        key = object()
+        context = copy_context()
+        context.run(call_attempt.set, key)
+        future = self._pool().submit(context.run, self._timed, attempt, model)
+        keys[future] = key
+        return future
+
+    def _timed(self, attempt: Callable[[str], object], model: str):
+        """Run one attempt and record its latency, failed attempts included."""
+        started = time.monotonic()
+        try:
+            result = attempt(model)
+        except (QueueFull, CallCancelled):
+            # Shed or withdrawn before reaching upstream
+            raise
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            self.tracker.record(model, max(elapsed, self.attempt_timeout) if _is_timeout(e) else elapsed)
+            raise
+        self.tracker.record(model, time.monotonic() - started)
+        return result
+
+    def _discard(self, loser, key: object, on_discard: Optional[Callable[[object], None]]) -> None:
+        """
+        Give up on an attempt that lost the race: free its scheduler slot
+        now, and account for and close its result once it returns.
+        """
+        self.scheduler.cancel(key)
+
+        def finished(future):
+            self.scheduler.forget(key)
+            if future.cancelled() or future.exception() is not None:
+                return
+            result = future.result()
+            try:
+                if on_discard is not None:
+                    on_discard(result)
+                close = getattr(result, "close", None)
+                if callable(close):
+                    close()
+                    self._count("losers_closed")
+            except Exception as e:
+                logger.warning(f"Failed to discard losing hedged attempt: {str(e)}")
+
+        loser.add_done_callback(finished)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """Create the worker pool on first hedged call."""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="ai-hedge"
+                    )
+        return self._executor
+
+    def _count(self, name: str) -> None:
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Hedging counters and the observed latency distribution per model.
+        """
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            "enabled": self.enabled,
+            **counters,
+            "models": self.tracker.snapshot(),
+        }
+
+
+def _is_timeout(error: Exception) -> bool:
+    """Whether an attempt failed by running into its request timeout."""
+    return isinstance(error, TimeoutError) or type(error).__name__.endswith(('Timeout', 'TimeoutError'))
+
+
+# Create a singleton instance shared by every AI call in the process
+hedger = Hedger.from_settings()
@@ -0,0 +1,296 @@
+"""
+Incremental summaries for documents that are re-uploaded with small edits.
+
+Long documents are split with content-defined chunking: a rolling gear
+hash over the last WINDOW characters picks the boundaries, so an edit only
+moves the boundaries next to it and every other chunk of the new version
+is byte-identical to a chunk of the previous one. Each chunk is summarized
+once and stored under the hash of its text; a new version looks its
+chunks up by hash, summarizes only the ones it does not find, and a cheap
+reduce call over the chunk summaries produces the final summary. Tokens
+and latency therefore scale with the size of the change rather than the
+size of the document.
+
+The number of chunk calls per document is bounded by INCREMENTAL_MAX_CHUNKS:
+the average chunk length is doubled until a document splits into about
+half that many chunks, and each chunk is condensed to the chunk prompt's
+input budget like any other long text (see AISummarizer.prepare_text).
+Doubling adds one bit to the boundary test, so the boundaries of the
+larger chunks are a subset of the smaller ones' and only change when a
+document crosses a power of two of the chunk length.
+"""
+import hashlib
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .ai_summarizer import ai_summarizer
+from .language import Language, calibrate, chunk_chars
+from .prompts import PromptTemplate, get_prompt
+from .scheduler import PRIORITY_SUMMARIZE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_PROMPT = 'chunk'
+
+# Characters the rolling hash looks at; a boundary depends on nothing else
+WINDOW = 48
+
+# Boundaries are moved to just after the next whitespace within this many characters
+SNAP_CHARS = 64
+
+# One random 64-bit value per low byte of a code point. Derived from SHA-256
+# so the boundaries, and with them the stored chunk hashes, never change.
+GEAR = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:8], 'little') for value in range(256)],
+    dtype=np.uint64,
+)
+
+re_whitespace = re.compile(r'\s')
+
+
+def chunk_key() -> str:
+    """Prompt key stored chunk summaries are tagged with."""
+    return get_prompt(CHUNK_PROMPT).key
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+def boundary_candidates(text: str, bits: int) -> np.ndarray:
+    """
+    Offsets after which the rolling hash of the last WINDOW characters has
+    its top `bits` bits clear, i.e. roughly one every 2**bits characters.
+
+    The gear hash h[i] = sum(GEAR[c[i - k]] << k for k < WINDOW) is computed
+    for all offsets at once, WINDOW vectorized shift-and-add passes instead
+    of a Python loop per character. The top bits mix in every character of
+    the window; the low bits would only see the last few.
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+    gears = GEAR[codes & 0xFF]
+    hashes = np.zeros_like(gears)
+    for shift in range(min(WINDOW, len(gears))):
+        hashes[shift:] += gears[:len(gears) - shift] << np.uint64(shift)
+    mask = np.uint64(((1 << bits) - 1) << (64 - bits))
+    return np.flatnonzero((hashes & mask) == 0) + 1
+
+
+def chunk_text(text: str, avg_chars: int, min_chars: Optional[int] = None,
+               max_chars: Optional[int] = None) -> List[str]:
+    """
+    Split text into content-defined chunks.
+
+    Args:
+        text: Full document text
+        avg_chars: Target average chunk length
+        min_chars: Shortest chunk, defaults to a quarter of avg_chars
+        max_chars: Longest chunk, defaults to three times avg_chars; only
+            runs without a hash boundary are cut here
+
+    Returns:
+        Chunks in document order; joined, they give back the text
+    """
+    min_chars = min_chars or avg_chars // 4
+    max_chars = max_chars or avg_chars * 3
+    bits = max(1, round(math.log2(max(avg_chars - min_chars, 2))))
+
+    cuts = []
+    start = 0
+
+    def cut_at(offset):
+        nonlocal start
+        match = re_whitespace.search(text, offset, offset + SNAP_CHARS)
+        offset = match.end() if match else offset
+        cuts.append(offset)
+        start = offset
+
+    for candidate in boundary_candidates(text, bits).tolist():
+        while candidate - start > max_chars:
+            cut_at(start + max_chars)
+        if candidate - start >= min_chars and candidate < len(text):
+            cut_at(candidate)
+    while len(text) - start > max_chars:
+        cut_at(start + max_chars)
+
+    bounds = [0] + [cut for cut in cuts if cut < len(text)] + [len(text)]
+    return [text[begin:end] for begin, end in zip(bounds, bounds[1:]) if end > begin]
+
+
+def document_chunk_chars(text_chars: int, language: Optional[Language] = None,
+                         max_chunks: Optional[int] = None) -> int:
+    """
+    Average chunk length for a document of text_chars characters.
+
+    The calibrated chunk length (see language.chunk_chars), doubled until
+    the document splits into at most half of max_chunks chunks on average.
+    """
+    max_chunks = max_chunks or settings.INCREMENTAL_MAX_CHUNKS
+    avg_chars = chunk_chars(language)
+    while text_chars > avg_chars * max(1, max_chunks // 2):
+        avg_chars *= 2
+    return avg_chars
+
+
+def cap_chunks(chunks: List[str], max_chunks: int) -> List[str]:
+    """Join neighbouring chunks into at most max_chunks, for the rare document over the average."""
+    if len(chunks) <= max_chunks:
+        return chunks
+    size = math.ceil(len(chunks) / max_chunks)
+    return ["".join(chunks[index:index + size]) for index in range(0, len(chunks), size)]
+
+
+class ChunkStream:
+    """
+    chunk_text over text that arrives piece by piece.
+
+    A cut depends only on the WINDOW characters before it and the
+    SNAP_CHARS after it, so once the text extends SNAP_CHARS past a cut the
+    chunk before it is final and identical to what chunk_text would
+    produce over the whole text. Only the text after the last final cut is
+    re-chunked as more arrives.
+    """
+
+    def __init__(self, avg_chars: int, min_chars: Optional[int] = None, max_chars: Optional[int] = None):
+        self.avg_chars = avg_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._pending = ''
+
+    def feed(self, text: str) -> List[str]:
+        """Add text and return the chunks that became final."""
+        self._pending += text
+        chunks = chunk_text(self._pending, self.avg_chars, self.min_chars, self.max_chars)
+        final = []
+        consumed = 0
+        # The last chunk can still grow
+        for chunk in chunks[:-1]:
+            if consumed + len(chunk) + SNAP_CHARS > len(self._pending):
+                break
+            final.append(chunk)
+            consumed += len(chunk)
+        self._pending = self._pending[consumed:]
+        return final
+
+    def finish(self) -> List[str]:
+        """Return the remaining chunks at the end of the text."""
+        pending, self._pending = self._pending, ''
+        return chunk_text(pending, self.avg_chars, self.min_chars, self.max_chars) if pending else []
+
+
+def chunk_template(model: Optional[str] = None, language: Optional[Language] = None) -> PromptTemplate:
+    """The chunk prompt, with a routed model as its default and input calibrated to the language."""
+    return calibrate(get_prompt(CHUNK_PROMPT), language).with_defaults(model=model)
+
+
+def summarize_chunk(chunk: str, template: PromptTemplate, summarizer=None,
+                    priority: str = PRIORITY_SUMMARIZE) -> Tuple[str, str]:
+    """
+    Summarize one chunk.
+
+    Returns:
+        Tuple of (summary, error_message)
+    """
+    summarizer = summarizer or ai_summarizer
+    return summarizer.generate(
+        template, priority=priority, text=summarizer.prepare_text(chunk, template.max_input_chars)
+    )
+
+
+def reduce_chunk_summaries(summaries: List[Tuple[str, str]], style: Optional[str] = None,
+                           version: Optional[str] = None, summarizer=None,
+                           priority: str = PRIORITY_SUMMARIZE, model: Optional[str] = None,
+                           max_tokens: Optional[int] = None, language: Optional[Language] = None,
+                           output_language: Optional[Language] = None) -> Tuple[str, str]:
+    """
+    Write the final summary in the requested style from the chunk summaries, in order.
+
+    Chunk summaries are intermediate, so only this call is localized.
+
+    Returns:
+        Tuple of (summary, error_message)
+    """
+    summarizer = summarizer or ai_summarizer
+    reduce_input = "\n\n".join(chunk_summary for _, chunk_summary in summaries)
+    return summarizer.summarize(
+        reduce_input, style=style, version=version, priority=priority, model=model, max_tokens=max_tokens,
+        language=language, output_language=output_language
+    )
+
+
+def summarize_incremental(text: str, lookup: Callable[[Iterable[str]], Dict[str, str]],
+                          style: Optional[str] = None, version: Optional[str] = None,
+                          summarizer=None, priority: str = PRIORITY_SUMMARIZE,
+                          model: Optional[str] = None, max_tokens: Optional[int] = None,
+                          language: Optional[Language] = None, output_language: Optional[Language] = None,
+                          max_chunks: Optional[int] = None) -> Tuple[str, List[Tuple[str, str]], str]:
+    """
+    Summarize a long document, reusing stored summaries of unchanged chunks.
+
+    Args:
+        text: Full document text
+        lookup: Returns the stored summaries of the given chunk hashes
+        style: Summary style of the final reduce call
+        version: Prompt version of the final reduce call
+        summarizer: AISummarizer to use, defaults to the shared instance
+        priority: Scheduler priority class for the AI calls
+        model: Model for templates without their own (see utils/routing.py)
+        max_tokens: Output budget of the reduce call if its template has none
+        language: Language of the document; chunk sizes are calibrated to its script
+        output_language: Language of the final summary, defaults to the document's
+        max_chunks: Most chunk calls for the document, defaults to INCREMENTAL_MAX_CHUNKS
+
+    Returns:
+        Tuple of (summary, chunks, error_message). chunks lists the
+        (hash, summary) of every chunk in order, for storing; it is filled
+        even when the reduce call fails, so a retry is cheap. When a chunk
+        call fails it lists the chunks summarized so far, so a retry only
+        repeats the failed ones.
+    """
+    summarizer = summarizer or ai_summarizer
+    if not text.strip():
+        return "", [], "No text provided for summarization"
+
+    max_chunks = max_chunks or settings.INCREMENTAL_MAX_CHUNKS
+    template = chunk_template(model, language)
+    avg_chars = document_chunk_chars(len(text), language, max_chunks)
+    # Grown chunks are longer than the prompt takes and are condensed when summarized
+    max_chars = template.max_input_chars if avg_chars == chunk_chars(language) else None
+    chunks = cap_chunks(chunk_text(text, avg_chars, max_chars=max_chars), max_chunks)
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    known = lookup(hashes)
+    missing = [index for index, digest in enumerate(hashes) if digest not in known]
+
+    def summarize_missing(index):
+        return summarize_chunk(chunks[index], template, summarizer, priority)
+
+    # Worker threads run in a copy of this context, so usage is attributed to the caller
+    context = copy_context()
+    with ThreadPoolExecutor(max_workers=settings.PYRAMID_MAX_WORKERS) as executor:
+        results = list(executor.map(lambda index: context.copy().run(summarize_missing, index), missing))
+
+    failed = None
+    for index, (summary, error) in zip(missing, results):
+        if error:
+            failed = failed or error
+            continue
+        known[hashes[index]] = summary
+    if failed:
+        return "", [(digest, known[digest]) for digest in hashes if digest in known], failed
+
+    logger.info(
+        f"Incremental summary: {len(chunks) - len(missing)} of {len(chunks)} chunks reused, "
+        f"{sum(len(chunks[index]) for index in missing)} of {len(text)} characters summarized"
+    )
+    summaries = [(digest, known[digest]) for digest in hashes]
+    summary, error = reduce_chunk_summaries(
+        summaries, style, version, summarizer, priority, model, max_tokens, language, output_language
+    )
+    return summary, summaries, error
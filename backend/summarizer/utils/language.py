@@ -0,0 +1,202 @@
+"""
+Local language detection and language-aware prompts.
+
+The language of a document is detected from a sample of its start, without
+a network call or model: the dominant script (see routing.detect_script)
+decides most languages outright, letters unique to one language split
+scripts shared by several (Japanese kana, Ukrainian and Persian letters),
+and Latin-script languages are told apart by their most frequent short
+words. A detection takes a tenth of a millisecond or less and is stored
+on the Document (see storage.document_language).
+
+The language then calibrates requests to the document's script. Input
+budgets (a template's max_input_chars and the chunk size of long
+documents) are set in characters of Latin text, so they are scaled by the
+script's characters per token to keep the same token budget. Prompts for
+documents that are not in English, or summaries requested in another
+language, get an instruction naming both languages after the document
+text, so the shared prefix that upstream prompt caching reuses is kept.
+The instruction is part of the template key, so summaries in different
+output languages are stored side by side.
+"""
+import string
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .prompts import PromptTemplate
+from .routing import CHARS_PER_TOKEN, detect_script
+
+# Characters from the start of the text that detection looks at
+SAMPLE_CHARS = 2000
+
+# Stripped from the ends of whitespace-separated words
+PUNCTUATION = string.punctuation + '«»“”„‘’…–—¿¡'
+
+
+class Language:
+    """A language code, its English name and its script."""
+
+    def __init__(self, code: str, name: str, script: str):
+        self.code = code
+        self.name = name
+        self.script = script
+
+    @property
+    def token_ratio(self) -> float:
+        """Characters per token of this script, relative to Latin text."""
+        return CHARS_PER_TOKEN.get(self.script, CHARS_PER_TOKEN['latin']) / CHARS_PER_TOKEN['latin']
+
+    def __eq__(self, other):
+        return isinstance(other, Language) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+    def __repr__(self):
+        return f"<Language {self.code} ({self.script})>"
+
+
+LANGUAGES: Dict[str, Language] = {language.code: language for language in (
+    Language('en', 'English', 'latin'),
+    Language('de', 'German', 'latin'),
+    Language('fr', 'French', 'latin'),
+    Language('es', 'Spanish', 'latin'),
+    Language('it', 'Italian', 'latin'),
+    Language('pt', 'Portuguese', 'latin'),
+    Language('nl', 'Dutch', 'latin'),
+    Language('sv', 'Swedish', 'latin'),
+    Language('pl', 'Polish', 'latin'),
+    Language('tr', 'Turkish', 'latin'),
+    Language('ru', 'Russian', 'cyrillic'),
+    Language('uk', 'Ukrainian', 'cyrillic'),
+    Language('el', 'Greek', 'greek'),
+    Language('he', 'Hebrew', 'hebrew'),
+    Language('ar', 'Arabic', 'arabic'),
+    Language('fa', 'Persian', 'arabic'),
+    Language('hi', 'Hindi', 'devanagari'),
+    Language('th', 'Thai', 'thai'),
+    Language('ko', 'Korean', 'hangul'),
+    Language('ja', 'Japanese', 'cjk'),
+    Language('zh', 'Chinese', 'cjk'),
+)}
+
+ENGLISH = LANGUAGES['en']
+LANGUAGE_CODES = tuple(LANGUAGES)
+
+# The language of each script that has only one here
+SCRIPT_LANGUAGES = {'greek': 'el', 'hebrew': 'he', 'devanagari': 'hi', 'thai': 'th', 'hangul': 'ko'}
+
+# Frequent short words of each Latin-script language; words shared by
+# several languages count for each of them, the distinctive ones decide
+STOPWORDS = {
+    'en': "the and of to is in that for with was are this on be it as by have not which from",
+    'de': "der die und das ist nicht mit den von zu ein eine auf für sich dem des auch werden wird",
+    'fr': "le la les et des est une du que pour dans pas sur qui au avec ce sont par plus",
+    'es': "el la los las de que y en del por una con para es se su al como más pero",
+    'it': "il la di che e un una per del della non sono con gli le nel alla anche come è",
+    'pt': "o a os as de que e do da em um uma para com não dos das por mais se",
+    'nl': "de het een en van is dat op te niet met voor zijn in er aan ook als door wordt",
+    'sv': "och att det som en är på för med av den till inte har de ett om var men kan",
+    'pl': "i w z na się nie do to że jest o jak od po dla przez ale są czy oraz",
+    'tr': "ve bir bu da de için ile olarak daha çok gibi olan en ne ama değil var mi her sonra",
+}
+# Each stopword and the languages it counts for
+WORD_LANGUAGES: Dict[str, List[str]] = {}
+for _code, _words in STOPWORDS.items():
+    for _word in _words.split():
+        WORD_LANGUAGES.setdefault(_word, []).append(_code)
+
+# Share of sample words that must be stopwords of the best language
+MIN_STOPWORD_SHARE = 0.05
+
+# Code points of letters that only one language of a shared script uses
+KANA = (0x3040, 0x30FF)
+UKRAINIAN = np.array([ord(char) for char in "іїєґІЇЄҐ"], dtype=np.uint32)
+PERSIAN = np.array([ord(char) for char in "پچژگکی"], dtype=np.uint32)
+ARABIC = np.array([ord(char) for char in "يكة"], dtype=np.uint32)
+
+
+def get_language(code: Optional[str]) -> Language:
+    """The language with the given code, English if it is unknown."""
+    return LANGUAGES.get(code or '', ENGLISH)
+
+
+def _latin_language(sample: str) -> str:
+    words = [word.strip(PUNCTUATION) for word in sample.lower().split()]
+    scores = Counter([code for word in words if word in WORD_LANGUAGES for code in WORD_LANGUAGES[word]])
+    if not scores:
+        return ENGLISH.code
+    code, score = scores.most_common(1)[0]
+    return code if score >= MIN_STOPWORD_SHARE * len(words) else ENGLISH.code
+
+
+def detect_language(text: str) -> Language:
+    """
+    Detect the language of a text from a sample of its start.
+
+    Returns:
+        The detected Language, English for text with no recognisable language
+    """
+    sample = text[:SAMPLE_CHARS]
+    script = detect_script(sample)
+    if script == 'latin':
+        return LANGUAGES[_latin_language(sample)]
+    if script in SCRIPT_LANGUAGES:
+        return LANGUAGES[SCRIPT_LANGUAGES[script]]
+
+    codes = np.frombuffer(sample.encode('utf-32-le'), dtype=np.uint32)
+    if script == 'cjk':
+        kana = np.count_nonzero((codes >= KANA[0]) & (codes <= KANA[1]))
+        # Japanese text mixes kana into its kanji; Chinese has none
+        code = 'ja' if kana > 0.1 * len(codes) else 'zh'
+    elif script == 'cyrillic':
+        code = 'uk' if np.isin(codes, UKRAINIAN).any() else 'ru'
+    elif script == 'arabic':
+        code = 'fa' if np.isin(codes, PERSIAN).sum() > np.isin(codes, ARABIC).sum() else 'ar'
+    else:
+        code = ENGLISH.code
+    return LANGUAGES[code]
+
+
+def calibrate(template: PromptTemplate, language: Optional[Language]) -> PromptTemplate:
+    """
+    The template with its input budget scaled to the language's script.
+
+    The key is unchanged: the prompt is the same, only less text is sent.
+    """
+    if language is None or language.token_ratio == 1:
+        return template
+    return template.with_input_chars(int(template.max_input_chars * language.token_ratio))
+
+
+def localize(template: PromptTemplate, language: Optional[Language] = None,
+             output_language: Optional[Language] = None) -> PromptTemplate:
+    """
+    The template for a document in the given language, answering in
+    output_language (by default the document's language).
+
+    English documents summarized in English keep the template as it is.
+    """
+    template = calibrate(template, language)
+    output_language = output_language or language or ENGLISH
+    source = language if language is not None and language != ENGLISH else None
+    if source is None and output_language == ENGLISH:
+        return template
+
+    instruction = f"Write your response in {output_language.name}."
+    if source is not None:
+        instruction = f"The document is in {source.name}. {instruction}"
+    if output_language == source:
+        variant = source.code
+    else:
+        variant = f"{language.code if language else ''}>{output_language.code}"
+    return template.with_instruction(instruction, variant)
+
+
+def chunk_chars(language: Optional[Language]) -> int:
+    """Average chunk length of long documents, calibrated to the language's script."""
+    ratio = language.token_ratio if language is not None else 1
+    return int(settings.INCREMENTAL_CHUNK_CHARS * ratio)
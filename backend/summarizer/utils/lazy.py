@@ -0,0 +1,52 @@
+"""
+Lazy imports for heavy optional dependencies.
+
+Modules such as openai, pypdf or numpy take hundreds of milliseconds to
+import. Wrapping them with lazy_import defers that cost from worker start
+to the first request that actually needs them.
+"""
+import threading
+from importlib import import_module
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Module proxy that imports the real module on first attribute access.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def _load(self) -> ModuleType:
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    self._lazy_module = import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the real module has been imported yet."""
+        return self._lazy_module is not None
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Return a proxy for a module that is imported on first use.
+
+    Args:
+        name: Absolute module name, e.g. "pypdf"
+
+    Returns:
+        LazyModule proxy
+    """
+    return LazyModule(name)
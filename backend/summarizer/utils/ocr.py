@@ -0,0 +1,187 @@
+"""
+Optional local OCR of scanned PDF pages.
+
+Off by default (OCR_ENABLED). When enabled, PDFs that the pre-scan finds
+to be image-only (see pdf_scan.py) are routed here instead of failing:
+the images of each page are passed to a local Tesseract install through
+pytesseract, in a pool of worker processes so that pages are recognised
+in parallel and the CPU-bound work stays out of the request threads.
+
+Results are cached per page in the OCR_CACHE_ALIAS cache, keyed by a
+hash of the page's image data and the OCR languages, so re-uploads and
+documents sharing pages are not recognised twice. Nothing leaves the
+machine.
+
+Requires the optional pytesseract and Pillow packages and the tesseract
+binary.
+"""
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def ocr_unavailable_reason() -> Optional[str]:
+    """
+    Why OCR cannot run here, or None if it can.
+    """
+    for module, package in (('pytesseract', 'pytesseract'), ('PIL', 'Pillow')):
+        if importlib.util.find_spec(module) is None:
+            return f"the {package} package is not installed"
+    if shutil.which(settings.OCR_TESSERACT_CMD) is None:
+        return f"the {settings.OCR_TESSERACT_CMD} binary was not found"
+    return None
+
+
+def ocr_images(images: List[bytes], languages: str, tesseract_cmd: str = 'tesseract') -> str:
+    """
+    Recognise the text of a page's images. Runs in a worker process.
+
+    Args:
+        images: Encoded image files (PNG, JPEG, ...) of one page
+        languages: Tesseract language codes, e.g. "eng" or "eng+deu"
+        tesseract_cmd: Path or name of the tesseract binary
+
+    Returns:
+        Recognised text, one block per image
+    """
+    from io import BytesIO
+
+    import pytesseract
+    from PIL import Image
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    texts = []
+    for data in images:
+        with Image.open(BytesIO(data)) as image:
+            texts.append(pytesseract.image_to_string(image, lang=languages).strip())
+    return "\n".join(text for text in texts if text)
+
+
+def page_cache_key(images: List[bytes], languages: str) -> str:
+    """Cache key of a page's OCR result."""
+    digest = hashlib.sha256(languages.encode())
+    for data in images:
+        digest.update(hashlib.sha256(data).digest())
+    return f"ocr:{digest.hexdigest()}"
+
+
+def page_images(page) -> List[bytes]:
+    """Encoded images painted on a PDF page."""
+    return [image.data for image in page.images]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Create the OCR worker pool on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a process that runs request threads is not safe
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.OCR_MAX_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def ocr_pdf_pages(reader) -> Tuple[List[str], Optional[str]]:
+    """
+    OCR every page of a scanned PDF.
+
+    Args:
+        reader: pypdf PdfReader
+
+    Returns:
+        Tuple of (page_texts, error_message). Pages without recognised text
+        are skipped, as in regular extraction.
+    """
+    reason = ocr_unavailable_reason()
+    if reason:
+        return [], f"This PDF is a scan and OCR is unavailable: {reason}."
+
+    languages = settings.OCR_LANGUAGES
+    cache = caches[settings.OCR_CACHE_ALIAS]
+    workers = settings.OCR_MAX_WORKERS
+    results: Dict[int, str] = {}
+    pending = {}
+    errors = []
+    cached = 0
+
+    def collect(done):
+        for future in done:
+            index, key = pending.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                errors.append(f"page {index + 1}: {str(e)}")
+                continue
+            cache.set(key, results[index])
+
+    try:
+        for index, page in enumerate(reader.pages):
+            try:
+                images = page_images(page)
+            except Exception as e:
+                errors.append(f"page {index + 1}: {str(e)}")
+                continue
+            if not images:
+                continue
+
+            key = page_cache_key(images, languages)
+            text = cache.get(key)
+            if text is not None:
+                results[index] = text
+                cached += 1
+            elif workers <= 0:
+                # In-process, mainly for tests and single-core hosts
+                try:
+                    results[index] = ocr_images(images, languages, settings.OCR_TESSERACT_CMD)
+                    cache.set(key, results[index])
+                except Exception as e:
+                    errors.append(f"page {index + 1}: {str(e)}")
+            else:
+                future = _get_pool().submit(ocr_images, images, languages, settings.OCR_TESSERACT_CMD)
+                pending[future] = (index, key)
+                # Bound the images held in memory to a couple of pages per worker
+                if len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+        if pending:
+            done, _ = wait(pending)
+            collect(done)
+    except BrokenProcessPool as e:
+        _reset_pool()
+        return [], f"OCR failed: {str(e)}"
+
+    for error in errors:
+        logger.warning(f"OCR error on {error}")
+    logger.info(f"OCR recognised {len(results)} of {len(reader.pages)} pages ({cached} from cache)")
+
+    # One entry per page, so pages without text keep the numbering
+    pages = [results.get(index, '') for index in range(len(reader.pages))]
+    if not any(page.strip() for page in pages):
+        detail = f" ({errors[0]})" if errors else ""
+        return [], f"OCR found no text in the scanned PDF{detail}."
+    return pages, None
@@ -0,0 +1,114 @@
+"""
+Cheap pre-scan of PDFs for extractable text.
+
+Running pypdf's extract_text() over every page of a large scanned PDF
+takes seconds, only to find that there is no text. Instead a few pages
+spread over the document are inspected directly: a page can only yield
+text if its resources declare a font and its content stream uses a
+text-showing operator (Tj or TJ). Scanned pages typically have neither,
+just an image XObject painted over the page.
+
+Form XObjects may carry their own text, so a page using one is treated
+as possibly containing text; the scan only ever errs towards extracting.
+"""
+import logging
+import re
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Text-showing operators, not part of a longer name
+re_text_operator = re.compile(rb'(?<![A-Za-z0-9])T[jJ](?![A-Za-z0-9])')
+
+
+class PdfScan:
+    """
+    What the sampled pages of a PDF contain.
+    """
+
+    def __init__(self, page_count: int, sampled: List[int], text_pages: int, image_pages: int):
+        self.page_count = page_count
+        self.sampled = sampled
+        self.text_pages = text_pages
+        self.image_pages = image_pages
+
+    @property
+    def image_only(self) -> bool:
+        """No sampled page can yield text, but some show images: a scan."""
+        return bool(self.sampled) and self.text_pages == 0 and self.image_pages > 0
+
+    def __repr__(self):
+        return (f"<PdfScan {len(self.sampled)}/{self.page_count} pages sampled, "
+                f"{self.text_pages} with text, {self.image_pages} with images>")
+
+
+def sample_pages(page_count: int, samples: int) -> List[int]:
+    """
+    Up to `samples` page indices spread evenly from the first to the last page.
+    """
+    if page_count <= 0 or samples <= 0:
+        return []
+    if samples == 1 or page_count == 1:
+        return [0]
+    step = (page_count - 1) / (min(samples, page_count) - 1)
+    return sorted({round(index * step) for index in range(min(samples, page_count))})
+
+
+def _resolve(value):
+    return value.get_object() if hasattr(value, 'get_object') else value
+
+
+def scan_page(page):
+    """
+    Inspect one page's resources and content stream.
+
+    Returns:
+        Tuple of (may_have_text, has_images)
+    """
+    resources = _resolve(page.get('/Resources')) or {}
+    has_fonts = bool(_resolve(resources.get('/Font')))
+
+    has_images = has_forms = False
+    for xobject in (_resolve(resources.get('/XObject')) or {}).values():
+        subtype = _resolve(xobject).get('/Subtype')
+        has_images = has_images or subtype == '/Image'
+        has_forms = has_forms or subtype == '/Form'
+
+    if has_forms:
+        return True, has_images
+    if not has_fonts:
+        return False, has_images
+
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b''
+    return bool(re_text_operator.search(data)), has_images
+
+
+def prescan_pdf(reader, samples: int) -> PdfScan:
+    """
+    Sample pages of a PDF to tell a scan from a text document.
+
+    Args:
+        reader: pypdf PdfReader
+        samples: Number of pages to inspect
+
+    Returns:
+        PdfScan of the sampled pages
+    """
+    page_count = len(reader.pages)
+    inspected = []
+    text_pages = image_pages = 0
+    for index in sample_pages(page_count, samples):
+        inspected.append(index)
+        try:
+            may_have_text, has_images = scan_page(reader.pages[index])
+        except Exception as e:
+            # Unusual structure: assume text so that normal extraction decides
+            logger.debug(f"Pre-scan could not inspect page {index + 1}: {str(e)}")
+            may_have_text, has_images = True, False
+        text_pages += may_have_text
+        image_pages += has_images
+        if may_have_text:
+            # One page with text is enough to go ahead with extraction
+            break
+    return PdfScan(page_count, inspected, text_pages, image_pages)
@@ -0,0 +1,222 @@
+"""
+Summarization that overlaps with text extraction.
+
+Without pipelining a long PDF is extracted completely before its first AI
+call, so extraction time and AI time add up. PipelinedSummary is fed the
+text as the extractor produces it. Once PIPELINE_MIN_CHARS have arrived
+and the router picks map-reduce for the document so far, the text goes
+through a streaming chunker (incremental.ChunkStream). Each chunk is
+dispatched to a worker thread as soon as it is final, while the extractor
+is still reading later pages. After extraction only the last chunks and
+the reduce call remain, so latency approaches the slower of the two
+stages rather than their sum.
+
+Chunks are the same content-defined chunks as incremental summaries, and
+their summaries are looked up and stored by hash the same way. A document
+that turns out to have a stored summary therefore only costs the lookups
+of chunks that were dispatched early.
+
+Chunks are dispatched at the calibrated chunk length, which incremental
+summaries only use for documents up to half of INCREMENTAL_MAX_CHUNKS
+chunks. A document that grows past that while it is extracted drops the
+pipeline, so the summary is made afterwards with the grown chunks of
+summarize_incremental; the calls spent on it stay within that bound too.
+"""
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from ..usage import usage_tally
+from .incremental import (
+    ChunkStream,
+    chunk_hash,
+    chunk_template,
+    document_chunk_chars,
+    reduce_chunk_summaries,
+    summarize_chunk,
+)
+from .language import Language, chunk_chars, detect_language
+from .routing import STRATEGY_MAP_REDUCE, RoutingDecision, router
+from .scheduler import PRIORITY_SUMMARIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PipelinedSummary:
+    """
+    Summarize a document's chunks while it is still being extracted.
+
+    Args:
+        lookup: Returns the stored summaries of the given chunk hashes
+        style: Summary style of the final reduce call
+        version: Prompt version of the final reduce call
+        summarizer: AISummarizer to use, defaults to the shared instance
+        priority: Scheduler priority class for the AI calls
+        min_chars: Text needed before chunks are dispatched, defaults to
+            PIPELINE_MIN_CHARS
+        output_language: Language of the final summary, defaults to the
+            document's, which is detected from the text seen at the start
+        max_chunks: Chunk call bound of the document, defaults to the
+            route's or INCREMENTAL_MAX_CHUNKS
+    """
+
+    def __init__(self, lookup: Callable[[Iterable[str]], Dict[str, str]], style: Optional[str] = None,
+                 version: Optional[str] = None, summarizer=None, priority: str = PRIORITY_SUMMARIZE,
+                 min_chars: Optional[int] = None, output_language: Optional[Language] = None,
+                 max_chunks: Optional[int] = None):
+        self.lookup = lookup
+        self.style = style
+        self.version = version
+        self.summarizer = summarizer
+        self.priority = priority
+        self.min_chars = settings.PIPELINE_MIN_CHARS if min_chars is None else min_chars
+        self.output_language = output_language
+        self.max_chunks = max_chunks
+        self.decision: Optional[RoutingDecision] = None
+        self.language: Optional[Language] = None
+        self._parts: List[str] = []
+        self._chars = 0
+        self._declined = False
+        self._stream: Optional[ChunkStream] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._context = None
+        self._template = None
+        # (hash, stored summary or Future) per chunk, in document order
+        self._chunks: List[Tuple[str, object]] = []
+        self._started_at = 0.0
+
+    @property
+    def started(self) -> bool:
+        """Whether chunks are being dispatched."""
+        return self._stream is not None
+
+    def feed(self, text: str) -> None:
+        """Add the next piece of extracted text."""
+        self._parts.append(text)
+        self._chars += len(text)
+        if self._stream is not None:
+            if document_chunk_chars(self._chars, self.language, self.max_chunks) > self._stream.avg_chars:
+                self._drop()
+                return
+            self._dispatch(self._stream.feed(text))
+        elif not self._declined and self._chars >= self.min_chars:
+            self._start()
+
+    def _start(self) -> None:
+        text = "".join(self._parts)
+        decision = router.decide(text)
+        if decision.route.strategy != STRATEGY_MAP_REDUCE:
+            # Routing is by what has been seen so far; a direct route stays direct
+            self._declined = True
+            return
+        language = detect_language(text)
+        self.max_chunks = self.max_chunks or decision.route.max_chunks or settings.INCREMENTAL_MAX_CHUNKS
+        if document_chunk_chars(len(text), language, self.max_chunks) > chunk_chars(language):
+            self._declined = True
+            return
+        self.decision = decision
+        self.language = language
+        self._started_at = time.perf_counter()
+        self._template = chunk_template(decision.route.model, self.language)
+        self._stream = ChunkStream(chunk_chars(self.language), max_chars=self._template.max_input_chars)
+        self._executor = ThreadPoolExecutor(max_workers=settings.PYRAMID_MAX_WORKERS,
+                                            thread_name_prefix='pipeline')
+        # Workers run in a copy of this context with the decision's usage tally,
+        # so their calls are attributed to the request and counted for the route
+        self._context = copy_context()
+        self._context.run(usage_tally.set, decision.usage)
+        logger.info(f"Pipelining summary after {self._chars} characters: {decision!r}")
+        self._dispatch(self._stream.feed(text))
+
+    def _dispatch(self, chunks: List[str]) -> None:
+        if not chunks:
+            return
+        hashes = [chunk_hash(chunk) for chunk in chunks]
+        known = self.lookup(hashes)
+        for chunk, digest in zip(chunks, hashes):
+            if digest in known:
+                self._chunks.append((digest, known[digest]))
+                continue
+            future = self._executor.submit(
+                self._context.copy().run, summarize_chunk, chunk, self._template, self.summarizer, self.priority
+            )
+            self._chunks.append((digest, future))
+
+    def result(self) -> Tuple[str, List[Tuple[str, str]], str]:
+        """
+        Dispatch the last chunks, wait for every chunk summary and reduce them.
+
+        Must only be called once extraction has finished and the pipeline
+        has started.
+
+        Returns:
+            Tuple of (summary, chunks, error_message) as summarize_incremental
+
+        Raises:
+            QueueFull: If the scheduler sheds one of the calls
+        """
+        decision = self.decision
+        try:
+            self._dispatch(self._stream.finish())
+            summaries = []
+            reused = 0
+            failed = None
+            for digest, value in self._chunks:
+                if isinstance(value, Future):
+                    summary, error = value.result()
+                    if error:
+                        # The other chunks are still collected, so they are stored for a retry
+                        failed = failed or error
+                        continue
+                else:
+                    summary = value
+                    reused += 1
+                summaries.append((digest, summary))
+            if failed:
+                decision.error = failed
+                return "", summaries, failed
+            logger.info(f"Pipelined summary: {reused} of {len(summaries)} chunks reused")
+
+            route = decision.route
+            token = usage_tally.set(decision.usage)
+            try:
+                summary, error = reduce_chunk_summaries(
+                    summaries, self.style, self.version, self.summarizer, self.priority,
+                    route.model, route.max_tokens, self.language, self.output_language
+                )
+            finally:
+                usage_tally.reset(token)
+            decision.error = error
+            return summary, summaries, error
+        except Exception as e:
+            decision.error = str(e)
+            raise
+        finally:
+            self.close()
+            decision.seconds = time.perf_counter() - self._started_at
+            router.record(decision)
+
+    def _drop(self) -> None:
+        """Stop dispatching a document too long for the calibrated chunk length."""
+        logger.info(f"Dropping pipelined summary after {self._chars} characters and {len(self._chunks)} chunks")
+        self.cancel()
+        self.decision = None
+        self._stream = None
+        self._chunks = []
+        self._declined = True
+
+    def cancel(self) -> None:
+        """Drop the pipeline, e.g. when extraction failed or a stored summary exists."""
+        for _, value in self._chunks:
+            if isinstance(value, Future):
+                value.cancel()
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,138 @@
+"""
+Extractive pre-filtering of long documents before the AI call.
+
+Sentences are scored by the cosine similarity of their TF-IDF vector to
+the document centroid, which favours sentences about the document's main
+topics. The best sentences are kept up to a token budget and returned in
+their original order, so only the condensed text is sent to the model.
+
+Scoring is vectorized with NumPy over (sentence, term) pairs; there is no
+Python loop per sentence or per term, which keeps a 10 MB document well
+under a second.
+"""
+import logging
+import string
+import time
+from typing import List
+
+from .lazy import lazy_import
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import('numpy')
+
+# Same rough estimate used for truncation: 1 token ≈ 4 characters
+CHARS_PER_TOKEN = 4
+
+# Marks sentence boundaries; NUL never survives into sentence text
+BOUNDARY = '\x00'
+SENTENCE_ENDS = ('. ', '! ', '? ', '.\n', '!\n', '?\n')
+# str.translate has a fast path for ASCII text, unlike a regex substitution
+PUNCTUATION_TO_SPACE = str.maketrans(string.punctuation, ' ' * len(string.punctuation))
+
+
+class PrefilterResult:
+    """
+    Condensed text plus statistics about the reduction.
+    """
+
+    def __init__(self, text: str, original_chars: int, sentences_total: int,
+                 sentences_kept: int, seconds: float):
+        self.text = text
+        self.original_chars = original_chars
+        self.sentences_total = sentences_total
+        self.sentences_kept = sentences_kept
+        self.seconds = seconds
+
+    @property
+    def compression_ratio(self) -> float:
+        """Original size divided by condensed size (1.0 means unchanged)."""
+        return self.original_chars / max(1, len(self.text))
+
+    def __repr__(self):
+        return (f"<PrefilterResult {self.sentences_kept}/{self.sentences_total} sentences, "
+                f"{self.compression_ratio:.1f}x in {self.seconds * 1000:.0f} ms>")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into non-empty sentences at ., ! or ? followed by whitespace and at blank lines.
+    """
+    # str.replace is several times faster than a regex split on multi-megabyte text
+    marked = text.replace(BOUNDARY, ' ').replace('\n\n', BOUNDARY)
+    for end in SENTENCE_ENDS:
+        marked = marked.replace(end, end[0] + BOUNDARY)
+    return [sentence for sentence in map(str.strip, marked.split(BOUNDARY)) if sentence]
+
+
+def score_sentences(sentences: List[str]):
+    """
+    Score each sentence by cosine similarity of its TF-IDF vector to the centroid.
+
+    Returns:
+        NumPy array with one score per sentence
+    """
+    # Tokenize all sentences in one pass, keeping the boundary marker as a token.
+    joined = BOUNDARY.join(sentences).lower().translate(PUNCTUATION_TO_SPACE)
+    tokens = joined.replace(BOUNDARY, f' {BOUNDARY} ').split()
+    hashes = np.fromiter(map(hash, tokens), dtype=np.int64, count=len(tokens))
+
+    # Markers number the sentences; hashing in C then np.unique assigns dense term ids.
+    is_boundary = hashes == hash(BOUNDARY)
+    sentence_ids = np.cumsum(is_boundary)[~is_boundary]
+    if not len(sentence_ids):
+        return np.zeros(len(sentences))
+    unique_terms, term_ids = np.unique(hashes[~is_boundary], return_inverse=True)
+    vocabulary_size = len(unique_terms)
+
+    # Collapse to unique (sentence, term) pairs with their term frequency.
+    pairs, tf = np.unique(sentence_ids * vocabulary_size + term_ids, return_counts=True)
+    pair_sentences = pairs // vocabulary_size
+    pair_terms = pairs % vocabulary_size
+
+    df = np.bincount(pair_terms, minlength=vocabulary_size)
+    idf = np.log(len(sentences) / df) + 1.0
+    weights = tf * idf[pair_terms]
+
+    centroid = np.bincount(pair_terms, weights=weights, minlength=vocabulary_size) / len(sentences)
+    dots = np.bincount(pair_sentences, weights=weights * centroid[pair_terms], minlength=len(sentences))
+    norms = np.sqrt(np.bincount(pair_sentences, weights=weights * weights, minlength=len(sentences)))
+    centroid_norm = np.sqrt((centroid * centroid).sum())
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = dots / (norms * centroid_norm)
+    return np.nan_to_num(scores)
+
+
+def prefilter_text(text: str, max_tokens: int) -> PrefilterResult:
+    """
+    Keep the most informative sentences of text up to a token budget.
+
+    Text that already fits the budget is returned unchanged.
+
+    Args:
+        text: Full document text
+        max_tokens: Budget for the condensed text, estimated as characters / 4
+
+    Returns:
+        PrefilterResult with the condensed text and the compression achieved
+    """
+    started = time.perf_counter()
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return PrefilterResult(text, len(text), 0, 0, time.perf_counter() - started)
+
+    sentences = split_sentences(text)
+    scores = score_sentences(sentences)
+    sizes = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences)) + 1
+
+    # Greedily take the best sentences whose running size fits the budget.
+    order = np.argsort(-scores, kind='stable')
+    fits = np.cumsum(sizes[order]) <= max_chars
+    keep = np.sort(order[fits]) if fits.any() else order[:1]
+
+    condensed = " ".join(sentences[index] for index in keep)[:max_chars]
+    result = PrefilterResult(condensed, len(text), len(sentences), len(keep),
+                             time.perf_counter() - started)
+    logger.info(f"Pre-filtered document: {result!r}")
+    return result
@@ -0,0 +1,324 @@
+"""
+Prompt registry for AI requests.
+
+This module holds named, versioned prompt templates together with the
+token budget and model parameters each one should be sent with. Every
+template starts with the same system message and places the document
+before any style-specific instruction, so requests about the same
+document share a stable prefix that upstream prompt caching can reuse.
+"""
+import copy
+import hashlib
+from string import Formatter
+from typing import Dict, List, Optional
+
+from .structured import RESPONSE_FORMAT as STRUCTURED_RESPONSE_FORMAT
+
+# Shared by every template; keep it byte-for-byte stable so that the
+# upstream prompt cache can reuse it across styles and versions.
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that reads documents and answers accurately and concisely. "
+    "Focus on extracting the most important information and only use what the document says."
+)
+
+
+class PromptTemplate:
+    """
+    A named, versioned prompt with its own token budget and model parameters.
+
+    The user message is parsed once at construction time, so rendering is
+    a plain join over precompiled literal and field parts.
+    """
+
+    def __init__(self, name: str, version: str, user: str, max_tokens: Optional[int] = None,
+                 temperature: Optional[float] = None, max_input_chars: int = 12000,
+                 model: Optional[str] = None, system: str = SYSTEM_PROMPT,
+                 response_format: Optional[Dict[str, object]] = None):
+        """
+        Args:
+            name: Template name used to select it (e.g. "brief", "chat")
+            version: Version label; part of every cache key built from this template
+            user: User message with str.format-style fields
+            max_tokens: Output token budget, None to use OPENAI_MAX_TOKENS
+            temperature: Sampling temperature, None to use OPENAI_TEMPERATURE
+            max_input_chars: Maximum characters of document text to include
+            model: Model override, None to use OPENAI_MODEL
+            system: System message (defaults to the shared prefix)
+            response_format: Optional response_format for the API, e.g. a JSON schema
+        """
+        self.name = name
+        self.version = version
+        self.system = system
+        self.user = user
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.max_input_chars = max_input_chars
+        self.model = model
+        self.response_format = response_format
+        # Set on copies with an extra instruction (see with_instruction)
+        self.variant = ''
+        self._parts = self._compile(user)
+        self.fields = frozenset(field for _, field in self._parts if field)
+
+    @staticmethod
+    def _compile(source: str) -> List[tuple]:
+        """Split a format string into (literal, field_name) pairs."""
+        parts = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if spec or conversion:
+                raise ValueError("Prompt fields do not support format specs or conversions")
+            parts.append((literal, field))
+        return parts
+
+    @property
+    def key(self) -> str:
+        """Identifier of this exact template, e.g. "brief@2" or "brief@2+de"."""
+        key = f"{self.name}@{self.version}"
+        return f"{key}+{self.variant}" if self.variant else key
+
+    def render(self, **values) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for this template.
+
+        Args:
+            **values: Values for every field in the user message
+
+        Returns:
+            List of message dicts ready for the chat completions API
+        """
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Missing prompt fields for {self.key}: {', '.join(sorted(missing))}")
+
+        user = "".join(literal + (str(values[field]) if field else "") for literal, field in self._parts)
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": user},
+        ]
+
+    def request_params(self, default_model: str, default_max_tokens: int,
+                       default_temperature: float) -> Dict[str, object]:
+        """
+        Model parameters for the completion call, falling back to the given defaults.
+        """
+        params = {
+            "model": self.model or default_model,
+            "max_tokens": self.max_tokens if self.max_tokens is not None else default_max_tokens,
+            "temperature": self.temperature if self.temperature is not None else default_temperature,
+        }
+        if self.response_format is not None:
+            params["response_format"] = self.response_format
+        return params
+
+    def with_defaults(self, model: Optional[str] = None, max_tokens: Optional[int] = None) -> 'PromptTemplate':
+        """
+        Copy of this template using the given model and output budget where
+        it has none of its own. The key is unchanged.
+        """
+        template = copy.copy(self)
+        if template.model is None:
+            template.model = model
+        if template.max_tokens is None:
+            template.max_tokens = max_tokens
+        return template
+
+    def with_input_chars(self, max_input_chars: int) -> 'PromptTemplate':
+        """
+        Copy of this template sending at most max_input_chars of text. The key
+        is unchanged.
+        """
+        template = copy.copy(self)
+        template.max_input_chars = max_input_chars
+        return template
+
+    def with_instruction(self, instruction: str, variant: str) -> 'PromptTemplate':
+        """
+        Copy of this template with an instruction after the user message,
+        keyed as the given variant (e.g. "brief@1+de").
+        """
+        template = copy.copy(self)
+        template.user = f"{self.user}\n\n{instruction.replace('{', '{{').replace('}', '}}')}"
+        template._parts = self._compile(template.user)
+        template.variant = f"{self.variant}+{variant}" if self.variant else variant
+        return template
+
+    def cache_key(self, *parts: str) -> str:
+        """
+        Build a result-cache key that changes whenever the template version does.
+
+        Args:
+            *parts: Extra key material, such as a document content hash
+
+        Returns:
+            Hex digest identifying the result of this template over the given inputs
+        """
+        digest = hashlib.sha256(self.key.encode("utf-8"))
+        for part in parts:
+            digest.update(b"\x00")
+            digest.update(str(part).encode("utf-8"))
+        return digest.hexdigest()
+
+    def __repr__(self):
+        return f"<PromptTemplate {self.key}>"
+
+
+class PromptRegistry:
+    """
+    Registry of prompt templates keyed by name and version.
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        self._latest: Dict[str, str] = {}
+
+    def register(self, template: PromptTemplate, latest: bool = True) -> PromptTemplate:
+        """
+        Add a template to the registry.
+
+        Args:
+            template: Template to register
+            latest: Whether this version becomes the default for its name
+
+        Returns:
+            The registered template
+        """
+        versions = self._templates.setdefault(template.name, {})
+        if template.version in versions:
+            raise ValueError(f"Prompt {template.key} is already registered")
+        versions[template.version] = template
+        if latest or template.name not in self._latest:
+            self._latest[template.name] = template.version
+        return template
+
+    def get(self, name: str, version: Optional[str] = None) -> PromptTemplate:
+        """
+        Look up a template, defaulting to the latest version of the name.
+
+        Raises:
+            KeyError: If the name or version is unknown
+        """
+        versions = self._templates.get(name)
+        if not versions:
+            raise KeyError(f"Unknown prompt: {name}")
+        version = version or self._latest[name]
+        if version not in versions:
+            raise KeyError(f"Unknown version {version} for prompt {name}")
+        return versions[version]
+
+    def has(self, name: str, version: Optional[str] = None) -> bool:
+        """Check whether a template (and optionally a version) exists."""
+        try:
+            self.get(name, version)
+        except KeyError:
+            return False
+        return True
+
+    def names(self) -> List[str]:
+        """Names of all registered templates."""
+        return sorted(self._templates)
+
+
+registry = PromptRegistry()
+
+# Summary styles. The document comes first so that every style shares the
+# system message plus document prefix; only the trailing instruction differs.
+SUMMARY_STYLES = ("brief", "detailed", "bullet", "executive")
+
+registry.register(PromptTemplate(
+    "brief", "1",
+    "Document:\n{text}\n\n"
+    "Summarize this document clearly and concisely. Focus on the main ideas and key points.",
+))
+registry.register(PromptTemplate(
+    "detailed", "1",
+    "Document:\n{text}\n\n"
+    "Write a detailed summary of this document. Cover every major section, the main "
+    "arguments, and any figures, dates or decisions that matter.",
+    max_tokens=700,
+    temperature=0.4,
+))
+registry.register(PromptTemplate(
+    "bullet", "1",
+    "Document:\n{text}\n\n"
+    "Summarize this document as a list of short bullet points, one key point per bullet.",
+    max_tokens=400,
+    temperature=0.3,
+))
+registry.register(PromptTemplate(
+    "executive", "1",
+    "Document:\n{text}\n\n"
+    "Write an executive summary of this document for a busy decision maker: the purpose, "
+    "the key findings, and any recommended actions.",
+    max_tokens=350,
+    temperature=0.3,
+))
+
+# Structured summary (see summarizer/utils/structured.py): the fields downstream
+# systems need, in one schema-constrained call instead of a summary plus a
+# second call to structure it. Needs a model with structured output support.
+STRUCTURED_PROMPT = "structured"
+
+registry.register(PromptTemplate(
+    STRUCTURED_PROMPT, "1",
+    "Document:\n{text}\n\n"
+    "Summarize this document as JSON: a short title, the key points in document order, "
+    "the named entities (people, organizations, locations, dates, products) and any action "
+    "items with their owner and due date when the document states them, otherwise null.",
+    max_tokens=900,
+    temperature=0.2,
+    response_format=STRUCTURED_RESPONSE_FORMAT,
+))
+
+# Summary pyramid (see summarizer/utils/pyramid.py). Sections are summarized
+# once; every shorter level is a condense pass over the level above it.
+registry.register(PromptTemplate(
+    "section", "1",
+    "Document:\n{text}\n\n"
+    "This is section {index} of {count} of a longer document. Summarize this section in a "
+    "few sentences, keeping names, figures, dates and decisions.",
+    max_tokens=250,
+    temperature=0.3,
+))
+# Content-defined chunks of long documents (see summarizer/utils/incremental.py).
+# Chunks move around between versions, so the prompt carries no position.
+registry.register(PromptTemplate(
+    "chunk", "1",
+    "Document:\n{text}\n\n"
+    "This is an excerpt of a longer document. Summarize this excerpt in a few sentences, "
+    "keeping names, figures, dates and decisions.",
+    max_tokens=250,
+    temperature=0.3,
+))
+registry.register(PromptTemplate(
+    "condense", "1",
+    "Summary:\n{text}\n\n"
+    "Rewrite this summary as a single coherent text of at most {words} words, "
+    "keeping only the most important points.",
+    max_tokens=700,
+    temperature=0.3,
+))
+
+registry.register(PromptTemplate(
+    "chat", "1",
+    "Document:\n{context}\n\n"
+    "User Question: {question}\n\n"
+    "Answer the question based only on the information provided in the document. "
+    "If the answer is not in the document, say so.",
+    max_tokens=300,
+    temperature=0.7,
+    max_input_chars=8000,
+))
+
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    """
+    Convenience function to look up a template in the default registry.
+
+    Args:
+        name: Template name
+        version: Optional version, defaults to the latest
+
+    Returns:
+        The matching PromptTemplate
+    """
+    return registry.get(name, version)
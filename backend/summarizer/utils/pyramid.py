@@ -0,0 +1,236 @@
+"""
+Summary pyramid utilities.
+
+A document is split into sections that are summarized once. The section
+summaries are then condensed into progressively shorter levels (detailed,
+paragraph, TL;DR). Any requested length is served from the nearest level,
+or by a cheap condense pass over it, instead of a full-document AI call.
+
+Templates are localized (see language.py): sections are summarized in the
+document's language, and the levels are written in the output language,
+so each output language has its own pyramid.
+"""
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Dict, List, Optional, Tuple, Union
+
+from django.conf import settings
+
+from .ai_summarizer import ai_summarizer
+from .language import Language, localize
+from .prompts import PromptTemplate, get_prompt
+from .scheduler import PRIORITY_SUMMARIZE
+
+logger = logging.getLogger(__name__)
+
+# Levels from longest to shortest, with their target length in words.
+LEVELS = (
+    ('detailed', 400),
+    ('paragraph', 120),
+    ('tldr', 30),
+)
+LEVEL_WORDS = dict(LEVELS)
+
+# A stored level is served as-is when it is at most this much longer than requested.
+LENGTH_TOLERANCE = 1.5
+
+
+def section_template(language: Optional[Language] = None) -> PromptTemplate:
+    """Template summarizing one section; intermediate, so in the document's language."""
+    return localize(get_prompt('section'), language)
+
+
+def condense_template(language: Optional[Language] = None,
+                      output_language: Optional[Language] = None) -> PromptTemplate:
+    """Template condensing summaries into a level, in the output language."""
+    return localize(get_prompt('condense'), language, output_language)
+
+
+def pyramid_key(language: Optional[Language] = None, output_language: Optional[Language] = None) -> str:
+    """
+    Identify the prompt templates a pyramid is built with.
+
+    Stored levels tagged with another key are stale and get rebuilt.
+    """
+    return f"{section_template(language).key}+{condense_template(language, output_language).key}"
+
+
+def word_count(text: str) -> int:
+    """Count whitespace-separated words."""
+    return len(text.split())
+
+
+def split_sections(text: str, section_chars: int, max_sections: int) -> List[str]:
+    """
+    Split text into sections on paragraph boundaries.
+
+    Args:
+        text: Full document text
+        section_chars: Preferred maximum characters per section
+        max_sections: Upper bound on the number of sections
+
+    Returns:
+        List of section texts, in document order
+    """
+    # Grow sections for very long documents so the number of AI calls stays bounded;
+    # each section is still truncated to the template's input limit when summarized.
+    target = max(section_chars, math.ceil(len(text) / max_sections))
+
+    sections = []
+    current = []
+    current_len = 0
+    for paragraph in text.split("\n\n"):
+        if not paragraph.strip():
+            continue
+        if current and current_len + len(paragraph) > target:
+            sections.append("\n\n".join(current))
+            current, current_len = [], 0
+        while len(paragraph) > target:
+            sections.append(paragraph[:target])
+            paragraph = paragraph[target:]
+        current.append(paragraph)
+        current_len += len(paragraph) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    if len(sections) > max_sections:
+        # Paragraph packing left some sections short; merge neighbours instead of dropping the tail.
+        group = math.ceil(len(sections) / max_sections)
+        sections = ["\n\n".join(sections[i:i + group]) for i in range(0, len(sections), group)]
+    return sections
+
+
+def condense(text: str, words: int, summarizer=None, priority: str = PRIORITY_SUMMARIZE,
+             language: Optional[Language] = None, output_language: Optional[Language] = None) -> Tuple[str, str]:
+    """
+    Shorten a summary to roughly the given number of words.
+
+    Text that is already short enough is returned unchanged without an AI
+    call, unless it has to be written in another language.
+
+    Returns:
+        Tuple of (condensed_text, error_message)
+    """
+    if word_count(text) <= words and output_language in (None, language):
+        return text, None
+    summarizer = summarizer or ai_summarizer
+    return summarizer.generate(
+        condense_template(language, output_language), priority=priority, text=text, words=words
+    )
+
+
+def build_pyramid(text: str, summarizer=None, priority: str = PRIORITY_SUMMARIZE,
+                  language: Optional[Language] = None,
+                  output_language: Optional[Language] = None) -> Tuple[Dict[str, object], str]:
+    """
+    Build every pyramid level for a document in one pass.
+
+    Args:
+        text: Full document text
+        summarizer: AISummarizer to use, defaults to the shared instance
+        priority: Scheduler priority class for the AI calls
+        language: Language of the document (see utils/language.py)
+        output_language: Language of the levels, defaults to the document's
+
+    Returns:
+        Tuple of (levels, error_message). levels maps "sections" to the list
+        of section summaries and each level name in LEVELS to its text.
+    """
+    summarizer = summarizer or ai_summarizer
+    if not text.strip():
+        return {}, "No text provided for summarization"
+
+    template = section_template(language)
+    sections = split_sections(text, template.max_input_chars, settings.PYRAMID_MAX_SECTIONS)
+
+    def summarize_section(item):
+        index, section = item
+        return summarizer.generate(
+            template,
+            priority=priority,
+            text=summarizer.prepare_text(section, template.max_input_chars),
+            index=index + 1,
+            count=len(sections),
+        )
+
+    # Worker threads run in a copy of this context, so usage is attributed to the caller
+    context = copy_context()
+    with ThreadPoolExecutor(max_workers=settings.PYRAMID_MAX_WORKERS) as executor:
+        results = list(executor.map(
+            lambda item: context.copy().run(summarize_section, item), enumerate(sections)
+        ))
+
+    for _, error in results:
+        if error:
+            return {}, error
+
+    section_summaries = [summary for summary, _ in results]
+    levels: Dict[str, object] = {'sections': section_summaries}
+
+    source = "\n\n".join(section_summaries)
+    for index, (level, words) in enumerate(LEVELS):
+        # Only the first pass translates; later ones condense text already in the output language
+        source_language = language if index == 0 else output_language or language
+        source, error = condense(source, words, summarizer, priority, source_language, output_language)
+        if error:
+            return {}, error
+        levels[level] = source
+
+    logger.info(f"Built summary pyramid from {len(sections)} sections")
+    return levels, None
+
+
+def parse_length(length: Union[str, int]) -> Optional[int]:
+    """
+    Convert a requested length (level name or word count) into words.
+
+    Returns:
+        Target word count, or None if the value is not a valid length
+    """
+    if isinstance(length, str) and length in LEVEL_WORDS:
+        return LEVEL_WORDS[length]
+    try:
+        words = int(length)
+    except (TypeError, ValueError):
+        return None
+    return words if words > 0 else None
+
+
+def summary_for_length(levels: Dict[str, str], length: Union[str, int], summarizer=None,
+                       priority: str = PRIORITY_SUMMARIZE,
+                       language: Optional[Language] = None) -> Tuple[str, str, str]:
+    """
+    Serve a summary of the requested length from precomputed levels.
+
+    The shortest level that is at least as long as requested is used. If it
+    is much longer than requested, it is condensed, which only costs an AI
+    call over a short summary rather than over the whole document.
+
+    Args:
+        levels: Mapping of level name to stored summary text
+        length: Level name or target word count
+        summarizer: AISummarizer to use for the condense pass
+        priority: Scheduler priority class for the condense call
+        language: Language the levels are written in
+
+    Returns:
+        Tuple of (summary, served_from_level, error_message)
+    """
+    words = parse_length(length)
+    if words is None:
+        return "", "", f"Invalid summary length: {length}"
+
+    # Walk from shortest to longest and stop at the first level that is long enough.
+    chosen = LEVELS[0][0]
+    for level, _ in reversed(LEVELS):
+        if word_count(levels[level]) >= words:
+            chosen = level
+            break
+
+    text = levels[chosen]
+    if word_count(text) <= words * LENGTH_TOLERANCE:
+        return text, chosen, None
+
+    summary, error = condense(text, words, summarizer, priority, language)
+    return summary, chosen, error
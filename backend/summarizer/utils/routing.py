@@ -0,0 +1,365 @@
+"""
+Routing of summary requests by cheap document features.
+
+Before a summary is generated, the router measures the document (an
+estimated token count, the number of headings and the dominant script) and
+picks a route from ROUTING_RULES: the first rule whose conditions all hold
+wins. A route sets
+
+- strategy: "direct" (one call over the pre-filtered text), "extractive"
+  (the pre-filter's key sentences, no AI call) or "map_reduce" (chunk
+  summaries plus a reduce call, see utils/incremental.py)
+- model: used by templates without a model of their own, instead of
+  OPENAI_MODEL
+- max_tokens: output budget of templates without one of their own,
+  instead of OPENAI_MAX_TOKENS
+- max_chunks: most chunk calls of a map-reduce summary, instead of
+  INCREMENTAL_MAX_CHUNKS
+
+Extractive summaries ignore the requested style and prompt, so they are
+stored under their own key (see extractive_key) rather than the
+template's, where a later AI summary in that style would find them.
+
+A rule is a JSON object such as
+
+    {"name": "short", "max_input_tokens": 1000, "strategy": "direct",
+     "model": "gpt-4o-mini", "max_tokens": 120}
+
+with the optional conditions min_input_chars, max_input_chars,
+min_input_tokens, max_input_tokens, min_sections, max_sections and scripts
+(a list such as ["cjk"]). When no rule matches, or ROUTING_ENABLED is off,
+the "default" route keeps the behaviour without routing. The default rules
+switch to map-reduce at INCREMENTAL_MIN_CHARS, like the default route;
+custom rules set their own thresholds instead.
+
+Every decision is logged with the latency and the tokens and cost of the
+AI calls it produced, and aggregated per route for /api/metrics/routing/,
+so the rules can be tuned from real traffic.
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from ..usage import UsageTally, usage_tally
+from .hedging import LatencyTracker
+from .prefilter import prefilter_text
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_DIRECT = 'direct'
+STRATEGY_EXTRACTIVE = 'extractive'
+STRATEGY_MAP_REDUCE = 'map_reduce'
+STRATEGIES = (STRATEGY_DIRECT, STRATEGY_EXTRACTIVE, STRATEGY_MAP_REDUCE)
+
+CONDITIONS = ('min_input_chars', 'max_input_chars', 'min_input_tokens', 'max_input_tokens', 'min_sections',
+              'max_sections', 'scripts')
+ROUTE_FIELDS = ('name', 'strategy', 'model', 'max_tokens', 'max_chunks')
+
+# Prompt key of stored extractive summaries, before the budget they were cut to
+EXTRACTIVE_KEY = 'extractive@1'
+
+# The script is detected on a sample from the start of the document
+SCRIPT_SAMPLE_CHARS = 4000
+
+# Inclusive code point ranges of each script's letters
+SCRIPTS = {
+    'latin': ((0x41, 0x5A), (0x61, 0x7A), (0xC0, 0x24F)),
+    'greek': ((0x370, 0x3FF),),
+    'cyrillic': ((0x400, 0x52F),),
+    'hebrew': ((0x590, 0x5FF),),
+    'arabic': ((0x600, 0x6FF), (0x750, 0x77F)),
+    'devanagari': ((0x900, 0x97F),),
+    'thai': ((0xE00, 0xE7F),),
+    'hangul': ((0x1100, 0x11FF), (0xAC00, 0xD7AF)),
+    'cjk': ((0x3040, 0x30FF), (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF)),
+}
+
+# Rough characters per token of each script; unlisted scripts use the latin figure
+CHARS_PER_TOKEN = {
+    'latin': 4.0,
+    'greek': 2.5,
+    'cyrillic': 2.5,
+    'hebrew': 2.5,
+    'arabic': 2.5,
+    'devanagari': 2.0,
+    'thai': 2.0,
+    'hangul': 1.5,
+    'cjk': 1.0,
+}
+
+# Markdown headings, numbered headings ("2.1 Scope") and short all-caps lines
+HEADING = re.compile(
+    r'^[ \t]*(?:#{1,6}[ \t]+\S.*|(?:\d+\.)+\d*[ \t]+[A-Z].{0,80}|'
+    r'(?i:chapter|section|part)[ \t]+[\dIVXLC]+\b.{0,80}|[A-Z][A-Z\d ,&:\-]{3,60})[ \t]*$',
+    re.MULTILINE,
+)
+
+
+# The ranges as sorted [start, end) edges, and the script of each range
+_RANGES = sorted((low, high, script) for script, ranges in SCRIPTS.items() for low, high in ranges)
+_EDGES = np.array([edge for low, high, _ in _RANGES for edge in (low, high + 1)], dtype=np.uint32)
+_RANGE_SCRIPTS = np.array([list(SCRIPTS).index(script) for _, _, script in _RANGES])
+
+
+def detect_script(text: str) -> str:
+    """
+    Dominant script of the letters in text, "latin" when there are none.
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    # A code point inside range k falls between edges 2k and 2k + 1
+    per_range = np.bincount(np.searchsorted(_EDGES, codes, side='right'), minlength=len(_EDGES) + 1)[1::2]
+    counts = np.bincount(_RANGE_SCRIPTS, weights=per_range, minlength=len(SCRIPTS))
+    best = int(counts.argmax())
+    return list(SCRIPTS)[best] if counts[best] else 'latin'
+
+
+class DocumentFeatures:
+    """
+    Cheap measurements of a document that routing rules are matched against.
+    """
+
+    def __init__(self, chars: int, tokens: int, sections: int, script: str):
+        self.chars = chars
+        self.tokens = tokens
+        self.sections = sections
+        self.script = script
+
+    @classmethod
+    def from_text(cls, text: str) -> 'DocumentFeatures':
+        script = detect_script(text[:SCRIPT_SAMPLE_CHARS])
+        tokens = int(len(text) / CHARS_PER_TOKEN.get(script, CHARS_PER_TOKEN['latin']))
+        sections = max(1, sum(1 for _ in HEADING.finditer(text)))
+        return cls(len(text), tokens, sections, script)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"chars": self.chars, "tokens": self.tokens, "sections": self.sections, "script": self.script}
+
+    def __repr__(self):
+        return f"<DocumentFeatures {self.tokens} tokens, {self.sections} sections, {self.script}>"
+
+
+class Route:
+    """
+    How to summarize a document: strategy, model, output budget and, for
+    map-reduce, the chunk call budget.
+    """
+
+    def __init__(self, name: str, strategy: str = STRATEGY_DIRECT, model: Optional[str] = None,
+                 max_tokens: Optional[int] = None, max_chunks: Optional[int] = None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r} in route {name!r}")
+        self.name = name
+        self.strategy = strategy
+        self.model = model or None
+        self.max_tokens = int(max_tokens) if max_tokens else None
+        self.max_chunks = int(max_chunks) if max_chunks else None
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"name": self.name, "strategy": self.strategy, "model": self.model, "max_tokens": self.max_tokens,
+                "max_chunks": self.max_chunks}
+
+    def __repr__(self):
+        return f"<Route {self.name}: {self.strategy}, model={self.model}, max_tokens={self.max_tokens}>"
+
+
+class RoutingRule:
+    """
+    A route and the document features it applies to.
+    """
+
+    def __init__(self, route: Route, conditions: Dict[str, object]):
+        self.route = route
+        self.conditions = conditions
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, object]) -> 'RoutingRule':
+        unknown = set(spec) - set(CONDITIONS) - set(ROUTE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown routing rule fields: {', '.join(sorted(unknown))}")
+        if not spec.get('name'):
+            raise ValueError(f"Routing rule without a name: {spec}")
+        route = Route(**{field: spec[field] for field in ROUTE_FIELDS if field in spec})
+        return cls(route, {condition: spec[condition] for condition in CONDITIONS if condition in spec})
+
+    def matches(self, features: DocumentFeatures) -> bool:
+        conditions = self.conditions
+        if features.chars < conditions.get('min_input_chars', 0):
+            return False
+        if 'max_input_chars' in conditions and features.chars > conditions['max_input_chars']:
+            return False
+        if features.tokens < conditions.get('min_input_tokens', 0):
+            return False
+        if 'max_input_tokens' in conditions and features.tokens > conditions['max_input_tokens']:
+            return False
+        if features.sections < conditions.get('min_sections', 0):
+            return False
+        if 'max_sections' in conditions and features.sections > conditions['max_sections']:
+            return False
+        return 'scripts' not in conditions or features.script in conditions['scripts']
+
+    def as_dict(self) -> Dict[str, object]:
+        return {**self.route.as_dict(), **self.conditions}
+
+
+class RoutingDecision:
+    """
+    The route picked for one document, and what following it cost.
+
+    Filled in by Router.track: latency in seconds, the usage of the AI
+    calls made, and the error message if the summary failed.
+    """
+
+    def __init__(self, route: Route, features: DocumentFeatures):
+        self.route = route
+        self.features = features
+        self.seconds = 0.0
+        self.usage = UsageTally()
+        self.error: Optional[str] = None
+
+    def __repr__(self):
+        return f"<RoutingDecision {self.route.name} for {self.features!r}>"
+
+
+def extractive_summary(text: str, max_tokens: Optional[int] = None) -> str:
+    """
+    Summary made of the document's most informative sentences, without an AI call.
+    """
+    return prefilter_text(text, max_tokens or settings.OPENAI_MAX_TOKENS).text
+
+
+def extractive_key(max_tokens: Optional[int] = None) -> str:
+    """Prompt key an extractive summary cut to max_tokens is stored under."""
+    return f"{EXTRACTIVE_KEY}+{max_tokens or settings.OPENAI_MAX_TOKENS}"
+
+
+class RouteStats:
+    """Decisions, failures and spend of one route."""
+
+    def __init__(self):
+        self.decisions = 0
+        self.errors = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = Decimal(0)
+
+
+class Router:
+    """
+    Picks a route per document and keeps per-route latency and cost.
+
+    Args:
+        rules: Rules in priority order
+        enabled: False to always take the default route
+    """
+
+    def __init__(self, rules: Iterable[RoutingRule], enabled: bool = True):
+        self.rules: List[RoutingRule] = list(rules)
+        self.enabled = enabled
+        self.latency = LatencyTracker()
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> 'Router':
+        return cls(
+            [RoutingRule.from_dict(spec) for spec in settings.ROUTING_RULES],
+            enabled=settings.ROUTING_ENABLED,
+        )
+
+    @staticmethod
+    def default_route(features: DocumentFeatures) -> Route:
+        """The route without routing rules: map-reduce above INCREMENTAL_MIN_CHARS."""
+        if settings.INCREMENTAL_ENABLED and features.chars >= settings.INCREMENTAL_MIN_CHARS:
+            return Route('default', STRATEGY_MAP_REDUCE)
+        return Route('default', STRATEGY_DIRECT)
+
+    def decide(self, text: str) -> RoutingDecision:
+        """Measure the document and pick the first matching rule's route."""
+        features = DocumentFeatures.from_text(text)
+        if self.enabled:
+            for rule in self.rules:
+                if rule.matches(features):
+                    return RoutingDecision(rule.route, features)
+        return RoutingDecision(self.default_route(features), features)
+
+    @contextmanager
+    def track(self, decision: RoutingDecision):
+        """
+        Measure the summary made inside the block, then log and record it.
+
+        The block sets decision.error when the summary failed; AI calls in
+        worker threads are counted when they run in a copy of this context.
+        """
+        token = usage_tally.set(decision.usage)
+        started = time.perf_counter()
+        try:
+            yield decision
+        except Exception as e:
+            decision.error = decision.error or str(e)
+            raise
+        finally:
+            decision.seconds = time.perf_counter() - started
+            usage_tally.reset(token)
+            self.record(decision)
+
+    def record(self, decision: RoutingDecision) -> None:
+        route, features, usage = decision.route, decision.features, decision.usage
+        with self._lock:
+            stats = self._stats.setdefault(route.name, RouteStats())
+            stats.decisions += 1
+            stats.errors += decision.error is not None
+            stats.calls += usage.calls
+            stats.prompt_tokens += usage.prompt_tokens
+            stats.completion_tokens += usage.completion_tokens
+            stats.cost_usd += usage.cost_usd
+        if decision.error is None:
+            self.latency.record(route.name, decision.seconds)
+        logger.info(
+            f"Routing decision route={route.name} strategy={route.strategy} model={route.model or '-'} "
+            f"max_tokens={route.max_tokens or '-'} input_tokens={features.tokens} sections={features.sections} "
+            f"script={features.script} latency_ms={decision.seconds * 1000:.0f} calls={usage.calls} "
+            f"prompt_tokens={usage.prompt_tokens} completion_tokens={usage.completion_tokens} "
+            f"cost_usd={usage.cost_usd:.6f} failed={decision.error is not None}"
+        )
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        The rules and, per route, decisions, spend and latency percentiles.
+        """
+        latency = self.latency.snapshot()
+        with self._lock:
+            routes = {
+                name: {
+                    "decisions": stats.decisions,
+                    "errors": stats.errors,
+                    "calls": stats.calls,
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "cost_usd": float(stats.cost_usd),
+                    "latency": latency.get(name),
+                }
+                for name, stats in self._stats.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "rules": [rule.as_dict() for rule in self.rules],
+            "routes": routes,
+        }
+
+    def reset(self) -> None:
+        """Forget recorded decisions."""
+        with self._lock:
+            self._stats = {}
+        self.latency = LatencyTracker()
+
+
+# Create a singleton instance shared by every summary request in the process
+router = Router.from_settings()
@@ -0,0 +1,389 @@
+"""
+Sandboxed extraction for documents that can exhaust a worker.
+
+A PDF under the upload limit can still hold content streams or object
+graphs that make pypdf use gigabytes of memory or spin for minutes. With
+SANDBOX_ENABLED, formats listed in SANDBOX_FORMATS are extracted in a
+separate process from a small pool that is reused across requests, so
+isolation does not cost a process spawn per document:
+
+- each page (chunk of a paged format) has SANDBOX_PAGE_TIMEOUT seconds, and
+  so does opening the document; a page that runs over is skipped, and
+  extraction continues
+- the whole document has SANDBOX_WALL_CLOCK seconds, and the process's
+  resident memory is polled against SANDBOX_MAX_RSS_MB; a process over
+  either limit is killed and replaced
+
+Pages are sent back as they are extracted, so when a limit trips the pages
+that did finish are returned. SandboxResult records which limit tripped
+(see SandboxResult.partial), and the pool keeps counters for
+/api/metrics/sandbox/.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LIMIT_PAGE_TIMEOUT = 'page_timeout'
+LIMIT_WALL_CLOCK = 'wall_clock'
+LIMIT_RSS = 'rss'
+LIMIT_CRASHED = 'crashed'
+
+LIMIT_ERRORS = {
+    LIMIT_WALL_CLOCK: "The document took too long to process.",
+    LIMIT_RSS: "The document needs too much memory to process.",
+    LIMIT_CRASHED: "The document could not be processed.",
+    LIMIT_PAGE_TIMEOUT: "A page of the document took too long to process.",
+}
+
+# How often the parent checks the sandbox's memory while waiting for pages
+POLL_INTERVAL = 0.05
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class PageTimeout(Exception):
+    """Raised in the sandbox when a page runs over SANDBOX_PAGE_TIMEOUT."""
+
+
+class SandboxResult:
+    """
+    Chunks extracted in the sandbox, and how the extraction ended.
+
+    Attributes:
+        extractor: Name of the detected format, None if detection failed
+        chunks: Normalised text chunks (pages for paged formats) that finished
+        error: Error message from the extractor, if any
+        limit: The limit that tripped (page_timeout, wall_clock, rss or
+            crashed), None if extraction ran to the end
+        page_timeouts: Pages skipped because they ran over the page timeout
+        seconds: Time from submission to the last chunk
+        peak_rss: Highest resident memory observed, in bytes
+    """
+
+    def __init__(self):
+        self.extractor: Optional[str] = None
+        self.chunks: List[str] = []
+        self.error: Optional[str] = None
+        self.limit: Optional[str] = None
+        self.page_timeouts = 0
+        self.seconds = 0.0
+        self.peak_rss = 0
+
+    @property
+    def partial(self) -> bool:
+        """Whether some of the document was left unextracted."""
+        return self.limit is not None
+
+    def __repr__(self):
+        limit = f", stopped by {self.limit}" if self.limit else ""
+        return (f"<SandboxResult {self.extractor} {len(self.chunks)} chunks in {self.seconds * 1000:.0f} ms, "
+                f"peak {self.peak_rss / 2 ** 20:.0f} MB, {self.page_timeouts} page timeouts{limit}>")
+
+
+def _page_alarm(signum, frame):
+    global _page_timeouts
+    _page_timeouts += 1
+    # Re-arm, so the next page of the same chunk request gets its own budget
+    signal.setitimer(signal.ITIMER_REAL, _page_timeout)
+    raise PageTimeout(f"Page extraction timed out after {_page_timeout} seconds")
+
+
+_page_timeout = 0.0
+_page_timeouts = 0
+
+
+def _worker_main(conn, page_timeout: float) -> None:
+    """Sandbox process: extract documents sent over conn until told to stop."""
+    global _page_timeout
+    import django
+    django.setup()
+    # Import the extractors up front, so the first page's budget is not spent on imports
+    import pypdf  # noqa: F401
+    from . import text_extractor  # noqa: F401
+    _page_timeout = page_timeout
+    signal.signal(signal.SIGALRM, _page_alarm)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        _extract(conn, *job)
+
+
+def _extract(conn, name: str, path: Optional[str], data: Optional[bytes]) -> None:
+    """Extract one document in the sandbox, sending each chunk as it is ready."""
+    global _page_timeouts
+    from io import BytesIO
+    from django.core.files import File
+    from .extractors import ExtractionError
+    from .text_extractor import detect_format, iter_text_chunks
+
+    _page_timeouts = 0
+    source = open(path, 'rb') if path else BytesIO(data)
+    try:
+        file = File(source, name=name)
+        extractor, error = detect_format(file)
+        if error:
+            conn.send(('done', error, 0))
+            return
+        conn.send(('start', extractor.name))
+
+        chunks = iter_text_chunks(file, extractor)
+        try:
+            while True:
+                # The first request also opens and prescans the document, within the same budget
+                if extractor.paged and _page_timeout:
+                    signal.setitimer(signal.ITIMER_REAL, _page_timeout)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                conn.send(('chunk', chunk))
+        except PageTimeout:
+            # Raised outside the extractor's own per-page error handling
+            pass
+        except ExtractionError as e:
+            conn.send(('done', str(e), _page_timeouts))
+            return
+        except Exception as e:
+            conn.send(('done', f"Failed to process {extractor.name.upper()} file: {str(e)}", _page_timeouts))
+            return
+        conn.send(('done', None, _page_timeouts))
+    finally:
+        source.close()
+
+
+def resident_memory(pid: int) -> int:
+    """Resident memory of a process in bytes, 0 where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+class SandboxWorker:
+    """One sandbox process and the pipe to it."""
+
+    def __init__(self, page_timeout: float):
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        # Not daemonic: the OCR stage starts its own worker processes
+        self.process = context.Process(target=_worker_main, args=(child_conn, page_timeout),
+                                       name='extraction-sandbox')
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def run(self, name: str, path: Optional[str], data: Optional[bytes], wall_clock: float,
+            max_rss: int, on_chunk: Optional[Callable[[str], None]] = None) -> SandboxResult:
+        """
+        Extract one document, stopping at the wall-clock and memory limits.
+
+        on_chunk, if given, is called with each chunk as it arrives.
+        """
+        result = SandboxResult()
+        self.jobs += 1
+        started = time.monotonic()
+        deadline = started + wall_clock
+        self.conn.send((name, path, data))
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    result.limit = LIMIT_WALL_CLOCK
+                    break
+                rss = resident_memory(self.pid)
+                result.peak_rss = max(result.peak_rss, rss)
+                if max_rss and rss > max_rss:
+                    result.limit = LIMIT_RSS
+                    break
+                if not self.conn.poll(min(POLL_INTERVAL, remaining)):
+                    continue
+                message = self.conn.recv()
+                if message[0] == 'chunk':
+                    result.chunks.append(message[1])
+                    if on_chunk is not None:
+                        on_chunk(message[1])
+                elif message[0] == 'start':
+                    result.extractor = message[1]
+                else:
+                    _, result.error, result.page_timeouts = message
+                    if result.page_timeouts:
+                        result.limit = LIMIT_PAGE_TIMEOUT
+                    break
+        except (EOFError, OSError):
+            result.limit = LIMIT_CRASHED
+        result.seconds = time.monotonic() - started
+        return result
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, kill: bool = False) -> None:
+        """Ask the process to exit, or kill it mid-document."""
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Reused sandbox processes with per-document limits.
+
+    Args:
+        size: Sandbox processes, started on demand
+        wall_clock: Seconds allowed per document
+        max_rss_mb: Resident memory allowed per process, 0 for no limit
+        page_timeout: Seconds allowed per page, 0 for no limit
+        max_jobs: Documents a process extracts before it is replaced
+    """
+
+    def __init__(self, size: int = 2, wall_clock: float = 60.0, max_rss_mb: int = 1024,
+                 page_timeout: float = 10.0, max_jobs: int = 200):
+        self.size = size
+        self.wall_clock = wall_clock
+        self.max_rss = max_rss_mb * 2 ** 20
+        self.page_timeout = page_timeout
+        self.max_jobs = max_jobs
+        # Most recently used first, so the fewest processes stay warm
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    @classmethod
+    def from_settings(cls) -> 'SandboxPool':
+        return cls(
+            size=settings.SANDBOX_WORKERS,
+            wall_clock=settings.SANDBOX_WALL_CLOCK,
+            max_rss_mb=settings.SANDBOX_MAX_RSS_MB,
+            page_timeout=settings.SANDBOX_PAGE_TIMEOUT,
+            max_jobs=settings.SANDBOX_MAX_JOBS,
+        )
+
+    def _acquire(self) -> Optional[SandboxWorker]:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = self._started < self.size
+            if start:
+                self._started += 1
+        if start:
+            try:
+                worker = SandboxWorker(self.page_timeout)
+            except Exception:
+                with self._lock:
+                    self._started -= 1
+                raise
+            self._count('started')
+            return worker
+        try:
+            return self._idle.get(timeout=self.wall_clock)
+        except queue.Empty:
+            return None
+
+    def _release(self, worker: SandboxWorker, healthy: bool) -> None:
+        if healthy and worker.alive and worker.jobs < self.max_jobs:
+            self._idle.put(worker)
+            return
+        worker.stop(kill=not healthy)
+        with self._lock:
+            self._started -= 1
+        self._count('replaced')
+
+    def extract(self, file, on_chunk: Optional[Callable[[str], None]] = None) -> SandboxResult:
+        """
+        Extract a file in a sandbox process.
+
+        Uploads stored on disk are read there by path; anything else is
+        sent as bytes. on_chunk, if given, is called with each chunk as it
+        arrives.
+        """
+        name = getattr(file, 'name', '') or ''
+        path = file.temporary_file_path() if hasattr(file, 'temporary_file_path') else None
+        data = None
+        if path is None:
+            file.seek(0)
+            data = file.read()
+
+        worker = self._acquire()
+        if worker is None:
+            result = SandboxResult()
+            result.error = "The server is busy extracting other documents. Please try again shortly."
+            self._count('busy')
+            return result
+
+        healthy = False
+        try:
+            result = worker.run(name, path, data, self.wall_clock, self.max_rss, on_chunk)
+            # A skipped page leaves the process usable; any other limit kills it
+            healthy = result.limit in (None, LIMIT_PAGE_TIMEOUT)
+        finally:
+            self._release(worker, healthy)
+
+        self._count('documents')
+        if result.limit:
+            self._count(result.limit)
+            logger.warning(f"Sandboxed extraction of {name} hit the {result.limit} limit: {result!r}")
+        return result
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def metrics(self) -> Dict[str, object]:
+        """Pool size and counters of documents, replaced processes and tripped limits."""
+        with self._lock:
+            counters = dict(self._counters)
+            started = self._started
+        return {
+            "enabled": settings.SANDBOX_ENABLED,
+            "processes": started,
+            "idle": self._idle.qsize(),
+            **counters,
+        }
+
+    def shutdown(self) -> None:
+        """Stop every idle sandbox process."""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.stop()
+            with self._lock:
+                self._started -= 1
+
+
+# Create a singleton pool per process; sandbox processes start on first use
+sandbox_pool = SandboxPool.from_settings()
+atexit.register(sandbox_pool.shutdown)
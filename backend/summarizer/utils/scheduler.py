@@ -0,0 +1,352 @@
+"""
+Priority scheduling and admission control for AI calls.
+
+Every upstream call takes a slot from a shared pool. When all slots are
+busy, callers wait in a bounded queue for their priority class, and freed
+slots are handed out by smooth weighted round robin so that interactive
+chat is served ahead of interactive summaries, which are served ahead of
+batch work, without starving any class. A caller whose queue is full, or
+who waits longer than the queue timeout, is shed with QueueFull so the
+view can answer 429 with a Retry-After hint.
+
+Calls made while call_group is set belong to that group, e.g. one
+speculative summary. A request that comes to depend on the group's work
+promotes it: its waiting calls move to the request's class, and its later
+calls are admitted there too.
+
+Calls can also be given up on: cancelling a call group or a hedged
+attempt (call_attempt) withdraws its waiting calls with CallCancelled,
+refuses its later ones, and returns the slot of a running attempt at once.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Set
+
+from django.conf import settings
+
+from ..timing import STAGE_QUEUE, STAGE_UPSTREAM, stage
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CHAT = 'chat'
+PRIORITY_SUMMARIZE = 'summarize'
+PRIORITY_BATCH = 'batch'
+PRIORITIES = (PRIORITY_CHAT, PRIORITY_SUMMARIZE, PRIORITY_BATCH)
+
+# Number of recent wait times kept per class for percentile metrics
+WAIT_SAMPLES = 1000
+
+# The unit of work the current calls belong to, for LLMScheduler.promote and cancel
+call_group: ContextVar[Optional[object]] = ContextVar('call_group', default=None)
+
+# The hedged attempt the current call is, for LLMScheduler.cancel (see hedging.py)
+call_attempt: ContextVar[Optional[object]] = ContextVar('call_attempt', default=None)
+
+
+class QueueFull(Exception):
+    """
+    Raised when a call is shed because its priority queue is full or it waited too long.
+    """
+
+    def __init__(self, priority: str, retry_after: int, reason: str = "queue full"):
+        self.priority = priority
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f"AI service is busy ({priority} {reason}). Retry in {retry_after} seconds.")
+
+
+class CallCancelled(Exception):
+    """
+    Raised when a call's group or attempt was cancelled before it was admitted.
+    """
+
+
+class _Ticket:
+    """A queued caller waiting for a slot."""
+    __slots__ = ('granted', 'cancelled', 'priority', 'group', 'attempt')
+
+    def __init__(self, priority: str, group: Optional[object] = None, attempt: Optional[object] = None):
+        self.granted = False
+        self.cancelled = False
+        self.priority = priority
+        self.group = group
+        self.attempt = attempt
+
+
+class _ClassStats:
+    """Counters and recent wait times for one priority class."""
+
+    def __init__(self):
+        self.admitted = 0
+        self.shed = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    def snapshot(self) -> Dict[str, object]:
+        waits = sorted(self.waits)
+        return {
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "p50": round(_percentile(waits, 0.50) * 1000, 2),
+                "p95": round(_percentile(waits, 0.95) * 1000, 2),
+                "max": round(waits[-1] * 1000, 2) if waits else 0.0,
+            },
+        }
+
+
+class LLMScheduler:
+    """
+    Bounded, weighted-fair admission control in front of the AI client.
+    """
+
+    def __init__(self, max_concurrency: int, queue_limits: Dict[str, int],
+                 weights: Dict[str, int], queue_timeout: float):
+        """
+        Args:
+            max_concurrency: Upstream calls allowed in flight at once
+            queue_limits: Maximum waiting callers per priority class
+            weights: Share of freed slots each class receives under contention
+            queue_timeout: Seconds a caller may wait before being shed
+        """
+        self.max_concurrency = max_concurrency
+        self.queue_limits = dict(queue_limits)
+        self.weights = dict(weights)
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._credit = {priority: 0 for priority in PRIORITIES}
+        self._stats = {priority: _ClassStats() for priority in PRIORITIES}
+        self._in_flight = 0
+        # Priority class of each promoted call group
+        self._promoted: Dict[object, str] = {}
+        # Cancelled call groups and attempts, until forget()
+        self._cancelled: Set[object] = set()
+        # Running hedged attempts, whose slot cancel() returns early
+        self._running: Set[object] = set()
+        # Moving average of upstream call duration, used for Retry-After
+        self._service_time = 1.0
+
+    @classmethod
+    def from_settings(cls) -> 'LLMScheduler':
+        """Build a scheduler from the LLM_SCHEDULER_* settings."""
+        return cls(
+            max_concurrency=settings.LLM_SCHEDULER_MAX_CONCURRENCY,
+            queue_limits=settings.LLM_SCHEDULER_QUEUE_LIMITS,
+            weights=settings.LLM_SCHEDULER_WEIGHTS,
+            queue_timeout=settings.LLM_SCHEDULER_QUEUE_TIMEOUT,
+        )
+
+    def run(self, priority: str, func: Callable, *args, **kwargs):
+        """
+        Run func once a slot is available for the given priority class.
+
+        Raises:
+            QueueFull: If the call is shed instead of admitted
+        """
+        with self.slot(priority):
+            return func(*args, **kwargs)
+
+    @contextmanager
+    def slot(self, priority: str):
+        """Hold one upstream slot for the duration of the block, or until its attempt is cancelled."""
+        attempt = call_attempt.get()
+        with stage(STAGE_QUEUE):
+            self.acquire(priority)
+        if attempt is not None:
+            with self._cond:
+                self._running.add(attempt)
+        started = time.monotonic()
+        try:
+            with stage(STAGE_UPSTREAM):
+                yield
+        finally:
+            held = True
+            if attempt is not None:
+                with self._cond:
+                    held = attempt in self._running
+                    self._running.discard(attempt)
+            if held:
+                self.release(time.monotonic() - started)
+
+    def acquire(self, priority: str) -> None:
+        """
+        Wait for a slot, or raise QueueFull if the caller is shed.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        group = call_group.get()
+        attempt = call_attempt.get()
+        enqueued = time.monotonic()
+        with self._cond:
+            if group in self._cancelled or attempt in self._cancelled:
+                raise CallCancelled(f"{priority} AI call was cancelled")
+            if group is not None:
+                priority = self._promoted.get(group, priority)
+            queue = self._queues[priority]
+
+            if self._in_flight < self.max_concurrency and not any(self._queues.values()):
+                self._in_flight += 1
+                self._stats[priority].admitted += 1
+                self._stats[priority].waits.append(0.0)
+                return
+
+            if len(queue) >= self.queue_limits[priority]:
+                self._stats[priority].shed += 1
+                logger.warning(f"Shedding {priority} AI call: queue full ({len(queue)} waiting)")
+                raise QueueFull(priority, self._retry_after())
+
+            ticket = _Ticket(priority, group, attempt)
+            queue.append(ticket)
+            deadline = enqueued + self.queue_timeout
+            while not ticket.granted:
+                if ticket.cancelled:
+                    raise CallCancelled(f"{ticket.priority} AI call was cancelled while waiting")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # The ticket may have been promoted to another queue while it waited
+                    self._queues[ticket.priority].remove(ticket)
+                    self._stats[ticket.priority].shed += 1
+                    logger.warning(f"Shedding {ticket.priority} AI call after waiting {self.queue_timeout}s")
+                    raise QueueFull(ticket.priority, self._retry_after(), "wait timeout")
+                self._cond.wait(remaining)
+
+            self._stats[ticket.priority].admitted += 1
+            self._stats[ticket.priority].waits.append(time.monotonic() - enqueued)
+
+    def release(self, duration: Optional[float] = None) -> None:
+        """Return a slot and hand it to the next waiting caller."""
+        with self._cond:
+            self._in_flight -= 1
+            if duration is not None:
+                self._service_time = 0.9 * self._service_time + 0.1 * duration
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to queued callers by smooth weighted round robin."""
+        granted = False
+        while self._in_flight < self.max_concurrency:
+            active = [priority for priority in PRIORITIES if self._queues[priority]]
+            if not active:
+                break
+            for priority in PRIORITIES:
+                if priority not in active:
+                    # Idle classes do not bank credit for later bursts
+                    self._credit[priority] = 0
+            total = 0
+            for priority in active:
+                self._credit[priority] += self.weights[priority]
+                total += self.weights[priority]
+            chosen = max(active, key=lambda priority: self._credit[priority])
+            self._credit[chosen] -= total
+
+            self._queues[chosen].popleft().granted = True
+            self._in_flight += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def promote(self, group: object, priority: str) -> int:
+        """
+        Serve a call group at a higher priority class from now on.
+
+        Its waiting calls move to the back of that class's queue, and its
+        later calls are admitted there until forget(group).
+
+        Returns:
+            Number of waiting calls moved
+        """
+        rank = PRIORITIES.index(priority)
+        moved = 0
+        with self._cond:
+            self._promoted[group] = priority
+            for lower in PRIORITIES[rank + 1:]:
+                queue = self._queues[lower]
+                for ticket in [ticket for ticket in queue if ticket.group is group]:
+                    queue.remove(ticket)
+                    ticket.priority = priority
+                    self._queues[priority].append(ticket)
+                    moved += 1
+        return moved
+
+    def cancel(self, key: object) -> int:
+        """
+        Give up on the calls of a call group or hedged attempt.
+
+        Its waiting calls raise CallCancelled, and so do its later calls
+        until forget(key). A running attempt's slot is returned at once;
+        the upstream request itself runs on until it returns or times out.
+
+        Returns:
+            Number of waiting calls withdrawn
+        """
+        withdrawn = 0
+        with self._cond:
+            self._cancelled.add(key)
+            for queue in self._queues.values():
+                for ticket in [ticket for ticket in queue if key is ticket.group or key is ticket.attempt]:
+                    queue.remove(ticket)
+                    ticket.cancelled = True
+                    withdrawn += 1
+            if key in self._running:
+                self._running.discard(key)
+                self._in_flight -= 1
+                self._dispatch()
+            self._cond.notify_all()
+        return withdrawn
+
+    def forget(self, key: object) -> None:
+        """Drop a finished call group's promotion, or a finished group's or attempt's cancellation."""
+        with self._cond:
+            self._promoted.pop(key, None)
+            self._cancelled.discard(key)
+
+    def load(self) -> float:
+        """Calls in flight and waiting, as a share of max_concurrency."""
+        with self._cond:
+            waiting = sum(len(queue) for queue in self._queues.values())
+            return (self._in_flight + waiting) / self.max_concurrency
+
+    def _retry_after(self) -> int:
+        """Estimate in whole seconds when a shed caller could be admitted."""
+        backlog = sum(len(queue) for queue in self._queues.values()) + 1
+        return max(1, math.ceil(backlog / self.max_concurrency * self._service_time))
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Current queue depths, admission counters and wait-time percentiles.
+        """
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "avg_service_ms": round(self._service_time * 1000, 2),
+                "classes": {
+                    priority: {
+                        "depth": len(self._queues[priority]),
+                        "limit": self.queue_limits[priority],
+                        "weight": self.weights[priority],
+                        **self._stats[priority].snapshot(),
+                    }
+                    for priority in PRIORITIES
+                },
+            }
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# Create a singleton instance shared by every AI call in the process
+llm_scheduler = LLMScheduler.from_settings()
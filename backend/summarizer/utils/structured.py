@@ -0,0 +1,287 @@
+"""
+Structured summaries: a JSON schema, its validation and incremental parsing.
+
+The "structured" prompt asks the model for one JSON object with a title,
+key points, entities and action items, constrained by SUMMARY_SCHEMA
+through the API's response_format. This replaces a free-text summary
+followed by a second call to structure it.
+
+When the completion is streamed, PartialJsonParser is fed the text
+deltas and reports every top-level field and every element of a
+top-level array as soon as its closing character arrives, so clients
+receive key points while the rest is still being generated.
+"""
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ENTITY_TYPES = ["person", "organization", "location", "date", "product", "other"]
+
+SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "entities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "type": {"type": "string", "enum": ENTITY_TYPES},
+                },
+                "required": ["name", "type"],
+                "additionalProperties": False,
+            },
+        },
+        "action_items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "task": {"type": "string"},
+                    "owner": {"type": ["string", "null"]},
+                    "due": {"type": ["string", "null"]},
+                },
+                "required": ["task", "owner", "due"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["title", "key_points", "entities", "action_items"],
+    "additionalProperties": False,
+}
+
+# response_format of the chat completions API for strict schema output
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "document_summary", "strict": True, "schema": SUMMARY_SCHEMA},
+}
+
+# Event names of the array fields' elements, e.g. one "key_point" per key point
+ITEM_EVENTS = {
+    "key_points": "key_point",
+    "entities": "entity",
+    "action_items": "action_item",
+}
+
+
+def validate_summary(data) -> Tuple[Dict[str, object], Optional[str]]:
+    """
+    Check a parsed summary against SUMMARY_SCHEMA.
+
+    Returns:
+        Tuple of (summary, error_message). Strings are stripped and empty
+        list entries dropped; unknown entity types become "other".
+    """
+    if not isinstance(data, dict):
+        return {}, "Structured summary must be a JSON object"
+
+    missing = [field for field in SUMMARY_SCHEMA["required"] if field not in data]
+    if missing:
+        return {}, f"Structured summary is missing {', '.join(missing)}"
+
+    if not isinstance(data["title"], str):
+        return {}, "Structured summary title must be a string"
+    for field in ITEM_EVENTS:
+        if not isinstance(data[field], list):
+            return {}, f"Structured summary {field} must be a list"
+
+    key_points = []
+    for point in data["key_points"]:
+        if not isinstance(point, str):
+            return {}, "Structured summary key_points must be strings"
+        if point.strip():
+            key_points.append(point.strip())
+
+    entities = []
+    for entity in data["entities"]:
+        if not isinstance(entity, dict) or not isinstance(entity.get("name"), str):
+            return {}, "Structured summary entities need a name"
+        if entity["name"].strip():
+            kind = entity.get("type")
+            entities.append({
+                "name": entity["name"].strip(),
+                "type": kind if kind in ENTITY_TYPES else "other",
+            })
+
+    action_items = []
+    for item in data["action_items"]:
+        if not isinstance(item, dict) or not isinstance(item.get("task"), str):
+            return {}, "Structured summary action_items need a task"
+        if item["task"].strip():
+            action_items.append({
+                "task": item["task"].strip(),
+                "owner": _optional_string(item.get("owner")),
+                "due": _optional_string(item.get("due")),
+            })
+
+    return {
+        "title": data["title"].strip(),
+        "key_points": key_points,
+        "entities": entities,
+        "action_items": action_items,
+    }, None
+
+
+def _optional_string(value) -> Optional[str]:
+    return value.strip() or None if isinstance(value, str) else None
+
+
+def parse_summary(text: str) -> Tuple[Dict[str, object], Optional[str]]:
+    """
+    Parse and validate a complete structured summary.
+
+    Returns:
+        Tuple of (summary, error_message)
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start < 0 or end < start:
+        return {}, "AI returned no JSON object"
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError as e:
+        return {}, f"AI returned invalid JSON: {str(e)}"
+    return validate_summary(data)
+
+
+def summary_events(summary: Dict[str, object]) -> Iterator[Tuple[str, object]]:
+    """The events a stream of this summary produces, for replaying a stored one."""
+    yield "title", summary["title"]
+    for field, event in ITEM_EVENTS.items():
+        for item in summary[field]:
+            yield event, item
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "expect", "start")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind
+        self.key = None
+        self.expect = "key" if kind == "object" else "value"
+        self.start = start
+
+
+class PartialJsonParser:
+    """
+    Incremental parser reporting completed values of a streamed JSON object.
+
+    feed() takes the next piece of text and returns (path, value) pairs
+    for every value completed by it, where path is (key,) for a value of
+    the top-level object and (key, index) for an element of a top-level
+    array. Deeper values are reported as part of their parents. Each
+    character is scanned once; anything before the opening brace (such
+    as a code fence) is skipped.
+    """
+
+    WHITESPACE = " \t\r\n"
+
+    def __init__(self):
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._primitive_start: Optional[int] = None
+        self._indices: Dict[str, int] = {}
+
+    def feed(self, text: str) -> List[Tuple[tuple, object]]:
+        self.buffer += text
+        completed: List[Tuple[tuple, object]] = []
+        buffer = self.buffer
+        for index in range(self._pos, len(buffer)):
+            if self.done:
+                break
+            self._step(buffer, index, buffer[index], completed)
+        self._pos = len(buffer)
+        return completed
+
+    def _step(self, buffer: str, index: int, char: str, completed) -> None:
+        if not self._started:
+            if char == "{":
+                self._started = True
+                self._stack.append(_Frame("object", index))
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                frame = self._stack[-1]
+                if self._string_is_key:
+                    frame.key = json.loads(buffer[self._string_start:index + 1])
+                    frame.expect = "colon"
+                else:
+                    self._complete(self._string_start, index + 1, completed)
+            return
+
+        if self._primitive_start is not None and (char in self.WHITESPACE or char in ",}]"):
+            self._complete(self._primitive_start, index, completed)
+            self._primitive_start = None
+
+        if char in self.WHITESPACE:
+            return
+        frame = self._stack[-1]
+        if char == '"':
+            self._in_string = True
+            self._string_start = index
+            self._string_is_key = frame.kind == "object" and frame.expect == "key"
+        elif char in "{[":
+            self._stack.append(_Frame("object" if char == "{" else "array", index))
+        elif char in "}]":
+            closed = self._stack.pop()
+            if not self._stack:
+                self.done = True
+                return
+            self._complete(closed.start, index + 1, completed)
+        elif char == ":":
+            frame.expect = "value"
+        elif char == ",":
+            frame.expect = "key" if frame.kind == "object" else "value"
+        elif self._primitive_start is None:
+            self._primitive_start = index
+
+    def _complete(self, start: int, end: int, completed) -> None:
+        depth = len(self._stack)
+        if depth == 1:
+            completed.append(((self._stack[0].key,), json.loads(self.buffer[start:end])))
+        elif depth == 2 and self._stack[1].kind == "array":
+            key = self._stack[0].key
+            position = self._indices.get(key, 0)
+            self._indices[key] = position + 1
+            completed.append(((key, position), json.loads(self.buffer[start:end])))
+
+
+def stream_summary_events(deltas: Iterator[str]) -> Iterator[Tuple[str, object]]:
+    """
+    Turn streamed text deltas into summary events.
+
+    Yields ("title", str), ("key_point", str), ("entity", dict) and
+    ("action_item", dict) as each value completes, then ("summary", dict)
+    with the validated whole, or ("error", str) if it does not validate.
+    """
+    parser = PartialJsonParser()
+    try:
+        for delta in deltas:
+            for path, value in parser.feed(delta):
+                if path == ("title",) and isinstance(value, str):
+                    yield "title", value
+                elif len(path) == 2 and path[0] in ITEM_EVENTS:
+                    yield ITEM_EVENTS[path[0]], value
+    except ValueError as e:
+        yield "error", f"AI returned invalid JSON: {str(e)}"
+        return
+
+    summary, error = parse_summary(parser.buffer)
+    if error:
+        yield "error", error
+    else:
+        yield "summary", summary
@@ -1,15 +1,178 @@
 """
 Text extraction utilities for different file formats.
 
-This module handles extracting text from PDF and TXT files safely.
+The format of an upload is detected from its content and the text is
+streamed out by the matching extractor (see extractors.py: PDF, DOCX,
+HTML, Markdown and TXT). Every format goes through the same chunk
+pipeline here, which normalises the chunks and records page spans.
+Scanned PDFs are detected up front (see pdf_scan.py) and either rejected
+quickly or passed to the optional OCR stage (see ocr.py). Formats prone to
+pathological files can be extracted in a sandbox process with time and
+memory limits (see sandbox.py).
 """
 import logging
-from typing import Tuple
-from pypdf import PdfReader
-from io import BytesIO
+import re
+from typing import Callable, Iterator, List, Optional, Tuple
+from django.conf import settings
+
+from ..timing import STAGE_EXTRACT, stage
+from .extractors import ExtractionError, Extractor, registry
+from .sandbox import LIMIT_ERRORS, sandbox_pool
 
 logger = logging.getLogger(__name__)
 
+# Separator placed between PDF pages in the combined text
+PAGE_SEPARATOR = "\n\n"
+
+# Characters dropped from extracted text: NULs break storage and prompts
+re_control = re.compile(r'[\x00\ufeff]')
+
+# Error for a file with no bytes, which no format detection could place
+EMPTY_FILE_ERROR = "The uploaded file is empty."
+
+
+def detect_format(file) -> Tuple[Extractor, str]:
+    """
+    Find the extractor for an uploaded file from its content.
+    
+    Args:
+        file: Django UploadedFile or File object
+        
+    Returns:
+        Tuple of (extractor, error_message)
+    """
+    name = getattr(file, 'name', '') or ''
+    extractor = registry.detect(file, name)
+    if extractor is None:
+        file_extension = name.split('.')[-1].lower() if '.' in name else 'unknown'
+        return None, f"Unsupported file type: {file_extension}. The file content is not a supported document format."
+    return extractor, None
+
+
+def iter_text_chunks(file, extractor: Extractor) -> Iterator[str]:
+    """
+    Stream normalised text chunks out of a file.
+    
+    Line endings are unified and control characters removed. A chunk that
+    ends in a carriage return is held back until the next one so that a
+    CRLF split across chunks still becomes a single newline.
+    
+    Raises:
+        ExtractionError: If the extractor cannot read the file
+    """
+    carry = ''
+    for chunk in extractor.iter_chunks(file):
+        chunk = carry + chunk
+        carry = ''
+        if chunk.endswith('\r') and not extractor.paged:
+            chunk, carry = chunk[:-1], '\r'
+        yield re_control.sub('', chunk.replace('\r\n', '\n').replace('\r', '\n'))
+    if carry:
+        yield '\n'
+
+
+def extract_chunks(file, on_text: Optional[Callable[[str], None]] = None) -> Tuple[Extractor, List[str], str]:
+    """
+    Detect the format of a file and extract all of its text chunks.
+    
+    Args:
+        file: Django UploadedFile or File object
+        on_text: Called with the text as it is extracted, in pieces that
+            join to the text extract_pages_from_file returns (see
+            utils/pipeline.py)
+        
+    Returns:
+        Tuple of (extractor, chunks, error_message)
+        For paged formats (PDF) each chunk is a page, empty for pages without text.
+    """
+    with stage(STAGE_EXTRACT):
+        return _extract_chunks(file, on_text)
+
+
+def _text_feed(extractor: Extractor, on_text: Optional[Callable[[str], None]]) -> Callable[[str], None]:
+    """
+    Turn extracted chunks into pieces of the combined text: empty pages
+    are skipped and pages separated by PAGE_SEPARATOR, as in the final text.
+    """
+    if on_text is None:
+        return lambda chunk: None
+    if not extractor.paged:
+        return on_text
+    first = True
+    
+    def feed(page):
+        nonlocal first
+        if page.strip():
+            on_text(page if first else PAGE_SEPARATOR + page)
+            first = False
+    return feed
+
+
+def _extract_chunks(file, on_text=None) -> Tuple[Extractor, List[str], str]:
+    if getattr(file, 'size', None) == 0:
+        return None, [], EMPTY_FILE_ERROR
+    extractor, error = detect_format(file)
+    if error:
+        return None, [], error
+    
+    feed = _text_feed(extractor, on_text)
+    if settings.SANDBOX_ENABLED and extractor.name in settings.SANDBOX_FORMATS:
+        chunks, error = _extract_sandboxed(file, feed)
+        if error:
+            return extractor, [], error
+    else:
+        try:
+            chunks = []
+            for chunk in iter_text_chunks(file, extractor):
+                chunks.append(chunk)
+                feed(chunk)
+        except ExtractionError as e:
+            return extractor, [], str(e)
+        except Exception as e:
+            logger.error(f"{extractor.name.upper()} extraction error: {str(e)}")
+            return extractor, [], f"Failed to process {extractor.name.upper()} file: {str(e)}"
+    
+    if not any(chunk.strip() for chunk in chunks):
+        return extractor, [], extractor.empty_error
+    return extractor, chunks, None
+
+
+def _extract_sandboxed(file, on_chunk: Callable[[str], None]) -> Tuple[List[str], str]:
+    """
+    Extract a file in a sandbox process (see sandbox.py).
+    
+    An extraction a limit stopped fails, even when some chunks finished:
+    the text would be stored and summarized as if it were the whole document.
+    
+    Returns:
+        Tuple of (chunks, error_message)
+    """
+    result = sandbox_pool.extract(file, on_chunk)
+    if result.error:
+        return [], result.error
+    if result.partial:
+        return [], LIMIT_ERRORS[result.limit]
+    return result.chunks, None
+
+
+def extract_pages_from_pdf(file) -> Tuple[List[str], str]:
+    """
+    Extract the text of each page of a PDF file using pypdf.
+    
+    Args:
+        file: Django UploadedFile or File object containing a PDF
+        
+    Returns:
+        Tuple of (page_texts, error_message)
+        Pages without text are skipped.
+        If failed, page_texts will be an empty list
+    """
+    try:
+        pages = [page for page in registry.get('pdf').iter_chunks(file) if page.strip()]
+    except ExtractionError as e:
+        return [], str(e)
+    return pages, None
+
 
 def extract_text_from_pdf(file) -> Tuple[str, str]:
     """
@@ -23,45 +186,17 @@ def extract_text_from_pdf(file) -> Tuple[str, str]:
         If successful, error_message will be None
         If failed, extracted_text will be empty string
     """
-    try:
-        # Read file content into BytesIO for pypdf
-        pdf_content = BytesIO(file.read())
-        
-        # Create PDF reader
-        reader = PdfReader(pdf_content)
-        
-        # Check if PDF has pages
-        if len(reader.pages) == 0:
-            return "", "PDF file contains no pages"
-        
-        # Extract text from all pages
-        text_content = []
-        for page_num, page in enumerate(reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text.strip():  # Only add non-empty pages
-                    text_content.append(page_text)
-            except Exception as page_error:
-                logger.warning(f"Failed to extract text from page {page_num + 1}: {str(page_error)}")
-                continue
-        
-        # Combine all page texts
-        full_text = "\n\n".join(text_content)
-        
-        # Check if we got any text
-        if not full_text.strip():
-            return "", "Could not extract text from PDF. The file might be image-based or encrypted."
-        
-        return full_text, None
-        
-    except Exception as e:
-        logger.error(f"PDF extraction error: {str(e)}")
-        return "", f"Failed to process PDF file: {str(e)}"
+    pages, error = extract_pages_from_pdf(file)
+    if error:
+        return "", error
+    
+    # Combine all page texts
+    return PAGE_SEPARATOR.join(pages), None
 
 
 def extract_text_from_txt(file) -> Tuple[str, str]:
     """
-    Extract text from a TXT file.
+    Extract text from a TXT file with the registry's text extractor.
     
     Args:
         file: Django UploadedFile object containing a text file
@@ -71,42 +206,94 @@ def extract_text_from_txt(file) -> Tuple[str, str]:
         If successful, error_message will be None
         If failed, extracted_text will be empty string
     """
+    extractor = registry.get('txt')
     try:
-        # Try UTF-8 first, fall back to latin-1 if that fails
-        try:
-            text = file.read().decode('utf-8')
-        except UnicodeDecodeError:
-            file.seek(0)  # Reset file pointer
-            text = file.read().decode('latin-1')
-        
-        # Check if text is empty
+        text = ''.join(iter_text_chunks(file, extractor))
         if not text.strip():
-            return "", "Text file is empty"
-        
+            return "", extractor.empty_error
         return text, None
-        
+    except ExtractionError as e:
+        return "", str(e)
     except Exception as e:
         logger.error(f"TXT extraction error: {str(e)}")
         return "", f"Failed to process text file: {str(e)}"
 
 
-def extract_text_from_file(file) -> Tuple[str, str]:
+def extract_text_from_file(file, on_text: Optional[Callable[[str], None]] = None) -> Tuple[str, str]:
     """
-    Main extraction function that routes to appropriate handler based on file type.
+    Main extraction function: detects the format from the content and runs
+    the matching extractor.
     
     Args:
         file: Django UploadedFile object
+        on_text: Optional callback fed the text as it is extracted
         
     Returns:
         Tuple of (extracted_text, error_message)
     """
-    # Get file extension
-    file_extension = file.name.split('.')[-1].lower()
+    text, _, error = extract_pages_from_file(file, on_text)
+    return text, error
+
+
+def split_text_pages(text: str, page_chars: int) -> List[Tuple[int, int]]:
+    """
+    Split plain text into page-sized spans, breaking at line ends where possible.
     
-    # Route to appropriate extractor
-    if file_extension == 'pdf':
-        return extract_text_from_pdf(file)
-    elif file_extension == 'txt':
-        return extract_text_from_txt(file)
-    else:
-        return "", f"Unsupported file type: {file_extension}"
+    Args:
+        text: Full text
+        page_chars: Maximum characters per page
+        
+    Returns:
+        List of (offset, length) spans covering the text
+    """
+    spans = []
+    offset = 0
+    while offset < len(text):
+        end = min(offset + page_chars, len(text))
+        if end < len(text):
+            newline = text.rfind("\n", offset, end)
+            if newline > offset:
+                end = newline + 1
+        spans.append((offset, end - offset))
+        offset = end
+    return spans
+
+
+def extract_pages_from_file(file, on_text: Optional[Callable[[str], None]] = None
+                            ) -> Tuple[str, List[Tuple[int, int]], str]:
+    """
+    Extract text along with the span of each page within it.
+    
+    PDF spans follow the document's pages, with an empty span for a page
+    without text so later pages keep their numbers; other formats are split
+    into pages of TEXT_PAGE_CHARS characters.
+    
+    Args:
+        file: Django UploadedFile object
+        on_text: Optional callback fed the text as it is extracted
+        
+    Returns:
+        Tuple of (extracted_text, page_spans, error_message)
+        page_spans is a list of (offset, length) into extracted_text
+    """
+    extractor, chunks, error = extract_chunks(file, on_text)
+    if error:
+        return "", [], error
+    
+    if extractor.paged:
+        pages = []
+        spans = []
+        offset = 0
+        for page in chunks:
+            if not page.strip():
+                spans.append((offset, 0))
+                continue
+            if pages:
+                offset += len(PAGE_SEPARATOR)
+            spans.append((offset, len(page)))
+            pages.append(page)
+            offset += len(page)
+        return PAGE_SEPARATOR.join(pages), spans, None
+    
+    text = "".join(chunks)
+    return text, split_text_pages(text, settings.TEXT_PAGE_CHARS), None
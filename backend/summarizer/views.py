@@ -1,37 +1,112 @@
 """
 API Views for document summarization.
 
-This module contains the main API endpoint for file upload and summarization.
+This module contains the main API endpoint for file upload and summarization,
+and the endpoint serving stored summaries with conditional GET support.
 """
+import json
 import logging
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from .serializers import FileUploadSerializer
+from .authentication import API_KEY_HEADER
+from .serializers import SummarizeRequestSerializer
 from .utils.text_extractor import extract_text_from_file
-from .utils.ai_summarizer import summarize_text
+from .models import Summary
+from .storage import (
+    document_language,
+    get_or_create_document,
+    load_chunk_summaries,
+    load_pyramid,
+    load_summary,
+    pyramid_summary,
+    save_chunk_summaries,
+    save_pyramid,
+    save_summary,
+)
+from .speculation import speculator
+from .usage import TokenQuotaThrottle, UsageAttributionMixin
+from .utils.ai_summarizer import ai_summarizer, summarize_text
+from .utils.incremental import summarize_incremental
+from .utils.language import get_language
+from .utils.prompts import STRUCTURED_PROMPT, SUMMARY_STYLES
+from .utils.pipeline import PipelinedSummary
+from .utils.pyramid import LEVELS, build_pyramid, pyramid_key, summary_for_length
+from .utils.routing import STRATEGY_EXTRACTIVE, STRATEGY_MAP_REDUCE, extractive_key, extractive_summary, router
+from .utils.scheduler import QueueFull
+from .utils.structured import summary_events
 
 logger = logging.getLogger(__name__)
 
 
-class SummarizeDocumentView(APIView):
+def overloaded_response(error: QueueFull) -> Response:
+    """
+    Build the 429 response for an AI call shed by the scheduler.
+    
+    Args:
+        error: The QueueFull raised by the scheduler
+        
+    Returns:
+        Response with a Retry-After header
+    """
+    logger.warning(f"Request shed: {error}")
+    return Response(
+        {
+            "error": "The AI service is busy. Please try again shortly.",
+            "retry_after": error.retry_after,
+            "status": "failed"
+        },
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def sse_event(event: str, data) -> bytes:
+    """Encode one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class SummarizeDocumentView(UsageAttributionMixin, APIView):
     """
     API endpoint for document summarization.
     
     POST /api/summarize/
     
-    Accepts file uploads (PDF or TXT), extracts text, and returns an AI-generated summary.
+    Accepts file uploads (PDF, DOCX, HTML, Markdown or TXT), extracts text, and returns an AI-generated summary.
+    Summaries are stored per document and prompt version, so repeat requests
+    cost no tokens, and can be fetched again from /api/summaries/<summary_id>/.
     
     Request:
-        - file: The document file to summarize (PDF or TXT)
+        - file: The document file to summarize (PDF, DOCX, HTML, Markdown or TXT)
+        - style: Optional summary style (brief, detailed, bullet, executive)
+        - prompt_version: Optional prompt template version
+        - length: Optional tldr, paragraph, detailed or a word count; served
+          from the document's stored summary pyramid
+        - output: Optional text (default) or structured
+        - stream: Optional; with output=structured, send server-sent events
+        - output_language: Optional language code; by default summaries
+          are in the document's detected language
         
     Response (Success):
         {
             "summary": "Generated summary text...",
+            "summary_id": "<hex digest>",
             "status": "success"
         }
+        summary_id is omitted for custom word counts condensed on the fly.
+        With output=structured, summary is an object with title, key_points,
+        entities and action_items.
+        
+    Response (stream=true, text/event-stream):
+        event: title, key_point, entity or action_item as each is generated,
+        then summary with {"summary": {...}, "summary_id": "..."}, or error
+        with {"error": "..."}.
         
     Response (Error):
         {
@@ -40,6 +115,7 @@ class SummarizeDocumentView(APIView):
         }
     """
     parser_classes = [MultiPartParser, FormParser]
+    throttle_classes = [TokenQuotaThrottle]
     
     def post(self, request):
         """
@@ -52,7 +128,7 @@ class SummarizeDocumentView(APIView):
         4. Return summary or error
         """
         # Step 1: Validate file upload
-        serializer = FileUploadSerializer(data=request.data)
+        serializer = SummarizeRequestSerializer(data=request.data)
         
         if not serializer.is_valid():
             logger.warning(f"File validation failed: {serializer.errors}")
@@ -65,13 +141,29 @@ class SummarizeDocumentView(APIView):
             )
         
         uploaded_file = serializer.validated_data['file']
+        style = serializer.validated_data.get('style')
+        prompt_version = serializer.validated_data.get('prompt_version')
+        length = serializer.validated_data.get('length')
+        structured = serializer.validated_data['output'] == SummarizeRequestSerializer.OUTPUT_STRUCTURED
+        output_language = serializer.validated_data.get('output_language')
+        output_language = get_language(output_language) if output_language else None
         logger.info(f"Processing file: {uploaded_file.name} ({uploaded_file.size} bytes)")
         
+        # Long documents are summarized chunk by chunk while they are still being extracted
+        pipeline = None
+        if settings.PIPELINE_ENABLED and not (structured or length):
+            pipeline = PipelinedSummary(load_chunk_summaries, style=style, version=prompt_version,
+                                        output_language=output_language)
+        
         # Step 2: Extract text from file
         try:
-            extracted_text, extraction_error = extract_text_from_file(uploaded_file)
+            extracted_text, extraction_error = extract_text_from_file(
+                uploaded_file, on_text=pipeline.feed if pipeline else None
+            )
             
             if extraction_error:
+                if pipeline is not None:
+                    pipeline.cancel()
                 logger.error(f"Text extraction failed: {extraction_error}")
                 return Response(
                     {
@@ -84,6 +176,8 @@ class SummarizeDocumentView(APIView):
             logger.info(f"Extracted {len(extracted_text)} characters from {uploaded_file.name}")
             
         except Exception as e:
+            if pipeline is not None:
+                pipeline.cancel()
             logger.error(f"Unexpected extraction error: {str(e)}")
             return Response(
                 {
@@ -95,7 +189,28 @@ class SummarizeDocumentView(APIView):
         
         # Step 3: Generate AI summary
         try:
-            summary, summarization_error = summarize_text(extracted_text)
+            if serializer.validated_data['stream']:
+                response, summarization_error = self._stream_structured(
+                    extracted_text, uploaded_file.name, prompt_version, output_language
+                )
+                if not summarization_error:
+                    return response
+            elif structured:
+                summary, stored, summarization_error = self._summarize_structured(
+                    extracted_text, uploaded_file.name, prompt_version, output_language
+                )
+            elif length:
+                summary, stored, summarization_error = self._summarize_from_pyramid(
+                    extracted_text, uploaded_file.name, length, output_language
+                )
+            elif pipeline is not None and pipeline.started:
+                summary, stored, summarization_error = self._summarize_pipelined(
+                    pipeline, extracted_text, uploaded_file.name, style, prompt_version, output_language
+                )
+            else:
+                summary, stored, summarization_error = self._summarize_direct(
+                    extracted_text, uploaded_file.name, style, prompt_version, output_language
+                )
             
             if summarization_error:
                 logger.error(f"Summarization failed: {summarization_error}")
@@ -109,6 +224,8 @@ class SummarizeDocumentView(APIView):
             
             logger.info(f"Successfully generated summary for {uploaded_file.name}")
             
+        except QueueFull as e:
+            return overloaded_response(e)
         except Exception as e:
             logger.error(f"Unexpected summarization error: {str(e)}")
             return Response(
@@ -120,14 +237,201 @@ class SummarizeDocumentView(APIView):
             )
         
         # Step 4: Return successful response
+        data = {"summary": summary}
+        if stored is not None:
+            data["summary_id"] = stored.digest
         return Response(
             {
-                "summary": summary,
+                **data,
                 "status": "success"
             },
             status=status.HTTP_200_OK
         )
     
+    @staticmethod
+    def _summarize_direct(text, filename, style, version, output_language=None):
+        """
+        Serve the document's stored summary for the prompt template, or generate and store it.
+        
+        The template is localized for the document's detected language and
+        the output language (see utils/language.py). A speculative summary
+        still being generated (see speculation.py) is waited for. The router
+        picks the strategy, model and output budget from the document's
+        features (see utils/routing.py). Extractive summaries are stored
+        under their own key, as they do not follow the template. Map-reduce
+        summarizes chunk by chunk, so a new version of a long document only
+        pays for its changed chunks.
+        
+        Returns:
+            Tuple of (summary, stored_summary, error_message)
+        """
+        document = get_or_create_document(text, filename)
+        language = document_language(document)
+        template = ai_summarizer.get_template(style, version, language, output_language)
+        stored = load_summary(document, template.key) or speculator.attach(document.content_hash, template.key)
+        if stored is not None:
+            logger.info(f"Served stored {template.key} summary {stored.digest[:12]}")
+            return stored.text, stored, None
+        
+        decision = router.decide(text)
+        route = decision.route
+        # Key sentences are in the document's language, so they cannot be translated
+        extractive = route.strategy == STRATEGY_EXTRACTIVE and output_language in (None, language)
+        key = extractive_key(route.max_tokens) if extractive else template.key
+        if extractive:
+            stored = load_summary(document, key)
+            if stored is not None:
+                logger.info(f"Served stored {key} summary {stored.digest[:12]}")
+                return stored.text, stored, None
+        with router.track(decision):
+            if extractive:
+                summary, error = extractive_summary(text, route.max_tokens), None
+            elif route.strategy == STRATEGY_MAP_REDUCE:
+                summary, chunks, error = summarize_incremental(
+                    text, load_chunk_summaries, style=style, version=version,
+                    model=route.model, max_tokens=route.max_tokens,
+                    language=language, output_language=output_language, max_chunks=route.max_chunks
+                )
+                if chunks:
+                    save_chunk_summaries(document, chunks)
+            else:
+                summary, error = summarize_text(
+                    text, style=style, version=version, model=route.model, max_tokens=route.max_tokens,
+                    language=language, output_language=output_language
+                )
+            decision.error = error
+        if error:
+            return "", None, error
+        return summary, save_summary(document, key, summary), None
+    
+    @staticmethod
+    def _summarize_pipelined(pipeline, text, filename, style, version, output_language=None):
+        """
+        Finish a summary whose chunks were dispatched during extraction
+        (see utils/pipeline.py), unless the document already has one stored.
+        
+        Returns:
+            Tuple of (summary, stored_summary, error_message)
+        """
+        document = get_or_create_document(text, filename)
+        language = document_language(document)
+        template = ai_summarizer.get_template(style, version, language, output_language)
+        stored = load_summary(document, template.key) or speculator.attach(document.content_hash, template.key)
+        if stored is not None:
+            pipeline.cancel()
+            logger.info(f"Served stored {template.key} summary {stored.digest[:12]}")
+            return stored.text, stored, None
+        if pipeline.language != language:
+            # Chunks were dispatched for the language seen during extraction; the stored one wins
+            pipeline.cancel()
+            return SummarizeDocumentView._summarize_direct(text, filename, style, version, output_language)
+        
+        summary, chunks, error = pipeline.result()
+        if chunks:
+            save_chunk_summaries(document, chunks)
+        if error:
+            return "", None, error
+        return summary, save_summary(document, template.key, summary), None
+    
+    @staticmethod
+    def _summarize_structured(text, filename, version, output_language=None):
+        """
+        Serve the document's stored structured summary, or generate and store it.
+        
+        The template is localized like text summaries (see _summarize_direct).
+        
+        Returns:
+            Tuple of (summary, stored_summary, error_message)
+        """
+        document = get_or_create_document(text, filename)
+        language = document_language(document)
+        template = ai_summarizer.get_template(STRUCTURED_PROMPT, version, language, output_language)
+        stored = load_summary(document, template.key)
+        if stored is not None:
+            logger.info(f"Served stored {template.key} summary {stored.digest[:12]}")
+            return json.loads(stored.text), stored, None
+        
+        summary, error = ai_summarizer.summarize_structured(
+            text, version=version, language=language, output_language=output_language
+        )
+        if error:
+            return {}, None, error
+        return summary, save_summary(document, template.key, json.dumps(summary)), None
+    
+    @staticmethod
+    def _stream_structured(text, filename, version, output_language=None):
+        """
+        Stream a structured summary as server-sent events.
+        
+        A stored summary is replayed at once. Otherwise the completion is
+        streamed and each field is sent as soon as it has been generated;
+        the validated summary is stored before the final event.
+        
+        Returns:
+            Tuple of (StreamingHttpResponse, error_message)
+        """
+        document = get_or_create_document(text, filename)
+        language = document_language(document)
+        template = ai_summarizer.get_template(STRUCTURED_PROMPT, version, language, output_language)
+        stored = load_summary(document, template.key)
+        if stored is not None:
+            logger.info(f"Replaying stored {template.key} summary {stored.digest[:12]}")
+            summary = json.loads(stored.text)
+            events = [*summary_events(summary), ("summary", summary)]
+        else:
+            events, error = ai_summarizer.stream_structured(
+                text, version=version, language=language, output_language=output_language
+            )
+            if error:
+                return None, error
+        
+        def body():
+            for event, data in events:
+                if event == "summary":
+                    row = stored or save_summary(document, template.key, json.dumps(data))
+                    yield sse_event(event, {"summary": data, "summary_id": row.digest})
+                elif event == "error":
+                    logger.error(f"Structured summary stream failed: {data}")
+                    yield sse_event(event, {"error": data})
+                else:
+                    yield sse_event(event, data)
+        
+        response = StreamingHttpResponse(body(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the events
+        response['X-Accel-Buffering'] = 'no'
+        return response, None
+    
+    @staticmethod
+    def _summarize_from_pyramid(text, filename, length, output_language=None):
+        """
+        Serve a summary of the requested length from the document's pyramid.
+        
+        The pyramid is built and stored on the first request for a document
+        and output language; later requests at any length reuse it.
+        
+        Returns:
+            Tuple of (summary, stored_summary, error_message). stored_summary
+            is None when the level was condensed to a custom length.
+        """
+        document = get_or_create_document(text, filename)
+        language = document_language(document)
+        key = pyramid_key(language, output_language)
+        levels = load_pyramid(document, key)
+        
+        if levels is None:
+            levels, error = build_pyramid(text, language=language, output_language=output_language)
+            if error:
+                return "", None, error
+            levels = save_pyramid(document, levels, key)
+        
+        summary, level, error = summary_for_length(levels, length, language=output_language or language)
+        if error:
+            return "", None, error
+        logger.info(f"Served {length} summary from pyramid level '{level}'")
+        stored = pyramid_summary(document, level, key) if summary == levels[level] else None
+        return summary, stored, None
+    
     @staticmethod
     def _format_validation_errors(errors):
         """
@@ -146,8 +450,15 @@ class SummarizeDocumentView(APIView):
                 return str(file_errors[0])
             return str(file_errors)
         
+        for field in ('style', 'prompt_version', 'length', 'output', 'output_language', 'stream', 'non_field_errors'):
+            if field in errors:
+                field_errors = errors[field]
+                if isinstance(field_errors, list) and len(field_errors) > 0:
+                    return str(field_errors[0])
+                return str(field_errors)
+        
         # Generic error message
-        return "Invalid request. Please upload a valid PDF or TXT file."
+        return "Invalid request. Please upload a valid PDF, DOCX, HTML, Markdown or TXT file."
     
     def get(self, request):
         """
@@ -158,9 +469,72 @@ class SummarizeDocumentView(APIView):
                 "message": "AI Document Summarizer API",
                 "endpoint": "/api/summarize/",
                 "method": "POST",
-                "accepted_formats": ["PDF", "TXT"],
+                "accepted_formats": ["PDF", "DOCX", "HTML", "Markdown", "TXT"],
                 "max_file_size": "10 MB",
+                "styles": list(SUMMARY_STYLES),
+                "lengths": [level for level, _ in LEVELS],
+                "outputs": [
+                    SummarizeRequestSerializer.OUTPUT_TEXT,
+                    SummarizeRequestSerializer.OUTPUT_STRUCTURED,
+                ],
                 "usage": "Send a POST request with a 'file' field containing your document."
             },
             status=status.HTTP_200_OK
         )
+
+
+class SummaryDetailView(APIView):
+    """
+    API endpoint serving a stored summary.
+    
+    GET /api/summaries/<summary_id>/
+    
+    The ID is derived from the document's content hash and the prompt
+    version, and a row regenerated under it may have different text, so
+    the strong ETag hashes the ID together with the text. It is sent along
+    with SUMMARY_CACHE_CONTROL. Requests with a
+    matching If-None-Match (or a later If-Modified-Since) get an empty 304.
+    Structured summaries are returned as objects.
+    """
+    
+    def get(self, request, summary_id):
+        """Return the summary, or 304 if the client's copy is current."""
+        summary = Summary.objects.select_related('document').filter(digest=summary_id).first()
+        if summary is None:
+            return Response(
+                {
+                    "error": "Summary not found",
+                    "status": "failed"
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        text = summary.text
+        if summary.prompt_key.startswith(f"{STRUCTURED_PROMPT}@"):
+            text = json.loads(text)
+        
+        last_modified = int(summary.created_at.timestamp())
+        response = get_conditional_response(request, etag=summary.etag, last_modified=last_modified)
+        if response is None:
+            response = Response(
+                {
+                    "summary_id": summary.digest,
+                    "document_id": summary.document.content_hash,
+                    "filename": summary.document.filename,
+                    "level": summary.level,
+                    "prompt_key": summary.prompt_key,
+                    "summary": text,
+                    "word_count": summary.word_count,
+                    "created_at": summary.created_at.isoformat(),
+                    "status": "success"
+                },
+                status=status.HTTP_200_OK
+            )
+        
+        # A 304 carries the same validators and caching policy as the full response
+        response.headers['ETag'] = summary.etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Cache-Control'] = settings.SUMMARY_CACHE_CONTROL
+        # The response depends on the key being accepted, so shared caches must not reuse it across keys
+        patch_vary_headers(response, [API_KEY_HEADER])
+        return response
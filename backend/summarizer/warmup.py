@@ -0,0 +1,46 @@
+"""
+Warm-up of shared state before worker processes fork.
+
+Heavy modules are imported lazily so that a single process starts fast
+(see utils/lazy.py). Under a preforking server it is cheaper to import
+them once in the master instead: forked workers then share those pages
+copy-on-write rather than each paying the import and holding a copy.
+
+Nothing here may open sockets, threads or database connections, since
+those do not survive a fork. In particular the OpenAI client is still
+built lazily inside each worker.
+"""
+import logging
+import time
+from importlib import import_module
+from typing import Dict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Import the modules listed in WARM_UP_MODULES and compile prompt templates.
+
+    Returns:
+        Mapping of what was warmed to the milliseconds it took
+    """
+    timings = {}
+    for module in settings.WARM_UP_MODULES:
+        started = time.perf_counter()
+        try:
+            import_module(module)
+        except ImportError as e:
+            logger.warning(f"Skipping warm-up of {module}: {str(e)}")
+            continue
+        timings[module] = (time.perf_counter() - started) * 1000
+
+    # Templates are parsed when the registry module is imported
+    started = time.perf_counter()
+    from .utils import prompts
+    timings['prompts'] = (time.perf_counter() - started) * 1000
+    logger.debug(f"Prompt templates ready: {', '.join(prompts.registry.names())}")
+
+    return timings
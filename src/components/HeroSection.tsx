@@ -1,6 +1,6 @@
 import { useState, useRef, ChangeEvent, DragEvent } from "react";
 import { FolderOpen, Loader2, FileText, CheckCircle2, AlertCircle } from "lucide-react";
-import { summarizeFile } from "@/services/api";
+import { summarizeFile, SUPPORTED_ACCEPT } from "@/services/api";
 
 const HeroSection = () => {
   // State management
@@ -146,7 +146,7 @@ const HeroSection = () => {
               <input
                 ref={fileInputRef}
                 type="file"
-                accept=".pdf,.txt"
+                accept={SUPPORTED_ACCEPT}
                 onChange={handleFileSelect}
                 className="hidden"
                 disabled={isLoading}
@@ -187,7 +187,7 @@ const HeroSection = () => {
               
               {/* Supported formats */}
               <p className="text-gray-500 text-sm">
-                Supports PDF and TXT files (max 10MB)
+                Supports PDF, DOCX, HTML, Markdown and TXT files (max 10MB)
               </p>
             </div>
           </div>
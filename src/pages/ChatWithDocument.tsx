@@ -10,6 +10,7 @@ import {
 import Header from "@/components/Header";
 import Footer from "@/components/Footer";
 import { extractText, chatWithDocument } from "@/services/chat-api";
+import { API_KEY_HEADERS, SUPPORTED_ACCEPT, isSupportedDocument } from "@/services/api";
 
 interface Message {
   role: "user" | "assistant";
@@ -44,11 +45,8 @@ const ChatWithDocument = () => {
     setIsUploading(true);
 
     // Validate file
-    if (
-      !selectedFile.type.includes("pdf") &&
-      !selectedFile.type.includes("text")
-    ) {
-      setError("Please upload a PDF or TXT file");
+    if (!isSupportedDocument(selectedFile)) {
+      setError("Please upload a PDF, DOCX, HTML, Markdown or TXT file");
       setIsUploading(false);
       return;
     }
@@ -106,6 +104,7 @@ const ChatWithDocument = () => {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          ...API_KEY_HEADERS,
         },
         body: JSON.stringify({
           question: userMessage,
@@ -188,7 +187,7 @@ const ChatWithDocument = () => {
                   <input
                     ref={fileInputRef}
                     type="file"
-                    accept=".pdf,.txt"
+                    accept={SUPPORTED_ACCEPT}
                     onChange={handleFileSelect}
                     className="hidden"
                     disabled={isUploading}
@@ -207,7 +206,7 @@ const ChatWithDocument = () => {
                   </button>
 
                   <p className="text-gray-600 text-base">
-                    PDF or TXT files (max 10MB)
+                    PDF, DOCX, HTML, Markdown or TXT files (max 10MB)
                   </p>
                 </div>
               </div>
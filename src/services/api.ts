@@ -5,12 +5,37 @@
 
 const API_BASE_URL = "https://ai-summarizer-pro-omy1.onrender.com/api";
 
+/**
+ * Optional API key header from VITE_API_KEY. Browser traffic is anonymous by
+ * default: a key compiled into the bundle is public, so never use one that
+ * carries a quota or identity that matters.
+ */
+export const API_KEY_HEADERS: Record<string, string> = import.meta.env.VITE_API_KEY
+  ? { 'X-API-Key': import.meta.env.VITE_API_KEY }
+  : {};
+
 
 /**
  * Response interface for successful summarization
  */
 export interface SummaryResponse {
   summary: string;
+  summary_id?: string;
+  status: 'success';
+}
+
+/**
+ * Response interface for a stored summary
+ */
+export interface StoredSummaryResponse {
+  summary_id: string;
+  document_id: string;
+  filename: string;
+  level: string;
+  prompt_key: string;
+  summary: string;
+  word_count: number;
+  created_at: string;
   status: 'success';
 }
 
@@ -22,10 +47,24 @@ export interface ErrorResponse {
   status: 'failed';
 }
 
+/** File extensions accepted by the backend (ALLOWED_FILE_TYPES) */
+export const SUPPORTED_EXTENSIONS = ['pdf', 'txt', 'docx', 'html', 'htm', 'md', 'markdown'];
+
+/** Value for the accept attribute of file inputs */
+export const SUPPORTED_ACCEPT = SUPPORTED_EXTENSIONS.map((extension) => `.${extension}`).join(',');
+
+/**
+ * Whether a file has one of the supported document extensions
+ */
+export function isSupportedDocument(file: File): boolean {
+  const extension = file.name.split('.').pop()?.toLowerCase() ?? '';
+  return SUPPORTED_EXTENSIONS.includes(extension);
+}
+
 /**
  * Upload a file to the backend for AI summarization
  * 
- * @param file - The PDF or TXT file to summarize
+ * @param file - The PDF, DOCX, HTML, Markdown or TXT file to summarize
  * @returns Promise with summary text or throws error
  * 
  * @example
@@ -42,10 +81,10 @@ export async function summarizeFile(file: File): Promise<string> {
     throw new Error('No file selected');
   }
 
-  // Check file type
-  const allowedTypes = ['application/pdf', 'text/plain'];
-  if (!allowedTypes.includes(file.type)) {
-    throw new Error('Invalid file type. Only PDF and TXT files are supported.');
+  // Check file type by extension; browsers often report no MIME type for
+  // Markdown or DOCX, and the backend detects the format from the content
+  if (!isSupportedDocument(file)) {
+    throw new Error('Invalid file type. Only PDF, DOCX, HTML, Markdown and TXT files are supported.');
   }
 
   // Check file size (10MB limit)
@@ -66,6 +105,7 @@ export async function summarizeFile(file: File): Promise<string> {
     // Send POST request to Django backend
     const response = await fetch(`${API_BASE_URL}/summarize/`, {
       method: 'POST',
+      headers: API_KEY_HEADERS,
       body: formData,
       // Note: Do NOT set Content-Type header
       // Browser automatically sets it with boundary for multipart/form-data
@@ -96,6 +136,26 @@ export async function summarizeFile(file: File): Promise<string> {
   }
 }
 
+/**
+ * Fetch a stored summary by the summary_id returned from summarization
+ *
+ * The backend sends a strong ETag and Cache-Control, so the browser cache
+ * revalidates repeat views with a 304 instead of downloading them again.
+ *
+ * @param summaryId - summary_id from a summarization response
+ * @returns Promise with the stored summary
+ */
+export async function fetchSummary(summaryId: string): Promise<StoredSummaryResponse> {
+  const response = await fetch(`${API_BASE_URL}/summaries/${encodeURIComponent(summaryId)}/`, {
+    headers: API_KEY_HEADERS,
+  });
+  const data = await response.json() as StoredSummaryResponse | ErrorResponse;
+  if (!response.ok || data.status === 'failed') {
+    throw new Error((data as ErrorResponse).error || 'Failed to load summary');
+  }
+  return data as StoredSummaryResponse;
+}
+
 /**
  * Check if the backend API is reachable
  * 
@@ -105,6 +165,7 @@ export async function checkAPIHealth(): Promise<boolean> {
   try {
     const response = await fetch(`${API_BASE_URL}/summarize/`, {
       method: 'GET',
+      headers: API_KEY_HEADERS,
     });
     return response.ok;
   } catch {
@@ -1,3 +1,5 @@
+import { API_KEY_HEADERS } from "./api";
+
 export interface ExtractTextResponse {
   text: string;
   filename: string;
@@ -22,6 +24,7 @@ export async function extractText(file: File): Promise<ExtractTextResponse> {
 
   const response = await fetch(`${API_BASE_URL}/extract-text/`, {
     method: "POST",
+    headers: API_KEY_HEADERS,
     body: formData,
   });
 
@@ -42,6 +45,7 @@ export async function chatWithDocument(
     method: "POST",
     headers: {
       "Content-Type": "application/json",
+      ...API_KEY_HEADERS,
     },
     body: JSON.stringify({ question, context }),
   });